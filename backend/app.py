@@ -1,19 +1,28 @@
 import asyncio
 import json
+import multiprocessing
 import os
 import html
+import math
 import time
+from array import array
 from datetime import datetime, timezone
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import asdict
-from typing import Any, Dict, Optional, Set, List
+from typing import Any, Callable, Dict, Iterator, Optional, Set, List, Tuple
 
 import httpx
 import paho.mqtt.client as mqtt
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
+import decoder
 import state
+from checkpoint import KIND_LOS_MATRIX, KIND_STATE, _read_checkpoint, _write_checkpoint
+from compression import codec_suffix, newest_variant, read_bytes, write_bytes
 from decoder import (
   ROUTE_PAYLOAD_TYPES_SET,
   _append_heat_points,
@@ -22,6 +31,7 @@ from decoder import (
   _ensure_node_decoder,
   _normalize_lat_lon,
   _normalize_role,
+  _index_node_hash,
   _rebuild_node_hash_map,
   _route_points_from_hashes,
   _route_points_from_device_ids,
@@ -29,22 +39,57 @@ from decoder import (
   _serialize_heat_events,
   _topic_marks_online,
   _try_parse_payload,
+  _unindex_node_hash,
   DIRECT_COORDS_TOPIC_RE,
-  _node_ready_once,
-  _node_unavailable_once,
 )
+from governor import _govern_memory, _governor_payload
 from history import (
-  _load_route_history,
+  _history_file_import_rows,
+  _iter_history_segments,
+  _load_route_history_background,
   _prune_route_history,
   _record_route_history,
+  _route_history_file_bounds,
+  _migrate_route_history_file,
+  STORAGE_CODEC,
+  _close_route_history_writer,
   _route_history_saver,
+  _route_history_writer,
+  route_history_writer,
+  _write_history_buckets_checkpoint,
+  _write_route_history_checkpoint,
 )
+from storage import (
+  _query_devices,
+  _query_peer_counts,
+  _query_trail,
+  _queue_device,
+  _queue_device_delete,
+  _queue_trail_point,
+  _sqlite_close,
+  _sqlite_init,
+  _sqlite_ready,
+  _sqlite_stats,
+  _sqlite_writer,
+)
+from losmatrix import LosMatrix
+from playback import PlaybackSession
+from viewshed import render_viewshed, viewshed_grid
+from propagation import (
+  estimate_samples,
+  init_worker,
+  parse_render_request,
+  raster_grid,
+  raster_meta,
+  raster_png,
+  render_key,
+  render_raster,
+)
+from tiles import TileCache, pack_edge_row, render_tile, tile_bounds, tile_valid
 from los import (
   _fetch_elevations,
-  _find_los_peaks,
-  _find_los_suggestion,
   _haversine_m,
-  _los_max_obstruction,
+  _los_evaluate,
   _sample_los_points,
 )
 from config import (
@@ -64,6 +109,8 @@ from config import (
   STATE_FILE,
   DEVICE_ROLES_FILE,
   STATE_SAVE_INTERVAL,
+  CHECKPOINT_ENABLED,
+  STATE_CHECKPOINT_FILE,
   DEVICE_TTL_SECONDS,
   TRAIL_LEN,
   ROUTE_TTL_SECONDS,
@@ -71,6 +118,19 @@ from config import (
   ROUTE_PATH_MAX_LEN,
   ROUTE_HISTORY_ENABLED,
   ROUTE_HISTORY_HOURS,
+  HISTORY_EDGES_PAGE_SIZE,
+  HISTORY_TILE_MAX_ZOOM,
+  PLAYBACK_ENABLED,
+  PLAYBACK_MAX_SESSIONS,
+  PLAYBACK_MAX_SPEED,
+  HISTORY_ROLLUP_ENABLED,
+  HISTORY_ROLLUP_DAYS,
+  TILES_ENABLED,
+  TILE_CACHE_SIZE,
+  TILE_WORKERS,
+  TILE_REFRESH_SECONDS,
+  TILE_MAX_FEATURES,
+  HISTORY_BUCKET_RETENTION_HOURS,
   ROUTE_HISTORY_MAX_SEGMENTS,
   ROUTE_HISTORY_FILE,
   ROUTE_HISTORY_PAYLOAD_TYPES,
@@ -79,6 +139,8 @@ from config import (
   HISTORY_EDGE_SAMPLE_LIMIT,
   MESSAGE_ORIGIN_TTL_SECONDS,
   HEAT_TTL_SECONDS,
+  MEMORY_BUDGET_MB,
+  MEMORY_GOVERNOR_INTERVAL,
   MQTT_ONLINE_SECONDS,
   MQTT_SEEN_BROADCAST_MIN_SECONDS,
   MQTT_ONLINE_TOPIC_SUFFIXES,
@@ -113,8 +175,29 @@ from config import (
   LOS_SAMPLE_MIN,
   LOS_SAMPLE_MAX,
   LOS_SAMPLE_STEP_METERS,
-  ELEVATION_CACHE_TTL,
   LOS_PEAKS_MAX,
+  LOS_MODEL,
+  LOS_K_FACTOR,
+  LOS_BATCH_MAX_PAIRS,
+  LOS_WORKERS,
+  LOS_MATRIX_ENABLED,
+  LOS_MATRIX_MAX_KM,
+  LOS_MATRIX_MOVE_METERS,
+  LOS_MATRIX_BATCH_PAIRS,
+  LOS_MATRIX_INTERVAL,
+  LOS_MATRIX_FILE,
+  DEM_DIR,
+  DEM_MAX_OPEN_TILES,
+  PROPAGATION_ENABLED,
+  PROPAGATION_WORKERS,
+  PROPAGATION_CACHE_SIZE,
+  PROPAGATION_MAX_CELLS,
+  PROPAGATION_MAX_ORIGINS,
+  PROPAGATION_MAX_RANGE_KM,
+  VIEWSHED_ENABLED,
+  VIEWSHED_CACHE_SIZE,
+  VIEWSHED_MAX_RADIUS_KM,
+  VIEWSHED_MOVE_METERS,
   COVERAGE_API_URL,
   APP_DIR,
   NODE_SCRIPT_PATH,
@@ -138,9 +221,9 @@ from state import (
   node_hash_to_device,
   node_hash_collisions,
   node_hash_candidates,
-  elevation_cache,
   device_names,
   message_origins,
+  peer_index,
   device_roles,
   device_role_sources,
 )
@@ -154,6 +237,7 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 mqtt_client: Optional[mqtt.Client] = None
 clients: Set[WebSocket] = set()
 update_queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+app_started_at = time.time()
 
 # =========================
 # Helpers: coordinate hunting
@@ -180,15 +264,17 @@ def _load_role_overrides() -> Dict[str, str]:
 
 
 def _serialize_state() -> Dict[str, Any]:
+  # Shallow copies of every live container, so the result can be encoded in a
+  # thread while the loop keeps mutating the originals.
   return {
     "version": 1,
     "saved_at": time.time(),
     "devices": {k: asdict(v) for k, v in devices.items()},
-    "trails": trails,
-    "seen_devices": seen_devices,
-    "device_names": device_names,
-    "device_roles": device_roles,
-    "device_role_sources": device_role_sources,
+    "trails": {k: list(v) for k, v in trails.items()},
+    "seen_devices": dict(seen_devices),
+    "device_names": dict(device_names),
+    "device_roles": dict(device_roles),
+    "device_role_sources": dict(device_role_sources),
   }
 
 
@@ -243,7 +329,8 @@ def _evict_device(device_id: str) -> bool:
   last_seen_broadcast.pop(device_id, None)
   if removed:
     state.state_dirty = True
-    _rebuild_node_hash_map()
+    _unindex_node_hash(device_id)
+    _queue_device_delete(device_id)
   return removed
 
 
@@ -362,12 +449,43 @@ def _ws_authorized(ws: WebSocket) -> bool:
   return token == PROD_TOKEN
 
 
+def _read_state_checkpoint() -> Optional[Dict[str, Any]]:
+  if not CHECKPOINT_ENABLED or not os.path.exists(STATE_CHECKPOINT_FILE):
+    return None
+  try:
+    state_path = newest_variant(STATE_FILE)
+    if state_path and os.path.getmtime(state_path) > os.path.getmtime(STATE_CHECKPOINT_FILE):
+      return None
+  except OSError:
+    return None
+  data, _ = _read_checkpoint(STATE_CHECKPOINT_FILE, KIND_STATE)
+  return data
+
+
+def _read_state_files() -> Optional[Dict[str, Any]]:
+  data = _read_state_checkpoint()
+  if data is None:
+    state_path = newest_variant(STATE_FILE)
+    if state_path:
+      data = json.loads(read_bytes(state_path))
+  return data
+
+
+def _sqlite_file_import() -> Tuple[Dict[str, Any], Dict[str, Any], Iterator[Tuple[Dict[str, Any], str]]]:
+  # Sources for SQLite's one-time import the first time it is enabled.
+  data = _read_state_files() or {}
+  segments = _history_file_import_rows() if ROUTE_HISTORY_ENABLED else iter(())
+  return data.get("devices") or {}, data.get("trails") or {}, segments
+
+
 def _load_state() -> None:
   try:
-    if not os.path.exists(STATE_FILE):
-      return
-    with open(STATE_FILE, "r", encoding="utf-8") as handle:
-      data = json.load(handle)
+    data = _read_state_files()
+    if data is None:
+      if _sqlite_ready():
+        data = {"devices": {row["device_id"]: row for row in _query_devices()}}
+      else:
+        return
   except Exception as exc:
     print(f"[state] failed to load {STATE_FILE}: {exc}")
     return
@@ -476,18 +594,27 @@ def _load_state() -> None:
     state.role = role_value if role_value else None
 
 
+def _write_state(snapshot: Dict[str, Any]) -> None:
+  os.makedirs(STATE_DIR, exist_ok=True)
+  # The binary checkpoint is what loads when enabled, so state.json is only the fallback.
+  if CHECKPOINT_ENABLED and _write_checkpoint(STATE_CHECKPOINT_FILE, KIND_STATE, snapshot):
+    return
+  state_path = STATE_FILE + codec_suffix(STORAGE_CODEC)
+  tmp_path = f"{state_path}.tmp"
+  write_bytes(tmp_path, STORAGE_CODEC, json.dumps(snapshot).encode("utf-8"))
+  os.replace(tmp_path, state_path)
+
+
 async def _state_saver() -> None:
   while True:
     if state.state_dirty:
+      state.state_dirty = False
       try:
-        os.makedirs(STATE_DIR, exist_ok=True)
-        tmp_path = f"{STATE_FILE}.tmp"
-        with open(tmp_path, "w", encoding="utf-8") as handle:
-          json.dump(_serialize_state(), handle)
-        os.replace(tmp_path, STATE_FILE)
-        state.state_dirty = False
+        await asyncio.to_thread(_write_state, _serialize_state())
       except Exception as exc:
+        state.state_dirty = True
         print(f"[state] failed to save {STATE_FILE}: {exc}")
+    await asyncio.to_thread(state.elevation_cache.flush)
     await asyncio.sleep(max(1.0, STATE_SAVE_INTERVAL))
 
 
@@ -628,23 +755,16 @@ def mqtt_on_message(client, userdata, msg: mqtt.MQTTMessage):
       route_origin_id = decoded_pubkey
   direction_value = str(direction or "").lower()
   if message_hash:
-    cache = message_origins.get(message_hash)
-    if not cache:
-      cache = {"origin_id": None, "first_rx": None, "receivers": set(), "ts": time.time()}
-      message_origins[message_hash] = cache
-    cache["ts"] = time.time()
     origin_for_tx = origin_id or receiver_id
-    if direction_value == "tx" and origin_for_tx:
-      cache["origin_id"] = origin_for_tx
-    if direction_value == "rx" and receiver_id:
-      cache["receivers"].add(receiver_id)
-      if not cache.get("first_rx"):
-        cache["first_rx"] = receiver_id
-    cached_origin = cache.get("origin_id")
+    cached_origin, first_rx = message_origins.observe(
+      message_hash,
+      time.time(),
+      origin_id=origin_for_tx if direction_value == "tx" else None,
+      receiver_id=receiver_id if direction_value == "rx" else None,
+    )
     if not route_origin_id and cached_origin:
       route_origin_id = cached_origin
     if not route_origin_id and direction_value == "rx":
-      first_rx = cache.get("first_rx")
       if first_rx and receiver_id and receiver_id != first_rx:
         route_origin_id = first_rx
   if not route_origin_id:
@@ -921,8 +1041,9 @@ async def broadcaster():
     devices[device_id] = device_state
     seen_devices[device_id] = time.time()
     state.state_dirty = True
+    _queue_device(device_state)
     if is_new_device:
-      _rebuild_node_hash_map()
+      _index_node_hash(device_id)
     if device_state.name:
       device_names[device_id] = device_state.name
     if device_state.role:
@@ -931,6 +1052,7 @@ async def broadcaster():
     if TRAIL_LEN > 0 and not _coords_are_zero(device_state.lat, device_state.lon):
       trails.setdefault(device_id, [])
       trails[device_id].append([device_state.lat, device_state.lon, device_state.ts])
+      _queue_trail_point(device_id, device_state.lat, device_state.lon, device_state.ts)
       if len(trails[device_id]) > TRAIL_LEN:
         trails[device_id] = trails[device_id][-TRAIL_LEN:]
     elif device_id in trails:
@@ -969,7 +1091,8 @@ async def reaper():
           devices.pop(dev_id, None)
           trails.pop(dev_id, None)
           state.state_dirty = True
-        _rebuild_node_hash_map()
+          _unindex_node_hash(dev_id)
+          _queue_device_delete(dev_id)
 
     if routes:
       bad_routes = []
@@ -1024,10 +1147,8 @@ async def reaper():
       cutoff = now - HEAT_TTL_SECONDS
       heat_events[:] = [entry for entry in heat_events if entry.get("ts", 0) >= cutoff]
 
-    if message_origins:
-      for msg_hash, info in list(message_origins.items()):
-        if now - info.get("ts", 0) > MESSAGE_ORIGIN_TTL_SECONDS:
-          message_origins.pop(msg_hash, None)
+    if len(message_origins):
+      message_origins.expire(now)
 
     prune_after = max(DEVICE_TTL_SECONDS * 3, 900) if DEVICE_TTL_SECONDS > 0 else 86400
     for dev_id, last in list(seen_devices.items()):
@@ -1037,6 +1158,27 @@ async def reaper():
     await asyncio.sleep(5)
 
 
+async def memory_governor():
+  if MEMORY_BUDGET_MB <= 0:
+    return
+  while True:
+    await asyncio.sleep(max(5.0, MEMORY_GOVERNOR_INTERVAL))
+    history_updates, history_removed = _govern_memory()
+    if not history_updates and not history_removed:
+      continue
+    dead = []
+    for ws in list(clients):
+      try:
+        if history_updates:
+          await ws.send_text(json.dumps({"type": "history_edges", "edges": [_history_edge_payload(e) for e in history_updates]}))
+        if history_removed:
+          await ws.send_text(json.dumps({"type": "history_edges_remove", "edge_ids": history_removed}))
+      except Exception:
+        dead.append(ws)
+    for ws in dead:
+      clients.discard(ws)
+
+
 # =========================
 # FastAPI routes
 # =========================
@@ -1078,6 +1220,11 @@ def root():
     "MAP_START_LAT": MAP_START_LAT,
     "MAP_START_LON": MAP_START_LON,
     "MAP_START_ZOOM": MAP_START_ZOOM,
+    "HISTORY_TILE_MAX_ZOOM": HISTORY_TILE_MAX_ZOOM if TILES_ENABLED else -1,
+    "PLAYBACK_ENABLED": "true" if PLAYBACK_ENABLED and ROUTE_HISTORY_ENABLED else "false",
+    "PLAYBACK_MAX_SPEED": PLAYBACK_MAX_SPEED,
+    "PROPAGATION_SERVER": str(PROPAGATION_ENABLED).lower(),
+    "PROPAGATION_SERVER_TERRAIN": str(PROPAGATION_ENABLED and bool(DEM_DIR)).lower(),
     "MAP_RADIUS_KM": MAP_RADIUS_KM,
     "MAP_RADIUS_SHOW": str(MAP_RADIUS_SHOW).lower(),
     "MAP_DEFAULT_LAYER": MAP_DEFAULT_LAYER,
@@ -1151,6 +1298,29 @@ def snapshot(request: Request):
   }
 
 
+@app.get("/ready")
+def ready():
+  history = dict(state.history_load)
+  total = history.get("total") or 0
+  history["percent"] = round((history.get("loaded") or 0) / total * 100.0, 1) if total else (100.0 if history.get("state") == "ready" else 0.0)
+  history_ready = history.get("state") in ("ready", "failed")
+  decoder_ready = (not DECODE_WITH_NODE) or decoder._node_ready_once or decoder._node_unavailable_once
+  payload = {
+    "ready": bool(history_ready and decoder_ready),
+    "live": True,
+    "uptime_seconds": round(time.time() - app_started_at, 3),
+    "devices": len(devices),
+    "history": history,
+    "decoder": {
+      "decode_with_node": DECODE_WITH_NODE,
+      "node_ready": decoder._node_ready_once,
+      "node_unavailable": decoder._node_unavailable_once,
+    },
+    "server_time": time.time(),
+  }
+  return JSONResponse(payload, status_code=200 if payload["ready"] else 503)
+
+
 @app.get("/stats")
 def get_stats():
   if PROD_MODE:
@@ -1183,9 +1353,25 @@ def get_stats():
     "top_topics": top_topics,
     "decoder": {
       "decode_with_node": DECODE_WITH_NODE,
-      "node_ready": _node_ready_once,
-      "node_unavailable": _node_unavailable_once,
+      "node_ready": decoder._node_ready_once,
+      "node_unavailable": decoder._node_unavailable_once,
     },
+    "message_origins": message_origins.stats(),
+    "peer_index": peer_index.stats(),
+    "history_buckets": state.history_buckets.stats(),
+    "history_edge_index": state.history_edge_index.stats(),
+    "tiles": tile_cache.stats(),
+    "playback_sessions": len(playback_sessions),
+    "history_rollups": state.history_rollups.stats(),
+    "elevation_client": state.elevation_client.stats(),
+    "elevation_cache": state.elevation_cache.stats(),
+    "dem": state.dem_store.stats() if state.dem_store is not None else None,
+    "los_matrix": los_matrix.stats() if LOS_MATRIX_ENABLED else None,
+    "propagation": {**propagation_cache.stats(), "renders": propagation_renders} if PROPAGATION_ENABLED else None,
+    "viewshed": {**viewshed_cache.stats(), "renders": viewshed_renders} if VIEWSHED_ENABLED else None,
+    "history_writer": route_history_writer.stats(),
+    "memory": _governor_payload(),
+    "storage": _sqlite_stats(),
     "route_payload_types": sorted(ROUTE_PAYLOAD_TYPES_SET),
     "direct_coords": {
       "mode": DIRECT_COORDS_MODE,
@@ -1234,13 +1420,257 @@ def api_nodes(request: Request, updated_since: Optional[str] = None, mode: Optio
   return payload
 
 
+HISTORY_WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_history_window(value: Optional[str]) -> float:
+  if not value:
+    return ROUTE_HISTORY_HOURS * 3600
+  text = value.strip().lower()
+  unit = HISTORY_WINDOW_UNITS.get(text[-1:])
+  if unit:
+    text = text[:-1]
+  try:
+    seconds = float(text) * (unit or 1)
+  except ValueError:
+    raise HTTPException(status_code=400, detail="window must look like 1h, 6h, 24h or 7d")
+  if seconds <= 0:
+    raise HTTPException(status_code=400, detail="window must be positive")
+  return min(seconds, HISTORY_BUCKET_RETENTION_HOURS * 3600)
+
+
+HISTORY_EDGES_PAGE_MAX = 10000
+
+
+def _parse_history_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+  if not value:
+    return None
+  try:
+    west, south, east, north = (float(part) for part in value.split(","))
+  except ValueError:
+    raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+  if not (-90.0 <= south <= north <= 90.0) or not (-180.0 <= west <= 180.0 and -180.0 <= east <= 180.0):
+    raise HTTPException(status_code=400, detail="bbox is out of range")
+  return west, south, east, north
+
+
+def _live_history_edges(bounds, min_count: int, payload_type: Optional[int]) -> List[Dict[str, Any]]:
+  edges = []
+  for key in state.history_edge_index.query(bounds):
+    edge = route_history_edges.get(key)
+    if not edge:
+      continue
+    count = edge.get("count") or 0
+    if payload_type is not None:
+      count = (edge.get("types") or {}).get(payload_type, 0)
+    if count < min_count:
+      continue
+    payload = _history_edge_payload(edge)
+    payload["count"] = count
+    edges.append(payload)
+  return edges
+
+
+@app.get("/history/edges")
+def get_history_edges(
+  request: Request,
+  window: Optional[str] = None,
+  bbox: Optional[str] = None,
+  min_count: int = 1,
+  payload_type: Optional[int] = None,
+  cursor: Optional[str] = None,
+  limit: Optional[int] = None,
+):
+  _require_prod_token(request)
+  bounds = _parse_history_bbox(bbox)
+  min_count = max(1, int(min_count or 1))
+  limit_value = max(1, min(int(limit or HISTORY_EDGES_PAGE_SIZE), HISTORY_EDGES_PAGE_MAX))
+  if window:
+    # Bucketed windows only keep totals per edge, so type filtering needs the live window.
+    if payload_type is not None:
+      raise HTTPException(status_code=400, detail="payload_type only applies without window")
+    window_seconds = _parse_history_window(window)
+    edges = state.history_buckets.window(window_seconds, bounds=bounds, min_count=min_count) if ROUTE_HISTORY_ENABLED else []
+  else:
+    window_seconds = ROUTE_HISTORY_HOURS * 3600
+    edges = _live_history_edges(bounds, min_count, payload_type) if ROUTE_HISTORY_ENABLED else []
+  # Edge ids are stable, so paging walks them in id order and the cursor is the last id sent.
+  edges.sort(key=lambda edge: edge["id"])
+  total = len(edges)
+  if cursor:
+    edges = edges[bisect_right([edge["id"] for edge in edges], cursor):]
+  page = edges[:limit_value]
+  return {
+    "window": window or "live",
+    "window_seconds": window_seconds,
+    "bucket_seconds": state.history_buckets.bucket_seconds,
+    "edge_count": total,
+    "edges": page,
+    "next_cursor": page[-1]["id"] if len(edges) > limit_value else None,
+    "server_time": time.time(),
+  }
+
+
+@app.get("/history/rollups")
+def get_history_rollups(
+  request: Request,
+  days: float = 28,
+  bbox: Optional[str] = None,
+  min_count: int = 1,
+  edge: Optional[str] = None,
+  limit: Optional[int] = None,
+):
+  _require_prod_token(request)
+  if not HISTORY_ROLLUP_ENABLED:
+    raise HTTPException(status_code=404, detail="history rollups disabled")
+  if days <= 0:
+    raise HTTPException(status_code=400, detail="days must be positive")
+  now = time.time()
+  days = min(float(days), HISTORY_ROLLUP_DAYS) if HISTORY_ROLLUP_DAYS > 0 else float(days)
+  start = now - days * 86400
+  rollups = state.history_rollups
+  payload: Dict[str, Any] = {
+    "days": days,
+    "from": start,
+    "covered_until": rollups.covered_until,
+    "server_time": now,
+  }
+  if edge:
+    payload["edge"] = edge
+    payload["series"] = rollups.series(edge, start, now)
+    return payload
+  limit_value = max(1, min(int(limit or HISTORY_EDGES_PAGE_SIZE), HISTORY_EDGES_PAGE_MAX))
+  matched, edges = rollups.query(
+    start,
+    now,
+    bounds=_parse_history_bbox(bbox),
+    min_count=max(1, int(min_count or 1)),
+    limit=limit_value,
+  )
+  payload["edge_count"] = matched
+  payload["edges"] = edges
+  return payload
+
+
+# =========================
+# Tiles
+# =========================
+tile_cache = TileCache(TILE_CACHE_SIZE)
+tile_pool: Optional[ProcessPoolExecutor] = None
+_tile_inflight: Dict[Tuple[Any, ...], asyncio.Future] = {}
+_tile_versions: Dict[str, Tuple[float, int]] = {}
+TILE_LAYERS = ("edges", "nodes")
+
+
+def _tile_pool() -> ProcessPoolExecutor:
+  # Snapping, merging and encoding a busy tile is pure Python, so threads
+  # would only take turns on the GIL; the rows are gathered on the loop and
+  # built in spawned processes.
+  global tile_pool
+  if tile_pool is None:
+    tile_pool = ProcessPoolExecutor(
+      max_workers=max(1, TILE_WORKERS),
+      mp_context=multiprocessing.get_context("spawn"),
+    )
+  return tile_pool
+
+
+def _shared_render(
+  inflight: Dict[Any, asyncio.Future],
+  key: Any,
+  start: Callable[[], asyncio.Future],
+  on_result: Callable[[Any], None],
+) -> asyncio.Future:
+  # Concurrent requests for one key share a single render. Callers await it
+  # through asyncio.shield, so a client that disconnects doesn't cancel it for
+  # the others; the done-callback stores the result and clears the entry even
+  # once nobody is left waiting.
+  future = inflight.get(key)
+  if future is None:
+    future = start()
+    inflight[key] = future
+
+    def _finish(done: asyncio.Future) -> None:
+      inflight.pop(key, None)
+      if not done.cancelled() and done.exception() is None:
+        on_result(done.result())
+
+    future.add_done_callback(_finish)
+  return future
+
+
+def _tile_version(layer: str) -> int:
+  # Versions are sampled at most every TILE_REFRESH_SECONDS, so a busy feed
+  # doesn't invalidate every cached tile on each packet.
+  now = time.time()
+  sampled = _tile_versions.get(layer)
+  if sampled and now - sampled[0] < TILE_REFRESH_SECONDS:
+    return sampled[1]
+  if layer == "edges":
+    version = state.history_version
+  else:
+    version = int(now // max(1.0, TILE_REFRESH_SECONDS))
+  _tile_versions[layer] = (now, version)
+  return version
+
+
+def _tile_rows(layer: str, z: int, x: int, y: int) -> Any:
+  bounds = tile_bounds(z, x, y)
+  if layer == "edges":
+    rows = array("d")
+    for key in state.history_edge_index.query(bounds):
+      edge = route_history_edges.get(key)
+      if edge:
+        pack_edge_row(rows, edge["a"], edge["b"], int(edge.get("count") or 0), edge.get("last_ts"))
+    return rows
+  west, south, east, north = bounds
+  rows = []
+  for device_id, device in list(devices.items()):
+    if _coords_are_zero(device.lat, device.lon):
+      continue
+    if not (south <= device.lat <= north and west <= device.lon <= east):
+      continue
+    name = device.name or device_names.get(device_id)
+    rows.append((device_id, float(device.lat), float(device.lon), name, device.role, device.ts))
+  return rows
+
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.json")
+async def get_tile(layer: str, z: int, x: int, y: int, request: Request):
+  _require_prod_token(request)
+  if not TILES_ENABLED:
+    raise HTTPException(status_code=404, detail="tiles disabled")
+  if layer not in TILE_LAYERS or not tile_valid(z, x, y):
+    raise HTTPException(status_code=404, detail="unknown tile")
+  key = (layer, z, x, y, _tile_version(layer))
+  body = tile_cache.get(key)
+  if body is None:
+    future = _shared_render(
+      _tile_inflight,
+      key,
+      lambda: asyncio.get_running_loop().run_in_executor(
+        _tile_pool(), render_tile, layer, z, _tile_rows(layer, z, x, y), TILE_MAX_FEATURES
+      ),
+      lambda rendered: tile_cache.put(key, rendered),
+    )
+    body = await asyncio.shield(future)
+  return Response(
+    content=body,
+    media_type="application/geo+json",
+    headers={"Cache-Control": f"max-age={int(TILE_REFRESH_SECONDS)}"},
+  )
+
+
 @app.get("/peers/{device_id}")
-def get_peers(device_id: str, request: Request, limit: int = 8):
+def get_peers(device_id: str, request: Request, limit: int = 8, hours: Optional[float] = None):
   _require_prod_token(request)
   if not device_id:
     raise HTTPException(status_code=400, detail="device_id required")
   limit_value = max(1, min(int(limit or 8), 50))
-  payload = _peer_stats_for_device(device_id, limit_value)
+  if hours and hours > 0 and hours != ROUTE_HISTORY_HOURS and _sqlite_ready():
+    payload = _peer_stats_from_storage(device_id, limit_value, float(hours))
+  else:
+    payload = _peer_stats_for_device(device_id, limit_value)
   state = devices.get(device_id)
   if state and not _coords_are_zero(state.lat, state.lon):
     payload["lat"] = float(state.lat)
@@ -1298,25 +1728,50 @@ def _peer_stats_for_device(device_id: str, limit: int) -> Dict[str, Any]:
   outbound: Dict[str, int] = {}
   inbound_last: Dict[str, float] = {}
   outbound_last: Dict[str, float] = {}
-  for entry in route_history_segments:
-    if not isinstance(entry, dict):
+  inbound_rows, outbound_rows = peer_index.peers(device_id)
+  for peer_id, count, last_ts in inbound_rows:
+    if _peer_is_excluded(peer_id):
       continue
-    a_id = entry.get("a_id")
-    b_id = entry.get("b_id")
-    if not a_id or not b_id:
+    inbound[peer_id] = count
+    inbound_last[peer_id] = last_ts
+  for peer_id, count, last_ts in outbound_rows:
+    if _peer_is_excluded(peer_id):
       continue
-    ts = entry.get("ts") or 0
-    if a_id == device_id and b_id != device_id:
-      if _peer_is_excluded(b_id):
-        continue
-      outbound[b_id] = outbound.get(b_id, 0) + 1
-      outbound_last[b_id] = max(outbound_last.get(b_id, 0), float(ts))
-    if b_id == device_id and a_id != device_id:
-      if _peer_is_excluded(a_id):
-        continue
-      inbound[a_id] = inbound.get(a_id, 0) + 1
-      inbound_last[a_id] = max(inbound_last.get(a_id, 0), float(ts))
+    outbound[peer_id] = count
+    outbound_last[peer_id] = last_ts
 
+  return _peer_stats_payload(device_id, limit, inbound, outbound, inbound_last, outbound_last, ROUTE_HISTORY_HOURS)
+
+
+def _peer_stats_from_storage(device_id: str, limit: int, hours: float) -> Dict[str, Any]:
+  since = time.time() - (hours * 3600)
+  inbound_rows, outbound_rows = _query_peer_counts(device_id, since)
+  inbound: Dict[str, int] = {}
+  outbound: Dict[str, int] = {}
+  inbound_last: Dict[str, float] = {}
+  outbound_last: Dict[str, float] = {}
+  for peer_id, (count, last_ts) in inbound_rows.items():
+    if _peer_is_excluded(peer_id):
+      continue
+    inbound[peer_id] = count
+    inbound_last[peer_id] = last_ts
+  for peer_id, (count, last_ts) in outbound_rows.items():
+    if _peer_is_excluded(peer_id):
+      continue
+    outbound[peer_id] = count
+    outbound_last[peer_id] = last_ts
+  return _peer_stats_payload(device_id, limit, inbound, outbound, inbound_last, outbound_last, hours)
+
+
+def _peer_stats_payload(
+  device_id: str,
+  limit: int,
+  inbound: Dict[str, int],
+  outbound: Dict[str, int],
+  inbound_last: Dict[str, float],
+  outbound_last: Dict[str, float],
+  window_hours: float,
+) -> Dict[str, Any]:
   inbound_total = sum(inbound.values())
   outbound_total = sum(outbound.values())
 
@@ -1341,20 +1796,42 @@ def _peer_stats_for_device(device_id: str, limit: int) -> Dict[str, Any]:
     "outgoing_total": outbound_total,
     "incoming": inbound_items,
     "outgoing": outbound_items,
-    "window_hours": ROUTE_HISTORY_HOURS,
+    "window_hours": window_hours,
+  }
+
+
+@app.get("/trail/{device_id}")
+def get_trail(device_id: str, request: Request, hours: float = 24, limit: int = 1000):
+  _require_prod_token(request)
+  if not device_id:
+    raise HTTPException(status_code=400, detail="device_id required")
+  limit_value = max(1, min(int(limit or 1000), 10000))
+  if _sqlite_ready():
+    since = time.time() - (max(0.0, float(hours)) * 3600)
+    points = _query_trail(device_id, since, limit_value)
+  else:
+    points = trails.get(device_id, [])[-limit_value:]
+  return {
+    "device_id": device_id,
+    "points": points,
+    "source": "sqlite" if _sqlite_ready() else "memory",
+    "server_time": time.time(),
   }
 
 
 @app.get("/los")
-def line_of_sight(lat1: float, lon1: float, lat2: float, lon2: float, profile: bool = False):
+async def line_of_sight(lat1: float, lon1: float, lat2: float, lon2: float, profile: bool = False, model: Optional[str] = None):
   include_points = bool(profile)
+  los_model = (model or LOS_MODEL).strip().lower()
+  if los_model not in ("straight", "radio"):
+    return {"ok": False, "error": "invalid_model"}
   start = _normalize_lat_lon(lat1, lon1)
   end = _normalize_lat_lon(lat2, lon2)
   if not start or not end:
     return {"ok": False, "error": "invalid_coords"}
 
   points = _sample_los_points(start[0], start[1], end[0], end[1])
-  elevations, error = _fetch_elevations(points)
+  elevations, error, from_dem = await _fetch_elevations(points)
   if error:
     return {"ok": False, "error": error}
 
@@ -1362,48 +1839,436 @@ def line_of_sight(lat1: float, lon1: float, lat2: float, lon2: float, profile: b
   if distance_m <= 0:
     return {"ok": False, "error": "zero_distance"}
 
-  start_elev = elevations[0]
-  end_elev = elevations[-1]
-  max_obstruction = _los_max_obstruction(points, elevations, 0, len(points) - 1)
-  max_terrain = max(elevations)
-  blocked = max_obstruction > 0.0
-  suggestion = _find_los_suggestion(points, elevations) if blocked else None
-  profile_samples = []
-  if distance_m > 0:
-    for (lat, lon, t), elev in zip(points, elevations):
-      line_elev = start_elev + (end_elev - start_elev) * t
-      profile_samples.append([
-        round(distance_m * t, 2),
-        round(float(elev), 2),
-        round(float(line_elev), 2),
-      ])
-  peaks = _find_los_peaks(points, elevations, distance_m)
-
-  response = {
+  return _los_evaluate(points, elevations, distance_m, los_model, include_points, from_dem=from_dem)
+
+
+los_pool = ThreadPoolExecutor(max_workers=max(1, LOS_WORKERS), thread_name_prefix="los")
+LOS_BATCH_CHUNK = 25
+
+
+def _los_endpoint(value: Any) -> Tuple[Optional[Tuple[float, float]], Optional[str]]:
+  # A pair endpoint is [lat, lon], {"lat": .., "lon": ..} or a device id.
+  if isinstance(value, str):
+    device = devices.get(value)
+    if device is None or _coords_are_zero(device.lat, device.lon):
+      return None, "unknown_device"
+    return (float(device.lat), float(device.lon)), None
+  if isinstance(value, dict):
+    coords = _normalize_lat_lon(value.get("lat"), value.get("lon"))
+  elif isinstance(value, (list, tuple)) and len(value) == 2:
+    coords = _normalize_lat_lon(value[0], value[1])
+  else:
+    coords = None
+  if not coords:
+    return None, "invalid_coords"
+  return coords, None
+
+
+def _los_evaluate_chunk(jobs: List[Tuple[Any, ...]], model: str, detail: bool) -> List[Dict[str, Any]]:
+  return [
+    _los_evaluate(points, elevations, distance_m, model, detail=detail, from_dem=from_dem)
+    for points, elevations, distance_m, from_dem in jobs
+  ]
+
+
+async def _los_pair_verdicts(
+  paths: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+  model: str,
+  detail: bool = False,
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+  # One elevation lookup for every sample of every path: the cache collapses
+  # shared cells (pairs from the same repeater) and misses go out as one set
+  # of chunked requests instead of one round trip per pair.
+  work = []
+  all_points: List[Tuple[float, float, float]] = []
+  for start, end in paths:
+    points = _sample_los_points(start[0], start[1], end[0], end[1])
+    work.append((len(all_points), points, _haversine_m(start[0], start[1], end[0], end[1])))
+    all_points.extend(points)
+  if not all_points:
+    return [], None
+  elevations, error, from_dem = await _fetch_elevations(all_points)
+  if error:
+    return None, error
+  jobs = [
+    (points, elevations[offset:offset + len(points)], distance_m, from_dem[offset:offset + len(points)])
+    for offset, points, distance_m in work
+  ]
+  loop = asyncio.get_running_loop()
+  parts = await asyncio.gather(*[
+    loop.run_in_executor(los_pool, _los_evaluate_chunk, jobs[i:i + LOS_BATCH_CHUNK], model, detail)
+    for i in range(0, len(jobs), LOS_BATCH_CHUNK)
+  ])
+  return [verdict for part in parts for verdict in part], None
+
+
+@app.post("/los/batch")
+async def line_of_sight_batch(request: Request):
+  _require_prod_token(request)
+  try:
+    body = await request.json()
+  except ValueError:
+    raise HTTPException(status_code=400, detail="invalid_json")
+  if not isinstance(body, dict) or not isinstance(body.get("pairs"), list):
+    raise HTTPException(status_code=400, detail="pairs required")
+  pairs = body["pairs"]
+  if len(pairs) > max(1, LOS_BATCH_MAX_PAIRS):
+    raise HTTPException(status_code=400, detail="too_many_pairs")
+  los_model = str(body.get("model") or LOS_MODEL).strip().lower()
+  if los_model not in ("straight", "radio"):
+    raise HTTPException(status_code=400, detail="invalid_model")
+  detail = bool(body.get("profile"))
+
+  results: List[Dict[str, Any]] = []
+  pending = []
+  paths = []
+  for index, pair in enumerate(pairs):
+    pair_id = index
+    if isinstance(pair, dict):
+      pair_id = pair.get("id", index)
+      a, b = pair.get("a"), pair.get("b")
+    elif isinstance(pair, (list, tuple)) and len(pair) == 2:
+      a, b = pair
+    else:
+      a = b = None
+    start, error = _los_endpoint(a)
+    end, end_error = _los_endpoint(b)
+    error = error or end_error
+    if not error and _haversine_m(start[0], start[1], end[0], end[1]) <= 0:
+      error = "zero_distance"
+    result = {"id": pair_id, "ok": False, "error": error}
+    results.append(result)
+    if error:
+      continue
+    pending.append(result)
+    paths.append((start, end))
+
+  verdicts, error = await _los_pair_verdicts(paths, los_model, detail)
+  if error:
+    return {"ok": False, "error": error}
+  for result, verdict in zip(pending, verdicts):
+    result.pop("error")
+    result.update(verdict)
+
+  return {
     "ok": True,
-    "blocked": blocked,
-    "max_obstruction_m": round(max_obstruction, 2),
-    "distance_m": round(distance_m, 2),
-    "distance_km": round(distance_m / 1000.0, 3),
-    "distance_mi": round(distance_m / 1609.344, 3),
-    "samples": len(points),
-    "elevation_m": {
-      "start": round(start_elev, 2),
-      "end": round(end_elev, 2),
-      "max_terrain": round(max_terrain, 2),
-    },
-    "provider": LOS_ELEVATION_URL,
-    "note": "Straight-line LOS using SRTM90m. No curvature/refraction.",
-    "suggested": suggestion,
-    "profile": profile_samples,
-    "peaks": peaks,
+    "model": los_model,
+    "pairs": len(pairs),
+    "samples": sum(verdict["samples"] for verdict in verdicts),
+    "results": results,
   }
-  if include_points:
-    response["profile_points"] = [
-      [round(lat, 6), round(lon, 6), round(t, 4), round(float(elev), 2)]
-      for (lat, lon, t), elev in zip(points, elevations)
-    ]
-  return response
+
+
+# =========================
+# Repeater LOS matrix
+# =========================
+los_matrix = LosMatrix(LOS_MATRIX_MAX_KM, LOS_MATRIX_MOVE_METERS, LOS_MODEL)
+
+
+def _repeater_positions() -> Dict[str, Tuple[float, float]]:
+  positions = {}
+  for device_id, device in list(devices.items()):
+    if (device.role or device_roles.get(device_id)) != "repeater":
+      continue
+    if _coords_are_zero(device.lat, device.lon) or not _within_map_radius(device.lat, device.lon):
+      continue
+    positions[device_id] = (float(device.lat), float(device.lon))
+  return positions
+
+
+def _write_los_matrix_checkpoint() -> bool:
+  if not LOS_MATRIX_FILE:
+    return False
+  return _write_checkpoint(LOS_MATRIX_FILE, KIND_LOS_MATRIX, los_matrix.export())
+
+
+def _read_los_matrix_checkpoint() -> bool:
+  if not LOS_MATRIX_FILE:
+    return False
+  body, _ = _read_checkpoint(LOS_MATRIX_FILE, KIND_LOS_MATRIX)
+  if not body:
+    return False
+  return los_matrix.restore(body)
+
+
+async def _los_matrix_worker() -> None:
+  if await asyncio.to_thread(_read_los_matrix_checkpoint):
+    print(f"[los] loaded matrix: {len(los_matrix.repeaters)} repeaters, {len(los_matrix)} pairs")
+  los_matrix.dirty = False
+  last_saved = time.time()
+  while True:
+    # Only new or moved repeaters are re-queued; each pass computes at most
+    # LOS_MATRIX_BATCH_PAIRS pairs so a fresh matrix fills in gradually.
+    los_matrix.sync(_repeater_positions())
+    jobs = los_matrix.take(LOS_MATRIX_BATCH_PAIRS) if los_matrix.pending else []
+    error = None
+    if jobs:
+      verdicts, error = await _los_pair_verdicts([(a, b) for _, a, b, _ in jobs], los_matrix.model)
+      if error:
+        # Put the pairs back and wait a full interval before trying again.
+        print(f"[los] matrix pass failed: {error}")
+        los_matrix.retry(key for key, _, _, _ in jobs)
+      else:
+        now = time.time()
+        for (key, _, _, versions), verdict in zip(jobs, verdicts):
+          los_matrix.finish(key, versions, verdict, now)
+    now = time.time()
+    if los_matrix.dirty and (not los_matrix.pending or now - last_saved >= STATE_SAVE_INTERVAL):
+      if await asyncio.to_thread(_write_los_matrix_checkpoint):
+        los_matrix.dirty = False
+      last_saved = now
+    if los_matrix.pending and not error:
+      await asyncio.sleep(0)
+    else:
+      await asyncio.sleep(max(1.0, LOS_MATRIX_INTERVAL))
+
+
+@app.get("/los/matrix")
+def line_of_sight_matrix(request: Request, device_id: Optional[str] = None):
+  _require_prod_token(request)
+  if not LOS_MATRIX_ENABLED:
+    raise HTTPException(status_code=404, detail="los matrix disabled")
+  if device_id is not None and device_id not in los_matrix.repeaters:
+    raise HTTPException(status_code=404, detail="unknown repeater")
+  pairs = los_matrix.rows(device_id)
+  ids = {device_id} if device_id is not None else set(los_matrix.repeaters)
+  for pair in pairs:
+    ids.add(pair["a"])
+    ids.add(pair["b"])
+  repeaters = {}
+  for repeater_id in ids:
+    lat, lon = los_matrix.repeaters[repeater_id]
+    device = devices.get(repeater_id)
+    repeaters[repeater_id] = {
+      "lat": lat,
+      "lon": lon,
+      "name": (device.name if device else None) or device_names.get(repeater_id),
+    }
+  return {
+    "ok": True,
+    "model": los_matrix.model,
+    "max_distance_km": round(los_matrix.max_m / 1000.0, 3),
+    "updated_at": los_matrix.updated_at,
+    "pending": len(los_matrix.pending) + los_matrix.in_flight,
+    "repeaters": repeaters,
+    "pairs": pairs,
+  }
+
+
+# =========================
+# Propagation rasters
+# =========================
+propagation_cache = TileCache(PROPAGATION_CACHE_SIZE)
+propagation_pool: Optional[ProcessPoolExecutor] = None
+_propagation_inflight: Dict[str, asyncio.Future] = {}
+propagation_renders = 0
+
+
+def _propagation_pool() -> ProcessPoolExecutor:
+  # Spawned, not forked: this process runs the MQTT thread and the event loop.
+  # Each worker opens its own DEM tile store.
+  global propagation_pool
+  if propagation_pool is None:
+    propagation_pool = ProcessPoolExecutor(
+      max_workers=max(1, PROPAGATION_WORKERS),
+      mp_context=multiprocessing.get_context("spawn"),
+      initializer=init_worker,
+      initargs=(DEM_DIR, DEM_MAX_OPEN_TILES),
+    )
+  return propagation_pool
+
+
+@app.post("/propagation/render")
+async def propagation_render(request: Request):
+  _require_prod_token(request)
+  if not PROPAGATION_ENABLED:
+    raise HTTPException(status_code=404, detail="propagation disabled")
+  try:
+    body = await request.json()
+  except ValueError:
+    raise HTTPException(status_code=400, detail="invalid_json")
+  params, error = parse_render_request(body, max(1, PROPAGATION_MAX_ORIGINS), PROPAGATION_MAX_RANGE_KM * 1000.0)
+  if error:
+    raise HTTPException(status_code=400, detail=error)
+  if params["terrain"] and not DEM_DIR:
+    raise HTTPException(status_code=400, detail="terrain_requires_dem")
+  grid = raster_grid(params)
+  if grid["rows"] * grid["cols"] > PROPAGATION_MAX_CELLS:
+    raise HTTPException(status_code=400, detail="too_many_cells")
+
+  # Keyed by the normalized origin set + parameters, so every client asking
+  # for the same render shares one computation and one cached raster.
+  key = render_key(params)
+  blob = propagation_cache.get(("bin", key))
+  cached = blob is not None
+  if blob is None:
+    started = time.perf_counter()
+
+    def _rendered(result: bytes) -> None:
+      global propagation_renders
+      propagation_cache.put(("bin", key), result)
+      propagation_renders += 1
+      print(
+        f"[propagation] rendered {key} {grid['cols']}x{grid['rows']} "
+        f"origins={len(params['origins'])} samples~{estimate_samples(params, grid)} "
+        f"in {time.perf_counter() - started:.2f}s"
+      )
+
+    future = _shared_render(
+      _propagation_inflight,
+      key,
+      lambda: asyncio.get_running_loop().run_in_executor(_propagation_pool(), render_raster, params),
+      _rendered,
+    )
+    blob = await asyncio.shield(future)
+  return {
+    "ok": True,
+    "key": key,
+    "cached": cached,
+    **raster_meta(blob),
+    "png": f"/propagation/raster/{key}.png",
+    "bin": f"/propagation/raster/{key}.bin",
+  }
+
+
+async def _raster_response(cache: TileCache, key: str, fmt: str) -> Response:
+  if fmt not in ("png", "bin"):
+    raise HTTPException(status_code=404, detail="unknown format")
+  blob = cache.get(("bin", key))
+  if blob is None:
+    raise HTTPException(status_code=404, detail="raster expired")
+  if fmt == "png":
+    body = cache.get(("png", key))
+    if body is None:
+      body = await asyncio.to_thread(raster_png, blob)
+      cache.put(("png", key), body)
+    media_type = "image/png"
+  else:
+    body = blob
+    media_type = "application/octet-stream"
+  return Response(content=body, media_type=media_type, headers={"Cache-Control": "private, max-age=3600"})
+
+
+@app.get("/propagation/raster/{key}.{fmt}")
+async def propagation_raster(key: str, fmt: str, request: Request):
+  _require_prod_token(request)
+  return await _raster_response(propagation_cache, key, fmt)
+
+
+# =========================
+# Viewsheds
+# =========================
+viewshed_cache = TileCache(VIEWSHED_CACHE_SIZE * 2)
+# (device id, height, radius, target height, grid step) -> (key, lat, lon)
+# of the last render for that node, so a node that moved drops its raster.
+_viewshed_nodes: "OrderedDict[Tuple[Any, ...], Tuple[str, float, float]]" = OrderedDict()
+_viewshed_inflight: Dict[str, asyncio.Future] = {}
+viewshed_renders = 0
+
+
+@app.get("/viewshed")
+async def viewshed(
+  request: Request,
+  device_id: Optional[str] = None,
+  lat: Optional[float] = None,
+  lon: Optional[float] = None,
+  height: float = 10.0,
+  radius_km: float = 10.0,
+  target_height: float = 2.0,
+  grid_step: float = 90.0,
+):
+  _require_prod_token(request)
+  if not VIEWSHED_ENABLED:
+    raise HTTPException(status_code=404, detail="viewshed disabled")
+  if not DEM_DIR:
+    raise HTTPException(status_code=400, detail="viewshed_requires_dem")
+  if device_id:
+    observer, error = _los_endpoint(device_id)
+  else:
+    observer, error = _los_endpoint([lat, lon])
+  if error:
+    raise HTTPException(status_code=400, detail=error)
+  values = [height, radius_km, target_height, grid_step]
+  if not all(math.isfinite(value) for value in values) or min(values) < 0:
+    raise HTTPException(status_code=400, detail="invalid_params")
+  radius_m = round(radius_km * 1000.0)
+  if radius_m <= 0:
+    raise HTTPException(status_code=400, detail="invalid_params")
+  if radius_m > VIEWSHED_MAX_RADIUS_KM * 1000.0:
+    raise HTTPException(status_code=400, detail="radius_too_large")
+
+  height = round(min(10000.0, height), 1)
+  target_height = round(min(10000.0, target_height), 1)
+  grid_step = round(min(5000.0, max(30.0, grid_step)), 1)
+  node_key = (device_id, height, radius_m, target_height, grid_step) if device_id else None
+  known = _viewshed_nodes.get(node_key) if node_key else None
+  if known is not None:
+    if _haversine_m(known[1], known[2], observer[0], observer[1]) <= VIEWSHED_MOVE_METERS:
+      # Small GPS jitter keeps the cached render.
+      observer = (known[1], known[2])
+    else:
+      viewshed_cache.discard(("bin", known[0]))
+      viewshed_cache.discard(("png", known[0]))
+  params = {
+    "lat": round(observer[0], 6),
+    "lon": round(observer[1], 6),
+    "height": height,
+    "target_height": target_height,
+    "radius_m": radius_m,
+    "grid_step": grid_step,
+    "k_factor": LOS_K_FACTOR,
+  }
+  grid = viewshed_grid(params)
+  if grid["rows"] * grid["cols"] > PROPAGATION_MAX_CELLS:
+    raise HTTPException(status_code=400, detail="too_many_cells")
+
+  key = render_key(params)
+  if node_key:
+    _viewshed_nodes[node_key] = (key, params["lat"], params["lon"])
+    _viewshed_nodes.move_to_end(node_key)
+    while len(_viewshed_nodes) > max(1, VIEWSHED_CACHE_SIZE):
+      _viewshed_nodes.popitem(last=False)
+  blob = viewshed_cache.get(("bin", key))
+  cached = blob is not None
+  if blob is None:
+    started = time.perf_counter()
+
+    def _rendered(result: bytes) -> None:
+      global viewshed_renders
+      viewshed_cache.put(("bin", key), result)
+      viewshed_renders += 1
+      print(
+        f"[viewshed] rendered {key} {grid['cols']}x{grid['rows']} "
+        f"radius={radius_m}m in {time.perf_counter() - started:.2f}s"
+      )
+
+    # Shares the propagation process pool (and its per-process DEM store).
+    future = _shared_render(
+      _viewshed_inflight,
+      key,
+      lambda: asyncio.get_running_loop().run_in_executor(_propagation_pool(), render_viewshed, params),
+      _rendered,
+    )
+    blob = await asyncio.shield(future)
+  meta = raster_meta(blob)
+  return {
+    "ok": True,
+    "key": key,
+    "cached": cached,
+    "device_id": device_id,
+    "observer": {"lat": params["lat"], "lon": params["lon"], "height": height},
+    "radius_m": radius_m,
+    "visible_km2": round(meta["coveredCells"] * grid_step * grid_step / 1e6, 3),
+    **meta,
+    "png": f"/viewshed/raster/{key}.png",
+    "bin": f"/viewshed/raster/{key}.bin",
+  }
+
+
+@app.get("/viewshed/raster/{key}.{fmt}")
+async def viewshed_raster(key: str, fmt: str, request: Request):
+  _require_prod_token(request)
+  return await _raster_response(viewshed_cache, key, fmt)
 
 
 @app.get("/coverage")
@@ -1485,16 +2350,114 @@ async def ws_endpoint(ws: WebSocket):
     clients.discard(ws)
 
 
+# =========================
+# Playback
+# =========================
+playback_sessions: Set[PlaybackSession] = set()
+
+
+def _parse_float(value: Any, default: float) -> float:
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return default
+
+
+async def _playback_commands(ws: WebSocket, session: PlaybackSession) -> None:
+  try:
+    while not session.closed:
+      try:
+        msg = json.loads(await ws.receive_text())
+      except ValueError:
+        continue
+      if not isinstance(msg, dict):
+        continue
+      action = msg.get("action")
+      if action == "pause":
+        session.pause()
+      elif action in ("play", "resume"):
+        session.resume()
+      elif action == "seek":
+        session.seek(_parse_float(msg.get("ts"), session.clock()))
+      elif action == "speed":
+        session.set_speed(_parse_float(msg.get("value"), session.speed))
+      elif action == "stop":
+        break
+  except (WebSocketDisconnect, RuntimeError):
+    pass
+  finally:
+    session.close()
+
+
+@app.websocket("/ws/playback")
+async def ws_playback(ws: WebSocket):
+  await ws.accept()
+  if not _ws_authorized(ws):
+    await ws.close(code=1008)
+    return
+  if not PLAYBACK_ENABLED or not ROUTE_HISTORY_ENABLED or len(playback_sessions) >= PLAYBACK_MAX_SESSIONS:
+    await ws.close(code=1013)
+    return
+  now = time.time()
+  hours = _parse_float(ws.query_params.get("hours"), 1.0)
+  hours = max(0.0, min(hours, ROUTE_HISTORY_HOURS))
+  start = _parse_float(ws.query_params.get("start"), now - hours * 3600)
+  start = max(now - ROUTE_HISTORY_HOURS * 3600, min(start, now))
+  speed = _parse_float(ws.query_params.get("speed"), 10.0)
+  session = PlaybackSession(_iter_history_segments, start, now, speed, PLAYBACK_MAX_SPEED)
+  playback_sessions.add(session)
+
+  async def send(payload: Dict[str, Any]) -> None:
+    await ws.send_text(json.dumps(payload))
+
+  commands = asyncio.create_task(_playback_commands(ws, session))
+  try:
+    await session.run(send)
+  except (WebSocketDisconnect, RuntimeError):
+    pass
+  finally:
+    session.close()
+    commands.cancel()
+    playback_sessions.discard(session)
+    try:
+      await ws.close()
+    except Exception:
+      pass
+
+
 # =========================
 # Startup / Shutdown
 # =========================
+async def _history_loader(until: float, end: Optional[Dict[str, Tuple[int, int]]]) -> None:
+  await _load_route_history_background(until, end)
+  if not route_history_edges or not clients:
+    return
+  payload = json.dumps({
+    "type": "history_edges",
+    "edges": [_history_edge_payload(e) for e in route_history_edges.values()],
+  })
+  dead = []
+  for ws in list(clients):
+    try:
+      await ws.send_text(payload)
+    except Exception:
+      dead.append(ws)
+  for ws in dead:
+    clients.discard(ws)
+
+
 @app.on_event("startup")
 async def startup():
   global mqtt_client
 
+  # The legacy single file is split first so SQLite's first-start import sees all of it.
+  _migrate_route_history_file()
+  _sqlite_init(_sqlite_file_import)
   _load_state()
-  _load_route_history()
-  _ensure_node_decoder()
+  state.elevation_cache.load()
+  # Everything recorded after this point is live; the background loader only reads older history.
+  history_until = time.time()
+  history_end = _route_history_file_bounds()
 
   loop = asyncio.get_event_loop()
   transport = "websockets" if MQTT_TRANSPORT == "websockets" else "tcp"
@@ -1533,10 +2496,17 @@ async def startup():
   mqtt_client.connect_async(MQTT_HOST, MQTT_PORT, keepalive=30)
   mqtt_client.loop_start()
 
+  asyncio.create_task(_history_loader(history_until, history_end))
+  asyncio.create_task(asyncio.to_thread(_ensure_node_decoder))
   asyncio.create_task(broadcaster())
   asyncio.create_task(reaper())
+  asyncio.create_task(memory_governor())
   asyncio.create_task(_state_saver())
   asyncio.create_task(_route_history_saver())
+  asyncio.create_task(_sqlite_writer())
+  asyncio.create_task(_route_history_writer())
+  if LOS_MATRIX_ENABLED:
+    asyncio.create_task(_los_matrix_worker())
 
 
 @app.on_event("shutdown")
@@ -1549,3 +2519,20 @@ async def shutdown():
     except Exception:
       pass
     mqtt_client = None
+  _close_route_history_writer()
+  if state.history_load.get("state") == "ready":
+    _write_route_history_checkpoint()
+    _write_history_buckets_checkpoint()
+  if HISTORY_ROLLUP_ENABLED:
+    state.history_rollups.flush()
+  if LOS_MATRIX_ENABLED and los_matrix.dirty:
+    _write_los_matrix_checkpoint()
+  await state.elevation_client.close()
+  state.elevation_cache.flush()
+  if state.dem_store is not None:
+    state.dem_store.close()
+  if propagation_pool is not None:
+    propagation_pool.shutdown(wait=False, cancel_futures=True)
+  if tile_pool is not None:
+    tile_pool.shutdown(wait=False, cancel_futures=True)
+  _sqlite_close()
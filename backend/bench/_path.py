@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run as `python bench/<name>.py` from backend/; backend modules (and the
+# test reference implementations) import as top-level modules.
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, "tests"))
@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import _path  # noqa: F401
+from logwriter import BufferedLogWriter
+
+# Route history appends: open/append/close per routed packet (the old path)
+# vs BufferedLogWriter, whose enqueue is all the event loop pays for, plus a
+# flood where a background flusher drains the queue like _route_history_writer.
+#   python bench/bench_logwriter.py [directory]   (defaults to a temp dir)
+ROUTES = 20000
+HOPS = 4
+BATCH = 256
+FLUSH_INTERVAL = 1.0
+
+
+def _routes():
+  rng = random.Random(34)
+  nodes = [(42 + rng.random(), -71 + rng.random(), f"{i:064x}") for i in range(300)]
+  routes = []
+  for i in range(ROUTES):
+    path = rng.sample(nodes, HOPS + 1)
+    routes.append([
+      {
+        "ts": 1760860000.0 + i, "a": [a[0], a[1]], "b": [b[0], b[1]], "a_id": a[2], "b_id": b[2],
+        "message_hash": f"{i:016x}", "payload_type": 2, "origin_id": path[0][2], "receiver_id": path[-1][2],
+        "route_mode": "path", "topic": "meshcore/BOS/x/packets",
+      }
+      for a, b in zip(path, path[1:])
+    ])
+  return routes
+
+
+def _old_append(path: str, entries) -> None:
+  with open(path, "a", encoding="utf-8") as handle:
+    for entry in entries:
+      handle.write(json.dumps(entry) + "\n")
+
+
+def _lines(path: str) -> int:
+  with open(path, "rb") as handle:
+    return sum(1 for _ in handle)
+
+
+def main(directory: str) -> None:
+  routes = _routes()
+  path = os.path.join(directory, "route_history.jsonl")
+
+  started = time.perf_counter()
+  for entries in routes:
+    _old_append(path, entries)
+  old = time.perf_counter() - started
+  assert _lines(path) == ROUTES * HOPS
+  os.remove(path)
+
+  writer = BufferedLogWriter(lambda record: path, BATCH, 0)
+  started = time.perf_counter()
+  for entries in routes:
+    writer.append(entries)
+  enqueue = time.perf_counter() - started
+  started = time.perf_counter()
+  writer.flush()
+  flush = time.perf_counter() - started
+  writer.close()
+  assert _lines(path) == ROUTES * HOPS
+  os.remove(path)
+
+  # Flood: producer enqueues, a thread flushes on batch-full or interval.
+  writer = BufferedLogWriter(lambda record: path, BATCH, 0)
+  wake = threading.Event()
+  done = threading.Event()
+
+  def flusher():
+    while not done.is_set():
+      wake.wait(FLUSH_INTERVAL)
+      wake.clear()
+      writer.flush()
+
+  thread = threading.Thread(target=flusher)
+  thread.start()
+  latencies = []
+  started = time.perf_counter()
+  for entries in routes:
+    t = time.perf_counter()
+    if writer.append(entries):
+      wake.set()
+    latencies.append(time.perf_counter() - t)
+  done.set()
+  wake.set()
+  thread.join()
+  writer.close()
+  flood = time.perf_counter() - started
+  assert _lines(path) == ROUTES * HOPS
+  latencies.sort()
+
+  lines = ROUTES * HOPS
+  print(f"{ROUTES} routes x {HOPS} segments in {directory}")
+  print(f"  open/append/close:  {old / ROUTES * 1e6:.2f} us/route on the loop, {lines / old:,.0f} lines/s")
+  print(f"  buffered enqueue:   {enqueue / ROUTES * 1e6:.2f} us/route on the loop (+{flush / ROUTES * 1e6:.2f} us/route amortized flush, off the loop)")
+  print(
+    f"  buffered flood:     {lines / flood:,.0f} lines/s, {writer.flushes} flushes, "
+    f"enqueue p50 {latencies[len(latencies) // 2] * 1e6:.2f} us p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.2f} us"
+  )
+
+
+if __name__ == "__main__":
+  import sys
+
+  if len(sys.argv) > 1:
+    main(sys.argv[1])
+  else:
+    directory = tempfile.mkdtemp(prefix="bench_logwriter")
+    try:
+      main(directory)
+    finally:
+      shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,55 @@
+import math
+import random
+import time
+
+import _path  # noqa: F401
+import los
+import los_reference
+
+# Blocked /los relay search + peaks, pure-Python reference vs NumPy, at
+# sample counts up to LOS_SAMPLE_MAX=2000.
+#   python bench/bench_los.py [--no-reference]
+SAMPLES = (80, 500, 1000, 2000)
+
+
+def _profiles(n: int):
+  rng = random.Random(n)
+  points = [(40.0 + i * 1e-4, -71.0, i / (n - 1)) for i in range(n)]
+  # Two ridges and a valley: no sample sees both ends.
+  no_clear = [100 + 250 * math.exp(-((i / n - 0.3) * 12) ** 2) + 250 * math.exp(-((i / n - 0.7) * 12) ** 2) + rng.uniform(-1, 1) for i in range(n)]
+  # A peak with concave-up flanks: its top sees both ends.
+  mid = n // 2
+  clear = [100 + 300 * (1 - abs(i - mid) / mid) ** 3 for i in range(n)]
+  return points, {"no clear relay": no_clear, "clear relay exists": clear}
+
+
+def _time(fn, repeat: int) -> float:
+  started = time.perf_counter()
+  for _ in range(repeat):
+    fn()
+  return (time.perf_counter() - started) / repeat * 1000.0
+
+
+def main(reference: bool) -> None:
+  print(f"{'samples':>8} {'profile':>20} {'reference ms':>14} {'numpy ms':>10}")
+  for n in SAMPLES:
+    points, profiles = _profiles(n)
+    for name, elev in profiles.items():
+      t, arr = los._los_arrays(points, elev)
+
+      def new():
+        los._find_los_suggestion(points, t, arr)
+        los._find_los_peaks(points, arr, 10000.0)
+
+      def old():
+        los_reference.find_los_suggestion(points, elev)
+        los_reference.find_los_peaks(points, elev, 10000.0, los.LOS_PEAKS_MAX)
+
+      old_ms = f"{_time(old, 1):14.1f}" if reference else f"{'-':>14}"
+      print(f"{n:>8} {name:>20} {old_ms} {_time(new, 20):10.2f}")
+
+
+if __name__ == "__main__":
+  import sys
+
+  main("--no-reference" not in sys.argv)
@@ -0,0 +1,52 @@
+import random
+import time
+
+import _path  # noqa: F401
+import decoder
+from state import DeviceState, devices
+
+# Node-hash index upkeep at 10k devices under evict/insert churn: a full
+# _rebuild_node_hash_map() per change (the old path) vs _index_node_hash /
+# _unindex_node_hash.
+#   python bench/bench_node_hash.py
+DEVICES = 10000
+CHURN = 5000
+
+
+def _device_id(rng: random.Random) -> str:
+  return "".join(rng.choice("0123456789ABCDEF") for _ in range(64))
+
+
+def _churn(rng: random.Random, rebuild: bool) -> float:
+  elapsed = 0.0
+  for _ in range(CHURN):
+    old = next(iter(devices))
+    new = _device_id(rng)
+    started = time.perf_counter()
+    devices.pop(old)
+    devices[new] = DeviceState(device_id=new, lat=42.0, lon=-71.0, ts=0.0)
+    if rebuild:
+      decoder._rebuild_node_hash_map()
+    else:
+      decoder._unindex_node_hash(old)
+      decoder._index_node_hash(new)
+    elapsed += time.perf_counter() - started
+  return elapsed / CHURN
+
+
+def main() -> None:
+  rng = random.Random(28)
+  devices.clear()
+  for _ in range(DEVICES):
+    device_id = _device_id(rng)
+    devices[device_id] = DeviceState(device_id=device_id, lat=42.0, lon=-71.0, ts=0.0)
+  decoder._rebuild_node_hash_map()
+  rebuild = _churn(rng, True)
+  incremental = _churn(rng, False)
+  print(f"{DEVICES} devices, {CHURN} evict+insert changes")
+  print(f"  full rebuild per change: {rebuild * 1000:.2f} ms")
+  print(f"  incremental per change:  {incremental * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+  main()
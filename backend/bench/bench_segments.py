@@ -0,0 +1,111 @@
+import gc
+import random
+import time
+import tracemalloc
+from collections import deque
+
+import _path  # noqa: F401
+from segments import HistorySegmentStore
+
+# Route history segment container at 200k segments (50k routes x 4 hops):
+# the old deque of dicts + per-edge count dict vs HistorySegmentStore.
+# Memory is tracemalloc'd container growth; prune pops the 100k oldest
+# segments and releases their edges.
+#   python bench/bench_segments.py
+ROUTES = 50000
+HOPS = 4
+NODES = 600
+PRUNE = 100000
+
+
+def _routes():
+  rng = random.Random(31)
+  nodes = [(rng.randrange(41_000_000, 44_000_000), rng.randrange(-73_000_000, -70_000_000)) for _ in range(NODES)]
+  ids = [f"{rng.getrandbits(256):064x}" for _ in range(NODES)]
+  routes = []
+  for i in range(ROUTES):
+    path = rng.sample(range(NODES), HOPS + 1)
+    routes.append((1000.0 + i, [(nodes[n], ids[n]) for n in path], f"{rng.getrandbits(32):08x}"))
+  return routes
+
+
+def _old_key(a, b) -> str:
+  return f"{round(a[0], 6)},{round(a[1], 6)}|{round(b[0], 6)},{round(b[1], 6)}"
+
+
+def _build_old(routes):
+  segments = deque()
+  edges = {}
+  for ts, hops, message_hash in routes:
+    for (a, a_id), (b, b_id) in zip(hops, hops[1:]):
+      pa = [a[0] / 1e6, a[1] / 1e6]
+      pb = [b[0] / 1e6, b[1] / 1e6]
+      segments.append({
+        "ts": ts, "a": pa, "b": pb, "a_id": a_id, "b_id": b_id, "message_hash": message_hash,
+        "payload_type": 4, "origin_id": hops[0][1], "receiver_id": hops[-1][1],
+        "route_mode": "path", "topic": "meshcore/packets",
+      })
+      key = _old_key(pa, pb)
+      edges[key] = edges.get(key, 0) + 1
+  return segments, edges
+
+
+def _prune_old(segments, edges) -> None:
+  for _ in range(PRUNE):
+    entry = segments.popleft()
+    key = _old_key(entry["a"], entry["b"])
+    edges[key] -= 1
+    if edges[key] <= 0:
+      del edges[key]
+
+
+def _build_new(routes):
+  store = HistorySegmentStore()
+  for ts, hops, message_hash in routes:
+    for (a, a_id), (b, b_id) in zip(hops, hops[1:]):
+      store.append(ts, a, b, a_id, b_id, message_hash, 4, hops[0][1], hops[-1][1], "path", "meshcore/packets")
+  return store
+
+
+def _prune_new(store) -> None:
+  for _ in range(PRUNE):
+    store.popleft()
+
+
+def _measure(build, routes):
+  gc.collect()
+  tracemalloc.start()
+  base = tracemalloc.get_traced_memory()[0]
+  built = build(routes)
+  size = tracemalloc.get_traced_memory()[0] - base
+  tracemalloc.stop()
+  # Timed again without tracemalloc, which slows allocation-heavy code.
+  del built
+  gc.collect()
+  started = time.perf_counter()
+  built = build(routes)
+  return built, size, time.perf_counter() - started
+
+
+def main() -> None:
+  routes = _routes()
+  segments = ROUTES * HOPS
+  (old_segments, old_edges), old_bytes, old_build = _measure(_build_old, routes)
+  store, new_bytes, new_build = _measure(_build_new, routes)
+  assert len(old_segments) == len(store) == segments
+  assert len(old_edges) == store.edge_count()
+  print(f"{segments} segments, {store.edge_count()} edges")
+  print(f"  memory:  deque of dicts {old_bytes / 1e6:.1f} MB, columnar {new_bytes / 1e6:.1f} MB (store estimate {store.nbytes() / 1e6:.1f} MB)")
+  print(f"  build:   {old_build / segments * 1e6:.2f} -> {new_build / segments * 1e6:.2f} us/segment")
+  started = time.perf_counter()
+  _prune_old(old_segments, old_edges)
+  old_prune = time.perf_counter() - started
+  started = time.perf_counter()
+  _prune_new(store)
+  new_prune = time.perf_counter() - started
+  assert len(old_edges) == store.edge_count()
+  print(f"  prune {PRUNE} oldest: {old_prune / PRUNE * 1e6:.2f} -> {new_prune / PRUNE * 1e6:.2f} us/segment")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,220 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from spatial import Bounds, EdgeGridIndex
+
+
+class EdgeBucketAggregator:
+  # Edge counts pre-aggregated into fixed time buckets: fine buckets for the
+  # recent past, rolled up into coarse (hourly) buckets, dropped after retention.
+  # Window queries sum buckets; the sum over closed buckets is cached per window
+  # and only the open bucket is added per request. A grid index over edge
+  # geometry lets bbox queries touch only the edges on screen.
+
+  def __init__(
+    self,
+    bucket_seconds: float,
+    fine_seconds: float,
+    retention_seconds: float,
+    cell_degrees: float = 0.25,
+    rollup_seconds: float = 3600.0,
+  ) -> None:
+    self.bucket_seconds = max(60.0, float(bucket_seconds))
+    self.rollup_seconds = max(self.bucket_seconds, float(rollup_seconds))
+    self.fine_seconds = max(self.bucket_seconds, float(fine_seconds))
+    self.retention_seconds = max(self.fine_seconds, float(retention_seconds))
+    # bucket index -> edge key -> count
+    self._fine: Dict[int, Dict[str, int]] = {}
+    self._coarse: Dict[int, Dict[str, int]] = {}
+    self._last_ts: Dict[str, float] = {}
+    self._geo: Dict[str, Tuple[List[float], List[float]]] = {}
+    self._index = EdgeGridIndex(cell_degrees)
+    self._generation = 0
+    self._rolled_at = -1
+    self._cache: Dict[int, Tuple[Tuple[int, int], Dict[str, int]]] = {}
+    self._lock = threading.Lock()
+    self.loaded_until = 0.0
+    self.cache_hits = 0
+    self.cache_misses = 0
+
+  def _fine_index(self, ts: float) -> int:
+    return int(ts // self.bucket_seconds)
+
+  def _coarse_index(self, ts: float) -> int:
+    return int(ts // self.rollup_seconds)
+
+  def _coarse_end(self, ts: float) -> float:
+    return (self._coarse_index(ts) + 1) * self.rollup_seconds
+
+  def _fine_floor(self, current: int) -> float:
+    return (current + 1) * self.bucket_seconds - self.fine_seconds
+
+  def add(self, key: str, a: List[float], b: List[float], ts: float, now: Optional[float] = None) -> None:
+    now = time.time() if now is None else now
+    if ts < now - self.retention_seconds:
+      return
+    with self._lock:
+      current = self._fine_index(now)
+      self._roll(current)
+      if self._coarse_end(ts) <= self._fine_floor(current):
+        bucket = self._coarse.setdefault(self._coarse_index(ts), {})
+      else:
+        bucket = self._fine.setdefault(self._fine_index(ts), {})
+      bucket[key] = bucket.get(key, 0) + 1
+      if self._fine_index(ts) != current:
+        # Late data lands in a closed bucket, so cached window sums are stale.
+        self._generation += 1
+      if ts > self._last_ts.get(key, 0.0):
+        self._last_ts[key] = float(ts)
+      if key not in self._geo:
+        self._geo[key] = (list(a), list(b))
+        self._index.add(key, a, b)
+
+  def _roll(self, current: int) -> None:
+    if current == self._rolled_at:
+      return
+    self._rolled_at = current
+    # Only whole coarse buckets roll up, so windows within the fine span never touch coarse data.
+    fine_floor = self._fine_floor(current)
+    moved = False
+    for idx in [idx for idx in self._fine if self._coarse_end(idx * self.bucket_seconds) <= fine_floor]:
+      target = self._coarse.setdefault(self._coarse_index(idx * self.bucket_seconds), {})
+      for key, count in self._fine.pop(idx).items():
+        target[key] = target.get(key, 0) + count
+      moved = True
+    coarse_floor = self._coarse_index((current + 1) * self.bucket_seconds - self.retention_seconds)
+    expired = [idx for idx in self._coarse if idx < coarse_floor]
+    for idx in expired:
+      del self._coarse[idx]
+    if expired:
+      live = set()
+      for bucket in self._fine.values():
+        live.update(bucket)
+      for bucket in self._coarse.values():
+        live.update(bucket)
+      for key in [key for key in self._geo if key not in live]:
+        self._geo.pop(key, None)
+        self._last_ts.pop(key, None)
+        self._index.remove(key)
+    if moved or expired:
+      self._generation += 1
+      self._cache.clear()
+
+  def _closed_sums(self, window_seconds: int, current: int) -> Dict[str, int]:
+    cache_key = (self._generation, current)
+    cached = self._cache.get(window_seconds)
+    if cached and cached[0] == cache_key:
+      self.cache_hits += 1
+      return cached[1]
+    self.cache_misses += 1
+    start = (current + 1) * self.bucket_seconds - window_seconds
+    sums: Dict[str, int] = {}
+    for idx, bucket in self._fine.items():
+      if idx == current or (idx + 1) * self.bucket_seconds <= start:
+        continue
+      for key, count in bucket.items():
+        sums[key] = sums.get(key, 0) + count
+    for idx, bucket in self._coarse.items():
+      if (idx + 1) * self.rollup_seconds <= start:
+        continue
+      for key, count in bucket.items():
+        sums[key] = sums.get(key, 0) + count
+    self._cache[window_seconds] = (cache_key, sums)
+    return sums
+
+  def window(
+    self,
+    window_seconds: float,
+    now: Optional[float] = None,
+    bounds: Optional[Bounds] = None,
+    min_count: int = 1,
+  ) -> List[Dict[str, Any]]:
+    now = time.time() if now is None else now
+    window_seconds = int(min(max(self.bucket_seconds, window_seconds), self.retention_seconds))
+    with self._lock:
+      current = self._fine_index(now)
+      self._roll(current)
+      sums = self._closed_sums(window_seconds, current)
+      open_bucket = self._fine.get(current) or {}
+      if bounds is None:
+        counts = dict(sums)
+        for key, count in open_bucket.items():
+          counts[key] = counts.get(key, 0) + count
+      else:
+        counts = {}
+        for key in self._index.query(bounds):
+          count = sums.get(key, 0) + open_bucket.get(key, 0)
+          if count:
+            counts[key] = count
+      edges = []
+      for key, count in counts.items():
+        geo = self._geo.get(key)
+        if not geo or count <= 0 or count < min_count:
+          continue
+        edges.append({
+          "id": key,
+          "a": geo[0],
+          "b": geo[1],
+          "count": count,
+          "last_ts": self._last_ts.get(key),
+        })
+    return edges
+
+  def export(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        "bucket_seconds": self.bucket_seconds,
+        "rollup_seconds": self.rollup_seconds,
+        "fine": {idx: dict(bucket) for idx, bucket in self._fine.items()},
+        "coarse": {idx: dict(bucket) for idx, bucket in self._coarse.items()},
+        "last_ts": dict(self._last_ts),
+        "geo": {key: [geo[0], geo[1]] for key, geo in self._geo.items()},
+        "saved_until": time.time(),
+      }
+
+  def restore(self, body: Dict[str, Any]) -> bool:
+    if body.get("bucket_seconds") != self.bucket_seconds or body.get("rollup_seconds") != self.rollup_seconds:
+      return False
+    with self._lock:
+      # Merge rather than replace: live segments may already have landed here.
+      for table, saved in ((self._fine, body.get("fine")), (self._coarse, body.get("coarse"))):
+        for idx, bucket in (saved or {}).items():
+          target = table.setdefault(int(idx), {})
+          for key, count in bucket.items():
+            target[key] = target.get(key, 0) + int(count)
+      for key, ts in (body.get("last_ts") or {}).items():
+        if ts > self._last_ts.get(key, 0.0):
+          self._last_ts[key] = float(ts)
+      for key, geo in (body.get("geo") or {}).items():
+        if key not in self._geo:
+          self._geo[key] = (list(geo[0]), list(geo[1]))
+          self._index.add(key, geo[0], geo[1])
+      self.loaded_until = float(body.get("saved_until") or 0.0)
+      self._generation += 1
+      self._rolled_at = -1
+      self._cache.clear()
+    return True
+
+  def approx_bytes(self) -> int:
+    with self._lock:
+      cells = sum(len(bucket) for bucket in self._fine.values()) + sum(len(bucket) for bucket in self._coarse.values())
+      edges = len(self._geo)
+    # dict slot + shared key + small int per cell; geometry/last_ts per edge.
+    return cells * 100 + edges * 420
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      cells = sum(len(bucket) for bucket in self._fine.values()) + sum(len(bucket) for bucket in self._coarse.values())
+      return {
+        "bucket_seconds": self.bucket_seconds,
+        "rollup_seconds": self.rollup_seconds,
+        "retention_seconds": self.retention_seconds,
+        "fine_buckets": len(self._fine),
+        "coarse_buckets": len(self._coarse),
+        "cells": cells,
+        "edges": len(self._geo),
+        "cache_hits": self.cache_hits,
+        "cache_misses": self.cache_misses,
+        "index": self._index.stats(),
+      }
@@ -0,0 +1,81 @@
+import marshal
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+# =========================
+# Binary checkpoints
+# =========================
+# Layout: fixed header + marshal body. marshal only round-trips plain
+# containers/scalars, which is all we store here, and loads far faster than JSON.
+CHECKPOINT_MAGIC = b"MMCP"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct("<4sHHdII")
+
+KIND_STATE = 1
+KIND_HISTORY = 2
+KIND_BUCKETS = 3
+KIND_LOS_MATRIX = 4
+
+
+def _write_checkpoint(path: str, kind: int, body: Dict[str, Any]) -> bool:
+  try:
+    blob = marshal.dumps(body)
+  except ValueError as exc:
+    print(f"[checkpoint] unserializable body for {path}: {exc}")
+    return False
+  header = CHECKPOINT_HEADER.pack(
+    CHECKPOINT_MAGIC,
+    CHECKPOINT_VERSION,
+    kind,
+    time.time(),
+    len(blob),
+    zlib.crc32(blob),
+  )
+  try:
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as handle:
+      handle.write(header)
+      handle.write(blob)
+    os.replace(tmp_path, path)
+  except Exception as exc:
+    print(f"[checkpoint] failed to write {path}: {exc}")
+    return False
+  return True
+
+
+def _read_checkpoint(path: str, kind: int) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+  if not path or not os.path.exists(path):
+    return None, None
+  try:
+    with open(path, "rb") as handle:
+      size = os.fstat(handle.fileno()).st_size
+      if size < CHECKPOINT_HEADER.size:
+        return None, None
+      with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        magic, version, file_kind, saved_at, length, crc = CHECKPOINT_HEADER.unpack_from(mapped, 0)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION or file_kind != kind:
+          return None, None
+        start = CHECKPOINT_HEADER.size
+        if start + length > size:
+          return None, None
+        view = memoryview(mapped)[start:start + length]
+        try:
+          if zlib.crc32(view) != crc:
+            print(f"[checkpoint] checksum mismatch in {path}")
+            return None, None
+          body = marshal.loads(view)
+        finally:
+          view.release()
+  except Exception as exc:
+    print(f"[checkpoint] failed to read {path}: {exc}")
+    return None, None
+  if not isinstance(body, dict):
+    return None, None
+  return body, saved_at
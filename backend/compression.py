@@ -0,0 +1,126 @@
+import gzip
+import io
+import lzma
+import os
+from typing import IO, Iterator, List, Optional
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# codec -> file suffix. Every codec here decodes concatenated frames as one
+# stream, so each flush can append a self-contained frame.
+CODEC_SUFFIXES = {
+  "gzip": ".gz",
+  "lzma": ".xz",
+  "zstd": ".zst",
+}
+
+
+def resolve_codec(name: str) -> Optional[str]:
+  codec = (name or "").strip().lower()
+  if codec in ("", "none", "off", "false", "0"):
+    return None
+  if codec in ("gz",):
+    codec = "gzip"
+  if codec in ("xz",):
+    codec = "lzma"
+  if codec not in CODEC_SUFFIXES:
+    print(f"[storage] unknown compression {name!r}; writing uncompressed")
+    return None
+  if codec == "zstd" and zstandard is None:
+    print("[storage] zstd requested but the zstandard package is not installed; using gzip")
+    return "gzip"
+  return codec
+
+
+def codec_suffix(codec: Optional[str]) -> str:
+  return CODEC_SUFFIXES.get(codec, "") if codec else ""
+
+
+def codec_for_path(path: str) -> Optional[str]:
+  for codec, suffix in CODEC_SUFFIXES.items():
+    if path.endswith(suffix):
+      return codec
+  return None
+
+
+def strip_suffix(name: str) -> str:
+  codec = codec_for_path(name)
+  return name[:-len(CODEC_SUFFIXES[codec])] if codec else name
+
+
+def compress_frame(codec: Optional[str], data: bytes) -> bytes:
+  if codec == "gzip":
+    return gzip.compress(data, compresslevel=6)
+  if codec == "lzma":
+    return lzma.compress(data, format=lzma.FORMAT_XZ, preset=1)
+  if codec == "zstd":
+    return zstandard.ZstdCompressor(level=3).compress(data)
+  return data
+
+
+def _stream(codec: Optional[str], raw: IO[bytes]) -> IO[bytes]:
+  if codec == "gzip":
+    return gzip.GzipFile(fileobj=raw, mode="rb")
+  if codec == "lzma":
+    return lzma.LZMAFile(raw, mode="rb")
+  if codec == "zstd":
+    if zstandard is None:
+      raise RuntimeError("zstandard is not installed")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+  return raw
+
+
+def iter_lines(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+  # Streams lines from a plain or compressed file. start/end are byte offsets in
+  # the file on disk; for compressed files they must fall on frame boundaries.
+  codec = codec_for_path(path)
+  with open(path, "rb") as raw:
+    if start:
+      raw.seek(start)
+    if codec is None:
+      position = start
+      for line in raw:
+        position += len(line)
+        if end is not None and position > end:
+          break
+        yield line
+      return
+    source: IO[bytes] = raw
+    if end is not None:
+      source = io.BytesIO(raw.read(max(0, end - start)))
+    try:
+      for line in _stream(codec, source):
+        yield line
+    except (EOFError, lzma.LZMAError, OSError) as exc:
+      # A frame cut off mid-write (crash, full disk): everything before it is still good.
+      print(f"[storage] stopped reading {os.path.basename(path)} at a damaged frame: {exc}")
+
+
+def path_variants(path: str) -> List[str]:
+  return [path] + [path + suffix for suffix in CODEC_SUFFIXES.values()]
+
+
+def newest_variant(path: str) -> Optional[str]:
+  # The same file may exist plain and compressed after a codec change; the newest wins.
+  best = None
+  best_mtime = -1.0
+  for candidate in path_variants(path):
+    try:
+      mtime = os.path.getmtime(candidate)
+    except OSError:
+      continue
+    if mtime > best_mtime:
+      best, best_mtime = candidate, mtime
+  return best
+
+
+def read_bytes(path: str) -> bytes:
+  return b"".join(iter_lines(path))
+
+
+def write_bytes(path: str, codec: Optional[str], data: bytes) -> None:
+  with open(path, "wb") as handle:
+    handle.write(compress_frame(codec, data))
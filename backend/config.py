@@ -22,6 +22,8 @@ MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "")
 
 STATE_DIR = os.getenv("STATE_DIR", "/data")
 STATE_FILE = os.getenv("STATE_FILE", os.path.join(STATE_DIR, "state.json"))
+# none | gzip | lzma | zstd (zstd needs the zstandard package)
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "none")
 DEVICE_ROLES_FILE = os.getenv("DEVICE_ROLES_FILE", os.path.join(STATE_DIR, "device_roles.json"))
 STATE_SAVE_INTERVAL = float(os.getenv("STATE_SAVE_INTERVAL", "5"))
 
@@ -34,12 +36,51 @@ ROUTE_HISTORY_ENABLED = os.getenv("ROUTE_HISTORY_ENABLED", "true").lower() == "t
 ROUTE_HISTORY_HOURS = float(os.getenv("ROUTE_HISTORY_HOURS", "24"))
 ROUTE_HISTORY_MAX_SEGMENTS = int(os.getenv("ROUTE_HISTORY_MAX_SEGMENTS", "40000"))
 ROUTE_HISTORY_FILE = os.getenv("ROUTE_HISTORY_FILE", os.path.join(STATE_DIR, "route_history.jsonl"))
+ROUTE_HISTORY_DIR = os.getenv("ROUTE_HISTORY_DIR", os.path.join(STATE_DIR, "route_history"))
+ROUTE_HISTORY_FILE_SECONDS = float(os.getenv("ROUTE_HISTORY_FILE_SECONDS", "3600"))
 ROUTE_HISTORY_PAYLOAD_TYPES = os.getenv("ROUTE_HISTORY_PAYLOAD_TYPES", ROUTE_PAYLOAD_TYPES)
 ROUTE_HISTORY_ALLOWED_MODES = os.getenv("ROUTE_HISTORY_ALLOWED_MODES", "path")
 ROUTE_HISTORY_COMPACT_INTERVAL = float(os.getenv("ROUTE_HISTORY_COMPACT_INTERVAL", "120"))
+ROUTE_HISTORY_FLUSH_INTERVAL = float(os.getenv("ROUTE_HISTORY_FLUSH_INTERVAL", "1"))
+ROUTE_HISTORY_FLUSH_BATCH = int(os.getenv("ROUTE_HISTORY_FLUSH_BATCH", "256"))
+ROUTE_HISTORY_FSYNC_INTERVAL = float(os.getenv("ROUTE_HISTORY_FSYNC_INTERVAL", "0"))
 HISTORY_EDGE_SAMPLE_LIMIT = 3
+HISTORY_BUCKET_SECONDS = float(os.getenv("HISTORY_BUCKET_SECONDS", "300"))
+HISTORY_BUCKET_FINE_HOURS = float(os.getenv("HISTORY_BUCKET_FINE_HOURS", "24"))
+HISTORY_BUCKET_RETENTION_HOURS = float(os.getenv("HISTORY_BUCKET_RETENTION_HOURS", "168"))
+HISTORY_INDEX_CELL_DEGREES = float(os.getenv("HISTORY_INDEX_CELL_DEGREES", "0.25"))
+HISTORY_EDGES_PAGE_SIZE = int(os.getenv("HISTORY_EDGES_PAGE_SIZE", "2000"))
+HISTORY_ROLLUP_ENABLED = os.getenv("HISTORY_ROLLUP_ENABLED", "true").lower() == "true"
+HISTORY_ROLLUP_DIR = os.getenv("HISTORY_ROLLUP_DIR", os.path.join(STATE_DIR, "history_rollups"))
+HISTORY_ROLLUP_DAYS = float(os.getenv("HISTORY_ROLLUP_DAYS", "365"))
+TILES_ENABLED = os.getenv("TILES_ENABLED", "true").lower() == "true"
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "512"))
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", "2"))
+TILE_REFRESH_SECONDS = float(os.getenv("TILE_REFRESH_SECONDS", "10"))
+TILE_MAX_FEATURES = int(os.getenv("TILE_MAX_FEATURES", "2000"))
+HISTORY_TILE_MAX_ZOOM = int(os.getenv("HISTORY_TILE_MAX_ZOOM", "8"))
+PLAYBACK_ENABLED = os.getenv("PLAYBACK_ENABLED", "true").lower() == "true"
+PLAYBACK_MAX_SPEED = float(os.getenv("PLAYBACK_MAX_SPEED", "100"))
+PLAYBACK_MAX_SESSIONS = int(os.getenv("PLAYBACK_MAX_SESSIONS", "8"))
+ROUTE_HISTORY_BUCKETS_FILE = os.getenv("ROUTE_HISTORY_BUCKETS_FILE", os.path.join(STATE_DIR, "route_history_buckets.bin"))
+
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+STATE_CHECKPOINT_FILE = os.getenv("STATE_CHECKPOINT_FILE", os.path.join(STATE_DIR, "state.bin"))
+ROUTE_HISTORY_CHECKPOINT_FILE = os.getenv("ROUTE_HISTORY_CHECKPOINT_FILE", os.path.join(STATE_DIR, "route_history.bin"))
+ROUTE_HISTORY_LOAD_CHUNK = int(os.getenv("ROUTE_HISTORY_LOAD_CHUNK", "2000"))
+ROUTE_HISTORY_LOAD_WORKERS = int(os.getenv("ROUTE_HISTORY_LOAD_WORKERS", "1"))
+
+SQLITE_ENABLED = os.getenv("SQLITE_ENABLED", "false").lower() == "true"
+SQLITE_FILE = os.getenv("SQLITE_FILE", os.path.join(STATE_DIR, "meshmap.db"))
+SQLITE_BATCH_SIZE = int(os.getenv("SQLITE_BATCH_SIZE", "500"))
+SQLITE_FLUSH_INTERVAL = float(os.getenv("SQLITE_FLUSH_INTERVAL", "2"))
+SQLITE_RETENTION_HOURS = float(os.getenv("SQLITE_RETENTION_HOURS", "168"))
+
 MESSAGE_ORIGIN_TTL_SECONDS = int(os.getenv("MESSAGE_ORIGIN_TTL_SECONDS", "300"))
+MESSAGE_ORIGIN_MAX_ENTRIES = int(os.getenv("MESSAGE_ORIGIN_MAX_ENTRIES", "20000"))
 HEAT_TTL_SECONDS = int(os.getenv("HEAT_TTL_SECONDS", "600"))
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "0"))
+MEMORY_GOVERNOR_INTERVAL = float(os.getenv("MEMORY_GOVERNOR_INTERVAL", "30"))
 MQTT_ONLINE_SECONDS = int(os.getenv("MQTT_ONLINE_SECONDS", "300"))
 MQTT_SEEN_BROADCAST_MIN_SECONDS = float(os.getenv("MQTT_SEEN_BROADCAST_MIN_SECONDS", "5"))
 MQTT_ONLINE_TOPIC_SUFFIXES = tuple(
@@ -114,7 +155,41 @@ LOS_SAMPLE_MIN = int(os.getenv("LOS_SAMPLE_MIN", "10"))
 LOS_SAMPLE_MAX = int(os.getenv("LOS_SAMPLE_MAX", "80"))
 LOS_SAMPLE_STEP_METERS = int(os.getenv("LOS_SAMPLE_STEP_METERS", "250"))
 ELEVATION_CACHE_TTL = int(os.getenv("ELEVATION_CACHE_TTL", "21600"))
+ELEVATION_CACHE_MAX_ENTRIES = int(os.getenv("ELEVATION_CACHE_MAX_ENTRIES", "100000"))
+ELEVATION_CACHE_GRID_ARCSEC = float(os.getenv("ELEVATION_CACHE_GRID_ARCSEC", "3"))
+ELEVATION_CACHE_FILE = os.getenv("ELEVATION_CACHE_FILE", os.path.join(STATE_DIR, "elevation_cache.db")).strip()
+LOS_ELEVATION_CHUNK = int(os.getenv("LOS_ELEVATION_CHUNK", "100"))
+LOS_ELEVATION_CONCURRENCY = int(os.getenv("LOS_ELEVATION_CONCURRENCY", "16"))
+LOS_ELEVATION_RETRIES = int(os.getenv("LOS_ELEVATION_RETRIES", "2"))
+LOS_ELEVATION_TIMEOUT = float(os.getenv("LOS_ELEVATION_TIMEOUT", "6"))
+LOS_ELEVATION_BATCH_MS = float(os.getenv("LOS_ELEVATION_BATCH_MS", "10"))
+DEM_DIR = os.getenv("DEM_DIR", "").strip()
+DEM_MAX_OPEN_TILES = int(os.getenv("DEM_MAX_OPEN_TILES", "16"))
+DEM_API_FALLBACK = os.getenv("DEM_API_FALLBACK", "true").lower() == "true"
 LOS_PEAKS_MAX = int(os.getenv("LOS_PEAKS_MAX", "4"))
+LOS_MODEL = os.getenv("LOS_MODEL", "straight").strip().lower()
+LOS_K_FACTOR = float(os.getenv("LOS_K_FACTOR", "1.333"))
+LOS_FREQUENCY_MHZ = float(os.getenv("LOS_FREQUENCY_MHZ", "915"))
+LOS_FRESNEL_CLEARANCE = float(os.getenv("LOS_FRESNEL_CLEARANCE", "0.6"))
+LOS_BATCH_MAX_PAIRS = int(os.getenv("LOS_BATCH_MAX_PAIRS", "500"))
+LOS_WORKERS = int(os.getenv("LOS_WORKERS", "2"))
+LOS_MATRIX_ENABLED = os.getenv("LOS_MATRIX_ENABLED", "false").lower() == "true"
+LOS_MATRIX_MAX_KM = float(os.getenv("LOS_MATRIX_MAX_KM", "30"))
+LOS_MATRIX_MOVE_METERS = float(os.getenv("LOS_MATRIX_MOVE_METERS", "100"))
+LOS_MATRIX_BATCH_PAIRS = int(os.getenv("LOS_MATRIX_BATCH_PAIRS", "200"))
+LOS_MATRIX_INTERVAL = float(os.getenv("LOS_MATRIX_INTERVAL", "30"))
+LOS_MATRIX_FILE = os.getenv("LOS_MATRIX_FILE", os.path.join(STATE_DIR, "los_matrix.bin")).strip()
+
+PROPAGATION_ENABLED = os.getenv("PROPAGATION_ENABLED", "false").lower() == "true"
+PROPAGATION_WORKERS = int(os.getenv("PROPAGATION_WORKERS", "2"))
+PROPAGATION_CACHE_SIZE = int(os.getenv("PROPAGATION_CACHE_SIZE", "32"))
+PROPAGATION_MAX_CELLS = int(os.getenv("PROPAGATION_MAX_CELLS", "500000"))
+PROPAGATION_MAX_ORIGINS = int(os.getenv("PROPAGATION_MAX_ORIGINS", "16"))
+PROPAGATION_MAX_RANGE_KM = float(os.getenv("PROPAGATION_MAX_RANGE_KM", "100"))
+VIEWSHED_ENABLED = os.getenv("VIEWSHED_ENABLED", "false").lower() == "true"
+VIEWSHED_CACHE_SIZE = int(os.getenv("VIEWSHED_CACHE_SIZE", "64"))
+VIEWSHED_MAX_RADIUS_KM = float(os.getenv("VIEWSHED_MAX_RADIUS_KM", "30"))
+VIEWSHED_MOVE_METERS = float(os.getenv("VIEWSHED_MOVE_METERS", "100"))
 
 COVERAGE_API_URL = os.getenv("COVERAGE_API_URL", "").strip()
 
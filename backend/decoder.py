@@ -3,6 +3,7 @@ import json
 import os
 import re
 import subprocess
+import threading
 import time
 from typing import Any, Dict, List, Optional, Set, Tuple
 
@@ -48,6 +49,7 @@ NODE_HASH_RE = re.compile(r"^[0-9a-fA-F]{2}$")
 
 _node_ready_once = False
 _node_unavailable_once = False
+_node_probe_lock = threading.Lock()
 
 ROUTE_PAYLOAD_TYPES_SET: Set[int] = set()
 for _part in ROUTE_PAYLOAD_TYPES.split(","):
@@ -274,6 +276,40 @@ def _rebuild_node_hash_map() -> None:
   node_hash_to_device.update(mapping)
 
 
+def _refresh_node_hash_bucket(node_hash: str) -> None:
+  ids = node_hash_candidates.get(node_hash)
+  if not ids:
+    node_hash_candidates.pop(node_hash, None)
+    node_hash_collisions.discard(node_hash)
+    node_hash_to_device.pop(node_hash, None)
+  elif len(ids) == 1:
+    node_hash_collisions.discard(node_hash)
+    node_hash_to_device[node_hash] = ids[0]
+  else:
+    node_hash_collisions.add(node_hash)
+    node_hash_to_device.pop(node_hash, None)
+
+
+def _index_node_hash(device_id: str) -> None:
+  node_hash = _node_hash_from_device_id(device_id)
+  if not node_hash:
+    return
+  ids = node_hash_candidates.setdefault(node_hash, [])
+  if device_id not in ids:
+    ids.append(device_id)
+  _refresh_node_hash_bucket(node_hash)
+
+
+def _unindex_node_hash(device_id: str) -> None:
+  node_hash = _node_hash_from_device_id(device_id)
+  if not node_hash:
+    return
+  ids = node_hash_candidates.get(node_hash)
+  if ids and device_id in ids:
+    ids.remove(device_id)
+  _refresh_node_hash_bucket(node_hash)
+
+
 def _choose_device_for_hash(node_hash: str, ts: float) -> Optional[str]:
   candidates = node_hash_candidates.get(node_hash)
   if not candidates:
@@ -534,8 +570,6 @@ def _direct_coords_allowed(topic: str, obj: Any) -> bool:
 # =========================
 
 def _ensure_node_decoder() -> bool:
-  global _node_ready_once, _node_unavailable_once
-
   if not DECODE_WITH_NODE:
     return False
   if _node_ready_once:
@@ -543,22 +577,46 @@ def _ensure_node_decoder() -> bool:
   if _node_unavailable_once:
     return False
 
+  with _node_probe_lock:
+    if _node_ready_once:
+      return True
+    if _node_unavailable_once:
+      return False
+    return _probe_node_decoder()
+
+
+def _start_node_probe(args: List[str]) -> Optional[subprocess.Popen]:
+  try:
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=APP_DIR)
+  except Exception:
+    return None
+
+
+def _node_probe_ok(proc: Optional[subprocess.Popen]) -> bool:
+  if proc is None:
+    return False
   try:
-    subprocess.run(["node", "-v"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc.wait(timeout=30) == 0
   except Exception:
+    proc.kill()
+    return False
+
+
+def _probe_node_decoder() -> bool:
+  global _node_ready_once, _node_unavailable_once
+
+  # Both probes only need node on PATH, so run them side by side instead of back to back.
+  version_proc = _start_node_probe(["node", "-v"])
+  import_proc = _start_node_probe(["node", "--input-type=module", "-e", "import('@michaelhart/meshcore-decoder')"])
+  node_ok = _node_probe_ok(version_proc)
+  import_ok = _node_probe_ok(import_proc)
+
+  if not node_ok:
     _node_unavailable_once = True
     print("[decode] node not found in container")
     return False
 
-  try:
-    subprocess.run(
-      ["node", "--input-type=module", "-e", "import('@michaelhart/meshcore-decoder')"],
-      check=True,
-      stdout=subprocess.DEVNULL,
-      stderr=subprocess.DEVNULL,
-      cwd=APP_DIR,
-    )
-  except Exception:
+  if not import_ok:
     _node_unavailable_once = True
     print("[decode] @michaelhart/meshcore-decoder not available")
     return False
@@ -0,0 +1,186 @@
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local elevation from SRTM .hgt tiles (N42W072.hgt: one degree square of
+# big-endian int16 samples, 1201x1201 for 3" or 3601x3601 for 1", row 0 at
+# the north edge). Tiles are memory-mapped, so only the pages a lookup
+# touches are read, and an LRU bounds the number of open maps.
+HGT_VOID = -32768
+HGT_SIZES = {1201 * 1201 * 2: 1201, 3601 * 3601 * 2: 3601}
+
+Location = Tuple[float, float]
+
+
+def hgt_name(lat: float, lon: float) -> str:
+  lat0 = math.floor(lat)
+  lon0 = math.floor(lon)
+  return f"{'N' if lat0 >= 0 else 'S'}{abs(lat0):02d}{'E' if lon0 >= 0 else 'W'}{abs(lon0):03d}.hgt"
+
+
+class HgtTile:
+
+  def __init__(self, path: str) -> None:
+    size = os.path.getsize(path)
+    self.samples = HGT_SIZES.get(size)
+    if self.samples is None:
+      raise ValueError(f"unexpected hgt size {size}")
+    self._handle = open(path, "rb")
+    self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+    self._unpack = struct.Struct(">h").unpack_from
+    self._grid: Optional[np.ndarray] = None
+
+  def close(self) -> None:
+    # The array view pins the map; drop it before closing.
+    self._grid = None
+    self._map.close()
+    self._handle.close()
+
+  def _value(self, row: int, col: int) -> int:
+    return self._unpack(self._map, (row * self.samples + col) * 2)[0]
+
+  def elevation(self, lat: float, lon: float) -> Optional[float]:
+    # Bilinear between the four surrounding posts; voids drop out of the
+    # weighting, and a sample surrounded by voids has no elevation.
+    last = self.samples - 1
+    y = (math.floor(lat) + 1 - lat) * last
+    x = (lon - math.floor(lon)) * last
+    row = min(int(y), last - 1)
+    col = min(int(x), last - 1)
+    fy = y - row
+    fx = x - col
+    total = 0.0
+    weight = 0.0
+    for dr, dc, w in ((0, 0, (1 - fy) * (1 - fx)), (0, 1, (1 - fy) * fx), (1, 0, fy * (1 - fx)), (1, 1, fy * fx)):
+      value = self._value(row + dr, col + dc)
+      if value != HGT_VOID and w > 0:
+        total += value * w
+        weight += w
+    if weight <= 0:
+      return None
+    return total / weight
+
+  def sample(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    # Vectorized elevation(): same bilinear weighting, NaN where every post is void.
+    if self._grid is None:
+      self._grid = np.frombuffer(self._map, dtype=">i2")
+    last = self.samples - 1
+    y = (np.floor(lats) + 1 - lats) * last
+    x = (lons - np.floor(lons)) * last
+    row = np.minimum(y.astype(np.intp), last - 1)
+    col = np.minimum(x.astype(np.intp), last - 1)
+    fy = y - row
+    fx = x - col
+    base = row * self.samples + col
+    total = np.zeros(lats.shape)
+    weight = np.zeros(lats.shape)
+    for offset, w in ((0, (1 - fy) * (1 - fx)), (1, (1 - fy) * fx), (self.samples, fy * (1 - fx)), (self.samples + 1, fy * fx)):
+      value = self._grid.take(base + offset).astype(np.int16)
+      w[value == HGT_VOID] = 0.0
+      total += value * w
+      weight += w
+    with np.errstate(invalid="ignore", divide="ignore"):
+      return np.where(weight > 0, total / weight, np.nan)
+
+
+class DemTileStore:
+
+  def __init__(self, directory: str, max_open: int = 16) -> None:
+    self.directory = directory
+    self.max_open = max(1, int(max_open))
+    self._tiles: "OrderedDict[str, Optional[HgtTile]]" = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.opened = 0
+
+  def _tile(self, name: str) -> Optional[HgtTile]:
+    tile = self._tiles.get(name, False)
+    if tile is not False:
+      self._tiles.move_to_end(name)
+      return tile
+    # Missing tiles are remembered as None so ocean/out-of-area lookups
+    # don't stat the directory every time.
+    path = os.path.join(self.directory, name)
+    tile = None
+    if os.path.exists(path):
+      try:
+        tile = HgtTile(path)
+        self.opened += 1
+      except (OSError, ValueError) as exc:
+        print(f"[dem] failed to open {path}: {exc}")
+    self._tiles[name] = tile
+    while len(self._tiles) > self.max_open:
+      _, old = self._tiles.popitem(last=False)
+      if old is not None:
+        old.close()
+    return tile
+
+  def lookup(self, locations: Sequence[Location]) -> List[Optional[float]]:
+    results: List[Optional[float]] = []
+    current = None
+    tile = None
+    with self._lock:
+      for lat, lon in locations:
+        # Consecutive samples along a path almost always share a tile.
+        cell = (math.floor(lat), math.floor(lon))
+        if cell != current:
+          current = cell
+          tile = self._tile(hgt_name(lat, lon))
+        elev = tile.elevation(lat, lon) if tile is not None else None
+        if elev is None:
+          self.misses += 1
+        else:
+          self.hits += 1
+        results.append(elev)
+    return results
+
+  def sample(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    # Array lookup for bulk callers (propagation rasters); NaN where no tile.
+    result = np.full(lats.shape, np.nan)
+    cells = (np.floor(lats).astype(np.int64) + 90) * 360 + (np.floor(lons).astype(np.int64) + 180)
+    if not len(cells):
+      return result
+    # Most batches sit in one tile; skip the grouping then.
+    groups = [cells[0]] if cells.min() == cells.max() else np.unique(cells)
+    with self._lock:
+      for cell in groups:
+        lat0, lon0 = divmod(int(cell), 360)
+        tile = self._tile(hgt_name(lat0 - 90, lon0 - 180))
+        if len(groups) == 1:
+          mask = slice(None)
+          count = len(cells)
+        else:
+          mask = cells == cell
+          count = int(mask.sum())
+        if tile is None:
+          self.misses += count
+          continue
+        result[mask] = tile.sample(lats[mask], lons[mask])
+        self.hits += count
+    return result
+
+  def close(self) -> None:
+    with self._lock:
+      for tile in self._tiles.values():
+        if tile is not None:
+          tile.close()
+      self._tiles.clear()
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      open_tiles = sum(1 for tile in self._tiles.values() if tile is not None)
+    return {
+      "directory": self.directory,
+      "open_tiles": open_tiles,
+      "max_open": self.max_open,
+      "opened": self.opened,
+      "hits": self.hits,
+      "misses": self.misses,
+    }
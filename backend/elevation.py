@@ -0,0 +1,363 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+# Async client for OpenTopoData-style elevation APIs
+# (GET url?locations=lat,lon|lat,lon -> {"status": "OK", "results": [{"elevation": ...}]}).
+# One pooled httpx.AsyncClient is shared by every request; chunks are fetched
+# concurrently under a semaphore and retried with backoff on transport
+# errors, 429 and 5xx.
+#
+# Lookups are single-flight per location: a location already in flight is
+# awaited, not fetched again. New locations wait up to batch_window seconds
+# in a shared queue, so concurrent callers fill the same chunk_size requests.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_AFTER_MAX = 5.0
+
+Location = Tuple[float, float]
+
+
+class ElevationError(Exception):
+  pass
+
+
+def _consume_exception(future: "asyncio.Future[float]") -> None:
+  if not future.cancelled():
+    future.exception()
+
+
+class ElevationClient:
+
+  def __init__(
+    self,
+    url: str,
+    chunk_size: int = 100,
+    concurrency: int = 16,
+    retries: int = 2,
+    timeout: float = 6.0,
+    backoff: float = 0.25,
+    batch_window: float = 0.01,
+  ) -> None:
+    self.url = url
+    self.chunk_size = max(1, int(chunk_size))
+    self.concurrency = max(1, int(concurrency))
+    self.retries = max(0, int(retries))
+    self.timeout = float(timeout)
+    self.backoff = max(0.0, float(backoff))
+    self.batch_window = max(0.0, float(batch_window))
+    # Created on first use so they bind to the serving event loop.
+    self._client: Optional[httpx.AsyncClient] = None
+    self._semaphore: Optional[asyncio.Semaphore] = None
+    self._inflight: Dict[Location, asyncio.Future] = {}
+    self._queue: List[Location] = []
+    self._flush_handle: Optional[asyncio.TimerHandle] = None
+    # Running chunk tasks; the loop only keeps weak references to them.
+    self._tasks: Set[asyncio.Task] = set()
+    self.requests = 0
+    self.retried = 0
+    self.failures = 0
+    self.locations = 0
+    self.coalesced = 0
+    self.request_seconds = 0.0
+
+  def _ensure_client(self) -> httpx.AsyncClient:
+    if self._client is None or self._client.is_closed:
+      limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+      self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+      self._semaphore = asyncio.Semaphore(self.concurrency)
+    return self._client
+
+  async def close(self) -> None:
+    if self._flush_handle is not None:
+      self._flush_handle.cancel()
+      self._flush_handle = None
+    self._queue = []
+    tasks = list(self._tasks)
+    for task in tasks:
+      task.cancel()
+    if tasks:
+      await asyncio.gather(*tasks, return_exceptions=True)
+    # Queued and cancelled locations alike: nobody will resolve them now.
+    inflight, self._inflight = self._inflight, {}
+    for future in inflight.values():
+      if not future.done():
+        future.set_exception(ElevationError("client_closed"))
+    if self._client is not None:
+      await self._client.aclose()
+      self._client = None
+      self._semaphore = None
+
+  async def _request(self, chunk: Sequence[Location]) -> Dict[str, Any]:
+    client = self._ensure_client()
+    locations = "|".join(f"{lat},{lon}" for lat, lon in chunk)
+    attempt = 0
+    while True:
+      delay = self.backoff * (2 ** attempt)
+      error = None
+      async with self._semaphore:
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+          resp = await client.get(self.url, params={"locations": locations})
+        except httpx.HTTPError as exc:
+          error = f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+          resp = None
+        finally:
+          self.request_seconds += time.perf_counter() - started
+      if resp is not None:
+        if resp.status_code not in RETRY_STATUSES:
+          if resp.status_code >= 400:
+            raise ElevationError(f"http_{resp.status_code}")
+          try:
+            return resp.json()
+          except ValueError:
+            raise ElevationError("invalid_json")
+        error = f"http_{resp.status_code}"
+        retry_after = resp.headers.get("retry-after")
+        if retry_after:
+          try:
+            delay = max(delay, min(RETRY_AFTER_MAX, float(retry_after)))
+          except ValueError:
+            pass
+      if attempt >= self.retries:
+        raise ElevationError(error)
+      attempt += 1
+      self.retried += 1
+      await asyncio.sleep(delay)
+
+  async def _fetch_chunk(self, chunk: Sequence[Location]) -> List[float]:
+    payload = await self._request(chunk)
+    if payload.get("status") not in (None, "OK"):
+      raise ElevationError(str(payload.get("status")))
+    results = payload.get("results", [])
+    if len(results) != len(chunk):
+      raise ElevationError("unexpected_result_length")
+    elevations = []
+    for entry in results:
+      elev = entry.get("elevation") if isinstance(entry, dict) else None
+      if elev is None:
+        raise ElevationError("missing_elevation")
+      elevations.append(float(elev))
+    return elevations
+
+  async def _run_chunk(self, chunk: List[Location]) -> None:
+    try:
+      elevations = await self._fetch_chunk(chunk)
+    except Exception as exc:
+      self.failures += 1
+      for location in chunk:
+        future = self._inflight.pop(location, None)
+        if future is not None and not future.done():
+          future.set_exception(exc if isinstance(exc, ElevationError) else ElevationError(str(exc)))
+      return
+    for location, elev in zip(chunk, elevations):
+      future = self._inflight.pop(location, None)
+      if future is not None and not future.done():
+        future.set_result(elev)
+
+  def _start_chunk(self, chunk: List[Location]) -> None:
+    task = asyncio.ensure_future(self._run_chunk(chunk))
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+
+  def _flush(self) -> None:
+    self._flush_handle = None
+    queue, self._queue = self._queue, []
+    for i in range(0, len(queue), self.chunk_size):
+      self._start_chunk(queue[i:i + self.chunk_size])
+
+  async def fetch(self, locations: Sequence[Location]) -> List[float]:
+    if not locations:
+      return []
+    self._ensure_client()
+    loop = asyncio.get_running_loop()
+    futures = []
+    for location in locations:
+      future = self._inflight.get(location)
+      if future is None:
+        future = loop.create_future()
+        # Callers that gave up detach their shields; the failure is still read here.
+        future.add_done_callback(_consume_exception)
+        self._inflight[location] = future
+        self._queue.append(location)
+        self.locations += 1
+      else:
+        self.coalesced += 1
+      futures.append(future)
+    # Full chunks go out now; a partial one waits for other callers.
+    while len(self._queue) >= self.chunk_size:
+      chunk, self._queue = self._queue[:self.chunk_size], self._queue[self.chunk_size:]
+      self._start_chunk(chunk)
+    if self._queue and self._flush_handle is None:
+      self._flush_handle = loop.call_later(self.batch_window, self._flush)
+    # Shielded: a caller that goes away must not cancel a shared lookup.
+    # Every result is collected before the first failure is raised.
+    results = await asyncio.gather(*[asyncio.shield(future) for future in futures], return_exceptions=True)
+    for result in results:
+      if isinstance(result, BaseException):
+        raise result
+    return list(results)
+
+  def stats(self) -> Dict[str, Any]:
+    return {
+      "requests": self.requests,
+      "retried": self.retried,
+      "failures": self.failures,
+      "locations": self.locations,
+      "coalesced": self.coalesced,
+      "in_flight": len(self._inflight),
+      "avg_request_ms": round(self.request_seconds / self.requests * 1000, 2) if self.requests else None,
+      "concurrency": self.concurrency,
+      "pool_open": self._client is not None and not self._client.is_closed,
+    }
+
+
+class ElevationCache:
+  # LRU of elevations keyed by a packed integer grid cell, so nearby samples
+  # that land on the same DEM post share one entry. New entries are written
+  # behind to SQLite on flush() and the newest max_entries reload at startup.
+
+  def __init__(self, grid_arcsec: float, max_entries: int, ttl: float, path: str = "") -> None:
+    self.step = max(0.01, float(grid_arcsec)) / 3600.0
+    self.cols = int(round(360.0 / self.step)) + 1
+    self.max_entries = max(1, int(max_entries))
+    self.ttl = float(ttl)
+    self.path = path
+    self._entries: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
+    self._pending: Dict[int, Tuple[float, float]] = {}
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.expired = 0
+    self.evicted = 0
+    self.loaded = 0
+    self.persisted = 0
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def key(self, lat: float, lon: float) -> int:
+    row = int(round((lat + 90.0) / self.step))
+    col = int(round((lon + 180.0) / self.step))
+    return row * self.cols + col
+
+  def location(self, key: int) -> Location:
+    row, col = divmod(key, self.cols)
+    return round(row * self.step - 90.0, 6), round(col * self.step - 180.0, 6)
+
+  def get(self, key: int, now: float) -> Optional[float]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      if self.ttl > 0 and now - entry[1] > self.ttl:
+        del self._entries[key]
+        self.expired += 1
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[0]
+
+  def put(self, key: int, elevation: float, now: float) -> None:
+    with self._lock:
+      self._entries[key] = (elevation, now)
+      self._entries.move_to_end(key)
+      if self.path:
+        self._pending[key] = (elevation, now)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self.evicted += 1
+
+  def _connect(self) -> sqlite3.Connection:
+    conn = sqlite3.connect(self.path, timeout=5)
+    conn.execute(
+      "CREATE TABLE IF NOT EXISTS elevations (cell INTEGER PRIMARY KEY, elevation REAL NOT NULL, ts REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_elevations_ts ON elevations (ts)")
+    return conn
+
+  def load(self) -> None:
+    if not self.path or not os.path.exists(self.path):
+      return
+    cutoff = time.time() - self.ttl if self.ttl > 0 else 0.0
+    try:
+      conn = self._connect()
+      try:
+        rows = conn.execute(
+          "SELECT cell, elevation, ts FROM elevations WHERE ts >= ? ORDER BY ts DESC LIMIT ?",
+          (cutoff, self.max_entries),
+        ).fetchall()
+      finally:
+        conn.close()
+    except sqlite3.Error as exc:
+      print(f"[elevation] failed to load {self.path}: {exc}")
+      return
+    with self._lock:
+      # Oldest first so the LRU order matches the stored timestamps.
+      for cell, elevation, ts in reversed(rows):
+        self._entries.setdefault(cell, (elevation, ts))
+      self.loaded = len(rows)
+    print(f"[elevation] loaded {len(rows)} cached elevations from {self.path}")
+
+  def flush(self) -> None:
+    if not self.path:
+      return
+    with self._lock:
+      if not self._pending:
+        return
+      pending, self._pending = self._pending, {}
+    try:
+      directory = os.path.dirname(self.path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      conn = self._connect()
+      try:
+        with conn:
+          conn.executemany(
+            "INSERT OR REPLACE INTO elevations (cell, elevation, ts) VALUES (?, ?, ?)",
+            [(cell, elev, ts) for cell, (elev, ts) in pending.items()],
+          )
+          # Keep the file about as large as the in-memory cache.
+          conn.execute(
+            "DELETE FROM elevations WHERE cell NOT IN (SELECT cell FROM elevations ORDER BY ts DESC LIMIT ?)",
+            (self.max_entries,),
+          )
+          if self.ttl > 0:
+            conn.execute("DELETE FROM elevations WHERE ts < ?", (time.time() - self.ttl,))
+      finally:
+        conn.close()
+      self.persisted += len(pending)
+    except sqlite3.Error as exc:
+      print(f"[elevation] failed to save {self.path}: {exc}")
+      with self._lock:
+        for cell, entry in pending.items():
+          self._pending.setdefault(cell, entry)
+
+  def approx_bytes(self) -> int:
+    # OrderedDict slot + int key + (float, float) tuple, measured ~240 B.
+    return len(self._entries) * 240
+
+  def stats(self) -> Dict[str, Any]:
+    lookups = self.hits + self.misses
+    return {
+      "entries": len(self._entries),
+      "max_entries": self.max_entries,
+      "grid_arcsec": round(self.step * 3600.0, 3),
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+      "expired": self.expired,
+      "evicted": self.evicted,
+      "loaded": self.loaded,
+      "persisted": self.persisted,
+      "pending": len(self._pending),
+      "file": self.path or None,
+    }
@@ -0,0 +1,233 @@
+import math
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import is_dataclass
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, List, Tuple
+
+import state
+from config import MEMORY_BUDGET_MB
+from history import _prune_route_history
+
+SAMPLE_SIZE = 32
+TARGET_RATIO = 0.9
+MIN_HISTORY_SEGMENTS = 100
+SHED_ROUNDS = 3
+
+governor_stats: Dict[str, Any] = {
+  "enabled": MEMORY_BUDGET_MB > 0,
+  "budget_bytes": int(MEMORY_BUDGET_MB * 1024 * 1024),
+  "runs": 0,
+  "last_run_ts": None,
+  "last_run_ms": None,
+  "estimated_bytes": 0,
+  "rss_bytes": None,
+  "structures": {},
+  "over_budget": False,
+}
+governor_actions: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+
+# =========================
+# Footprint estimates
+# =========================
+def _deep_sizeof(obj: Any, depth: int = 0) -> int:
+  size = sys.getsizeof(obj)
+  if depth > 4:
+    return size
+  if isinstance(obj, dict):
+    for key, value in obj.items():
+      # Field-name keys are interned and shared across records; only count non-string keys.
+      if not isinstance(key, str):
+        size += _deep_sizeof(key, depth + 1)
+      size += _deep_sizeof(value, depth + 1)
+  elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+    for value in obj:
+      size += _deep_sizeof(value, depth + 1)
+  elif is_dataclass(obj) and hasattr(obj, "__dict__"):
+    size += _deep_sizeof(obj.__dict__, depth + 1)
+  return size
+
+
+def _sampled_bytes(items: Iterable[Any], count: int, container: Any) -> int:
+  if count <= 0:
+    return sys.getsizeof(container)
+  sample = list(islice(items, SAMPLE_SIZE))
+  if not sample:
+    return sys.getsizeof(container)
+  per_item = sum(_deep_sizeof(item) for item in sample) / len(sample)
+  return int(sys.getsizeof(container) + per_item * count)
+
+
+def _estimate_structures() -> Dict[str, Dict[str, int]]:
+  trail_points = sum(len(trail) for trail in state.trails.values())
+  return {
+    "route_history_segments": {
+      "items": len(state.route_history_segments),
+      "bytes": state.route_history_segments.nbytes(),
+    },
+    "route_history_edges": {
+      "items": len(state.route_history_edges),
+      "bytes": _sampled_bytes(state.route_history_edges.items(), len(state.route_history_edges), state.route_history_edges),
+    },
+    "heat_events": {
+      "items": len(state.heat_events),
+      "bytes": _sampled_bytes(iter(state.heat_events), len(state.heat_events), state.heat_events),
+    },
+    "trails": {
+      "items": trail_points,
+      "bytes": _sampled_bytes(state.trails.items(), len(state.trails), state.trails),
+    },
+    "history_buckets": {
+      "items": state.history_buckets.stats()["cells"],
+      "bytes": state.history_buckets.approx_bytes(),
+    },
+    "message_origins": {
+      "items": len(state.message_origins),
+      "bytes": state.message_origins.approx_bytes(),
+    },
+    "routes": {
+      "items": len(state.routes),
+      "bytes": _sampled_bytes(state.routes.items(), len(state.routes), state.routes),
+    },
+    "devices": {
+      "items": len(state.devices),
+      "bytes": _sampled_bytes(state.devices.items(), len(state.devices), state.devices),
+    },
+    "debug_last": {
+      "items": len(state.debug_last) + len(state.status_last),
+      "bytes": _sampled_bytes(iter(state.debug_last), len(state.debug_last), state.debug_last)
+      + _sampled_bytes(iter(state.status_last), len(state.status_last), state.status_last),
+    },
+    "elevation_cache": {
+      "items": len(state.elevation_cache),
+      "bytes": state.elevation_cache.approx_bytes(),
+    },
+  }
+
+
+def _read_rss_bytes() -> Any:
+  try:
+    with open("/proc/self/statm", "r", encoding="ascii") as handle:
+      pages = int(handle.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE")
+  except Exception:
+    return None
+
+
+# =========================
+# Eviction policy
+# =========================
+def _record_action(structure: str, action: str, count: int, freed_bytes: int) -> None:
+  governor_actions.append({
+    "ts": time.time(),
+    "structure": structure,
+    "action": action,
+    "count": int(count),
+    "freed_bytes": int(freed_bytes),
+  })
+
+
+def _shed_history(excess: int, estimates: Dict[str, Dict[str, int]], updates: List[Dict[str, Any]], removed: List[str]) -> int:
+  count = len(state.route_history_segments)
+  if count <= MIN_HISTORY_SEGMENTS:
+    return 0
+  # Dropping segments also shrinks edges, so spread both over the segment count.
+  history_bytes = estimates["route_history_segments"]["bytes"] + estimates["route_history_edges"]["bytes"]
+  per_segment = history_bytes / max(1, count)
+  drop = min(count - MIN_HISTORY_SEGMENTS, int(math.ceil(excess / max(1.0, per_segment))))
+  if drop <= 0:
+    return 0
+  edge_updates, edge_removed = _prune_route_history(force_limit=True, max_segments=count - drop)
+  updates.extend(edge_updates)
+  removed.extend(edge_removed)
+  freed = int(drop * per_segment)
+  _record_action("route_history_segments", "evict_oldest", drop, freed)
+  return freed
+
+
+def _shed_heat(excess: int, estimates: Dict[str, Dict[str, int]], updates: List[Dict[str, Any]], removed: List[str]) -> int:
+  count = len(state.heat_events)
+  if count == 0:
+    return 0
+  per_event = estimates["heat_events"]["bytes"] / count
+  drop = min(count, int(math.ceil(excess / max(1.0, per_event))))
+  del state.heat_events[:drop]
+  freed = int(drop * per_event)
+  _record_action("heat_events", "evict_oldest", drop, freed)
+  return freed
+
+
+def _shed_trails(excess: int, estimates: Dict[str, Dict[str, int]], updates: List[Dict[str, Any]], removed: List[str]) -> int:
+  points = estimates["trails"]["items"]
+  if points == 0:
+    return 0
+  per_point = estimates["trails"]["bytes"] / points
+  dropped = 0
+  # Downsample: keep every other point but always keep the newest one.
+  for device_id, trail in list(state.trails.items()):
+    if len(trail) <= 2:
+      continue
+    kept = trail[-1::-2][::-1]
+    dropped += len(trail) - len(kept)
+    state.trails[device_id] = kept
+    if dropped * per_point >= excess:
+      break
+  if dropped:
+    state.state_dirty = True
+  freed = int(dropped * per_point)
+  if dropped:
+    _record_action("trails", "downsample", dropped, freed)
+  return freed
+
+
+def _shed_message_origins(excess: int, estimates: Dict[str, Dict[str, int]], updates: List[Dict[str, Any]], removed: List[str]) -> int:
+  count = estimates["message_origins"]["items"]
+  if count == 0:
+    return 0
+  per_entry = estimates["message_origins"]["bytes"] / count
+  keep = max(0, count - int(math.ceil(excess / max(1.0, per_entry))))
+  dropped = state.message_origins.trim(keep)
+  freed = int(dropped * per_entry)
+  if dropped:
+    _record_action("message_origins", "evict_lru", dropped, freed)
+  return freed
+
+
+def _govern_memory() -> Tuple[List[Dict[str, Any]], List[str]]:
+  started = time.perf_counter()
+  estimates = _estimate_structures()
+  total = sum(item["bytes"] for item in estimates.values())
+  budget = governor_stats["budget_bytes"]
+  history_updates: List[Dict[str, Any]] = []
+  history_removed: List[str] = []
+
+  governor_stats["over_budget"] = bool(budget > 0 and total > budget)
+  if governor_stats["over_budget"]:
+    target = int(budget * TARGET_RATIO)
+    # Priority order: oldest history first, then heat, then trails; origins only as a last resort.
+    for shed in (_shed_history, _shed_heat, _shed_trails, _shed_message_origins):
+      for _ in range(SHED_ROUNDS):
+        excess = total - target
+        if excess <= 0:
+          break
+        if not shed(excess, estimates, history_updates, history_removed):
+          break
+        estimates = _estimate_structures()
+        total = sum(item["bytes"] for item in estimates.values())
+
+  governor_stats["runs"] += 1
+  governor_stats["last_run_ts"] = time.time()
+  governor_stats["last_run_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+  governor_stats["estimated_bytes"] = total
+  governor_stats["rss_bytes"] = _read_rss_bytes()
+  governor_stats["structures"] = estimates
+  return history_updates, history_removed
+
+
+def _governor_payload() -> Dict[str, Any]:
+  payload = dict(governor_stats)
+  payload["recent_actions"] = list(governor_actions)
+  return payload
@@ -1,23 +1,45 @@
 import asyncio
+import calendar
+import heapq
 import json
 import os
+import shutil
 import time
-from typing import Any, Dict, List, Optional, Set, Tuple
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import state
+from compression import codec_suffix, compress_frame, iter_lines, strip_suffix
+from checkpoint import KIND_BUCKETS, KIND_HISTORY, _read_checkpoint, _write_checkpoint
 from config import (
+  CHECKPOINT_ENABLED,
   HISTORY_EDGE_SAMPLE_LIMIT,
+  HISTORY_ROLLUP_ENABLED,
+  ROUTE_HISTORY_BUCKETS_FILE,
   ROUTE_HISTORY_ALLOWED_MODES_SET,
+  ROUTE_HISTORY_CHECKPOINT_FILE,
   ROUTE_HISTORY_COMPACT_INTERVAL,
+  ROUTE_HISTORY_DIR,
   ROUTE_HISTORY_ENABLED,
   ROUTE_HISTORY_FILE,
+  ROUTE_HISTORY_FILE_SECONDS,
+  ROUTE_HISTORY_FLUSH_BATCH,
+  ROUTE_HISTORY_FLUSH_INTERVAL,
+  ROUTE_HISTORY_FSYNC_INTERVAL,
   ROUTE_HISTORY_HOURS,
+  ROUTE_HISTORY_LOAD_CHUNK,
+  ROUTE_HISTORY_LOAD_WORKERS,
   ROUTE_HISTORY_MAX_SEGMENTS,
   ROUTE_HISTORY_PAYLOAD_TYPES,
 )
 from decoder import _coords_are_zero
+from logwriter import BufferedLogWriter
 from los import _haversine_m
 from config import MAP_RADIUS_KM, MAP_START_LAT, MAP_START_LON
+from segments import PointE6, _edge_key_from_e6
+from storage import _query_history_segments, _queue_history_segments, _sqlite_ready
 
 ROUTE_HISTORY_PAYLOAD_TYPES_SET: Set[int] = set()
 for _part in ROUTE_HISTORY_PAYLOAD_TYPES.split(","):
@@ -62,12 +84,11 @@ def _normalize_history_point(point: Any) -> Optional[Tuple[float, float]]:
   return (round(lat_val, 6), round(lon_val, 6))
 
 
-def _history_edge_key(a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[str, Tuple[float, float], Tuple[float, float]]:
-  if a <= b:
-    key = f"{a[0]:.6f},{a[1]:.6f}|{b[0]:.6f},{b[1]:.6f}"
-    return key, a, b
-  key = f"{b[0]:.6f},{b[1]:.6f}|{a[0]:.6f},{a[1]:.6f}"
-  return key, b, a
+def _history_point_e6(point: Any) -> Optional[PointE6]:
+  normalized = _normalize_history_point(point)
+  if not normalized:
+    return None
+  return (int(round(normalized[0] * 1e6)), int(round(normalized[1] * 1e6)))
 
 
 def _history_sample_from_route(route: Dict[str, Any], ts: float) -> Dict[str, Any]:
@@ -82,6 +103,13 @@ def _history_sample_from_route(route: Dict[str, Any], ts: float) -> Dict[str, An
   }
 
 
+def _history_recent_wants(edge: Dict[str, Any], ts: float) -> bool:
+  recent = edge.get("recent")
+  if not isinstance(recent, list) or len(recent) < HISTORY_EDGE_SAMPLE_LIMIT:
+    return True
+  return ts > (recent[-1].get("ts") or 0)
+
+
 def _update_history_edge_recent(edge: Dict[str, Any], sample: Dict[str, Any]) -> None:
   if not edge or not sample:
     return
@@ -95,6 +123,27 @@ def _update_history_edge_recent(edge: Dict[str, Any], sample: Dict[str, Any]) ->
   edge["recent"] = recent
 
 
+def _touch_history_edge(key: str, first: PointE6, second: PointE6, ts: float, payload_type: Any = None) -> Dict[str, Any]:
+  edge = state.route_history_edges.get(key)
+  if not edge:
+    edge = {
+      "id": key,
+      "a": [first[0] / 1e6, first[1] / 1e6],
+      "b": [second[0] / 1e6, second[1] / 1e6],
+      "count": 0,
+      "last_ts": ts,
+      "types": {},
+    }
+    state.route_history_edges[key] = edge
+    state.history_edge_index.add(key, edge["a"], edge["b"])
+  edge["count"] = int(edge.get("count", 0)) + 1
+  edge["last_ts"] = max(edge.get("last_ts", ts), ts)
+  # Per payload type counts back the payload_type filter on /history/edges.
+  types = edge["types"]
+  types[payload_type] = types.get(payload_type, 0) + 1
+  return edge
+
+
 def _record_route_history(route: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
   if not ROUTE_HISTORY_ENABLED:
     return [], []
@@ -110,14 +159,24 @@ def _record_route_history(route: Dict[str, Any]) -> Tuple[List[Dict[str, Any]],
   if not isinstance(points, list) or len(points) < 2:
     return [], []
 
-  ts = route.get("ts") or time.time()
+  ts = float(route.get("ts") or time.time())
   sample = _history_sample_from_route(route, ts)
+  fields = (
+    sample["message_hash"],
+    sample["payload_type"],
+    sample["origin_id"],
+    sample["receiver_id"],
+    sample["route_mode"],
+    sample["topic"],
+  )
+  store = state.route_history_segments
   updated_keys: Set[str] = set()
   new_entries: List[Dict[str, Any]] = []
+  new_keys: List[str] = []
 
   for idx in range(len(points) - 1):
-    a = _normalize_history_point(points[idx])
-    b = _normalize_history_point(points[idx + 1])
+    a = _history_point_e6(points[idx])
+    b = _history_point_e6(points[idx + 1])
     if not a or not b:
       continue
     a_id = None
@@ -125,11 +184,15 @@ def _record_route_history(route: Dict[str, Any]) -> Tuple[List[Dict[str, Any]],
     if point_ids and idx < len(point_ids) - 1:
       a_id = point_ids[idx]
       b_id = point_ids[idx + 1]
-    key, first, second = _history_edge_key(a, b)
+    first, second = (a, b) if a <= b else (b, a)
+    key = store.append(ts, first, second, a_id, b_id, *fields)
+    state.peer_index.add(a_id, b_id, ts)
+    edge = _touch_history_edge(key, first, second, ts, sample.get("payload_type"))
+    state.history_buckets.add(key, edge["a"], edge["b"], ts)
     new_entries.append({
-      "ts": float(ts),
-      "a": [first[0], first[1]],
-      "b": [second[0], second[1]],
+      "ts": ts,
+      "a": list(edge["a"]),
+      "b": list(edge["b"]),
       "a_id": a_id,
       "b_id": b_id,
       "message_hash": sample.get("message_hash"),
@@ -139,30 +202,23 @@ def _record_route_history(route: Dict[str, Any]) -> Tuple[List[Dict[str, Any]],
       "route_mode": sample.get("route_mode"),
       "topic": sample.get("topic"),
     })
-    edge = state.route_history_edges.get(key)
-    if not edge:
-      edge = {
-        "id": key,
-        "a": [first[0], first[1]],
-        "b": [second[0], second[1]],
-        "count": 0,
-        "last_ts": float(ts),
-      }
-      state.route_history_edges[key] = edge
-    edge["count"] = int(edge.get("count", 0)) + 1
-    edge["last_ts"] = max(edge.get("last_ts", float(ts)), float(ts))
+    new_keys.append(key)
     _update_history_edge_recent(edge, sample)
     updated_keys.add(key)
 
   if not new_entries:
     return [], []
+  state.history_version += 1
 
-  state.route_history_segments.extend(new_entries)
-  _append_route_history_file(new_entries)
+  if _sqlite_ready():
+    _queue_history_segments(new_entries, new_keys)
+  else:
+    _append_route_history_file(new_entries)
+    state.route_history_dirty = True
 
   updates = [state.route_history_edges[key] for key in updated_keys if key in state.route_history_edges]
   removed: List[str] = []
-  if ROUTE_HISTORY_MAX_SEGMENTS > 0 and len(state.route_history_segments) > ROUTE_HISTORY_MAX_SEGMENTS:
+  if ROUTE_HISTORY_MAX_SEGMENTS > 0 and len(store) > ROUTE_HISTORY_MAX_SEGMENTS:
     extra_updates, extra_removed = _prune_route_history(force_limit=True)
     updates.extend(extra_updates)
     removed.extend(extra_removed)
@@ -170,172 +226,625 @@ def _record_route_history(route: Dict[str, Any]) -> Tuple[List[Dict[str, Any]],
   return updates, removed
 
 
-def _prune_route_history(force_limit: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
-  if not ROUTE_HISTORY_ENABLED or not state.route_history_segments:
+def _prune_route_history(force_limit: bool = False, max_segments: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+  store = state.route_history_segments
+  if not ROUTE_HISTORY_ENABLED or not len(store):
     return [], []
+  limit = ROUTE_HISTORY_MAX_SEGMENTS if max_segments is None else max_segments
 
   updated: Dict[str, Dict[str, Any]] = {}
   removed: List[str] = []
   now = time.time()
   cutoff = now - (ROUTE_HISTORY_HOURS * 3600)
 
-  while state.route_history_segments:
-    entry = state.route_history_segments[0]
-    if not isinstance(entry, dict):
-      state.route_history_segments.popleft()
-      continue
-    ts = entry.get("ts")
-    if ts is None:
-      state.route_history_segments.popleft()
-      continue
-    if not force_limit and ts >= cutoff:
+  # Segments are time-ordered, so expiry is a head advance; each popped segment
+  # hands back its edge key, so edges and peer counters are decremented in place.
+  while len(store):
+    if not force_limit and store.oldest_ts() >= cutoff:
       break
-    if force_limit and ROUTE_HISTORY_MAX_SEGMENTS > 0 and len(state.route_history_segments) <= ROUTE_HISTORY_MAX_SEGMENTS:
+    if force_limit and limit > 0 and len(store) <= limit:
       break
-    state.route_history_segments.popleft()
-    a = entry.get("a")
-    b = entry.get("b")
-    a_point = _normalize_history_point(a) if a else None
-    b_point = _normalize_history_point(b) if b else None
-    if not a_point or not b_point:
-      state.route_history_compact = True
-      continue
-    key, _, _ = _history_edge_key(a_point, b_point)
+    a_id, b_id = store.oldest_endpoints()
+    state.peer_index.remove(a_id, b_id)
+    payload_type = store.oldest_payload_type()
+    oldest_ts = store.oldest_ts()
+    key, emptied = store.popleft()
+    state.route_history_dirty = True
+    state.history_version += 1
     edge = state.route_history_edges.get(key)
     if not edge:
-      state.route_history_compact = True
+      continue
+    if HISTORY_ROLLUP_ENABLED:
+      # Everything leaving the raw window lands in the daily rollups.
+      state.history_rollups.fold(oldest_ts, key, edge["a"], edge["b"], payload_type)
+    if emptied:
+      state.route_history_edges.pop(key, None)
+      state.history_edge_index.remove(key)
+      updated.pop(key, None)
+      removed.append(key)
       continue
     edge["count"] = int(edge.get("count", 0)) - 1
+    types = edge.get("types")
+    if types and payload_type in types:
+      types[payload_type] -= 1
+      if types[payload_type] <= 0:
+        del types[payload_type]
     recent = edge.get("recent")
-    if isinstance(recent, list):
+    if isinstance(recent, list) and recent and (recent[-1].get("ts") or 0) < cutoff:
       edge["recent"] = [s for s in recent if (s.get("ts") or 0) >= cutoff]
       if not edge["recent"]:
         edge.pop("recent", None)
-    if edge["count"] <= 0:
-      state.route_history_edges.pop(key, None)
-      removed.append(key)
-    else:
-      updated[key] = edge
-    state.route_history_compact = True
+    updated[key] = edge
 
   return list(updated.values()), removed
 
 
-def _append_route_history_file(entries: List[Dict[str, Any]]) -> None:
-  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_FILE:
-    return
-  if not entries:
-    return
+# =========================
+# Segment files
+# =========================
+# History is stored as one JSONL file per ROUTE_HISTORY_FILE_SECONDS span,
+# named by the UTC start of the span. Expiry deletes whole files.
+HISTORY_FILE_NAME_FORMAT = "%Y%m%dT%H%MZ"
+HISTORY_FILE_SUFFIX = ".jsonl"
+STORAGE_CODEC = state.storage_codec
+MIGRATE_FRAME_LINES = 2000
+
+FileBounds = Dict[str, Tuple[int, int]]
+
+
+def _history_file_span() -> float:
+  return max(60.0, float(ROUTE_HISTORY_FILE_SECONDS))
+
+
+def _history_file_name(ts: float) -> str:
+  start = ts - (ts % _history_file_span())
+  return time.strftime(HISTORY_FILE_NAME_FORMAT, time.gmtime(start)) + HISTORY_FILE_SUFFIX + codec_suffix(STORAGE_CODEC)
+
+
+def _history_file_path(record: Dict[str, Any]) -> str:
+  return os.path.join(ROUTE_HISTORY_DIR, _history_file_name(float(record.get("ts") or time.time())))
+
+
+def _history_file_start(name: str) -> Optional[float]:
+  # Files written under another codec stay readable, so match any codec suffix.
+  name = strip_suffix(name)
+  if not name.endswith(HISTORY_FILE_SUFFIX):
+    return None
   try:
-    os.makedirs(os.path.dirname(ROUTE_HISTORY_FILE), exist_ok=True)
-    with open(ROUTE_HISTORY_FILE, "a", encoding="utf-8") as handle:
-      for entry in entries:
-        handle.write(json.dumps(entry) + "\n")
-  except Exception as exc:
-    print(f"[history] failed to append {ROUTE_HISTORY_FILE}: {exc}")
+    parsed = time.strptime(name[:-len(HISTORY_FILE_SUFFIX)], HISTORY_FILE_NAME_FORMAT)
+  except ValueError:
+    return None
+  return float(calendar.timegm(parsed))
 
 
-def _load_route_history() -> None:
-  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_FILE:
-    return
-  if not os.path.exists(ROUTE_HISTORY_FILE):
-    return
+def _list_route_history_files() -> List[Tuple[float, str]]:
+  try:
+    names = os.listdir(ROUTE_HISTORY_DIR)
+  except OSError:
+    return []
+  files = []
+  for name in names:
+    start = _history_file_start(name)
+    if start is not None:
+      files.append((start, name))
+  files.sort()
+  return files
+
+
+def _route_history_file_bounds() -> FileBounds:
+  bounds: FileBounds = {}
+  for _, name in _list_route_history_files():
+    try:
+      info = os.stat(os.path.join(ROUTE_HISTORY_DIR, name))
+    except OSError:
+      continue
+    bounds[name] = (info.st_ino, info.st_size)
+  return bounds
 
-  cutoff = time.time() - (ROUTE_HISTORY_HOURS * 3600)
-  loaded_any = False
 
+def _expire_route_history_files(cutoff: float) -> int:
+  removed = 0
+  span = _history_file_span()
+  for start, name in _list_route_history_files():
+    if start + span > cutoff:
+      break
+    try:
+      os.remove(os.path.join(ROUTE_HISTORY_DIR, name))
+      removed += 1
+    except OSError as exc:
+      print(f"[history] failed to expire {name}: {exc}")
+  return removed
+
+
+def _migrated_span_files() -> List[str]:
   try:
-    with open(ROUTE_HISTORY_FILE, "r", encoding="utf-8") as handle:
-      for line in handle:
-        line = line.strip()
+    names = os.listdir(ROUTE_HISTORY_DIR)
+  except OSError:
+    return []
+  return [name for name in names if name.endswith(".tmp") and _history_file_start(name[:-4]) is not None]
+
+
+def _finish_route_history_migration(done_path: str) -> None:
+  for name in _migrated_span_files():
+    path = os.path.join(ROUTE_HISTORY_DIR, name)
+    os.replace(path, path[:-4])
+  os.remove(done_path)
+
+
+def _migrate_route_history_file() -> int:
+  # One-time split of the old single route_history.jsonl into span files.
+  # Spans are written to .tmp files; renaming the source to .migrated is the
+  # commit point, so a failure before it leaves the span files untouched and
+  # a restart after it only has to finish moving the .tmp files into place.
+  if not ROUTE_HISTORY_FILE or not ROUTE_HISTORY_DIR:
+    return 0
+  done_path = f"{ROUTE_HISTORY_FILE}.migrated"
+  if os.path.exists(done_path):
+    try:
+      _finish_route_history_migration(done_path)
+    except OSError as exc:
+      print(f"[history] failed to finish migrating {ROUTE_HISTORY_FILE}: {exc}")
+    return 0
+  if not os.path.exists(ROUTE_HISTORY_FILE):
+    return 0
+  moved = 0
+  handles: Dict[str, Any] = {}
+  buffered: Dict[str, List[bytes]] = {}
+
+  def _write_frame(path: str) -> None:
+    handle = handles.get(path)
+    if handle is None:
+      tmp_path = f"{path}.tmp"
+      # A span file that already exists keeps its segments ahead of the migrated ones.
+      if os.path.exists(path):
+        shutil.copyfile(path, tmp_path)
+      handle = open(tmp_path, "ab")
+      handles[path] = handle
+    handle.write(compress_frame(STORAGE_CODEC, b"".join(buffered.pop(path))))
+
+  try:
+    os.makedirs(ROUTE_HISTORY_DIR, exist_ok=True)
+    # Leftovers of an attempt that failed before its commit point.
+    for name in _migrated_span_files():
+      os.remove(os.path.join(ROUTE_HISTORY_DIR, name))
+    with open(ROUTE_HISTORY_FILE, "rb") as source:
+      for raw in source:
+        line = raw.strip()
         if not line:
           continue
         try:
-          entry = json.loads(line)
-        except json.JSONDecodeError:
-          state.route_history_compact = True
-          continue
-        if not isinstance(entry, dict):
-          state.route_history_compact = True
+          ts = float(json.loads(line).get("ts"))
+        except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
           continue
-        ts = entry.get("ts")
-        if not isinstance(ts, (int, float)) or ts < cutoff:
-          state.route_history_compact = True
-          continue
-        a_point = _normalize_history_point(entry.get("a"))
-        b_point = _normalize_history_point(entry.get("b"))
-        if not a_point or not b_point:
-          state.route_history_compact = True
-          continue
-        sample = {
-          "ts": float(ts),
-          "message_hash": entry.get("message_hash"),
-          "payload_type": entry.get("payload_type"),
-          "origin_id": entry.get("origin_id"),
-          "receiver_id": entry.get("receiver_id"),
-          "route_mode": entry.get("route_mode"),
-          "topic": entry.get("topic"),
-        }
-        key, first, second = _history_edge_key(a_point, b_point)
-        state.route_history_segments.append({
-          "ts": float(ts),
-          "a": [first[0], first[1]],
-          "b": [second[0], second[1]],
-          "a_id": entry.get("a_id"),
-          "b_id": entry.get("b_id"),
-          "message_hash": sample.get("message_hash"),
-          "payload_type": sample.get("payload_type"),
-          "origin_id": sample.get("origin_id"),
-          "receiver_id": sample.get("receiver_id"),
-          "route_mode": sample.get("route_mode"),
-          "topic": sample.get("topic"),
-        })
-        edge = state.route_history_edges.get(key)
-        if not edge:
-          edge = {
-            "id": key,
-            "a": [first[0], first[1]],
-            "b": [second[0], second[1]],
-            "count": 0,
-            "last_ts": float(ts),
-          }
-          state.route_history_edges[key] = edge
-        edge["count"] = int(edge.get("count", 0)) + 1
-        edge["last_ts"] = max(edge.get("last_ts", float(ts)), float(ts))
-        _update_history_edge_recent(edge, sample)
-        loaded_any = True
+        path = os.path.join(ROUTE_HISTORY_DIR, _history_file_name(ts))
+        lines = buffered.setdefault(path, [])
+        lines.append(line + b"\n")
+        if len(lines) >= MIGRATE_FRAME_LINES:
+          _write_frame(path)
+        moved += 1
+    for path in list(buffered):
+      _write_frame(path)
+    for handle in handles.values():
+      handle.flush()
+      os.fsync(handle.fileno())
   except Exception as exc:
-    print(f"[history] failed to load {ROUTE_HISTORY_FILE}: {exc}")
+    print(f"[history] failed to migrate {ROUTE_HISTORY_FILE}: {exc}")
+    for handle in handles.values():
+      handle.close()
+    for path in handles:
+      try:
+        os.remove(f"{path}.tmp")
+      except OSError:
+        pass
+    return 0
+  for handle in handles.values():
+    handle.close()
+  try:
+    os.replace(ROUTE_HISTORY_FILE, done_path)
+    _finish_route_history_migration(done_path)
+  except OSError as exc:
+    print(f"[history] failed to finish migrating {ROUTE_HISTORY_FILE}: {exc}")
+    return 0
+  print(f"[history] migrated {moved} segments from {ROUTE_HISTORY_FILE} into {ROUTE_HISTORY_DIR}")
+  return moved
+
+
+def _encode_history_frame(data: bytes) -> bytes:
+  return compress_frame(STORAGE_CODEC, data)
+
+
+route_history_writer = BufferedLogWriter(
+  _history_file_path,
+  ROUTE_HISTORY_FLUSH_BATCH,
+  ROUTE_HISTORY_FSYNC_INTERVAL,
+  encode=_encode_history_frame if STORAGE_CODEC else None,
+)
+_flush_wanted: Optional[asyncio.Event] = None
+
+
+def _append_route_history_file(entries: List[Dict[str, Any]]) -> None:
+  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_DIR:
     return
+  if not entries:
+    return
+  # Queue only; _route_history_writer serializes and writes batches off the event loop.
+  if route_history_writer.append(entries) and _flush_wanted is not None:
+    _flush_wanted.set()
 
-  if not loaded_any:
+
+async def _route_history_writer() -> None:
+  global _flush_wanted
+  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_DIR:
     return
+  _flush_wanted = asyncio.Event()
+  while True:
+    try:
+      await asyncio.wait_for(_flush_wanted.wait(), timeout=max(0.05, ROUTE_HISTORY_FLUSH_INTERVAL))
+    except asyncio.TimeoutError:
+      pass
+    _flush_wanted.clear()
+    if route_history_writer.pending() or ROUTE_HISTORY_FSYNC_INTERVAL > 0:
+      await asyncio.to_thread(route_history_writer.flush)
+
+
+def _close_route_history_writer() -> None:
+  if ROUTE_HISTORY_DIR:
+    route_history_writer.close()
+
+
+HISTORY_SEGMENT_FIELDS = ("a_id", "b_id", "message_hash", "payload_type", "origin_id", "receiver_id", "route_mode", "topic")
+
+# (ts, a_e6, b_e6, a_id, b_id, message_hash, payload_type, origin_id, receiver_id, route_mode, topic)
+HistoryItem = Tuple[Any, ...]
+
+
+def _history_item_from_entry(entry: Any, cutoff: float) -> Optional[HistoryItem]:
+  if not isinstance(entry, dict):
+    return None
+  ts = entry.get("ts")
+  if not isinstance(ts, (int, float)) or ts < cutoff:
+    return None
+  a_point = _history_point_e6(entry.get("a"))
+  b_point = _history_point_e6(entry.get("b"))
+  if not a_point or not b_point:
+    return None
+  first, second = (a_point, b_point) if a_point <= b_point else (b_point, a_point)
+  return (float(ts), first, second) + tuple(entry.get(field) for field in HISTORY_SEGMENT_FIELDS)
+
+
+def _apply_history_item(item: HistoryItem, front: bool = False) -> None:
+  store = state.route_history_segments
+  ts, first, second = item[0], item[1], item[2]
+  key = store.appendleft(*item) if front else store.append(*item)
+  state.peer_index.add(item[3], item[4], ts)
+  edge = _touch_history_edge(key, first, second, ts, item[6])
+  # Buckets restored from their checkpoint already count segments up to loaded_until.
+  if ts > state.history_buckets.loaded_until:
+    state.history_buckets.add(key, edge["a"], edge["b"], ts)
+  if _history_recent_wants(edge, ts):
+    _update_history_edge_recent(edge, {
+      "ts": ts,
+      "message_hash": item[5],
+      "payload_type": item[6],
+      "origin_id": item[7],
+      "receiver_id": item[8],
+      "route_mode": item[9],
+      "topic": item[10],
+    })
+
+
+def _history_checkpoint_scope() -> List[float]:
+  return [float(MAP_RADIUS_KM), float(MAP_START_LAT), float(MAP_START_LON)]
+
+
+def _route_history_checkpoint_snapshot() -> Optional[Dict[str, Any]]:
+  if not CHECKPOINT_ENABLED or not ROUTE_HISTORY_CHECKPOINT_FILE or not ROUTE_HISTORY_DIR:
+    return None
+  if _sqlite_ready():
+    return None
+  # Flush, file bounds and column copies must all see the same segments, so
+  # they run back to back without yielding; decoding and the write can wait.
+  route_history_writer.flush()
+  return {
+    "scope": _history_checkpoint_scope(),
+    "files": _route_history_file_bounds(),
+    "segments": state.route_history_segments.snapshot(),
+  }
+
 
+def _write_route_history_checkpoint(snapshot: Optional[Dict[str, Any]] = None) -> bool:
+  if snapshot is None:
+    snapshot = _route_history_checkpoint_snapshot()
+    if snapshot is None:
+      return False
+  body = {"scope": snapshot["scope"], "files": snapshot["files"]}
+  body.update(state.route_history_segments.export_columns(snapshot["segments"]))
+  return _write_checkpoint(ROUTE_HISTORY_CHECKPOINT_FILE, KIND_HISTORY, body)
+
+
+def _read_route_history_checkpoint(cutoff: float) -> Tuple[Optional[List[HistoryItem]], FileBounds]:
+  if not CHECKPOINT_ENABLED or not ROUTE_HISTORY_CHECKPOINT_FILE:
+    return None, {}
+  body, _ = _read_checkpoint(ROUTE_HISTORY_CHECKPOINT_FILE, KIND_HISTORY)
+  if not body or body.get("scope") != _history_checkpoint_scope():
+    return None, {}
+  saved_files = body.get("files")
+  if not isinstance(saved_files, dict):
+    return None, {}
+  # Every in-window file the checkpoint covered must still be there, unchanged or grown.
+  current = _route_history_file_bounds()
+  span = _history_file_span()
+  for name, (inode, size) in saved_files.items():
+    start = _history_file_start(name)
+    if start is None or start + span <= cutoff:
+      continue
+    now_bounds = current.get(name)
+    if not now_bounds or now_bounds[0] != inode or now_bounds[1] < size:
+      return None, {}
+  ts_values = array("d")
+  ts_values.frombytes(body.get("ts") or b"")
+  coords = array("i")
+  coords.frombytes(body.get("coords_e6") or b"")
+  columns = body.get("columns") or {}
+  count = len(ts_values)
+  if len(coords) != count * 4:
+    return None, {}
+  if any(len(columns.get(field) or []) != count for field in HISTORY_SEGMENT_FIELDS):
+    return None, {}
+  field_columns = [columns[field] for field in HISTORY_SEGMENT_FIELDS]
+  items: List[HistoryItem] = []
+  for idx in range(count):
+    ts = ts_values[idx]
+    if ts < cutoff:
+      continue
+    base = idx * 4
+    items.append(
+      (ts, (coords[base], coords[base + 1]), (coords[base + 2], coords[base + 3]))
+      + tuple(column[idx] for column in field_columns)
+    )
+  return items, saved_files
+
+
+def _write_history_buckets_checkpoint() -> bool:
+  if not CHECKPOINT_ENABLED or not ROUTE_HISTORY_BUCKETS_FILE:
+    return False
+  return _write_checkpoint(ROUTE_HISTORY_BUCKETS_FILE, KIND_BUCKETS, state.history_buckets.export())
+
+
+def _read_history_buckets_checkpoint() -> bool:
+  if not CHECKPOINT_ENABLED or not ROUTE_HISTORY_BUCKETS_FILE:
+    return False
+  body, _ = _read_checkpoint(ROUTE_HISTORY_BUCKETS_FILE, KIND_BUCKETS)
+  if not body:
+    return False
+  return state.history_buckets.restore(body)
+
+
+def _read_route_history_jsonl(path: str, cutoff: float, start: int = 0, end: Optional[int] = None) -> List[HistoryItem]:
+  items: List[HistoryItem] = []
+  if not os.path.exists(path):
+    return items
+  for raw in iter_lines(path, start, end):
+    line = raw.strip()
+    if not line:
+      continue
+    try:
+      entry = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+      continue
+    item = _history_item_from_entry(entry, cutoff)
+    if item is not None:
+      items.append(item)
+  return items
+
+
+def _read_route_history_files(cutoff: float, end: Optional[FileBounds], skip: FileBounds) -> List[HistoryItem]:
+  bounds = end if end is not None else _route_history_file_bounds()
+  span = _history_file_span()
+  jobs = []
+  for name, (inode, size) in sorted(bounds.items()):
+    start = _history_file_start(name)
+    if start is None or start + span <= cutoff:
+      continue
+    # Resume after the bytes a checkpoint already covered for this file.
+    saved = skip.get(name)
+    offset = saved[1] if saved and saved[0] == inode else 0
+    if offset >= size:
+      continue
+    jobs.append((os.path.join(ROUTE_HISTORY_DIR, name), offset, size))
+  if not jobs:
+    return []
+  workers = max(1, min(ROUTE_HISTORY_LOAD_WORKERS, len(jobs)))
+  if workers == 1:
+    chunks = [_read_route_history_jsonl(path, cutoff, offset, size) for path, offset, size in jobs]
+  else:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+      chunks = list(pool.map(lambda job: _read_route_history_jsonl(job[0], cutoff, job[1], job[2]), jobs))
+  items: List[HistoryItem] = []
+  for chunk in chunks:
+    items.extend(chunk)
+  return items
+
+
+PLAYBACK_REORDER_SECONDS = 5.0
+PLAYBACK_SQLITE_PAGE_SECONDS = 600.0
+
+
+def _iter_history_segments(start: float, end: float) -> Iterator[Dict[str, Any]]:
+  # Streams stored segments with start <= ts <= end in ts order, one file (or
+  # one SQLite time page) at a time, so replaying a day never loads the day.
+  if _sqlite_ready():
+    page_start = start
+    while True:
+      page_end = min(end, page_start + PLAYBACK_SQLITE_PAGE_SECONDS)
+      last = page_end >= end
+      for entry in _query_history_segments(page_start, until=page_end):
+        # Pages share their boundary instant; it belongs to the later page.
+        if last or entry.get("ts", 0) < page_end:
+          yield entry
+      if last:
+        return
+      page_start = page_end
+  # Segments still queued in the writer would otherwise be missing from the files.
+  route_history_writer.flush()
+  yield from _iter_history_file_segments(start, end)
+
+
+def _iter_history_file_segments(start: float, end: float) -> Iterator[Dict[str, Any]]:
+  if not ROUTE_HISTORY_DIR:
+    return
+  span = _history_file_span()
+  # Flush batches can land slightly out of order around span boundaries, so
+  # a small heap holds entries until nothing older can still arrive.
+  heap: List[Tuple[float, int, Dict[str, Any]]] = []
+  seq = 0
+  for file_start, name in _list_route_history_files():
+    if file_start + span < start or file_start > end:
+      continue
+    for raw in iter_lines(os.path.join(ROUTE_HISTORY_DIR, name)):
+      try:
+        entry = json.loads(raw)
+        ts = float(entry.get("ts"))
+      except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
+        continue
+      if ts < start or ts > end:
+        continue
+      heapq.heappush(heap, (ts, seq, entry))
+      seq += 1
+      while heap and heap[0][0] < ts - PLAYBACK_REORDER_SECONDS:
+        yield heapq.heappop(heap)[2]
+  while heap:
+    yield heapq.heappop(heap)[2]
+
+
+def _history_file_import_rows() -> Iterator[Tuple[Dict[str, Any], str]]:
+  # Every segment still in the span files, keyed the way _record_route_history
+  # keys it, for SQLite's one-time import.
+  for entry in _iter_history_file_segments(0.0, float("inf")):
+    item = _history_item_from_entry(entry, 0.0)
+    if item is not None:
+      yield entry, _edge_key_from_e6(item[1], item[2])
+
+
+def _read_route_history_items(cutoff: float, until: Optional[float] = None, end: Optional[FileBounds] = None) -> Tuple[List[HistoryItem], str]:
+  if _sqlite_ready():
+    items = []
+    for entry in _query_history_segments(cutoff, until=until):
+      item = _history_item_from_entry(entry, cutoff)
+      if item is not None:
+        items.append(item)
+    return items, "sqlite"
+  if not ROUTE_HISTORY_DIR:
+    return [], "none"
+  checkpoint_items, covered = _read_route_history_checkpoint(cutoff)
+  if checkpoint_items is not None:
+    items = checkpoint_items + _read_route_history_files(cutoff, end, covered)
+    source = "checkpoint"
+  else:
+    items = _read_route_history_files(cutoff, end, {})
+    source = "jsonl"
+  # Files and flushes can interleave slightly around span boundaries; the store expects ts order.
+  items.sort(key=itemgetter(0))
+  return items, source
+
+
+def _catch_up_history_rollups(cutoff: float, end: Optional[FileBounds] = None) -> int:
+  # Segments that expired while the process was down were never pruned, so
+  # fold whatever is still stored between the rollup horizon and the cutoff.
+  rollups = state.history_rollups
+  since = rollups.covered_until
+  if not HISTORY_ROLLUP_ENABLED or since >= cutoff:
+    return 0
+  if _sqlite_ready():
+    items = []
+    for entry in _query_history_segments(since, until=cutoff):
+      item = _history_item_from_entry(entry, since)
+      if item is not None:
+        items.append(item)
+  elif ROUTE_HISTORY_DIR:
+    bounds = end if end is not None else _route_history_file_bounds()
+    older = {name: info for name, info in bounds.items() if (_history_file_start(name) or cutoff) < cutoff}
+    items = [item for item in _read_route_history_files(since, older, {}) if item[0] < cutoff]
+  else:
+    return 0
+  # The route at exactly covered_until was folded before the restart.
+  items = [item for item in items if item[0] > since]
+  items.sort(key=itemgetter(0))
+  for item in items:
+    a = [item[1][0] / 1e6, item[1][1] / 1e6]
+    b = [item[2][0] / 1e6, item[2][1] / 1e6]
+    rollups.fold(item[0], _edge_key_from_e6(item[1], item[2]), a, b, item[6])
+  folded = len(items)
+  if folded:
+    rollups.flush()
+    print(f"[rollup] folded {folded} segments that expired while offline")
+  return folded
+
+
+def _finish_route_history_load() -> None:
+  state.route_history_dirty = not _sqlite_ready()
   if ROUTE_HISTORY_MAX_SEGMENTS > 0 and len(state.route_history_segments) > ROUTE_HISTORY_MAX_SEGMENTS:
     _prune_route_history(force_limit=True)
-    state.route_history_compact = True
+
+
+async def _load_route_history_background(until: float, end: Optional[FileBounds]) -> None:
+  progress = state.history_load
+  if not ROUTE_HISTORY_ENABLED:
+    progress.update({"state": "ready", "finished_at": time.time()})
+    return
+  progress.update({"state": "loading", "started_at": time.time()})
+  cutoff = time.time() - (ROUTE_HISTORY_HOURS * 3600)
+  try:
+    await asyncio.to_thread(_read_history_buckets_checkpoint)
+    await asyncio.to_thread(_catch_up_history_rollups, cutoff, end)
+    floor = cutoff
+    if HISTORY_ROLLUP_ENABLED and state.history_rollups.covered_until > cutoff:
+      # The memory governor folded these before the restart; reloading them
+      # would bring shed segments back and count them twice when they expire.
+      floor = state.history_rollups.covered_until
+    items, source = await asyncio.to_thread(_read_route_history_items, floor, until, end)
+    if floor > cutoff:
+      items = [item for item in items if item[0] > floor]
+  except Exception as exc:
+    print(f"[history] failed to load {ROUTE_HISTORY_DIR}: {exc}")
+    progress.update({"state": "failed", "error": str(exc), "finished_at": time.time()})
+    return
+  progress.update({"source": source, "total": len(items)})
+  # Insert newest-first at the head so live segments recorded meanwhile stay at the tail.
+  chunk = max(100, ROUTE_HISTORY_LOAD_CHUNK)
+  total = len(items)
+  for stop in range(total, 0, -chunk):
+    for idx in range(stop - 1, max(0, stop - chunk) - 1, -1):
+      _apply_history_item(items[idx], front=True)
+    progress["loaded"] = total - max(0, stop - chunk)
+    await asyncio.sleep(0)
+  _finish_route_history_load()
+  progress.update({"state": "ready", "finished_at": time.time()})
+  elapsed = progress["finished_at"] - (progress.get("started_at") or progress["finished_at"])
+  print(f"[history] loaded {len(items)} segments from {source} in {elapsed:.2f}s")
 
 
 async def _route_history_saver() -> None:
-  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_FILE:
+  if not ROUTE_HISTORY_ENABLED or not ROUTE_HISTORY_DIR:
     return
   while True:
     await asyncio.sleep(max(5.0, ROUTE_HISTORY_COMPACT_INTERVAL))
-    if not state.route_history_compact:
+    if state.history_load.get("state") != "ready":
       continue
-    now = time.time()
-    if now - state.route_history_last_compact < ROUTE_HISTORY_COMPACT_INTERVAL:
+    await asyncio.to_thread(_write_history_buckets_checkpoint)
+    if HISTORY_ROLLUP_ENABLED:
+      await asyncio.to_thread(state.history_rollups.flush)
+    if _sqlite_ready():
+      state.route_history_dirty = False
       continue
-    try:
-      os.makedirs(os.path.dirname(ROUTE_HISTORY_FILE), exist_ok=True)
-      tmp_path = f"{ROUTE_HISTORY_FILE}.tmp"
-      with open(tmp_path, "w", encoding="utf-8") as handle:
-        for entry in state.route_history_segments:
-          if not isinstance(entry, dict):
-            continue
-          handle.write(json.dumps(entry) + "\n")
-      os.replace(tmp_path, ROUTE_HISTORY_FILE)
-      state.route_history_last_compact = now
-      state.route_history_compact = False
-    except Exception as exc:
-      print(f"[history] failed to compact {ROUTE_HISTORY_FILE}: {exc}")
+    cutoff = time.time() - (ROUTE_HISTORY_HOURS * 3600)
+    # Expired spans are whole files, so retention never rewrites anything.
+    await asyncio.to_thread(_expire_route_history_files, cutoff)
+    if not state.route_history_dirty:
+      continue
+    state.route_history_dirty = False
+    # Most pending records go out in a thread first; the snapshot only flushes what arrived since.
+    await asyncio.to_thread(route_history_writer.flush)
+    snapshot = _route_history_checkpoint_snapshot()
+    if snapshot is not None:
+      await asyncio.to_thread(_write_route_history_checkpoint, snapshot)
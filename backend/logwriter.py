@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+FrameEncoder = Callable[[bytes], bytes]
+
+
+class BufferedLogWriter:
+  # Long-lived append handles with group commit: records are queued in memory,
+  # routed to a file by path_for(record), serialized and written in one batch
+  # per file per flush, and fsynced on their own cadence. With encode set, each
+  # per-file batch is written as one self-contained (e.g. compressed) frame.
+
+  def __init__(
+    self,
+    path_for: Callable[[Dict[str, Any]], str],
+    batch_records: int,
+    fsync_interval: float,
+    encode: Optional[FrameEncoder] = None,
+  ) -> None:
+    self.path_for = path_for
+    self.encode = encode
+    self.batch_records = max(1, int(batch_records))
+    self.fsync_interval = float(fsync_interval)
+    self._handles: Dict[str, Any] = {}
+    self._dirty: set = set()
+    self._pending: List[Dict[str, Any]] = []
+    self._lock = threading.Lock()
+    self._io_lock = threading.Lock()
+    self._last_fsync = time.time()
+    self.appended_total = 0
+    self.flushes = 0
+    self.bytes_written = 0
+    self.fsyncs = 0
+    self.errors = 0
+    self.last_flush_ms: Optional[float] = None
+
+  def append(self, records: List[Dict[str, Any]]) -> bool:
+    # Returns True once enough records are pending that a flush should run now.
+    with self._lock:
+      self._pending.extend(records)
+      self.appended_total += len(records)
+      return len(self._pending) >= self.batch_records
+
+  def pending(self) -> int:
+    with self._lock:
+      return len(self._pending)
+
+  def _open(self, path: str) -> Any:
+    handle = self._handles.get(path)
+    if handle is None:
+      directory = os.path.dirname(path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      handle = open(path, "ab")
+      self._handles[path] = handle
+    return handle
+
+  def _sync(self, path: str) -> None:
+    handle = self._handles.get(path)
+    if handle is not None:
+      os.fsync(handle.fileno())
+      self.fsyncs += 1
+    self._dirty.discard(path)
+
+  def flush(self, fsync: bool = False) -> int:
+    with self._io_lock:
+      with self._lock:
+        batch, self._pending = self._pending, []
+      written = 0
+      path = None
+      try:
+        if batch:
+          started = time.perf_counter()
+          grouped: Dict[str, List[str]] = {}
+          for record in batch:
+            grouped.setdefault(self.path_for(record), []).append(json.dumps(record) + "\n")
+          for path, lines in grouped.items():
+            data = "".join(lines).encode("utf-8")
+            if self.encode is not None:
+              data = self.encode(data)
+            handle = self._open(path)
+            handle.write(data)
+            handle.flush()
+            written += len(data)
+            self._dirty.add(path)
+          self.bytes_written += written
+          self.flushes += 1
+          self.last_flush_ms = round((time.perf_counter() - started) * 1000.0, 3)
+          # Files roll over by time, so anything not written this round is done with.
+          for stale in [name for name in self._handles if name not in grouped]:
+            if stale in self._dirty and self.fsync_interval > 0:
+              self._sync(stale)
+            self._close_handle(stale)
+        now = time.time()
+        due = self.fsync_interval > 0 and now - self._last_fsync >= self.fsync_interval
+        if self._dirty and (fsync or due):
+          for name in list(self._dirty):
+            path = name
+            self._sync(name)
+          self._last_fsync = now
+      except Exception as exc:
+        self.errors += 1
+        print(f"[history] failed to append {path}: {exc}")
+        self._close_all()
+      return written
+
+  def _close_handle(self, path: str) -> None:
+    handle = self._handles.pop(path, None)
+    self._dirty.discard(path)
+    if handle is None:
+      return
+    try:
+      handle.close()
+    except Exception:
+      pass
+
+  def _close_all(self) -> None:
+    for path in list(self._handles):
+      self._close_handle(path)
+
+  def reopen(self) -> None:
+    # Call after files were replaced or removed on disk so the next write opens the new inode.
+    with self._io_lock:
+      self._close_all()
+
+  def close(self) -> None:
+    self.flush(fsync=True)
+    with self._io_lock:
+      self._close_all()
+
+  def stats(self) -> Dict[str, Any]:
+    with self._io_lock:
+      open_files = sorted(os.path.basename(path) for path in self._handles)
+    return {
+      "open_files": open_files,
+      "pending": self.pending(),
+      "appended_total": self.appended_total,
+      "flushes": self.flushes,
+      "bytes_written": self.bytes_written,
+      "fsyncs": self.fsyncs,
+      "errors": self.errors,
+      "last_flush_ms": self.last_flush_ms,
+    }
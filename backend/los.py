@@ -1,19 +1,24 @@
-import json
 import math
 import time
-import urllib.parse
-import urllib.request
+from bisect import bisect_left
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+
+import state
 from config import (
-  ELEVATION_CACHE_TTL,
+  DEM_API_FALLBACK,
+  DEM_DIR,
   LOS_ELEVATION_URL,
+  LOS_FREQUENCY_MHZ,
+  LOS_FRESNEL_CLEARANCE,
+  LOS_K_FACTOR,
   LOS_PEAKS_MAX,
   LOS_SAMPLE_MAX,
   LOS_SAMPLE_MIN,
   LOS_SAMPLE_STEP_METERS,
 )
-from state import elevation_cache
+from state import elevation_cache, elevation_client
 
 
 def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -27,59 +32,65 @@ def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
   return radius * c
 
 
-def _elevation_cache_key(lat: float, lon: float) -> str:
-  return f"{lat:.5f},{lon:.5f}"
-
-
-def _chunked(seq: List[Any], size: int) -> List[List[Any]]:
-  return [seq[i:i + size] for i in range(0, len(seq), size)]
-
-
-def _fetch_elevations(points: List[Tuple[float, float, float]]) -> Tuple[Optional[List[float]], Optional[str]]:
+async def _fetch_elevations(
+  points: List[Tuple[float, float, float]],
+) -> Tuple[Optional[List[float]], Optional[str], List[bool]]:
+  # Returns (elevations, error, from_dem); from_dem marks the samples the DEM
+  # tiles answered, the rest came from the API or its cache.
   now = time.time()
   results: List[Optional[float]] = [None] * len(points)
-  missing: List[Tuple[int, float, float, str]] = []
 
+  if state.dem_store is not None:
+    local = state.dem_store.lookup([(lat, lon) for lat, lon, _ in points])
+    for idx, elev in enumerate(local):
+      results[idx] = elev
+    from_dem = [val is not None for val in results]
+    if all(from_dem):
+      return [float(val) for val in results], None, from_dem
+    if not DEM_API_FALLBACK:
+      return None, "elevation_fetch_failed: dem_tile_missing", from_dem
+  else:
+    from_dem = [False] * len(points)
+
+  # Samples are cached per DEM grid cell; each missing cell is fetched once,
+  # at the cell's own coordinates.
+  missing: Dict[int, List[int]] = {}
   for idx, (lat, lon, _) in enumerate(points):
-    key = _elevation_cache_key(lat, lon)
-    cached = elevation_cache.get(key)
-    if cached and now - cached[1] <= ELEVATION_CACHE_TTL:
-      results[idx] = cached[0]
+    if results[idx] is not None:
+      continue
+    key = elevation_cache.key(lat, lon)
+    if key in missing:
+      missing[key].append(idx)
+      continue
+    cached = elevation_cache.get(key, now)
+    if cached is not None:
+      results[idx] = cached
     else:
-      missing.append((idx, lat, lon, key))
+      missing[key] = [idx]
 
-  if not missing:
-    if any(val is None for val in results):
-      return None, "elevation_fetch_failed: incomplete_cache"
-    return [float(val) for val in results], None
-
-  for chunk in _chunked(missing, 100):
-    locations = "|".join(f"{lat},{lon}" for _, lat, lon, _ in chunk)
-    query = urllib.parse.urlencode({"locations": locations})
-    url = f"{LOS_ELEVATION_URL}?{query}"
+  if missing:
+    keys = list(missing)
     try:
-      with urllib.request.urlopen(url, timeout=6) as resp:
-        payload = json.loads(resp.read().decode("utf-8"))
+      fetched = await elevation_client.fetch([elevation_cache.location(key) for key in keys])
     except Exception as exc:
-      return None, f"elevation_fetch_failed: {exc}"
-
-    if payload.get("status") not in (None, "OK"):
-      return None, f"elevation_fetch_failed: {payload.get('status')}"
+      return None, f"elevation_fetch_failed: {exc}", from_dem
+    for key, elev in zip(keys, fetched):
+      elevation_cache.put(key, elev, now)
+      for idx in missing[key]:
+        results[idx] = elev
 
-    elev_results = payload.get("results", [])
-    if len(elev_results) != len(chunk):
-      return None, "elevation_fetch_failed: unexpected_result_length"
+  if any(val is None for val in results):
+    return None, "elevation_fetch_failed: incomplete_results", from_dem
+  return [float(val) for val in results], None, from_dem
 
-    for (idx, _, _, key), entry in zip(chunk, elev_results):
-      elev = entry.get("elevation")
-      if elev is None:
-        return None, "elevation_fetch_failed: missing_elevation"
-      elevation_cache[key] = (float(elev), now)
-      results[idx] = float(elev)
 
-  if any(val is None for val in results):
-    return None, "elevation_fetch_failed: incomplete_results"
-  return [float(val) for val in results], None
+def _elevation_provider(from_dem: Optional[List[bool]]) -> str:
+  dem = sum(from_dem) if from_dem else 0
+  if from_dem and dem == len(from_dem):
+    return f"dem:{DEM_DIR}"
+  if dem:
+    return "mixed"
+  return LOS_ELEVATION_URL
 
 
 def _sample_los_points(lat1: float, lon1: float, lat2: float, lon2: float) -> List[Tuple[float, float, float]]:
@@ -101,90 +112,290 @@ def _sample_los_points(lat1: float, lon1: float, lat2: float, lon2: float) -> Li
   return points
 
 
-def _los_max_obstruction(points: List[Tuple[float, float, float]], elevations: List[float], start_idx: int, end_idx: int) -> float:
-  if end_idx <= start_idx + 1:
-    return 0.0
-  start_t = points[start_idx][2]
-  end_t = points[end_idx][2]
-  if end_t <= start_t:
+def _los_arrays(points: List[Tuple[float, float, float]], elevations: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+  t = np.fromiter((point[2] for point in points), dtype=np.float64, count=len(points))
+  return t, np.asarray(elevations, dtype=np.float64)
+
+
+def _los_clearance(t: np.ndarray, elev: np.ndarray, start_idx: int, end_idx: int) -> np.ndarray:
+  # Terrain height above the straight sight line for the samples strictly
+  # between start_idx and end_idx (positive = obstruction).
+  start_t = t[start_idx]
+  end_t = t[end_idx]
+  frac = (t[start_idx + 1:end_idx] - start_t) / (end_t - start_t)
+  line_elev = elev[start_idx] + (elev[end_idx] - elev[start_idx]) * frac
+  return elev[start_idx + 1:end_idx] - line_elev
+
+
+def _los_max_obstruction(t: np.ndarray, elev: np.ndarray, start_idx: int, end_idx: int) -> float:
+  if end_idx <= start_idx + 1 or t[end_idx] <= t[start_idx]:
     return 0.0
-  start_elev = elevations[start_idx]
-  end_elev = elevations[end_idx]
-  max_obstruction = 0.0
-  for idx in range(start_idx + 1, end_idx):
-    frac = (points[idx][2] - start_t) / (end_t - start_t)
-    line_elev = start_elev + (end_elev - start_elev) * frac
-    clearance = elevations[idx] - line_elev
-    if clearance > max_obstruction:
-      max_obstruction = clearance
-  return max_obstruction
-
-
-def _find_los_suggestion(points: List[Tuple[float, float, float]], elevations: List[float]) -> Optional[Dict[str, Any]]:
-  if len(points) < 3:
+  return max(0.0, float(_los_clearance(t, elev, start_idx, end_idx).max()))
+
+
+# Relative slack for the fast relay passes (float noise, not meters).
+RELAY_SLOPE_EPS = 1e-9
+RELAY_SCORE_EPS = 1e-6
+
+
+def _relay_obstruction(t: np.ndarray, elev: np.ndarray, idx: int) -> float:
+  # Worst obstruction between a relay at idx and either endpoint, computed
+  # the same way as the endpoint-to-endpoint check. The fast passes below
+  # only shortlist candidates; verdicts and reported scores come from here.
+  return max(_los_max_obstruction(t, elev, 0, idx), _los_max_obstruction(t, elev, idx, len(elev) - 1))
+
+
+def _sweep_obstruction(dist: List[float], rise: List[float], slopes: List[float]) -> List[float]:
+  # For each k, max(0, max over j < k of rise[j] - slopes[k] * dist[j]): the
+  # worst obstruction under a sight line of slope slopes[k] from the origin,
+  # counting only samples before k. The max is always on the upper convex
+  # hull of the (dist, rise) points seen so far, whose edge slopes decrease,
+  # so each query is a bisect and the sweep is O(n log n).
+  hull_d: List[float] = []
+  hull_r: List[float] = []
+  neg_edges: List[float] = []
+  out = [0.0] * len(dist)
+  for k, (d, r) in enumerate(zip(dist, rise)):
+    if hull_d:
+      j = bisect_left(neg_edges, -slopes[k])
+      worst = hull_r[j] - slopes[k] * hull_d[j]
+      if worst > 0.0:
+        out[k] = worst
+    while len(hull_d) >= 2 and (
+      (hull_d[-1] - hull_d[-2]) * (r - hull_r[-2]) - (hull_r[-1] - hull_r[-2]) * (d - hull_d[-2]) >= 0
+    ):
+      hull_d.pop()
+      hull_r.pop()
+      neg_edges.pop()
+    if hull_d:
+      neg_edges.append(-(r - hull_r[-1]) / (d - hull_d[-1]))
+    hull_d.append(d)
+    hull_r.append(r)
+  return out
+
+
+def _relay_scores(t: np.ndarray, elev: np.ndarray) -> np.ndarray:
+  # max(obstruction to start, obstruction to end) for each inner sample.
+  last = len(elev) - 1
+  dist_a = t[1:last] - t[0]
+  rise_a = elev[1:last] - elev[0]
+  obst_a = _sweep_obstruction(dist_a.tolist(), rise_a.tolist(), (rise_a / dist_a).tolist())
+  dist_b = (t[last] - t[1:last])[::-1]
+  rise_b = (elev[1:last] - elev[last])[::-1]
+  obst_b = _sweep_obstruction(dist_b.tolist(), rise_b.tolist(), (rise_b / dist_b).tolist())[::-1]
+  return np.maximum(np.asarray(obst_a), np.asarray(obst_b))
+
+
+def _find_los_suggestion(
+  points: List[Tuple[float, float, float]],
+  t: np.ndarray,
+  elev: np.ndarray,
+  terrain: Optional[np.ndarray] = None,
+) -> Optional[Dict[str, Any]]:
+  # elev is the profile the sight lines are tested against; terrain (if the
+  # profile was adjusted, e.g. for curvature) is what gets reported.
+  n = len(elev)
+  if n < 3:
     return None
+  last = n - 1
+  # A relay at idx sees the start iff no earlier sample rises above the
+  # elevation angle from the start to idx, i.e. the prefix max of the slopes
+  # (e_i - e_0) / (t_i - t_0) doesn't exceed idx's own slope. The end side
+  # is the same with suffix maxima, so every candidate is classified in O(n).
+  slope_a = (elev[1:] - elev[0]) / (t[1:] - t[0])
+  horizon_a = np.concatenate(([-np.inf], np.maximum.accumulate(slope_a)[:-1]))
+  slope_b = (elev[:last] - elev[last]) / (t[last] - t[:last])
+  horizon_b = np.concatenate((np.maximum.accumulate(slope_b[::-1])[::-1][1:], [-np.inf]))
+  # Candidates are 1..n-2; slope_a is offset by one, slope_b is not. The
+  # slope test is loosened by float noise, and each shortlisted candidate is
+  # confirmed with _relay_obstruction, highest first (path order on ties).
+  near_a = RELAY_SLOPE_EPS * (np.abs(horizon_a[:-1]) + np.abs(slope_a[:-1]) + 1.0)
+  near_b = RELAY_SLOPE_EPS * (np.abs(horizon_b[1:]) + np.abs(slope_b[1:]) + 1.0)
+  maybe_clear = (horizon_a[:-1] <= slope_a[:-1] + near_a) & (horizon_b[1:] <= slope_b[1:] + near_b)
+  candidates = np.flatnonzero(maybe_clear) + 1
   best_idx = None
-  best_score = None
-  best_clear = False
-  for idx in range(1, len(points) - 1):
-    obst_a = _los_max_obstruction(points, elevations, 0, idx)
-    obst_b = _los_max_obstruction(points, elevations, idx, len(points) - 1)
-    score = max(obst_a, obst_b)
-    clear = score <= 0.0
-    if clear and not best_clear:
+  for idx in candidates[np.argsort(-elev[candidates], kind="stable")].tolist():
+    if _relay_obstruction(t, elev, idx) <= 0.0:
       best_idx = idx
-      best_score = score
-      best_clear = True
-    elif clear and best_clear:
-      if elevations[idx] > elevations[best_idx]:
-        best_idx = idx
-        best_score = score
-    elif not best_clear:
+      break
+  if best_idx is not None:
+    best_score = 0.0
+    best_clear = True
+  else:
+    scores = _relay_scores(t, elev)
+    # Rescore everything within float noise of the hull minimum; the first
+    # lowest in path order wins.
+    best_score = None
+    for idx in (np.flatnonzero(scores <= scores.min() * (1.0 + RELAY_SCORE_EPS) + RELAY_SCORE_EPS) + 1).tolist():
+      score = _relay_obstruction(t, elev, idx)
       if best_score is None or score < best_score:
         best_idx = idx
         best_score = score
-  if best_idx is None:
-    return None
+    best_clear = False
   return {
     "lat": round(points[best_idx][0], 6),
     "lon": round(points[best_idx][1], 6),
-    "elevation_m": round(float(elevations[best_idx]), 2),
+    "elevation_m": round(float((elev if terrain is None else terrain)[best_idx]), 2),
     "clear": best_clear,
-    "max_obstruction_m": round(float(best_score), 2) if best_score is not None else None,
+    "max_obstruction_m": round(best_score, 2),
+  }
+
+
+EARTH_RADIUS_M = 6371000.0
+SPEED_OF_LIGHT_M_S = 299792458.0
+
+
+def _earth_bulge(t: np.ndarray, distance_m: float, k_factor: float) -> np.ndarray:
+  # Height of the effective (k-scaled) earth above the chord between the
+  # endpoints, in meters.
+  d1 = t * distance_m
+  return d1 * (distance_m - d1) / (2.0 * k_factor * EARTH_RADIUS_M)
+
+
+def _los_radio_model(
+  t: np.ndarray,
+  elev: np.ndarray,
+  distance_m: float,
+  k_factor: float,
+  frequency_mhz: float,
+  clearance: float,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+  # Returns terrain raised by earth curvature (feed it to the obstruction and
+  # relay math in place of elev) plus first Fresnel zone clearance per sample.
+  bulge = _earth_bulge(t, distance_m, k_factor)
+  effective = elev + bulge
+  line_elev = effective[0] + (effective[-1] - effective[0]) * t
+  gap = line_elev - effective
+  d1 = t * distance_m
+  wavelength = SPEED_OF_LIGHT_M_S / (frequency_mhz * 1e6)
+  radius = np.sqrt(np.maximum(wavelength * d1 * (distance_m - d1) / distance_m, 0.0))
+  required_pct = clearance * 100.0
+  pct = np.full(len(elev), np.nan)
+  if len(elev) > 2:
+    pct[1:-1] = gap[1:-1] / radius[1:-1] * 100.0
+  model: Dict[str, Any] = {
+    "k_factor": k_factor,
+    "frequency_mhz": frequency_mhz,
+    "required_clearance_pct": round(required_pct, 1),
+    "max_bulge_m": round(float(bulge.max()), 2),
+    # Endpoints have no Fresnel zone and report None.
+    "clearance_pct": [None] * len(elev),
+    "fresnel_clear": True,
+    "worst": None,
   }
+  if len(elev) > 2:
+    model["clearance_pct"][1:-1] = np.round(pct[1:-1], 1).tolist()
+    idx = int(np.nanargmin(pct))
+    model["fresnel_clear"] = bool(pct[idx] >= required_pct)
+    model["worst"] = {
+      "index": idx,
+      "distance_m": round(float(d1[idx]), 2),
+      "clearance_pct": round(float(pct[idx]), 1),
+      "fresnel_radius_m": round(float(radius[idx]), 2),
+      "intrusion_m": round(max(0.0, float(clearance * radius[idx] - gap[idx])), 2),
+    }
+  return effective, model
 
 
 def _find_los_peaks(
   points: List[Tuple[float, float, float]],
-  elevations: List[float],
+  elev: np.ndarray,
   distance_m: float,
 ) -> List[Dict[str, Any]]:
   if len(points) < 3:
     return []
 
-  peak_indices = []
-  for idx in range(1, len(elevations) - 1):
-    elev = elevations[idx]
-    if elev >= elevations[idx - 1] and elev >= elevations[idx + 1]:
-      peak_indices.append(idx)
+  inner = elev[1:-1]
+  peak_indices = np.flatnonzero((inner >= elev[:-2]) & (inner >= elev[2:])) + 1
+  if not len(peak_indices):
+    peak_indices = np.array([int(np.argmax(inner)) + 1])
 
-  if not peak_indices:
-    try:
-      peak_indices = [max(range(1, len(elevations) - 1), key=lambda i: elevations[i])]
-    except ValueError:
-      return []
-
-  peak_indices = sorted(peak_indices, key=lambda i: elevations[i], reverse=True)[:LOS_PEAKS_MAX]
-  peak_indices = sorted(peak_indices, key=lambda i: points[i][2])
+  # Highest first (stable, so equal heights keep path order), then by position.
+  peak_indices = peak_indices[np.argsort(-elev[peak_indices], kind="stable")][:LOS_PEAKS_MAX]
+  peak_indices = np.sort(peak_indices)
 
   peaks = []
-  for i, idx in enumerate(peak_indices, start=1):
+  for i, idx in enumerate(peak_indices.tolist(), start=1):
     t = points[idx][2]
     peaks.append({
       "index": i,
       "lat": round(points[idx][0], 6),
       "lon": round(points[idx][1], 6),
-      "elevation_m": round(float(elevations[idx]), 2),
+      "elevation_m": round(float(elev[idx]), 2),
       "distance_m": round(distance_m * t, 2),
     })
   return peaks
+
+
+def _los_evaluate(
+  points: List[Tuple[float, float, float]],
+  elevations: List[float],
+  distance_m: float,
+  model: str,
+  include_points: bool = False,
+  detail: bool = True,
+  from_dem: Optional[List[bool]] = None,
+) -> Dict[str, Any]:
+  # The /los verdict for one sampled path; detail=False skips the per-sample
+  # profile, peaks and Fresnel percentages (batch verdicts). from_dem is the
+  # per-sample mask from _fetch_elevations and picks the reported provider.
+  sample_t, sample_elev = _los_arrays(points, elevations)
+  radio = None
+  if model == "radio":
+    # Curvature raises mid-path terrain; everything below uses the raised profile.
+    los_elev, radio = _los_radio_model(
+      sample_t, sample_elev, distance_m, LOS_K_FACTOR, LOS_FREQUENCY_MHZ, LOS_FRESNEL_CLEARANCE
+    )
+  else:
+    los_elev = sample_elev
+  start_elev = elevations[0]
+  end_elev = elevations[-1]
+  max_obstruction = _los_max_obstruction(sample_t, los_elev, 0, len(points) - 1)
+  max_terrain = max(elevations)
+  blocked = max_obstruction > 0.0
+  suggestion = _find_los_suggestion(points, sample_t, los_elev, sample_elev) if blocked else None
+  profile_samples = []
+  if detail:
+    for (lat, lon, t), elev in zip(points, los_elev.tolist()):
+      line_elev = start_elev + (end_elev - start_elev) * t
+      profile_samples.append([
+        round(distance_m * t, 2),
+        round(float(elev), 2),
+        round(float(line_elev), 2),
+      ])
+  peaks = _find_los_peaks(points, sample_elev, distance_m) if detail else None
+
+  response = {
+    "ok": True,
+    "blocked": blocked,
+    "max_obstruction_m": round(max_obstruction, 2),
+    "distance_m": round(distance_m, 2),
+    "distance_km": round(distance_m / 1000.0, 3),
+    "distance_mi": round(distance_m / 1609.344, 3),
+    "samples": len(points),
+    "elevation_m": {
+      "start": round(start_elev, 2),
+      "end": round(end_elev, 2),
+      "max_terrain": round(max_terrain, 2),
+    },
+    "provider": _elevation_provider(from_dem),
+    "model": model,
+    "note": (
+      f"Effective earth curvature (k={LOS_K_FACTOR:g}) and first Fresnel zone at {LOS_FREQUENCY_MHZ:g} MHz."
+      if radio else "Straight-line LOS using SRTM90m. No curvature/refraction."
+    ),
+    "suggested": suggestion,
+  }
+  if detail:
+    response["profile"] = profile_samples
+    response["peaks"] = peaks
+  if radio:
+    if not detail:
+      radio = {key: value for key, value in radio.items() if key != "clearance_pct"}
+    response["fresnel"] = radio
+  if include_points:
+    response["profile_points"] = [
+      [round(lat, 6), round(lon, 6), round(t, 4), round(float(elev), 2)]
+      for (lat, lon, t), elev in zip(points, elevations)
+    ]
+  return response
@@ -0,0 +1,197 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from los import _haversine_m
+from spatial import EdgeGridIndex
+
+# Repeater-to-repeater LOS matrix. Only pairs within max_km are tracked;
+# candidates come from a grid index of repeater positions, so a row costs a
+# handful of cell lookups instead of a scan over every repeater. When a
+# repeater appears or moves, its row/column is dropped and re-queued; the
+# rest of the matrix is left alone.
+METERS_PER_DEGREE = 111320.0
+
+PairKey = Tuple[str, str]
+
+
+def _pair_key(a: str, b: str) -> PairKey:
+  return (a, b) if a < b else (b, a)
+
+
+class LosMatrix:
+
+  def __init__(self, max_km: float, move_meters: float = 100.0, model: str = "straight") -> None:
+    self.max_m = max(0.0, float(max_km)) * 1000.0
+    self.move_meters = max(0.0, float(move_meters))
+    self.model = model
+    # Cells about the query radius wide, so a row lookup touches ~9 cells.
+    self._index = EdgeGridIndex(max(0.01, self.max_m / METERS_PER_DEGREE))
+    self.repeaters: Dict[str, Tuple[float, float]] = {}
+    self._versions: Dict[str, int] = {}
+    self._links: Dict[str, Set[str]] = {}
+    self.pairs: Dict[PairKey, Dict[str, Any]] = {}
+    self.pending: Set[PairKey] = set()
+    self.in_flight = 0
+    self.updated_at: Optional[float] = None
+    self.computed = 0
+    self.dirty = False
+
+  def __len__(self) -> int:
+    return len(self.pairs)
+
+  def _neighbors(self, device_id: str) -> List[str]:
+    lat, lon = self.repeaters[device_id]
+    dlat = self.max_m / METERS_PER_DEGREE
+    dlon = dlat / max(0.01, math.cos(math.radians(lat)))
+    west = lon - dlon
+    east = lon + dlon
+    if dlon >= 180.0:
+      west, east = -180.0, 180.0
+    else:
+      west = west + 360.0 if west < -180.0 else west
+      east = east - 360.0 if east > 180.0 else east
+    bounds = (west, max(-90.0, lat - dlat), east, min(90.0, lat + dlat))
+    found = []
+    for other in self._index.query(bounds):
+      if other == device_id:
+        continue
+      o_lat, o_lon = self.repeaters[other]
+      if _haversine_m(lat, lon, o_lat, o_lon) <= self.max_m:
+        found.append(other)
+    return found
+
+  def _drop(self, device_id: str) -> None:
+    for other in self._links.pop(device_id, set()):
+      self._links.get(other, set()).discard(device_id)
+      key = _pair_key(device_id, other)
+      self.pairs.pop(key, None)
+      self.pending.discard(key)
+
+  def _place(self, device_id: str, lat: float, lon: float) -> None:
+    self._index.remove(device_id)
+    self.repeaters[device_id] = (lat, lon)
+    self._versions[device_id] = self._versions.get(device_id, 0) + 1
+    self._index.add(device_id, [lat, lon], [lat, lon])
+    self._drop(device_id)
+    for other in self._neighbors(device_id):
+      self._links.setdefault(device_id, set()).add(other)
+      self._links.setdefault(other, set()).add(device_id)
+      self.pending.add(_pair_key(device_id, other))
+
+  def remove(self, device_id: str) -> None:
+    if device_id not in self.repeaters:
+      return
+    self._drop(device_id)
+    self._index.remove(device_id)
+    self.repeaters.pop(device_id, None)
+    self._versions.pop(device_id, None)
+    self.dirty = True
+
+  def sync(self, positions: Dict[str, Tuple[float, float]]) -> int:
+    # positions is the current {repeater id: (lat, lon)}; returns how many
+    # rows were invalidated.
+    changed = 0
+    for device_id in [d for d in self.repeaters if d not in positions]:
+      self.remove(device_id)
+      changed += 1
+    for device_id, (lat, lon) in positions.items():
+      known = self.repeaters.get(device_id)
+      if known is not None and _haversine_m(known[0], known[1], lat, lon) <= self.move_meters:
+        continue
+      self._place(device_id, lat, lon)
+      changed += 1
+    if changed:
+      self.dirty = True
+    return changed
+
+  def take(self, limit: int) -> List[Tuple[PairKey, Tuple[float, float], Tuple[float, float], Tuple[int, int]]]:
+    # Pops up to limit pending pairs with the positions and row versions they
+    # are computed against; finish() drops results whose rows moved since.
+    jobs = []
+    for key in list(self.pending)[:max(1, int(limit))]:
+      self.pending.discard(key)
+      a, b = key
+      jobs.append((key, self.repeaters[a], self.repeaters[b], (self._versions[a], self._versions[b])))
+    # Every taken pair is counted until its finish() or retry().
+    self.in_flight += len(jobs)
+    return jobs
+
+  def finish(self, key: PairKey, versions: Tuple[int, int], verdict: Dict[str, Any], now: float) -> bool:
+    self.in_flight = max(0, self.in_flight - 1)
+    a, b = key
+    if (self._versions.get(a), self._versions.get(b)) != versions:
+      return False
+    entry = {
+      "distance_m": verdict.get("distance_m"),
+      "blocked": verdict.get("blocked"),
+      "max_obstruction_m": verdict.get("max_obstruction_m"),
+      "ts": now,
+    }
+    fresnel = verdict.get("fresnel")
+    if fresnel:
+      entry["fresnel_clear"] = fresnel.get("fresnel_clear")
+      entry["fresnel_pct"] = (fresnel.get("worst") or {}).get("clearance_pct")
+    self.pairs[key] = entry
+    self.updated_at = now
+    self.computed += 1
+    self.dirty = True
+    return True
+
+  def retry(self, keys: Iterable[PairKey]) -> None:
+    for key in keys:
+      self.in_flight = max(0, self.in_flight - 1)
+      if key[0] in self._links and key[1] in self._links.get(key[0], set()):
+        self.pending.add(key)
+
+  def rows(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    if device_id is not None:
+      keys = [_pair_key(device_id, other) for other in self._links.get(device_id, set())]
+    else:
+      keys = list(self.pairs)
+    rows = []
+    for key in keys:
+      entry = self.pairs.get(key)
+      if entry is not None:
+        rows.append({"a": key[0], "b": key[1], **entry})
+    return rows
+
+  def export(self) -> Dict[str, Any]:
+    return {
+      "model": self.model,
+      "max_m": self.max_m,
+      "repeaters": {device_id: [lat, lon] for device_id, (lat, lon) in self.repeaters.items()},
+      "pairs": [[a, b, entry] for (a, b), entry in self.pairs.items()],
+      "updated_at": self.updated_at,
+    }
+
+  def restore(self, body: Dict[str, Any]) -> bool:
+    # A checkpoint from another model or range would mix verdicts; start over.
+    if body.get("model") != self.model or body.get("max_m") != self.max_m:
+      return False
+    for device_id, (lat, lon) in (body.get("repeaters") or {}).items():
+      self.repeaters[device_id] = (float(lat), float(lon))
+      self._versions[device_id] = 1
+      self._index.add(device_id, [lat, lon], [lat, lon])
+    for a, b, entry in body.get("pairs") or []:
+      if a in self.repeaters and b in self.repeaters:
+        self.pairs[_pair_key(a, b)] = dict(entry)
+    # Rebuild links (and queue any in-range pair the checkpoint lacks).
+    for device_id in self.repeaters:
+      for other in self._neighbors(device_id):
+        self._links.setdefault(device_id, set()).add(other)
+        key = _pair_key(device_id, other)
+        if key not in self.pairs:
+          self.pending.add(key)
+    self.updated_at = body.get("updated_at")
+    return True
+
+  def stats(self) -> Dict[str, Any]:
+    return {
+      "repeaters": len(self.repeaters),
+      "pairs": len(self.pairs),
+      "pending": len(self.pending) + self.in_flight,
+      "computed": self.computed,
+      "max_km": round(self.max_m / 1000.0, 3),
+      "model": self.model,
+      "updated_at": self.updated_at,
+    }
@@ -0,0 +1,140 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+NO_ID = 0xFFFFFFFF
+INTERN_COMPACT_AT = 65536
+
+
+class MessageOriginTracker:
+  # Per-message-hash origin cache: LRU ordered by last touch, TTL expiry from
+  # the cold end, a hard entry cap, and receivers stored as interned id indices.
+
+  def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+    self.ttl_seconds = float(ttl_seconds)
+    self.max_entries = int(max_entries)
+    # message_hash -> [last_ts, origin_idx, first_rx_idx, receivers array('I')]
+    self._entries: "OrderedDict[str, list]" = OrderedDict()
+    self._ids: Dict[str, int] = {}
+    self._names: List[str] = []
+    self._lock = threading.Lock()
+    self.inserted_total = 0
+    self.expired_total = 0
+    self.evicted_total = 0
+    self.compactions = 0
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def _intern(self, value: str) -> int:
+    idx = self._ids.get(value)
+    if idx is None:
+      idx = len(self._names)
+      self._ids[value] = idx
+      self._names.append(value)
+    return idx
+
+  def _name(self, idx: int) -> Optional[str]:
+    if idx == NO_ID:
+      return None
+    return self._names[idx]
+
+  def observe(
+    self,
+    message_hash: str,
+    now: float,
+    origin_id: Optional[str] = None,
+    receiver_id: Optional[str] = None,
+  ) -> Tuple[Optional[str], Optional[str]]:
+    with self._lock:
+      entry = self._entries.get(message_hash)
+      if entry is None:
+        entry = [now, NO_ID, NO_ID, array("I")]
+        self._entries[message_hash] = entry
+        self.inserted_total += 1
+        if self.max_entries > 0:
+          while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted_total += 1
+      else:
+        entry[0] = now
+        self._entries.move_to_end(message_hash)
+      if origin_id:
+        entry[1] = self._intern(origin_id)
+      if receiver_id:
+        rx_idx = self._intern(receiver_id)
+        receivers = entry[3]
+        if rx_idx not in receivers:
+          receivers.append(rx_idx)
+        if entry[2] == NO_ID:
+          entry[2] = rx_idx
+      return self._name(entry[1]), self._name(entry[2])
+
+  def receivers(self, message_hash: str) -> List[str]:
+    with self._lock:
+      entry = self._entries.get(message_hash)
+      if entry is None:
+        return []
+      return [self._names[idx] for idx in entry[3]]
+
+  def expire(self, now: float) -> int:
+    removed = 0
+    with self._lock:
+      cutoff = now - self.ttl_seconds
+      while self._entries:
+        entry = next(iter(self._entries.values()))
+        if entry[0] >= cutoff:
+          break
+        self._entries.popitem(last=False)
+        removed += 1
+      self.expired_total += removed
+      if len(self._names) >= INTERN_COMPACT_AT:
+        self._compact()
+    return removed
+
+  def trim(self, max_entries: int) -> int:
+    removed = 0
+    with self._lock:
+      while len(self._entries) > max(0, max_entries):
+        self._entries.popitem(last=False)
+        removed += 1
+      self.evicted_total += removed
+    return removed
+
+  def _compact(self) -> None:
+    old_names = self._names
+    self._ids = {}
+    self._names = []
+    for entry in self._entries.values():
+      if entry[1] != NO_ID:
+        entry[1] = self._intern(old_names[entry[1]])
+      if entry[2] != NO_ID:
+        entry[2] = self._intern(old_names[entry[2]])
+      entry[3] = array("I", (self._intern(old_names[idx]) for idx in entry[3]))
+    self.compactions += 1
+
+  def approx_bytes(self) -> int:
+    with self._lock:
+      receivers = sum(len(entry[3]) for entry in self._entries.values())
+      entries = len(self._entries)
+      interned = len(self._names)
+    # OrderedDict slot + 16-char hash key + 4-slot list + array header, then 4 bytes per receiver.
+    return entries * 330 + receivers * 4 + interned * 150
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      receivers = sum(len(entry[3]) for entry in self._entries.values())
+      entries = len(self._entries)
+      interned = len(self._names)
+    return {
+      "entries": entries,
+      "max_entries": self.max_entries,
+      "ttl_seconds": self.ttl_seconds,
+      "receivers": receivers,
+      "interned_ids": interned,
+      "inserted_total": self.inserted_total,
+      "expired_total": self.expired_total,
+      "evicted_total": self.evicted_total,
+      "compactions": self.compactions,
+    }
@@ -0,0 +1,99 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+PeerRow = Tuple[str, int, float]
+
+
+class PeerIndex:
+  # Per-device adjacency built from route history segments: outbound[a][b] and
+  # inbound[b][a] hold [count, last_ts]. Sorted peer lists are cached per device
+  # and dropped whenever that device's counters change.
+
+  def __init__(self) -> None:
+    self._outbound: Dict[str, Dict[str, List[float]]] = {}
+    self._inbound: Dict[str, Dict[str, List[float]]] = {}
+    self._versions: Dict[str, int] = {}
+    self._cache: Dict[str, Tuple[int, List[PeerRow], List[PeerRow]]] = {}
+    self._lock = threading.Lock()
+    self.cache_hits = 0
+    self.cache_misses = 0
+
+  def _bump(self, device_id: str) -> None:
+    self._versions[device_id] = self._versions.get(device_id, 0) + 1
+
+  def add(self, a_id: Optional[str], b_id: Optional[str], ts: float) -> None:
+    if not a_id or not b_id or a_id == b_id:
+      return
+    with self._lock:
+      for table, device_id, peer_id in ((self._outbound, a_id, b_id), (self._inbound, b_id, a_id)):
+        peers = table.setdefault(device_id, {})
+        counter = peers.get(peer_id)
+        if counter is None:
+          peers[peer_id] = [1, float(ts)]
+        else:
+          counter[0] += 1
+          if ts > counter[1]:
+            counter[1] = float(ts)
+        self._bump(device_id)
+
+  def remove(self, a_id: Optional[str], b_id: Optional[str]) -> None:
+    if not a_id or not b_id or a_id == b_id:
+      return
+    with self._lock:
+      for table, device_id, peer_id in ((self._outbound, a_id, b_id), (self._inbound, b_id, a_id)):
+        peers = table.get(device_id)
+        counter = peers.get(peer_id) if peers else None
+        if counter is None:
+          continue
+        # Expiry removes the oldest segment, so last_ts stays valid while any remain.
+        counter[0] -= 1
+        if counter[0] <= 0:
+          del peers[peer_id]
+          if not peers:
+            del table[device_id]
+        self._bump(device_id)
+        if device_id not in self._outbound and device_id not in self._inbound:
+          self._versions.pop(device_id, None)
+          self._cache.pop(device_id, None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._outbound.clear()
+      self._inbound.clear()
+      self._versions.clear()
+      self._cache.clear()
+
+  def peers(self, device_id: str) -> Tuple[List[PeerRow], List[PeerRow]]:
+    with self._lock:
+      version = self._versions.get(device_id, 0)
+      cached = self._cache.get(device_id)
+      if cached and cached[0] == version:
+        self.cache_hits += 1
+        return cached[1], cached[2]
+      self.cache_misses += 1
+      inbound = sorted(
+        ((peer_id, int(c[0]), c[1]) for peer_id, c in self._inbound.get(device_id, {}).items()),
+        key=lambda row: row[1],
+        reverse=True,
+      )
+      outbound = sorted(
+        ((peer_id, int(c[0]), c[1]) for peer_id, c in self._outbound.get(device_id, {}).items()),
+        key=lambda row: row[1],
+        reverse=True,
+      )
+      if version:
+        self._cache[device_id] = (version, inbound, outbound)
+      return inbound, outbound
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      links = sum(len(peers) for peers in self._outbound.values())
+      devices = len(set(self._outbound) | set(self._inbound))
+      cached = len(self._cache)
+    return {
+      "devices": devices,
+      "links": links,
+      "cached_devices": cached,
+      "cache_hits": self.cache_hits,
+      "cache_misses": self.cache_misses,
+    }
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+SegmentSource = Callable[[float, float], Iterator[Dict[str, Any]]]
+Sender = Callable[[Dict[str, Any]], Awaitable[None]]
+
+READ_CHUNK = 500
+MAX_BATCH = 1000
+MIN_TICK = 0.05
+MAX_TICK = 0.5
+CLOCK_EVERY = 1.0
+
+
+def _compact_segment(entry: Dict[str, Any]) -> List[Any]:
+  # [ts, [lat, lon], [lat, lon], a_id, b_id, payload_type, route_mode]
+  return [
+    entry.get("ts"),
+    entry.get("a"),
+    entry.get("b"),
+    entry.get("a_id"),
+    entry.get("b_id"),
+    entry.get("payload_type"),
+    entry.get("route_mode"),
+  ]
+
+
+class PlaybackSession:
+  # Replays stored segments against a virtual clock: clock = anchor_ts +
+  # (now - anchor_real) * speed while playing. Segments are pulled from the
+  # source iterator in small chunks on a worker thread as the clock reaches
+  # them. Commands only set fields; run() is the single consumer and applies
+  # seeks between reads. The source generator is closed on seek and whenever
+  # run() exits, including a disconnect or cancellation mid-read.
+
+  def __init__(self, source: SegmentSource, start: float, end: float, speed: float, max_speed: float) -> None:
+    self.source = source
+    self.start = start
+    self.end = end
+    self.max_speed = max_speed
+    self.speed = self._clamp_speed(speed)
+    self.paused = False
+    self.closed = False
+    self._anchor_ts = start
+    self._anchor_real = time.monotonic()
+    self._iterator: Optional[Iterator[Dict[str, Any]]] = None
+    self._reading: Optional["asyncio.Future[List[Dict[str, Any]]]"] = None
+    self._buffer: List[Dict[str, Any]] = []
+    self._exhausted = False
+    self._seek_to: Optional[float] = start
+    self._changed = asyncio.Event()
+    self.sent = 0
+
+  def _clamp_speed(self, speed: float) -> float:
+    return max(0.1, min(float(speed), self.max_speed))
+
+  def clock(self) -> float:
+    if self.paused:
+      return self._anchor_ts
+    return min(self.end, self._anchor_ts + (time.monotonic() - self._anchor_real) * self.speed)
+
+  def _reanchor(self, ts: float) -> None:
+    self._anchor_ts = ts
+    self._anchor_real = time.monotonic()
+
+  def pause(self) -> None:
+    if not self.paused:
+      self._reanchor(self.clock())
+      self.paused = True
+      self._changed.set()
+
+  def resume(self) -> None:
+    if self.paused:
+      self.paused = False
+      self._reanchor(self._anchor_ts)
+      self._changed.set()
+
+  def set_speed(self, speed: float) -> None:
+    self._reanchor(self.clock())
+    self.speed = self._clamp_speed(speed)
+    self._changed.set()
+
+  def seek(self, ts: float) -> None:
+    ts = max(self.start, min(float(ts), self.end))
+    self._reanchor(ts)
+    self._seek_to = ts
+    self._changed.set()
+
+  def close(self) -> None:
+    self.closed = True
+    self._changed.set()
+
+  def _release(self) -> None:
+    # Closing the source generator releases its open file or cursor. A chunk
+    # still being read on the worker thread owns it, so that read closes it.
+    iterator, self._iterator = self._iterator, None
+    if iterator is None or not hasattr(iterator, "close"):
+      return
+    reading = self._reading
+    if reading is None or reading.done():
+      iterator.close()
+      return
+
+    def _close_after(done: "asyncio.Future[List[Dict[str, Any]]]") -> None:
+      if not done.cancelled():
+        done.exception()
+      iterator.close()
+
+    reading.add_done_callback(_close_after)
+
+  async def _read(self) -> List[Dict[str, Any]]:
+    self._reading = asyncio.ensure_future(asyncio.to_thread(self._read_chunk))
+    return await asyncio.shield(self._reading)
+
+  def _read_chunk(self) -> List[Dict[str, Any]]:
+    chunk = []
+    for entry in self._iterator:
+      chunk.append(entry)
+      if len(chunk) >= READ_CHUNK:
+        break
+    return chunk
+
+  def state(self) -> Dict[str, Any]:
+    return {
+      "type": "playback_state",
+      "start": self.start,
+      "end": self.end,
+      "clock": self.clock(),
+      "speed": self.speed,
+      "paused": self.paused,
+    }
+
+  async def _wait(self, seconds: float) -> None:
+    try:
+      await asyncio.wait_for(self._changed.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+      pass
+    self._changed.clear()
+
+  async def run(self, send: Sender) -> None:
+    try:
+      await self._run(send)
+    finally:
+      self._release()
+
+  async def _run(self, send: Sender) -> None:
+    last_clock_sent = 0.0
+    while not self.closed:
+      if self._seek_to is not None:
+        target, self._seek_to = self._seek_to, None
+        self._release()
+        self._iterator = self.source(target, self.end)
+        self._buffer = []
+        self._exhausted = False
+        await send(self.state())
+      if self.paused:
+        await self._wait(MAX_TICK * 4)
+        continue
+      clock = self.clock()
+      # Read ahead only as far as the clock has reached.
+      while not self._exhausted and (not self._buffer or self._buffer[-1]["ts"] <= clock):
+        chunk = await self._read()
+        if not chunk:
+          self._exhausted = True
+        self._buffer.extend(chunk)
+        if self._seek_to is not None or self.closed:
+          break
+      if self._seek_to is not None:
+        continue
+      due = 0
+      while due < len(self._buffer) and due < MAX_BATCH and self._buffer[due]["ts"] <= clock:
+        due += 1
+      if due:
+        batch, self._buffer = self._buffer[:due], self._buffer[due:]
+        self.sent += due
+        await send({
+          "type": "playback_segments",
+          "clock": clock,
+          "segments": [_compact_segment(entry) for entry in batch],
+        })
+        last_clock_sent = time.monotonic()
+      elif time.monotonic() - last_clock_sent >= CLOCK_EVERY:
+        await send({"type": "playback_clock", "clock": clock})
+        last_clock_sent = time.monotonic()
+      if self._exhausted and not self._buffer and clock >= self.end:
+        await send({"type": "playback_end", "clock": clock, "sent": self.sent})
+        self.pause()
+        continue
+      if self._buffer:
+        wait = (self._buffer[0]["ts"] - clock) / self.speed
+      else:
+        wait = MAX_TICK
+      await self._wait(max(MIN_TICK, min(MAX_TICK, wait)))
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import math
+import struct
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from dem import DemTileStore
+
+# Server-side propagation raster: the browser worker's link-budget model
+# (log-distance path loss + clutter, knife-edge diffraction over the worst
+# obstruction, partial Fresnel clearance loss, 4/3-earth bulge) evaluated with
+# NumPy over the local DEM tiles. Renders run in a process pool; each worker
+# process opens its own DemTileStore.
+#
+# Rasters are returned as a compact binary blob:
+#   header (RASTER_HEADER) + coverage[rows * cols] + alpha[rows * cols]
+# coverage is the number of origins that reach a cell (0 = none) and alpha the
+# overlay opacity. Cells reached by at least required_overlap origins are drawn
+# green, the rest red, exactly like the client renderer.
+RASTER_MAGIC = b"MMPR"
+RASTER_VERSION = 1
+RASTER_HEADER = struct.Struct("<4sHHII6d")
+LAT_SCALE = 111320.0
+SPEED_OF_LIGHT = 299792458.0
+OVERLAP_RGB = (34, 197, 94)
+SINGLE_RGB = (239, 68, 68)
+
+# Mirrors PROP_DEFAULTS in app.js.
+DEFAULTS = {
+  "freq_mhz": 910.525,
+  "fresnel_factor": 0.2,
+  "clearance_ratio": 0.6,
+  "clearance_loss_db": 12.0,
+  "earth_radius_m": 6371000.0 * (4.0 / 3.0),
+}
+
+_dem: Optional[DemTileStore] = None
+
+
+def init_worker(dem_dir: str, max_open: int) -> None:
+  global _dem
+  _dem = DemTileStore(dem_dir, max_open) if dem_dir else None
+
+
+def _number(value: Any, default: Optional[float], low: float, high: float) -> Optional[float]:
+  try:
+    number = float(value)
+  except (TypeError, ValueError):
+    return default
+  if not math.isfinite(number):
+    return default
+  return round(min(high, max(low, number)), 6)
+
+
+def parse_render_request(body: Any, max_origins: int, max_range_m: float) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+  # Accepts the same shape the client posts to its worker
+  # ({origins, renderRange, maxPathLossDb, freqMHz, config: {...}}) and returns
+  # normalized, rounded params, so equal renders hash to the same key.
+  if not isinstance(body, dict):
+    return None, "invalid_body"
+  origins = []
+  for origin in body.get("origins") or []:
+    if isinstance(origin, dict):
+      lat, lon = origin.get("lat"), origin.get("lon")
+    elif isinstance(origin, (list, tuple)) and len(origin) == 2:
+      lat, lon = origin
+    else:
+      return None, "invalid_origin"
+    lat = _number(lat, None, -90.0, 90.0)
+    lon = _number(lon, None, -180.0, 180.0)
+    if lat is None or lon is None:
+      return None, "invalid_origin"
+    origins.append([lat, lon])
+  if not origins:
+    return None, "no_origins"
+  if len(origins) > max_origins:
+    return None, "too_many_origins"
+  config = body.get("config") if isinstance(body.get("config"), dict) else {}
+  range_m = _number(body.get("renderRange"), None, 0.0, float("inf"))
+  max_path_loss = _number(body.get("maxPathLossDb"), None, -1000.0, 1000.0)
+  if not range_m or max_path_loss is None:
+    return None, "invalid_budget"
+  if range_m > max_range_m:
+    return None, "range_too_large"
+  params = {
+    "origins": sorted(origins),
+    "range_m": range_m,
+    "max_path_loss_db": max_path_loss,
+    "freq_mhz": _number(body.get("freqMHz"), DEFAULTS["freq_mhz"], 1.0, 100000.0),
+    "grid_step": _number(config.get("gridStep"), 90.0, 30.0, 5000.0),
+    "sample_step": _number(config.get("sampleStep"), 90.0, 30.0, 5000.0),
+    "path_loss_exp": _number(config.get("pathLossExp"), 2.0, 1.0, 6.0),
+    "clutter_loss_db": _number(config.get("clutterLossDb"), 0.0, 0.0, 100.0),
+    "terrain": bool(config.get("useTerrain")),
+    "fresnel_factor": _number(config.get("fresnelFactor"), DEFAULTS["fresnel_factor"], 0.0, 1.0),
+    "clearance_ratio": _number(config.get("clearanceRatio"), DEFAULTS["clearance_ratio"], 0.01, 1.0),
+    "clearance_loss_db": _number(config.get("clearanceLossDb"), DEFAULTS["clearance_loss_db"], 0.0, 100.0),
+    "earth_radius_m": _number(config.get("earthRadiusM"), DEFAULTS["earth_radius_m"], 1000.0, 1e9),
+    "tx_agl": _number(config.get("txAgl"), 0.0, 0.0, 10000.0),
+    "rx_agl": _number(config.get("rxAgl"), 0.0, 0.0, 10000.0),
+    "tx_msl": _number(config.get("txMsl"), None, -1000.0, 10000.0),
+    "rx_msl": _number(config.get("rxMsl"), None, -1000.0, 10000.0),
+    "fade_by_margin": bool(config.get("fadeByMargin")),
+  }
+  return params, None
+
+
+def render_key(params: Dict[str, Any]) -> str:
+  blob = json.dumps(params, sort_keys=True, separators=(",", ":")).encode("utf-8")
+  return hashlib.sha1(blob).hexdigest()[:24]
+
+
+def raster_grid(params: Dict[str, Any]) -> Dict[str, float]:
+  origins = params["origins"]
+  ref_lat = sum(lat for lat, _ in origins) / len(origins)
+  lon_scale = LAT_SCALE * math.cos(math.radians(ref_lat))
+  lat_step = params["grid_step"] / LAT_SCALE
+  lon_step = params["grid_step"] / lon_scale
+  lat_radius = params["range_m"] / LAT_SCALE
+  lat_min = min(lat for lat, _ in origins) - lat_radius
+  lat_max = max(lat for lat, _ in origins) + lat_radius
+  lon_min = min(lon - params["range_m"] / (LAT_SCALE * math.cos(math.radians(lat))) for lat, lon in origins)
+  lon_max = max(lon + params["range_m"] / (LAT_SCALE * math.cos(math.radians(lat))) for lat, lon in origins)
+  return {
+    "lat_min": lat_min,
+    "lat_max": lat_max,
+    "lon_min": lon_min,
+    "lon_max": lon_max,
+    "lat_step": lat_step,
+    "lon_step": lon_step,
+    "rows": max(1, int(math.ceil((lat_max - lat_min) / lat_step))),
+    "cols": max(1, int(math.ceil((lon_max - lon_min) / lon_step))),
+  }
+
+
+def estimate_samples(params: Dict[str, Any], grid: Dict[str, float]) -> int:
+  # Same estimate as the client's cost label: cells * samples per ray * origins.
+  per_ray = max(2, int(math.ceil(params["range_m"] / params["sample_step"])) + 1) if params["terrain"] else 1
+  return int(grid["rows"] * grid["cols"] * per_ray * len(params["origins"]))
+
+
+def _knife_edge_loss(v: np.ndarray) -> np.ndarray:
+  with np.errstate(invalid="ignore", divide="ignore"):
+    loss = 6.9 + 20.0 * np.log10(np.sqrt((v - 0.1) ** 2 + 1.0) + v - 0.1)
+  return np.where(v > 0, np.maximum(0.0, loss), 0.0)
+
+
+def _elevations(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+  if _dem is None:
+    return np.full(lats.shape, np.nan)
+  return _dem.sample(lats, lons)
+
+
+def _origin_margin(
+  params: Dict[str, Any],
+  origin: Tuple[float, float],
+  lat: np.ndarray,
+  lon: np.ndarray,
+  end_ground: Optional[np.ndarray],
+) -> np.ndarray:
+  # Link margin (dB) from one origin to every cell; -inf outside its range.
+  o_lat, o_lon = origin
+  o_lon_scale = LAT_SCALE * math.cos(math.radians(o_lat))
+  dx = (lon - o_lon) * o_lon_scale
+  dy = (lat - o_lat) * LAT_SCALE
+  distance = np.sqrt(dx * dx + dy * dy)
+  valid = (distance > 1.0) & (distance <= params["range_m"])
+  if end_ground is not None:
+    valid &= ~np.isnan(end_ground)
+  margin = np.full(lat.shape, -np.inf)
+  if not valid.any():
+    return margin
+
+  idx = np.nonzero(valid)
+  d = distance[idx]
+  c_lat = lat[idx]
+  c_lon = lon[idx]
+  terrain = end_ground is not None
+  if params["tx_msl"] is not None:
+    tx_abs = params["tx_msl"]
+  else:
+    ground = float(_elevations(np.array([o_lat]), np.array([o_lon]))[0]) if terrain else 0.0
+    tx_abs = (0.0 if math.isnan(ground) else ground) + params["tx_agl"]
+  if params["rx_msl"] is not None:
+    rx_abs = np.full(d.shape, params["rx_msl"])
+  elif terrain:
+    rx_abs = end_ground[idx] + params["rx_agl"]
+  else:
+    rx_abs = np.full(d.shape, tx_abs)
+
+  extra = np.zeros(d.shape)
+  clearance_loss = np.zeros(d.shape)
+  if terrain:
+    lam = SPEED_OF_LIGHT / (params["freq_mhz"] * 1e6)
+    samples = np.maximum(2, np.ceil(d / params["sample_step"]).astype(np.int64) + 1)
+    max_v = np.zeros(d.shape)
+    min_ratio = np.full(d.shape, np.inf)
+    # Walk sample index i along every ray at once; rays drop out when they
+    # run out of interior samples, so total work matches the per-cell loop.
+    for i in range(1, int(samples.max()) - 1):
+      active = np.nonzero(i < samples - 1)[0]
+      t = i / (samples[active] - 1)
+      elev = _elevations(o_lat + (c_lat[active] - o_lat) * t, o_lon + (c_lon[active] - o_lon) * t)
+      known = ~np.isnan(elev)
+      if not known.all():
+        active, t, elev = active[known], t[known], elev[known]
+      da = d[active]
+      line = tx_abs + (rx_abs[active] - tx_abs) * t
+      d1 = da * t
+      d2 = da * (1 - t)
+      f1 = np.sqrt((lam * d1 * d2) / (d1 + d2))
+      effective = elev + (d1 * d2) / (2 * params["earth_radius_m"])
+      clearance = line - effective
+      with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(f1 > 0, clearance / f1, np.inf)
+        obstruction = -clearance - params["fresnel_factor"] * f1
+        v = np.where(obstruction > 0, obstruction * np.sqrt((2 * (d1 + d2)) / (lam * d1 * d2)), 0.0)
+      # Indices in active are unique, so plain fancy assignment is safe.
+      min_ratio[active] = np.minimum(min_ratio[active], ratio)
+      max_v[active] = np.maximum(max_v[active], v)
+    extra = _knife_edge_loss(max_v)
+    ratio_limit = params["clearance_ratio"]
+    short = np.isfinite(min_ratio) & (min_ratio < ratio_limit)
+    deficit = ratio_limit - np.maximum(-1.0, np.where(short, min_ratio, ratio_limit))
+    clearance_loss = np.where(
+      short, np.minimum(params["clearance_loss_db"], (deficit / ratio_limit) * params["clearance_loss_db"]), 0.0
+    )
+
+  fspl_1m = 32.44 + 20 * math.log10(params["freq_mhz"]) - 60
+  path_loss = fspl_1m + 10 * params["path_loss_exp"] * np.log10(d) + extra + clearance_loss + params["clutter_loss_db"]
+  margin[idx] = params["max_path_loss_db"] - path_loss
+  return margin
+
+
+def render_raster(params: Dict[str, Any]) -> bytes:
+  grid = raster_grid(params)
+  rows, cols = grid["rows"], grid["cols"]
+  lat = (grid["lat_max"] - np.arange(rows) * grid["lat_step"])[:, None] * np.ones((1, cols))
+  lon = (grid["lon_min"] + np.arange(cols) * grid["lon_step"])[None, :] * np.ones((rows, 1))
+  lat = lat.ravel()
+  lon = lon.ravel()
+  end_ground = _elevations(lat, lon) if params["terrain"] else None
+
+  count = np.zeros(lat.shape, dtype=np.int64)
+  best = np.full(lat.shape, -np.inf)
+  for origin in params["origins"]:
+    margin = _origin_margin(params, (origin[0], origin[1]), lat, lon, end_ground)
+    covered = margin > 0
+    count += covered
+    best = np.where(covered, np.maximum(best, margin), best)
+
+  covered = count > 0
+  if params["fade_by_margin"]:
+    # Math.round semantics (half up), like the client.
+    alpha = np.floor(255 * np.minimum(1.0, np.where(covered, best, 0.0) / 20.0) + 0.5)
+  else:
+    alpha = np.full(lat.shape, 255.0)
+  alpha = np.where(covered, alpha, 0).astype(np.uint8)
+  coverage = np.minimum(255, count).astype(np.uint8)
+  required = len(params["origins"]) if len(params["origins"]) >= 3 else 2
+  header = RASTER_HEADER.pack(
+    RASTER_MAGIC,
+    RASTER_VERSION,
+    required,
+    cols,
+    rows,
+    grid["lat_min"],
+    grid["lat_max"],
+    grid["lon_min"],
+    grid["lon_max"],
+    grid["lat_step"],
+    grid["lon_step"],
+  )
+  return header + coverage.tobytes() + alpha.tobytes()
+
+
+def raster_meta(blob: bytes) -> Dict[str, Any]:
+  _, _, required, cols, rows, lat_min, lat_max, lon_min, lon_max, lat_step, lon_step = RASTER_HEADER.unpack_from(blob, 0)
+  coverage = np.frombuffer(blob, dtype=np.uint8, count=rows * cols, offset=RASTER_HEADER.size)
+  return {
+    "width": cols,
+    "height": rows,
+    "bounds": {"latMin": lat_min, "latMax": lat_max, "lonMin": lon_min, "lonMax": lon_max},
+    "latStep": lat_step,
+    "lonStep": lon_step,
+    "requiredOverlap": required,
+    "coveredCells": int(np.count_nonzero(coverage)),
+  }
+
+
+def raster_png(blob: bytes) -> bytes:
+  _, _, required, cols, rows = RASTER_HEADER.unpack_from(blob, 0)[:5]
+  cells = rows * cols
+  coverage = np.frombuffer(blob, dtype=np.uint8, count=cells, offset=RASTER_HEADER.size)
+  alpha = np.frombuffer(blob, dtype=np.uint8, count=cells, offset=RASTER_HEADER.size + cells)
+  rgba = np.zeros((cells, 4), dtype=np.uint8)
+  overlap = coverage >= required
+  single = (coverage > 0) & ~overlap
+  rgba[overlap, :3] = OVERLAP_RGB
+  rgba[single, :3] = SINGLE_RGB
+  rgba[:, 3] = alpha
+  # Filter type 0 (None) on every scanline.
+  scanlines = np.zeros((rows, cols * 4 + 1), dtype=np.uint8)
+  scanlines[:, 1:] = rgba.reshape(rows, cols * 4)
+
+  def chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+  return b"".join([
+    b"\x89PNG\r\n\x1a\n",
+    chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, 6, 0, 0, 0)),
+    chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+    chunk(b"IEND", b""),
+  ])
@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from compression import codec_suffix, read_bytes, write_bytes
+from spatial import Bounds
+
+# One record per edge per UTC day:
+# [a_lat, a_lon, b_lat, b_lon, count, first_ts, last_ts, {payload_type: count}]
+Rollup = List[Any]
+TOP_PAYLOAD_TYPES = 5
+DAY_CACHE_SIZE = 32
+META_FILE = "meta.json"
+
+
+def _day_of(ts: float) -> str:
+  return time.strftime("%Y%m%d", time.gmtime(ts))
+
+
+def _merge(target: Rollup, source: Rollup) -> None:
+  target[4] += source[4]
+  target[5] = min(target[5], source[5])
+  target[6] = max(target[6], source[6])
+  types = target[7]
+  for payload_type, count in source[7].items():
+    types[payload_type] = types.get(payload_type, 0) + count
+
+
+def _copy(record: Rollup) -> Rollup:
+  return record[:7] + [dict(record[7])]
+
+
+def _in_bounds(record: Rollup, bounds: Optional[Bounds]) -> bool:
+  if bounds is None:
+    return True
+  west, south, east, north = bounds
+  e_south, e_north = min(record[0], record[2]), max(record[0], record[2])
+  e_west, e_east = min(record[1], record[3]), max(record[1], record[3])
+  if e_north < south or e_south > north:
+    return False
+  if west > east:
+    return e_east >= west or e_west <= east
+  return e_east >= west and e_west <= east
+
+
+class DailyRollupStore:
+  # Daily per-edge aggregates of segments that aged out of the raw history.
+  # Folds accumulate in memory and are merged into one file per UTC day on
+  # flush. covered_until is the newest folded ts: the startup catch-up and
+  # the history loader both start after it, so nothing is folded twice.
+
+  def __init__(self, directory: str, retention_days: float, codec: Optional[str]) -> None:
+    self.directory = directory
+    self.retention_days = float(retention_days)
+    self.codec = codec
+    self.covered_until = 0.0
+    self._pending: Dict[str, Dict[str, Rollup]] = {}
+    self._cache: "OrderedDict[str, Tuple[float, Dict[str, Rollup]]]" = OrderedDict()
+    self._lock = threading.Lock()
+    self._io_lock = threading.Lock()
+    self.folded = 0
+    self.flushes = 0
+    self._load_meta()
+
+  def _load_meta(self) -> None:
+    try:
+      with open(os.path.join(self.directory, META_FILE), "r", encoding="utf-8") as handle:
+        self.covered_until = float(json.load(handle).get("covered_until") or 0.0)
+    except (OSError, ValueError, TypeError, AttributeError):
+      self.covered_until = 0.0
+
+  def _path(self, day: str) -> str:
+    return os.path.join(self.directory, f"{day}.json{codec_suffix(self.codec)}")
+
+  def _day_files(self) -> Dict[str, str]:
+    files: Dict[str, str] = {}
+    try:
+      names = os.listdir(self.directory)
+    except OSError:
+      return files
+    for name in names:
+      day = name.split(".", 1)[0]
+      if len(day) == 8 and day.isdigit() and name != META_FILE:
+        # After a codec change the newest file for a day wins.
+        current = files.get(day)
+        if current is None or os.path.getmtime(os.path.join(self.directory, name)) > os.path.getmtime(current):
+          files[day] = os.path.join(self.directory, name)
+    return files
+
+  def fold(self, ts: float, key: str, a: List[float], b: List[float], payload_type: Any) -> None:
+    with self._lock:
+      bucket = self._pending.setdefault(_day_of(ts), {})
+      record = bucket.get(key)
+      if record is None:
+        record = [a[0], a[1], b[0], b[1], 0, ts, ts, {}]
+        bucket[key] = record
+      record[4] += 1
+      record[5] = min(record[5], ts)
+      record[6] = max(record[6], ts)
+      label = str(payload_type) if payload_type is not None else "unknown"
+      record[7][label] = record[7].get(label, 0) + 1
+      # Segments can expire out of ts order, so the high-water mark only
+      # moves forward; the startup catch-up folds strictly newer segments.
+      if ts > self.covered_until:
+        self.covered_until = ts
+      self.folded += 1
+
+  def _read_day(self, path: str) -> Dict[str, Rollup]:
+    try:
+      mtime = os.path.getmtime(path)
+    except OSError:
+      return {}
+    with self._lock:
+      cached = self._cache.get(path)
+      if cached and cached[0] == mtime:
+        self._cache.move_to_end(path)
+        return cached[1]
+    try:
+      edges = json.loads(read_bytes(path)).get("edges") or {}
+    except (OSError, ValueError, AttributeError) as exc:
+      print(f"[rollup] failed to read {path}: {exc}")
+      return {}
+    with self._lock:
+      self._cache[path] = (mtime, edges)
+      while len(self._cache) > DAY_CACHE_SIZE:
+        self._cache.popitem(last=False)
+    return edges
+
+  def flush(self) -> int:
+    with self._io_lock:
+      with self._lock:
+        pending, self._pending = self._pending, {}
+        covered_until = self.covered_until
+      if not pending:
+        return 0
+      os.makedirs(self.directory, exist_ok=True)
+      files = self._day_files()
+      written = 0
+      for day, updates in pending.items():
+        existing = files.get(day)
+        merged = {key: _copy(record) for key, record in self._read_day(existing).items()} if existing else {}
+        for key, record in updates.items():
+          current = merged.get(key)
+          if current is None:
+            merged[key] = record
+          else:
+            _merge(current, record)
+        for record in merged.values():
+          if len(record[7]) > TOP_PAYLOAD_TYPES:
+            record[7] = dict(sorted(record[7].items(), key=lambda item: item[1], reverse=True)[:TOP_PAYLOAD_TYPES])
+        path = self._path(day)
+        tmp_path = f"{path}.tmp"
+        write_bytes(tmp_path, self.codec, json.dumps({"day": day, "edges": merged}, separators=(",", ":")).encode("utf-8"))
+        os.replace(tmp_path, path)
+        if existing and existing != path:
+          os.remove(existing)
+        written += len(updates)
+      meta_tmp = os.path.join(self.directory, META_FILE + ".tmp")
+      with open(meta_tmp, "w", encoding="utf-8") as handle:
+        json.dump({"covered_until": covered_until}, handle)
+      os.replace(meta_tmp, os.path.join(self.directory, META_FILE))
+      self._expire()
+      self.flushes += 1
+      return written
+
+  def _expire(self) -> None:
+    if self.retention_days <= 0:
+      return
+    oldest = _day_of(time.time() - self.retention_days * 86400)
+    for day, path in self._day_files().items():
+      if day < oldest:
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+
+  def _days(self, start_ts: float, end_ts: float) -> List[Tuple[str, Dict[str, Rollup]]]:
+    first, last = _day_of(start_ts), _day_of(end_ts)
+    files = self._day_files()
+    with self._lock:
+      pending = {day: {key: _copy(record) for key, record in edges.items()} for day, edges in self._pending.items()}
+    days = []
+    for day in sorted(set(files) | set(pending)):
+      if day < first or day > last:
+        continue
+      edges = self._read_day(files[day]) if day in files else {}
+      if day in pending:
+        merged = {key: _copy(record) for key, record in edges.items()}
+        for key, record in pending[day].items():
+          if key in merged:
+            _merge(merged[key], record)
+          else:
+            merged[key] = record
+        edges = merged
+      days.append((day, edges))
+    return days
+
+  def query(
+    self,
+    start_ts: float,
+    end_ts: float,
+    bounds: Optional[Bounds] = None,
+    min_count: int = 1,
+    limit: Optional[int] = None,
+  ) -> Tuple[int, List[Dict[str, Any]]]:
+    days = self._days(start_ts, end_ts)
+    # key -> [count, first_ts, last_ts, active_days, record]
+    totals: Dict[str, List[Any]] = {}
+    for _, edges in days:
+      for key, record in edges.items():
+        total = totals.get(key)
+        if total is None:
+          if bounds is not None and not _in_bounds(record, bounds):
+            continue
+          totals[key] = [record[4], record[5], record[6], 1, record]
+          continue
+        total[0] += record[4]
+        if record[5] < total[1]:
+          total[1] = record[5]
+        if record[6] > total[2]:
+          total[2] = record[6]
+        total[3] += 1
+    ranked = sorted(
+      ((key, total) for key, total in totals.items() if total[0] >= min_count),
+      key=lambda item: item[1][0],
+      reverse=True,
+    )
+    matched = len(ranked)
+    if limit is not None:
+      ranked = ranked[:limit]
+    results = []
+    for key, (count, first_ts, last_ts, active, record) in ranked:
+      # Payload types are only merged for the edges actually returned.
+      types: Dict[str, int] = {}
+      for _, edges in days:
+        day_record = edges.get(key)
+        if day_record is None:
+          continue
+        for payload_type, type_count in day_record[7].items():
+          types[payload_type] = types.get(payload_type, 0) + type_count
+      top = sorted(types.items(), key=lambda item: item[1], reverse=True)[:TOP_PAYLOAD_TYPES]
+      results.append({
+        "id": key,
+        "a": [record[0], record[1]],
+        "b": [record[2], record[3]],
+        "count": count,
+        "first_seen": first_ts,
+        "last_seen": last_ts,
+        "active_days": active,
+        "payload_types": dict(top),
+      })
+    return matched, results
+
+  def series(self, key: str, start_ts: float, end_ts: float) -> List[Dict[str, Any]]:
+    rows = []
+    for day, edges in self._days(start_ts, end_ts):
+      record = edges.get(key)
+      if record is None:
+        continue
+      rows.append({
+        "day": f"{day[:4]}-{day[4:6]}-{day[6:]}",
+        "count": record[4],
+        "first_seen": record[5],
+        "last_seen": record[6],
+        "payload_types": dict(record[7]),
+      })
+    return rows
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      pending = sum(len(edges) for edges in self._pending.values())
+      cached = len(self._cache)
+    return {
+      "days": len(self._day_files()),
+      "pending_edges": pending,
+      "cached_days": cached,
+      "covered_until": self.covered_until,
+      "folded": self.folded,
+      "flushes": self.flushes,
+    }
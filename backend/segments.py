@@ -0,0 +1,353 @@
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+NONE_IDX = -1
+
+PointE6 = Tuple[int, int]
+
+
+def _format_e6(value: int) -> str:
+  sign = "-" if value < 0 else ""
+  whole, frac = divmod(abs(value), 1000000)
+  return f"{sign}{whole}.{frac:06d}"
+
+
+def _edge_key_from_e6(a: PointE6, b: PointE6) -> str:
+  return f"{_format_e6(a[0])},{_format_e6(a[1])}|{_format_e6(b[0])},{_format_e6(b[1])}"
+
+
+class StringPool:
+  # Refcounted string interning; freed slots are reused so the pool tracks live values only.
+
+  def __init__(self) -> None:
+    self._ids: Dict[str, int] = {}
+    self._values: List[Optional[str]] = []
+    self._refs = array("I")
+    self._free: List[int] = []
+
+  def __len__(self) -> int:
+    return len(self._ids)
+
+  def acquire(self, value: Any) -> int:
+    if value is None:
+      return NONE_IDX
+    if not isinstance(value, str):
+      value = str(value)
+    idx = self._ids.get(value)
+    if idx is None:
+      if self._free:
+        idx = self._free.pop()
+        self._values[idx] = value
+        self._refs[idx] = 0
+      else:
+        idx = len(self._values)
+        self._values.append(value)
+        self._refs.append(0)
+      self._ids[value] = idx
+    self._refs[idx] += 1
+    return idx
+
+  def release(self, idx: int) -> None:
+    if idx == NONE_IDX:
+      return
+    refs = self._refs[idx] - 1
+    self._refs[idx] = refs
+    if refs == 0:
+      value = self._values[idx]
+      self._values[idx] = None
+      self._ids.pop(value, None)
+      self._free.append(idx)
+
+  def value(self, idx: int) -> Optional[str]:
+    if idx == NONE_IDX:
+      return None
+    return self._values[idx]
+
+  def values(self) -> List[Optional[str]]:
+    return list(self._values)
+
+  def clear(self) -> None:
+    self._ids.clear()
+    self._values.clear()
+    self._refs = array("I")
+    self._free.clear()
+
+  def nbytes(self) -> int:
+    # dict slot + list slot + string object, roughly, for each live value.
+    return len(self._ids) * 170 + sum(len(v) for v in self._ids) + self._refs.itemsize * len(self._refs)
+
+
+class HistorySegmentStore:
+  # Columnar ring buffer for route history segments. Timestamps are float64,
+  # coordinates are int32 microdegrees, and ids/hashes/topics are pool indices.
+  # Each segment carries an integer edge slot, so expiring one is a head advance
+  # plus an edge refcount decrement. Columns double when full and halve once
+  # occupancy drops below a quarter, down to the initial capacity.
+
+  def __init__(self, capacity: int = 1024) -> None:
+    self._min_cap = max(16, capacity)
+    self._cap = 0
+    self._head = 0
+    self._size = 0
+    self._ids = StringPool()
+    self._hashes = StringPool()
+    self._labels = StringPool()
+    self._edge_slots: Dict[Tuple[int, int, int, int], int] = {}
+    self._edge_keys: List[Optional[str]] = []
+    self._edge_coords: List[Optional[Tuple[int, int, int, int]]] = []
+    self._edge_refs = array("i")
+    self._edge_free: List[int] = []
+    self._alloc(self._min_cap)
+
+  # ---- buffer management ----
+  def _columns(self) -> List[str]:
+    return [
+      "_ts", "_a_lat", "_a_lon", "_b_lat", "_b_lon", "_edge",
+      "_a_id", "_b_id", "_origin", "_receiver", "_hash", "_payload", "_mode", "_topic",
+    ]
+
+  def _alloc(self, capacity: int) -> None:
+    self._ts = array("d", bytes(8 * capacity))
+    for name in self._columns()[1:]:
+      setattr(self, name, array("i", bytes(4 * capacity)))
+    self._cap = capacity
+    self._head = 0
+
+  def _resize(self, new_cap: int) -> None:
+    for name in self._columns():
+      col = getattr(self, name)
+      ordered = self._ordered(col)
+      ordered.extend(array(col.typecode, bytes(col.itemsize * (new_cap - self._size))))
+      setattr(self, name, ordered)
+    self._cap = new_cap
+    self._head = 0
+
+  def __len__(self) -> int:
+    return self._size
+
+  def _slot(self, i: int) -> int:
+    if i < 0:
+      i += self._size
+    if i < 0 or i >= self._size:
+      raise IndexError("segment index out of range")
+    return (self._head + i) % self._cap
+
+  # ---- edges ----
+  def _acquire_edge(self, coords: Tuple[int, int, int, int]) -> Tuple[int, bool]:
+    slot = self._edge_slots.get(coords)
+    created = False
+    if slot is None:
+      key = _edge_key_from_e6((coords[0], coords[1]), (coords[2], coords[3]))
+      if self._edge_free:
+        slot = self._edge_free.pop()
+        self._edge_keys[slot] = key
+        self._edge_coords[slot] = coords
+        self._edge_refs[slot] = 0
+      else:
+        slot = len(self._edge_keys)
+        self._edge_keys.append(key)
+        self._edge_coords.append(coords)
+        self._edge_refs.append(0)
+      self._edge_slots[coords] = slot
+      created = True
+    self._edge_refs[slot] += 1
+    return slot, created
+
+  def _release_edge(self, slot: int) -> Tuple[str, bool]:
+    key = self._edge_keys[slot] or ""
+    refs = self._edge_refs[slot] - 1
+    self._edge_refs[slot] = refs
+    if refs > 0:
+      return key, False
+    coords = self._edge_coords[slot]
+    if coords is not None:
+      self._edge_slots.pop(coords, None)
+    self._edge_keys[slot] = None
+    self._edge_coords[slot] = None
+    self._edge_free.append(slot)
+    return key, True
+
+  def edge_key(self, a: PointE6, b: PointE6) -> Optional[str]:
+    slot = self._edge_slots.get((a[0], a[1], b[0], b[1]))
+    if slot is None:
+      return None
+    return self._edge_keys[slot]
+
+  def edge_count(self) -> int:
+    return len(self._edge_slots)
+
+  # ---- mutation ----
+  def _write(
+    self,
+    slot: int,
+    ts: float,
+    a: PointE6,
+    b: PointE6,
+    a_id: Any,
+    b_id: Any,
+    message_hash: Any,
+    payload_type: Any,
+    origin_id: Any,
+    receiver_id: Any,
+    route_mode: Any,
+    topic: Any,
+  ) -> str:
+    edge_slot, _ = self._acquire_edge((a[0], a[1], b[0], b[1]))
+    self._ts[slot] = float(ts)
+    self._a_lat[slot] = a[0]
+    self._a_lon[slot] = a[1]
+    self._b_lat[slot] = b[0]
+    self._b_lon[slot] = b[1]
+    self._edge[slot] = edge_slot
+    self._a_id[slot] = self._ids.acquire(a_id)
+    self._b_id[slot] = self._ids.acquire(b_id)
+    self._origin[slot] = self._ids.acquire(origin_id)
+    self._receiver[slot] = self._ids.acquire(receiver_id)
+    self._hash[slot] = self._hashes.acquire(message_hash)
+    self._payload[slot] = payload_type if isinstance(payload_type, int) and payload_type >= 0 else NONE_IDX
+    self._mode[slot] = self._labels.acquire(route_mode)
+    self._topic[slot] = self._labels.acquire(topic)
+    return self._edge_keys[edge_slot] or ""
+
+  def append(self, ts: float, a: PointE6, b: PointE6, *fields: Any) -> str:
+    if self._size == self._cap:
+      self._resize(self._cap * 2)
+    slot = (self._head + self._size) % self._cap
+    key = self._write(slot, ts, a, b, *fields)
+    self._size += 1
+    return key
+
+  def appendleft(self, ts: float, a: PointE6, b: PointE6, *fields: Any) -> str:
+    if self._size == self._cap:
+      self._resize(self._cap * 2)
+    slot = (self._head - 1) % self._cap
+    key = self._write(slot, ts, a, b, *fields)
+    self._head = slot
+    self._size += 1
+    return key
+
+  def popleft(self) -> Tuple[str, bool]:
+    if not self._size:
+      raise IndexError("pop from empty segment store")
+    slot = self._head
+    self._ids.release(self._a_id[slot])
+    self._ids.release(self._b_id[slot])
+    self._ids.release(self._origin[slot])
+    self._ids.release(self._receiver[slot])
+    self._hashes.release(self._hash[slot])
+    self._labels.release(self._mode[slot])
+    self._labels.release(self._topic[slot])
+    key, emptied = self._release_edge(self._edge[slot])
+    self._head = (slot + 1) % self._cap
+    self._size -= 1
+    if self._cap > self._min_cap and self._size < self._cap // 4:
+      self._resize(max(self._min_cap, self._cap // 2))
+    return key, emptied
+
+  def clear(self) -> None:
+    self._ids.clear()
+    self._hashes.clear()
+    self._labels.clear()
+    self._edge_slots.clear()
+    self._edge_keys.clear()
+    self._edge_coords.clear()
+    self._edge_refs = array("i")
+    self._edge_free.clear()
+    self._size = 0
+    self._alloc(self._min_cap)
+
+  # ---- reads ----
+  def oldest_ts(self) -> Optional[float]:
+    if not self._size:
+      return None
+    return self._ts[self._head]
+
+  def oldest_endpoints(self) -> Tuple[Optional[str], Optional[str]]:
+    slot = self._slot(0)
+    return self._ids.value(self._a_id[slot]), self._ids.value(self._b_id[slot])
+
+  def oldest_payload_type(self) -> Optional[int]:
+    payload = self._payload[self._slot(0)]
+    return payload if payload != NONE_IDX else None
+
+  def ts_at(self, i: int) -> float:
+    return self._ts[self._slot(i)]
+
+  def entry(self, i: int) -> Dict[str, Any]:
+    slot = self._slot(i)
+    payload = self._payload[slot]
+    return {
+      "ts": self._ts[slot],
+      "a": [self._a_lat[slot] / 1e6, self._a_lon[slot] / 1e6],
+      "b": [self._b_lat[slot] / 1e6, self._b_lon[slot] / 1e6],
+      "a_id": self._ids.value(self._a_id[slot]),
+      "b_id": self._ids.value(self._b_id[slot]),
+      "message_hash": self._hashes.value(self._hash[slot]),
+      "payload_type": payload if payload != NONE_IDX else None,
+      "origin_id": self._ids.value(self._origin[slot]),
+      "receiver_id": self._ids.value(self._receiver[slot]),
+      "route_mode": self._labels.value(self._mode[slot]),
+      "topic": self._labels.value(self._topic[slot]),
+    }
+
+  def edge_key_at(self, i: int) -> str:
+    return self._edge_keys[self._edge[self._slot(i)]] or ""
+
+  def __iter__(self) -> Iterator[Dict[str, Any]]:
+    for i in range(self._size):
+      yield self.entry(i)
+
+  def endpoints(self) -> Iterator[Tuple[float, Optional[str], Optional[str]]]:
+    ids = self._ids
+    for i in range(self._size):
+      slot = (self._head + i) % self._cap
+      yield self._ts[slot], ids.value(self._a_id[slot]), ids.value(self._b_id[slot])
+
+  def _ordered(self, col: array) -> array:
+    end = self._head + self._size
+    if end <= self._cap:
+      return col[self._head:end]
+    return col[self._head:] + col[:end - self._cap]
+
+  def snapshot(self) -> Dict[str, Any]:
+    # Ordered column copies and pool values as of now: cheap enough for the event
+    # loop, and export_columns() can decode it in a thread while appends go on.
+    return {
+      "columns": {name: self._ordered(getattr(self, name)) for name in self._columns() if name != "_edge"},
+      "ids": self._ids.values(),
+      "hashes": self._hashes.values(),
+      "labels": self._labels.values(),
+    }
+
+  def export_columns(self, snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    snap = snapshot if snapshot is not None else self.snapshot()
+    cols = snap["columns"]
+    coords = array("i", bytes(4 * 4 * len(cols["_ts"])))
+    coords[0::4] = cols["_a_lat"]
+    coords[1::4] = cols["_a_lon"]
+    coords[2::4] = cols["_b_lat"]
+    coords[3::4] = cols["_b_lon"]
+
+    def decode(values: List[Optional[str]], col: array) -> List[Optional[str]]:
+      return [values[idx] if idx != NONE_IDX else None for idx in col]
+
+    ids = snap["ids"]
+    return {
+      "ts": cols["_ts"].tobytes(),
+      "coords_e6": coords.tobytes(),
+      "columns": {
+        "a_id": decode(ids, cols["_a_id"]),
+        "b_id": decode(ids, cols["_b_id"]),
+        "message_hash": decode(snap["hashes"], cols["_hash"]),
+        "payload_type": [idx if idx != NONE_IDX else None for idx in cols["_payload"]],
+        "origin_id": decode(ids, cols["_origin"]),
+        "receiver_id": decode(ids, cols["_receiver"]),
+        "route_mode": decode(snap["labels"], cols["_mode"]),
+        "topic": decode(snap["labels"], cols["_topic"]),
+      },
+    }
+
+  def nbytes(self) -> int:
+    columns = sum(getattr(self, name).itemsize * self._cap for name in self._columns())
+    edges = len(self._edge_slots) * 260 + self._edge_refs.itemsize * len(self._edge_refs)
+    return columns + edges + self._ids.nbytes() + self._hashes.nbytes() + self._labels.nbytes()
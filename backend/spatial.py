@@ -0,0 +1,110 @@
+import math
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+
+
+class EdgeGridIndex:
+  # Uniform lat/lon grid over edge bounding boxes. An edge is listed in every
+  # cell its bbox touches; edges spanning more than max_cells cells go to a
+  # small "wide" set that every query checks directly.
+
+  def __init__(self, cell_degrees: float = 0.25, max_cells: int = 64) -> None:
+    self.cell_degrees = max(0.001, float(cell_degrees))
+    self.max_cells = max(1, int(max_cells))
+    self._cells: Dict[Tuple[int, int], Set[str]] = {}
+    self._bounds: Dict[str, Bounds] = {}
+    self._wide: Set[str] = set()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._bounds)
+
+  def _cell(self, value: float) -> int:
+    return int(math.floor(value / self.cell_degrees))
+
+  def _cell_range(self, bounds: Bounds) -> Tuple[int, int, int, int]:
+    west, south, east, north = bounds
+    return self._cell(west), self._cell(south), self._cell(east), self._cell(north)
+
+  def add(self, key: str, a: List[float], b: List[float]) -> None:
+    bounds = (min(a[1], b[1]), min(a[0], b[0]), max(a[1], b[1]), max(a[0], b[0]))
+    with self._lock:
+      if key in self._bounds:
+        return
+      self._bounds[key] = bounds
+      x0, y0, x1, y1 = self._cell_range(bounds)
+      if (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_cells:
+        self._wide.add(key)
+        return
+      for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+          self._cells.setdefault((x, y), set()).add(key)
+
+  def remove(self, key: str) -> None:
+    with self._lock:
+      bounds = self._bounds.pop(key, None)
+      if bounds is None:
+        return
+      if key in self._wide:
+        self._wide.discard(key)
+        return
+      x0, y0, x1, y1 = self._cell_range(bounds)
+      for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+          cell = self._cells.get((x, y))
+          if cell is None:
+            continue
+          cell.discard(key)
+          if not cell:
+            del self._cells[(x, y)]
+
+  def clear(self) -> None:
+    with self._lock:
+      self._cells.clear()
+      self._bounds.clear()
+      self._wide.clear()
+
+  def _query_box(self, box: Bounds, found: Set[str]) -> None:
+    west, south, east, north = box
+    x0, y0, x1, y1 = self._cell_range(box)
+    candidates: Set[str] = set(self._wide)
+    if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self._cells):
+      for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+          cell = self._cells.get((x, y))
+          if cell:
+            candidates.update(cell)
+    else:
+      # Zoomed far out: walking the occupied cells is cheaper than the box.
+      for (x, y), cell in self._cells.items():
+        if x0 <= x <= x1 and y0 <= y <= y1:
+          candidates.update(cell)
+    for key in candidates:
+      e_west, e_south, e_east, e_north = self._bounds[key]
+      if e_east >= west and e_west <= east and e_north >= south and e_south <= north:
+        found.add(key)
+
+  def query(self, bounds: Optional[Bounds] = None) -> Set[str]:
+    with self._lock:
+      if bounds is None:
+        return set(self._bounds)
+      west, south, east, north = bounds
+      found: Set[str] = set()
+      if west > east:
+        # Box crosses the antimeridian.
+        self._query_box((west, south, 180.0, north), found)
+        self._query_box((-180.0, south, east, north), found)
+      else:
+        self._query_box(bounds, found)
+      return found
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        "cell_degrees": self.cell_degrees,
+        "edges": len(self._bounds),
+        "cells": len(self._cells),
+        "wide_edges": len(self._wide),
+      }
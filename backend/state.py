@@ -3,6 +3,15 @@ from dataclasses import dataclass
 from typing import Any, Deque, Dict, List, Optional, Set
 
 import config
+from buckets import EdgeBucketAggregator
+from compression import resolve_codec
+from dem import DemTileStore
+from elevation import ElevationCache, ElevationClient
+from origins import MessageOriginTracker
+from peers import PeerIndex
+from rollups import DailyRollupStore
+from segments import HistorySegmentStore
+from spatial import EdgeGridIndex
 
 
 @dataclass
@@ -42,16 +51,51 @@ devices: Dict[str, DeviceState] = {}
 trails: Dict[str, list] = {}
 routes: Dict[str, Dict[str, Any]] = {}
 heat_events: List[Dict[str, float]] = []
-route_history_segments: Deque[Dict[str, Any]] = deque()
+route_history_segments = HistorySegmentStore()
 route_history_edges: Dict[str, Dict[str, Any]] = {}
-route_history_compact = False
-route_history_last_compact = 0.0
+history_edge_index = EdgeGridIndex(config.HISTORY_INDEX_CELL_DEGREES)
+peer_index = PeerIndex()
+history_buckets = EdgeBucketAggregator(
+  config.HISTORY_BUCKET_SECONDS,
+  config.HISTORY_BUCKET_FINE_HOURS * 3600,
+  config.HISTORY_BUCKET_RETENTION_HOURS * 3600,
+  config.HISTORY_INDEX_CELL_DEGREES,
+)
+storage_codec = resolve_codec(config.STORAGE_COMPRESSION)
+# Rollups are always compressed; gzip unless another codec is configured.
+history_rollups = DailyRollupStore(config.HISTORY_ROLLUP_DIR, config.HISTORY_ROLLUP_DAYS, storage_codec or "gzip")
+route_history_dirty = False
+# Bumped whenever live history edges change; tiles are cached per version.
+history_version = 0
+history_load: Dict[str, Any] = {
+  "state": "pending",
+  "source": None,
+  "loaded": 0,
+  "total": 0,
+  "started_at": None,
+  "finished_at": None,
+  "error": None,
+}
 node_hash_to_device: Dict[str, str] = {}
 node_hash_collisions: Set[str] = set()
 node_hash_candidates: Dict[str, List[str]] = {}
-elevation_cache: Dict[str, tuple] = {}
+elevation_cache = ElevationCache(
+  config.ELEVATION_CACHE_GRID_ARCSEC,
+  config.ELEVATION_CACHE_MAX_ENTRIES,
+  config.ELEVATION_CACHE_TTL,
+  config.ELEVATION_CACHE_FILE,
+)
+elevation_client = ElevationClient(
+  config.LOS_ELEVATION_URL,
+  config.LOS_ELEVATION_CHUNK,
+  config.LOS_ELEVATION_CONCURRENCY,
+  config.LOS_ELEVATION_RETRIES,
+  config.LOS_ELEVATION_TIMEOUT,
+  batch_window=config.LOS_ELEVATION_BATCH_MS / 1000.0,
+)
+dem_store = DemTileStore(config.DEM_DIR, config.DEM_MAX_OPEN_TILES) if config.DEM_DIR else None
 device_names: Dict[str, str] = {}
-message_origins: Dict[str, Dict[str, Any]] = {}
+message_origins = MessageOriginTracker(config.MESSAGE_ORIGIN_TTL_SECONDS, config.MESSAGE_ORIGIN_MAX_ENTRIES)
 device_roles: Dict[str, str] = {}
 device_role_sources: Dict[str, str] = {}
 state_dirty = False
@@ -120,6 +120,7 @@
     const historyLines = new Map(); // edge_id -> { line, count }
     const historyCache = new Map(); // edge_id -> raw edge data
     const historyLayer = L.layerGroup();
+    const playbackLayer = L.layerGroup();
     const peerLayer = L.layerGroup();
     const peerLines = new Map(); // peer_id -> line
     const routeLayer = L.layerGroup().addTo(map);
@@ -215,6 +216,30 @@
     const historyLinkSizeInput = document.getElementById('history-link-size');
     const historyLinkSizeValue = document.getElementById('history-link-size-value');
     let historyWindowSeconds = null;
+    const historyWindowSelect = document.getElementById('history-window');
+    const HISTORY_WINDOWS = ['live', '1h', '6h', '24h', '7d'];
+    const HISTORY_WINDOW_REFRESH_MS = 60000;
+    const historyLiveCache = new Map(); // live edges kept while a bucketed window is shown
+    let historyWindowChoice = 'live';
+    let historyWindowTimer = null;
+    let historyWindowBounds = null; // padded map bounds the current window was loaded for
+    let historyWindowMoveTimer = null;
+    const HISTORY_WINDOW_MAX_PAGES = 20;
+    // Zoomed out past this, live history is drawn from server tiles instead of one polyline per edge.
+    const historyTileMaxZoom = Number(config.historyTileMaxZoom);
+    const HISTORY_TILE_REFRESH_MS = 30000;
+    let historyTileLayer = null;
+    let historyTileTimer = null;
+    const playbackEnabled = config.playbackEnabled === 'true';
+    const playbackMaxSpeed = Number(config.playbackMaxSpeed) || 100;
+    const PLAYBACK_TRAIL_MS = 3000;
+    const PLAYBACK_MAX_LINES = 1500;
+    const playbackLines = []; // { line, expires } in draw order
+    let playbackSocket = null;
+    let playbackState = null; // last playback_state from the server
+    let playbackClock = 0;
+    let playbackPaused = false;
+    let playbackSweepTimer = null;
     const historyToolVersion = '1';
     localStorage.setItem('meshmapHistoryToolVersion', historyToolVersion);
     let historyVisible = false;
@@ -293,6 +318,9 @@
     let propagationLastConfig = null;
     let propagationGpu = null;
     let propagationGpuInitPromise = null;
+    // Server-side renders (cached per origin set + parameters); terrain needs a server DEM.
+    const propagationServer = config.propagationServer === 'true';
+    const propagationServerTerrain = config.propagationServerTerrain === 'true';
 
     const PROP_DEFAULTS = {
       freqMHz: 910.525,
@@ -674,6 +702,7 @@
           map.removeLayer(peerLayer);
         }
       }
+      syncHistoryTiles();
     }
 
     function setHistoryVisible(visible) {
@@ -702,10 +731,14 @@
         }
         renderHistoryFromCache();
         updateHistoryRendering();
-      } else if (map.hasLayer(historyLayer)) {
-        map.removeLayer(historyLayer);
-        clearHistoryLayer();
+      } else {
+        if (map.hasLayer(historyLayer)) {
+          map.removeLayer(historyLayer);
+          clearHistoryLayer();
+        }
+        stopPlayback();
       }
+      syncHistoryTiles();
       layoutSidePanels();
     }
 
@@ -1229,6 +1262,9 @@
           ? ' • Relay Suggested'
           : ' • Relay May Help (Still Blocked)';
       }
+      if (meta.fresnel_pct != null) {
+        status += ` • Fresnel ${Math.round(meta.fresnel_pct)}%`;
+      }
       return status;
     }
 
@@ -1515,7 +1551,8 @@
         blocked,
         obstruction_m: data.max_obstruction_m,
         suggested: false,
-        suggested_clear: false
+        suggested_clear: false,
+        fresnel_pct: data.fresnel && data.fresnel.worst ? data.fresnel.worst.clearance_pct : null
       };
       if (losSuggestion) {
         losLayer.removeLayer(losSuggestion);
@@ -2080,46 +2117,15 @@
           return;
         }
         if (msg.type === 'result') {
-          const pixels = new Uint8ClampedArray(msg.pixels);
-          const coverage = new Uint8Array(msg.coverage);
-          const canvas = document.createElement('canvas');
-          canvas.width = msg.width;
-          canvas.height = msg.height;
-          const ctx = canvas.getContext('2d');
-          const imageData = new ImageData(pixels, msg.width, msg.height);
-          ctx.putImageData(imageData, 0, 0);
-          propagationRasterCanvas = canvas;
-          const dataUrl = canvas.toDataURL('image/png');
-          const bounds = [
-            [msg.bounds.latMin, msg.bounds.lonMin],
-            [msg.bounds.latMax, msg.bounds.lonMax]
-          ];
-          if (!propagationRaster) {
-            propagationRaster = L.imageOverlay(dataUrl, bounds, { opacity: propagationLastConfig?.opacity ?? 0.2 }).addTo(propagationLayer);
-          } else {
-            propagationRaster.setUrl(dataUrl);
-            propagationRaster.setBounds(bounds);
-          }
-          if (propagationRaster && propagationLastConfig) {
-            propagationRaster.setOpacity(propagationLastConfig.opacity);
-          }
-          keepOverlaysAbovePropagation();
-          propagationRasterMeta = {
-            latMin: msg.bounds.latMin,
-            latMax: msg.bounds.latMax,
-            lonMin: msg.bounds.lonMin,
-            lonMax: msg.bounds.lonMax,
+          showPropagationRaster({
+            width: msg.width,
+            height: msg.height,
+            bounds: msg.bounds,
             latStep: msg.latStep,
             lonStep: msg.lonStep,
-            rows: msg.height,
-            cols: msg.width,
-            coverage
-          };
-          propagationRenderInFlight = false;
-          propagationNeedsRender = false;
-          if (propagationOrigins.length) {
-            updatePropagationStatusFromRaster();
-          }
+            pixels: new Uint8ClampedArray(msg.pixels),
+            coverage: new Uint8Array(msg.coverage)
+          });
           return;
         }
         if (msg.type === 'error') {
@@ -2130,6 +2136,97 @@
       return propagationWorker;
     }
 
+    function showPropagationRaster(result) {
+      const canvas = document.createElement('canvas');
+      canvas.width = result.width;
+      canvas.height = result.height;
+      const ctx = canvas.getContext('2d');
+      const imageData = new ImageData(result.pixels, result.width, result.height);
+      ctx.putImageData(imageData, 0, 0);
+      propagationRasterCanvas = canvas;
+      const dataUrl = canvas.toDataURL('image/png');
+      const bounds = [
+        [result.bounds.latMin, result.bounds.lonMin],
+        [result.bounds.latMax, result.bounds.lonMax]
+      ];
+      if (!propagationRaster) {
+        propagationRaster = L.imageOverlay(dataUrl, bounds, { opacity: propagationLastConfig?.opacity ?? 0.2 }).addTo(propagationLayer);
+      } else {
+        propagationRaster.setUrl(dataUrl);
+        propagationRaster.setBounds(bounds);
+      }
+      if (propagationRaster && propagationLastConfig) {
+        propagationRaster.setOpacity(propagationLastConfig.opacity);
+      }
+      keepOverlaysAbovePropagation();
+      propagationRasterMeta = {
+        latMin: result.bounds.latMin,
+        latMax: result.bounds.latMax,
+        lonMin: result.bounds.lonMin,
+        lonMax: result.bounds.lonMax,
+        latStep: result.latStep,
+        lonStep: result.lonStep,
+        rows: result.height,
+        cols: result.width,
+        coverage: result.coverage
+      };
+      propagationRenderInFlight = false;
+      propagationNeedsRender = false;
+      if (propagationOrigins.length) {
+        updatePropagationStatusFromRaster();
+      }
+    }
+
+    async function renderPropagationRasterServer(token, request) {
+      // Returns false when the server can't render it, so the caller falls back to the worker.
+      try {
+        const res = await fetch(withToken('/propagation/render'), {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...tokenHeaders() },
+          body: JSON.stringify(request)
+        });
+        if (!res.ok) return false;
+        const meta = await res.json();
+        if (token !== propagationComputeToken) return true;
+        const binRes = await fetch(withToken(meta.bin), { headers: tokenHeaders() });
+        if (!binRes.ok) return false;
+        const buffer = await binRes.arrayBuffer();
+        if (token !== propagationComputeToken) return true;
+        // Layout: header, coverage[cells], alpha[cells].
+        const cells = meta.width * meta.height;
+        const headerBytes = buffer.byteLength - (cells * 2);
+        const coverage = new Uint8Array(buffer.slice(headerBytes, headerBytes + cells));
+        const alpha = new Uint8Array(buffer, headerBytes + cells, cells);
+        const pixels = new Uint8ClampedArray(cells * 4);
+        for (let i = 0; i < cells; i++) {
+          if (!coverage[i]) continue;
+          const offset = i * 4;
+          if (coverage[i] >= meta.requiredOverlap) {
+            pixels[offset] = 34;
+            pixels[offset + 1] = 197;
+            pixels[offset + 2] = 94;
+          } else {
+            pixels[offset] = 239;
+            pixels[offset + 1] = 68;
+            pixels[offset + 2] = 68;
+          }
+          pixels[offset + 3] = alpha[i];
+        }
+        showPropagationRaster({
+          width: meta.width,
+          height: meta.height,
+          bounds: meta.bounds,
+          latStep: meta.latStep,
+          lonStep: meta.lonStep,
+          pixels,
+          coverage
+        });
+        return true;
+      } catch (err) {
+        return false;
+      }
+    }
+
     async function ensurePropagationGpu() {
       if (propagationGpu) return propagationGpu;
       if (!navigator.gpu) return null;
@@ -2473,10 +2570,7 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       } else {
         setPropStatus('Rendering: 0%');
       }
-      ensurePropagationWorker();
-      propagationWorker.postMessage({
-        type: 'render',
-        token,
+      const request = {
         origins,
         renderRange,
         maxPathLossDb: maxPathLoss,
@@ -2498,7 +2592,15 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
           rxMsl: config.rxMsl,
           fadeByMargin: config.fadeMargin
         }
-      });
+      };
+      if (propagationServer && (!config.terrain || propagationServerTerrain)) {
+        setPropStatus('Rendering on server...');
+        if (await renderPropagationRasterServer(token, request)) return;
+        if (token !== propagationComputeToken) return;
+        setPropStatus('Server render unavailable. Rendering: 0%');
+      }
+      ensurePropagationWorker();
+      propagationWorker.postMessage({ type: 'render', token, ...request });
     }
 
     function setPropagationOrigin(latlng, id = null) {
@@ -3096,6 +3198,81 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       return true;
     }
 
+    function historyTilesWanted() {
+      return historyVisible && nodesVisible && historyWindowChoice === 'live'
+        && Number.isFinite(historyTileMaxZoom) && historyTileMaxZoom >= 0
+        && map.getZoom() <= historyTileMaxZoom;
+    }
+
+    function drawHistoryTile(tile, coords, size, data) {
+      const ctx = tile.getContext('2d');
+      const thresholds = computeHistoryThresholds();
+      const origin = L.point(coords.x * size.x, coords.y * size.y);
+      ctx.lineCap = 'round';
+      ctx.lineJoin = 'round';
+      ctx.globalAlpha = 0.6;
+      (data.features || []).forEach(feature => {
+        const count = Number(feature.properties && feature.properties.count) || 1;
+        if (!historyFilterAllows(count, thresholds)) return;
+        const points = feature.geometry && feature.geometry.coordinates;
+        if (!Array.isArray(points) || points.length < 2) return;
+        ctx.beginPath();
+        points.forEach((coord, idx) => {
+          const p = map.project([coord[1], coord[0]], coords.z).subtract(origin);
+          if (idx === 0) ctx.moveTo(p.x, p.y);
+          else ctx.lineTo(p.x, p.y);
+        });
+        ctx.strokeStyle = historyColor(count, thresholds);
+        ctx.lineWidth = historyWeight(count);
+        ctx.stroke();
+      });
+    }
+
+    function createHistoryTileLayer() {
+      const HistoryTiles = L.GridLayer.extend({
+        createTile(coords, done) {
+          const tile = L.DomUtil.create('canvas', 'leaflet-tile');
+          const size = this.getTileSize();
+          tile.width = size.x;
+          tile.height = size.y;
+          fetch(withToken(`/tiles/edges/${coords.z}/${coords.x}/${coords.y}.json`), { headers: tokenHeaders() })
+            .then(res => (res.ok ? res.json() : null))
+            .then(data => {
+              if (data) drawHistoryTile(tile, coords, size, data);
+              done(null, tile);
+            })
+            .catch(err => done(err, tile));
+          return tile;
+        }
+      });
+      return new HistoryTiles({ pane: 'overlayPane', updateWhenZooming: false });
+    }
+
+    function redrawHistoryTiles() {
+      if (historyTileLayer && map.hasLayer(historyTileLayer)) {
+        historyTileLayer.redraw();
+      }
+    }
+
+    function syncHistoryTiles() {
+      if (historyTilesWanted()) {
+        if (!historyTileLayer) historyTileLayer = createHistoryTileLayer();
+        if (!map.hasLayer(historyTileLayer)) historyTileLayer.addTo(map);
+        if (map.hasLayer(historyLayer)) map.removeLayer(historyLayer);
+        if (!historyTileTimer) historyTileTimer = setInterval(redrawHistoryTiles, HISTORY_TILE_REFRESH_MS);
+        return;
+      }
+      if (historyTileLayer && map.hasLayer(historyTileLayer)) map.removeLayer(historyTileLayer);
+      if (historyTileTimer) {
+        clearInterval(historyTileTimer);
+        historyTileTimer = null;
+      }
+      if (historyVisible && nodesVisible && !map.hasLayer(historyLayer)) {
+        historyLayer.addTo(map);
+        renderHistoryFromCache();
+      }
+    }
+
     function updateHistoryFilterLabel() {
       if (!historyFilterLabel) return;
       let text = 'All links';
@@ -3137,6 +3314,7 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       updateHistoryFilterLabel();
       if (historyVisible && nodesVisible) {
         updateHistoryRendering();
+        redrawHistoryTiles();
       }
     }
 
@@ -3148,6 +3326,7 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       updateHistoryLinkSizeUI();
       if (historyVisible && nodesVisible) {
         updateHistoryRendering();
+        redrawHistoryTiles();
       }
     }
 
@@ -3209,6 +3388,105 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       renderHistoryEdge(edgeData);
     }
 
+    function upsertLiveHistoryEdge(edge) {
+      if (historyWindowChoice !== 'live') {
+        const id = historyEdgeId(edge);
+        if (id) historyLiveCache.set(id, { ...edge, id });
+        return;
+      }
+      upsertHistoryEdge(edge);
+    }
+
+    function removeLiveHistoryEdges(ids) {
+      if (historyWindowChoice !== 'live') {
+        ids.forEach(id => historyLiveCache.delete(id));
+        return;
+      }
+      removeHistoryEdges(ids);
+    }
+
+    function replaceHistoryEdges(edges) {
+      clearHistoryLayer();
+      historyCache.clear();
+      edges.forEach(edge => upsertHistoryEdge(edge));
+      updateHistoryRendering();
+      setStats();
+    }
+
+    async function loadHistoryWindow() {
+      const choice = historyWindowChoice;
+      if (choice === 'live') return;
+      // Only fetch what is on screen (plus a margin so small pans don't refetch).
+      const bounds = map.getBounds().pad(0.25);
+      const bbox = [
+        Math.max(-180, bounds.getWest()),
+        Math.max(-90, bounds.getSouth()),
+        Math.min(180, bounds.getEast()),
+        Math.min(90, bounds.getNorth())
+      ].map(v => v.toFixed(5)).join(',');
+      try {
+        const edges = [];
+        let cursor = null;
+        let windowSeconds = null;
+        for (let page = 0; page < HISTORY_WINDOW_MAX_PAGES; page += 1) {
+          let path = `/history/edges?window=${encodeURIComponent(choice)}&bbox=${bbox}`;
+          if (cursor) path += `&cursor=${encodeURIComponent(cursor)}`;
+          const res = await fetch(withToken(path), { headers: tokenHeaders() });
+          if (!res.ok) return;
+          const data = await res.json();
+          if (historyWindowChoice !== choice) return;
+          if (Array.isArray(data.edges)) edges.push(...data.edges);
+          windowSeconds = Number(data.window_seconds);
+          cursor = data.next_cursor;
+          if (!cursor) break;
+        }
+        historyWindowBounds = bounds;
+        replaceHistoryEdges(edges);
+        updateHistoryWindowLabel(windowSeconds);
+      } catch (err) {
+        console.warn('history window failed', err);
+      }
+    }
+
+    function onHistoryWindowMove() {
+      if (historyWindowChoice === 'live') return;
+      if (historyWindowBounds && historyWindowBounds.contains(map.getBounds())) return;
+      if (historyWindowMoveTimer) clearTimeout(historyWindowMoveTimer);
+      historyWindowMoveTimer = setTimeout(() => {
+        historyWindowMoveTimer = null;
+        loadHistoryWindow();
+      }, 300);
+    }
+
+    function setHistoryWindow(choice) {
+      const next = HISTORY_WINDOWS.includes(choice) ? choice : 'live';
+      localStorage.setItem('meshmapHistoryWindow', next);
+      if (historyWindowSelect) {
+        historyWindowSelect.value = next;
+      }
+      if (next === historyWindowChoice) return;
+      if (historyWindowChoice === 'live') {
+        // Keep receiving live edges in the background so switching back is instant.
+        historyLiveCache.clear();
+        historyCache.forEach((edge, id) => historyLiveCache.set(id, edge));
+      }
+      historyWindowChoice = next;
+      if (historyWindowTimer) {
+        clearInterval(historyWindowTimer);
+        historyWindowTimer = null;
+      }
+      historyWindowBounds = null;
+      syncHistoryTiles();
+      if (next === 'live') {
+        replaceHistoryEdges(Array.from(historyLiveCache.values()));
+        historyLiveCache.clear();
+        updateHistoryWindowLabel(historyWindowSeconds);
+        return;
+      }
+      loadHistoryWindow();
+      historyWindowTimer = setInterval(loadHistoryWindow, HISTORY_WINDOW_REFRESH_MS);
+    }
+
     function updateHistoryWindowLabel(seconds) {
       const targets = [historyLabel, historyPanelLabel].filter(Boolean);
       if (!targets.length) return;
@@ -3340,11 +3618,13 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
           snap.routes.forEach(r => upsertRoute(r, true));
         }
         if (Array.isArray(snap.history_edges)) {
-          snap.history_edges.forEach(edge => upsertHistoryEdge(edge));
+          snap.history_edges.forEach(edge => upsertLiveHistoryEdge(edge));
         }
         if (snap.history_window_seconds != null) {
           historyWindowSeconds = Number(snap.history_window_seconds);
-          updateHistoryWindowLabel(historyWindowSeconds);
+          if (historyWindowChoice === 'live') {
+            updateHistoryWindowLabel(historyWindowSeconds);
+          }
         }
         setStats();
       } catch (e) {
@@ -3352,6 +3632,123 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       }
     }
 
+    function playbackSegmentStyle(payloadType, routeMode) {
+      const type = Number(payloadType);
+      const color = type === 4
+        ? '#2ecc71'
+        : ((type === 2 || type === 5 || routeMode === 'fanout') ? '#2b8cff' : '#ff7a1a');
+      return { color, weight: 3, opacity: 0.9, interactive: false };
+    }
+
+    function sweepPlaybackLines(all = false) {
+      const now = Date.now();
+      while (playbackLines.length && (all || playbackLines[0].expires <= now || playbackLines.length > PLAYBACK_MAX_LINES)) {
+        playbackLayer.removeLayer(playbackLines.shift().line);
+      }
+    }
+
+    function drawPlaybackSegments(segments) {
+      const expires = Date.now() + PLAYBACK_TRAIL_MS;
+      for (const seg of segments) {
+        // [ts, a, b, a_id, b_id, payload_type, route_mode]
+        if (!Array.isArray(seg) || !Array.isArray(seg[1]) || !Array.isArray(seg[2])) continue;
+        const line = L.polyline([seg[1], seg[2]], playbackSegmentStyle(seg[5], seg[6])).addTo(playbackLayer);
+        playbackLines.push({ line, expires });
+      }
+      sweepPlaybackLines();
+    }
+
+    function updatePlaybackControls() {
+      const active = !!playbackSocket;
+      const toggle = document.getElementById('playback-toggle');
+      const stop = document.getElementById('playback-stop');
+      const seek = document.getElementById('playback-seek');
+      const clock = document.getElementById('playback-clock');
+      if (toggle) toggle.textContent = active && !playbackPaused ? 'Pause' : 'Play';
+      if (stop) stop.disabled = !active;
+      if (seek) {
+        seek.disabled = !active || !playbackState;
+        if (active && playbackState && document.activeElement !== seek) {
+          const span = Math.max(1, playbackState.end - playbackState.start);
+          seek.value = String(Math.round(((playbackClock - playbackState.start) / span) * 1000));
+        }
+      }
+      if (clock) {
+        clock.textContent = active && playbackClock
+          ? new Date(playbackClock * 1000).toLocaleString()
+          : '';
+      }
+    }
+
+    function sendPlayback(msg) {
+      if (playbackSocket && playbackSocket.readyState === WebSocket.OPEN) {
+        playbackSocket.send(JSON.stringify(msg));
+      }
+    }
+
+    function stopPlayback() {
+      if (playbackSocket) {
+        const ws = playbackSocket;
+        playbackSocket = null;
+        ws.onclose = null;
+        ws.close();
+      }
+      if (playbackSweepTimer) {
+        clearInterval(playbackSweepTimer);
+        playbackSweepTimer = null;
+      }
+      sweepPlaybackLines(true);
+      if (map.hasLayer(playbackLayer)) {
+        map.removeLayer(playbackLayer);
+      }
+      playbackState = null;
+      playbackClock = 0;
+      playbackPaused = false;
+      updatePlaybackControls();
+    }
+
+    function startPlayback() {
+      stopPlayback();
+      const hours = Number(document.getElementById('playback-hours')?.value || 1);
+      const speed = Math.min(playbackMaxSpeed, Number(document.getElementById('playback-speed')?.value || 10));
+      const proto = location.protocol === 'https:' ? 'wss' : 'ws';
+      const params = new URLSearchParams({ hours: String(hours), speed: String(speed) });
+      if (prodMode && apiToken) params.set('token', apiToken);
+      const ws = new WebSocket(`${proto}://${location.host}/ws/playback?${params}`);
+      playbackSocket = ws;
+      playbackLayer.addTo(map);
+      playbackSweepTimer = setInterval(() => sweepPlaybackLines(), 500);
+      ws.onmessage = (ev) => {
+        if (ws !== playbackSocket) return;
+        const msg = JSON.parse(ev.data);
+        if (msg.type === 'playback_state') {
+          playbackState = msg;
+          playbackPaused = !!msg.paused;
+          sweepPlaybackLines(true);
+        } else if (msg.type === 'playback_segments') {
+          drawPlaybackSegments(msg.segments || []);
+        } else if (msg.type === 'playback_end') {
+          playbackPaused = true;
+        }
+        if (Number.isFinite(msg.clock)) playbackClock = msg.clock;
+        updatePlaybackControls();
+      };
+      ws.onclose = () => {
+        if (ws === playbackSocket) stopPlayback();
+      };
+      updatePlaybackControls();
+    }
+
+    function togglePlayback() {
+      if (!playbackSocket) {
+        startPlayback();
+        return;
+      }
+      playbackPaused = !playbackPaused;
+      sendPlayback({ action: playbackPaused ? 'pause' : 'resume' });
+      updatePlaybackControls();
+    }
+
     function connectWS() {
       const proto = location.protocol === 'https:' ? 'wss' : 'ws';
       const wsSuffix = (prodMode && apiToken) ? `?token=${encodeURIComponent(apiToken)}` : '';
@@ -3380,11 +3777,13 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
             msg.routes.forEach(r => upsertRoute(r, true));
           }
           if (Array.isArray(msg.history_edges)) {
-            msg.history_edges.forEach(edge => upsertHistoryEdge(edge));
+            msg.history_edges.forEach(edge => upsertLiveHistoryEdge(edge));
           }
           if (msg.history_window_seconds != null) {
             historyWindowSeconds = Number(msg.history_window_seconds);
-            updateHistoryWindowLabel(historyWindowSeconds);
+            if (historyWindowChoice === 'live') {
+              updateHistoryWindowLabel(historyWindowSeconds);
+            }
           }
           setStats();
           return;
@@ -3425,13 +3824,13 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
 
         if (msg.type === "history_edges") {
           const edges = Array.isArray(msg.edges) ? msg.edges : [];
-          edges.forEach(edge => upsertHistoryEdge(edge));
+          edges.forEach(edge => upsertLiveHistoryEdge(edge));
           setStats();
           return;
         }
 
         if (msg.type === "history_edges_remove") {
-          removeHistoryEdges(msg.edge_ids || []);
+          removeLiveHistoryEdges(msg.edge_ids || []);
           return;
         }
 
@@ -3751,11 +4150,31 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
         updateHistoryFilter(ev.target.value);
       });
     }
+    if (historyWindowSelect) {
+      historyWindowSelect.addEventListener('change', (ev) => {
+        setHistoryWindow(ev.target.value);
+      });
+    }
+    setHistoryWindow(localStorage.getItem('meshmapHistoryWindow') || 'live');
     if (historyLinkSizeInput) {
       historyLinkSizeInput.addEventListener('input', (ev) => {
         updateHistoryLinkScale(ev.target.value);
       });
     }
+    const playbackPanel = document.getElementById('history-playback');
+    if (playbackPanel && playbackEnabled) {
+      playbackPanel.removeAttribute('hidden');
+      document.getElementById('playback-toggle')?.addEventListener('click', togglePlayback);
+      document.getElementById('playback-stop')?.addEventListener('click', stopPlayback);
+      document.getElementById('playback-speed')?.addEventListener('change', (ev) => {
+        sendPlayback({ action: 'speed', value: Number(ev.target.value) });
+      });
+      document.getElementById('playback-seek')?.addEventListener('change', (ev) => {
+        if (!playbackState) return;
+        const span = playbackState.end - playbackState.start;
+        sendPlayback({ action: 'seek', ts: playbackState.start + (Number(ev.target.value) / 1000) * span });
+      });
+    }
 
     if (peersToggle) {
       setPeersActive(false);
@@ -4070,6 +4489,9 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
       });
     }
 
+    map.on('moveend', onHistoryWindowMove);
+    map.on('zoomend', syncHistoryTiles);
+
     map.on('click', (ev) => {
       const target = ev && ev.originalEvent ? ev.originalEvent.target : null;
       if (target && target.closest && target.closest('.leaflet-popup')) {
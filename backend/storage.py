@@ -0,0 +1,482 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import (
+  SQLITE_BATCH_SIZE,
+  SQLITE_ENABLED,
+  SQLITE_FILE,
+  SQLITE_FLUSH_INTERVAL,
+  SQLITE_RETENTION_HOURS,
+)
+
+# =========================
+# Optional SQLite storage
+# =========================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+  device_id TEXT PRIMARY KEY,
+  lat REAL NOT NULL,
+  lon REAL NOT NULL,
+  ts REAL NOT NULL,
+  heading REAL,
+  speed REAL,
+  rssi REAL,
+  snr REAL,
+  name TEXT,
+  role TEXT,
+  raw_topic TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_devices_ts ON devices (ts);
+
+CREATE TABLE IF NOT EXISTS trails (
+  device_id TEXT NOT NULL,
+  lat REAL NOT NULL,
+  lon REAL NOT NULL,
+  ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trails_device_ts ON trails (device_id, ts);
+CREATE INDEX IF NOT EXISTS idx_trails_ts ON trails (ts);
+
+CREATE TABLE IF NOT EXISTS history_segments (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  ts REAL NOT NULL,
+  edge_key TEXT NOT NULL,
+  a_lat REAL NOT NULL,
+  a_lon REAL NOT NULL,
+  b_lat REAL NOT NULL,
+  b_lon REAL NOT NULL,
+  a_id TEXT,
+  b_id TEXT,
+  message_hash TEXT,
+  payload_type INTEGER,
+  origin_id TEXT,
+  receiver_id TEXT,
+  route_mode TEXT,
+  topic TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_ts ON history_segments (ts);
+CREATE INDEX IF NOT EXISTS idx_history_a_id ON history_segments (a_id, ts);
+CREATE INDEX IF NOT EXISTS idx_history_b_id ON history_segments (b_id, ts);
+CREATE INDEX IF NOT EXISTS idx_history_edge_key ON history_segments (edge_key, ts);
+
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
+"""
+
+DEVICE_COLUMNS = ("device_id", "lat", "lon", "ts", "heading", "speed", "rssi", "snr", "name", "role", "raw_topic")
+SEGMENT_COLUMNS = (
+  "ts", "edge_key", "a_lat", "a_lon", "b_lat", "b_lon", "a_id", "b_id",
+  "message_hash", "payload_type", "origin_id", "receiver_id", "route_mode", "topic",
+)
+FILE_IMPORT_KEY = "file_import_ts"
+
+# devices / trails as stored in state.json, plus (entry, edge_key) for every stored history segment.
+FileImport = Tuple[Dict[str, Any], Dict[str, Any], Iterable[Tuple[Dict[str, Any], str]]]
+
+_write_lock = threading.Lock()
+_write_conn: Optional[sqlite3.Connection] = None
+_read_local = threading.local()
+
+_pending_devices: Dict[str, Optional[Tuple[Any, ...]]] = {}
+_pending_trails: List[Tuple[Any, ...]] = []
+_pending_segments: List[Tuple[Any, ...]] = []
+_flush_wanted: Optional[asyncio.Event] = None
+_last_retention_prune = 0.0
+
+storage_stats = {
+  "flushes": 0,
+  "rows_written": 0,
+  "last_flush_ts": None,
+  "last_flush_ms": None,
+  "errors": 0,
+}
+
+
+def _connect() -> sqlite3.Connection:
+  conn = sqlite3.connect(SQLITE_FILE, timeout=10.0, check_same_thread=False)
+  conn.execute("PRAGMA journal_mode=WAL")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  conn.execute("PRAGMA temp_store=MEMORY")
+  conn.row_factory = sqlite3.Row
+  return conn
+
+
+def _sqlite_init(file_import: Optional[Callable[[], FileImport]] = None) -> bool:
+  global _write_conn
+  if not SQLITE_ENABLED:
+    return False
+  if _write_conn is not None:
+    return True
+  try:
+    directory = os.path.dirname(SQLITE_FILE)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    conn = _connect()
+    conn.executescript(SCHEMA)
+    conn.commit()
+  except Exception as exc:
+    print(f"[sqlite] failed to open {SQLITE_FILE}: {exc}")
+    return False
+  if file_import is not None and conn.execute("SELECT 1 FROM meta WHERE key = ?", (FILE_IMPORT_KEY,)).fetchone() is None:
+    try:
+      counts = _import_files(conn, *file_import())
+    except Exception as exc:
+      # Nothing was committed; stay on the files this run and retry the import next start.
+      print(f"[sqlite] failed to import file-backed state and history: {exc}")
+      conn.close()
+      return False
+    print(f"[sqlite] imported {counts[0]} devices, {counts[1]} trail points and {counts[2]} history segments from files")
+  _write_conn = conn
+  return True
+
+
+def _import_files(
+  conn: sqlite3.Connection,
+  device_data: Dict[str, Any],
+  trail_data: Dict[str, Any],
+  segments: Iterable[Tuple[Dict[str, Any], str]],
+) -> Tuple[int, int, int]:
+  # One-time copy of what the file-backed storage holds, so turning SQLite on
+  # keeps existing devices, trails and history. One transaction, marker
+  # included: an import that fails partway leaves nothing to duplicate.
+  device_rows = []
+  for device_id, value in device_data.items():
+    if not isinstance(value, dict):
+      continue
+    row = dict(value, device_id=str(device_id))
+    if any(row.get(col) is None for col in ("lat", "lon", "ts")):
+      continue
+    device_rows.append(tuple(row.get(col) for col in DEVICE_COLUMNS))
+  trail_rows = []
+  for device_id, trail in trail_data.items():
+    if not isinstance(trail, list):
+      continue
+    for point in trail:
+      if isinstance(point, (list, tuple)) and len(point) >= 3 and None not in point[:3]:
+        trail_rows.append((str(device_id), float(point[0]), float(point[1]), float(point[2])))
+  device_sql = (
+    f"INSERT OR REPLACE INTO devices ({', '.join(DEVICE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in DEVICE_COLUMNS)})"
+  )
+  segment_sql = (
+    f"INSERT INTO history_segments ({', '.join(SEGMENT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in SEGMENT_COLUMNS)})"
+  )
+  with conn:
+    conn.executemany(device_sql, device_rows)
+    conn.executemany("INSERT INTO trails (device_id, lat, lon, ts) VALUES (?, ?, ?, ?)", trail_rows)
+    imported = conn.executemany(segment_sql, (_segment_row(entry, key) for entry, key in segments)).rowcount
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (FILE_IMPORT_KEY, str(time.time())))
+  return len(device_rows), len(trail_rows), max(0, imported)
+
+
+def _sqlite_ready() -> bool:
+  return SQLITE_ENABLED and _write_conn is not None
+
+
+def _reader() -> Optional[sqlite3.Connection]:
+  if not _sqlite_ready():
+    return None
+  conn = getattr(_read_local, "conn", None)
+  if conn is None:
+    try:
+      conn = _connect()
+    except Exception as exc:
+      print(f"[sqlite] failed to open reader: {exc}")
+      return None
+    _read_local.conn = conn
+  return conn
+
+
+def _signal_flush() -> None:
+  pending = len(_pending_devices) + len(_pending_trails) + len(_pending_segments)
+  if _flush_wanted is not None and pending >= max(1, SQLITE_BATCH_SIZE):
+    _flush_wanted.set()
+
+
+def _queue_device(device: Any) -> None:
+  if not _sqlite_ready():
+    return
+  _pending_devices[device.device_id] = tuple(getattr(device, col) for col in DEVICE_COLUMNS)
+  _signal_flush()
+
+
+def _queue_device_delete(device_id: str) -> None:
+  if not _sqlite_ready():
+    return
+  _pending_devices[device_id] = None
+  _signal_flush()
+
+
+def _queue_trail_point(device_id: str, lat: float, lon: float, ts: float) -> None:
+  if not _sqlite_ready():
+    return
+  _pending_trails.append((device_id, float(lat), float(lon), float(ts)))
+  _signal_flush()
+
+
+def _segment_row(entry: Dict[str, Any], key: str) -> Tuple[Any, ...]:
+  a = entry.get("a") or [None, None]
+  b = entry.get("b") or [None, None]
+  return (
+    entry.get("ts"),
+    key,
+    a[0],
+    a[1],
+    b[0],
+    b[1],
+    entry.get("a_id"),
+    entry.get("b_id"),
+    entry.get("message_hash"),
+    entry.get("payload_type"),
+    entry.get("origin_id"),
+    entry.get("receiver_id"),
+    entry.get("route_mode"),
+    entry.get("topic"),
+  )
+
+
+def _queue_history_segments(entries: List[Dict[str, Any]], edge_keys: List[str]) -> None:
+  if not _sqlite_ready():
+    return
+  for entry, key in zip(entries, edge_keys):
+    _pending_segments.append(_segment_row(entry, key))
+  _signal_flush()
+
+
+def _take_pending() -> Tuple[Dict[str, Optional[Tuple[Any, ...]]], List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+  global _pending_devices, _pending_trails, _pending_segments
+  batch = (_pending_devices, _pending_trails, _pending_segments)
+  _pending_devices = {}
+  _pending_trails = []
+  _pending_segments = []
+  return batch
+
+
+def _write_batch(
+  device_rows: Dict[str, Optional[Tuple[Any, ...]]],
+  trail_rows: List[Tuple[Any, ...]],
+  segment_rows: List[Tuple[Any, ...]],
+) -> None:
+  global _last_retention_prune
+  if _write_conn is None:
+    return
+  started = time.perf_counter()
+  upserts = [row for row in device_rows.values() if row is not None]
+  deletes = [(device_id,) for device_id, row in device_rows.items() if row is None]
+  device_sql = (
+    f"INSERT OR REPLACE INTO devices ({', '.join(DEVICE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in DEVICE_COLUMNS)})"
+  )
+  segment_sql = (
+    f"INSERT INTO history_segments ({', '.join(SEGMENT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in SEGMENT_COLUMNS)})"
+  )
+  with _write_lock:
+    try:
+      with _write_conn:
+        if upserts:
+          _write_conn.executemany(device_sql, upserts)
+        if deletes:
+          _write_conn.executemany("DELETE FROM devices WHERE device_id = ?", deletes)
+        if trail_rows:
+          _write_conn.executemany("INSERT INTO trails (device_id, lat, lon, ts) VALUES (?, ?, ?, ?)", trail_rows)
+        if segment_rows:
+          _write_conn.executemany(segment_sql, segment_rows)
+        now = time.time()
+        if SQLITE_RETENTION_HOURS > 0 and now - _last_retention_prune >= 300:
+          cutoff = now - (SQLITE_RETENTION_HOURS * 3600)
+          _write_conn.execute("DELETE FROM history_segments WHERE ts < ?", (cutoff,))
+          _write_conn.execute("DELETE FROM trails WHERE ts < ?", (cutoff,))
+          _last_retention_prune = now
+    except Exception as exc:
+      storage_stats["errors"] += 1
+      print(f"[sqlite] batch write failed: {exc}")
+      return
+  storage_stats["flushes"] += 1
+  storage_stats["rows_written"] += len(upserts) + len(deletes) + len(trail_rows) + len(segment_rows)
+  storage_stats["last_flush_ts"] = time.time()
+  storage_stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+
+def _sqlite_flush_now() -> None:
+  if not _sqlite_ready():
+    return
+  device_rows, trail_rows, segment_rows = _take_pending()
+  if device_rows or trail_rows or segment_rows:
+    _write_batch(device_rows, trail_rows, segment_rows)
+
+
+async def _sqlite_writer() -> None:
+  global _flush_wanted
+  if not _sqlite_ready():
+    return
+  _flush_wanted = asyncio.Event()
+  while True:
+    try:
+      await asyncio.wait_for(_flush_wanted.wait(), timeout=max(0.2, SQLITE_FLUSH_INTERVAL))
+    except asyncio.TimeoutError:
+      pass
+    _flush_wanted.clear()
+    device_rows, trail_rows, segment_rows = _take_pending()
+    if device_rows or trail_rows or segment_rows:
+      await asyncio.to_thread(_write_batch, device_rows, trail_rows, segment_rows)
+
+
+def _sqlite_close() -> None:
+  global _write_conn
+  if _write_conn is None:
+    return
+  _sqlite_flush_now()
+  with _write_lock:
+    try:
+      _write_conn.close()
+    except Exception:
+      pass
+    _write_conn = None
+
+
+# =========================
+# Queries
+# =========================
+def _segment_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+  return {
+    "ts": float(row["ts"]),
+    "a": [row["a_lat"], row["a_lon"]],
+    "b": [row["b_lat"], row["b_lon"]],
+    "a_id": row["a_id"],
+    "b_id": row["b_id"],
+    "message_hash": row["message_hash"],
+    "payload_type": row["payload_type"],
+    "origin_id": row["origin_id"],
+    "receiver_id": row["receiver_id"],
+    "route_mode": row["route_mode"],
+    "topic": row["topic"],
+  }
+
+
+def _query_history_segments(
+  since: float,
+  until: Optional[float] = None,
+  device_id: Optional[str] = None,
+  limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+  conn = _reader()
+  if conn is None:
+    return []
+  until_value = until if until is not None else time.time() + 1.0
+  if device_id:
+    sql = (
+      "SELECT * FROM history_segments WHERE a_id = ? AND ts >= ? AND ts <= ? "
+      "UNION ALL "
+      "SELECT * FROM history_segments WHERE b_id = ? AND a_id IS NOT ? AND ts >= ? AND ts <= ? "
+      "ORDER BY ts"
+    )
+    params: Tuple[Any, ...] = (device_id, since, until_value, device_id, device_id, since, until_value)
+  else:
+    sql = "SELECT * FROM history_segments WHERE ts >= ? AND ts <= ? ORDER BY ts"
+    params = (since, until_value)
+  if limit and limit > 0:
+    sql += f" LIMIT {int(limit)}"
+  try:
+    return [_segment_from_row(row) for row in conn.execute(sql, params)]
+  except Exception as exc:
+    print(f"[sqlite] segment query failed: {exc}")
+    return []
+
+
+def _query_history_edges(since: float, until: Optional[float] = None) -> List[Dict[str, Any]]:
+  conn = _reader()
+  if conn is None:
+    return []
+  until_value = until if until is not None else time.time() + 1.0
+  sql = (
+    "SELECT edge_key, MIN(a_lat) AS a_lat, MIN(a_lon) AS a_lon, MIN(b_lat) AS b_lat, MIN(b_lon) AS b_lon, "
+    "COUNT(*) AS count, MAX(ts) AS last_ts "
+    "FROM history_segments WHERE ts >= ? AND ts <= ? GROUP BY edge_key"
+  )
+  try:
+    rows = conn.execute(sql, (since, until_value)).fetchall()
+  except Exception as exc:
+    print(f"[sqlite] edge query failed: {exc}")
+    return []
+  return [
+    {
+      "id": row["edge_key"],
+      "a": [row["a_lat"], row["a_lon"]],
+      "b": [row["b_lat"], row["b_lon"]],
+      "count": int(row["count"]),
+      "last_ts": float(row["last_ts"]),
+    }
+    for row in rows
+  ]
+
+
+def _query_peer_counts(device_id: str, since: float) -> Tuple[Dict[str, Tuple[int, float]], Dict[str, Tuple[int, float]]]:
+  conn = _reader()
+  if conn is None:
+    return {}, {}
+  outbound: Dict[str, Tuple[int, float]] = {}
+  inbound: Dict[str, Tuple[int, float]] = {}
+  try:
+    for row in conn.execute(
+      "SELECT b_id AS peer, COUNT(*) AS count, MAX(ts) AS last_ts FROM history_segments "
+      "WHERE a_id = ? AND ts >= ? AND b_id IS NOT NULL AND b_id != ? GROUP BY b_id",
+      (device_id, since, device_id),
+    ):
+      outbound[row["peer"]] = (int(row["count"]), float(row["last_ts"]))
+    for row in conn.execute(
+      "SELECT a_id AS peer, COUNT(*) AS count, MAX(ts) AS last_ts FROM history_segments "
+      "WHERE b_id = ? AND ts >= ? AND a_id IS NOT NULL AND a_id != ? GROUP BY a_id",
+      (device_id, since, device_id),
+    ):
+      inbound[row["peer"]] = (int(row["count"]), float(row["last_ts"]))
+  except Exception as exc:
+    print(f"[sqlite] peer query failed: {exc}")
+    return {}, {}
+  return inbound, outbound
+
+
+def _query_trail(device_id: str, since: float, limit: int = 1000) -> List[List[float]]:
+  conn = _reader()
+  if conn is None:
+    return []
+  try:
+    rows = conn.execute(
+      "SELECT lat, lon, ts FROM trails WHERE device_id = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+      (device_id, since, max(1, int(limit))),
+    ).fetchall()
+  except Exception as exc:
+    print(f"[sqlite] trail query failed: {exc}")
+    return []
+  return [[row["lat"], row["lon"], row["ts"]] for row in reversed(rows)]
+
+
+def _query_devices(since: Optional[float] = None) -> List[Dict[str, Any]]:
+  conn = _reader()
+  if conn is None:
+    return []
+  try:
+    if since is None:
+      rows = conn.execute("SELECT * FROM devices").fetchall()
+    else:
+      rows = conn.execute("SELECT * FROM devices WHERE ts >= ?", (since,)).fetchall()
+  except Exception as exc:
+    print(f"[sqlite] device query failed: {exc}")
+    return []
+  return [{col: row[col] for col in DEVICE_COLUMNS} for row in rows]
+
+
+def _sqlite_stats() -> Dict[str, Any]:
+  payload: Dict[str, Any] = {"enabled": SQLITE_ENABLED, "ready": _sqlite_ready()}
+  if not _sqlite_ready():
+    return payload
+  payload.update(storage_stats)
+  payload["pending"] = len(_pending_devices) + len(_pending_trails) + len(_pending_segments)
+  return payload
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Backend modules import each other as top-level modules (the app runs from
+# backend/), so put that directory on the path for the tests.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# The pure-Python LOS relay/peak search from before the NumPy rewrite, kept
+# verbatim as the reference for test_los.py and bench/bench_los.py.
+
+
+def los_max_obstruction(points: List[Tuple[float, float, float]], elevations: List[float], start_idx: int, end_idx: int) -> float:
+  if end_idx <= start_idx + 1:
+    return 0.0
+  start_t = points[start_idx][2]
+  end_t = points[end_idx][2]
+  if end_t <= start_t:
+    return 0.0
+  start_elev = elevations[start_idx]
+  end_elev = elevations[end_idx]
+  max_obstruction = 0.0
+  for idx in range(start_idx + 1, end_idx):
+    frac = (points[idx][2] - start_t) / (end_t - start_t)
+    line_elev = start_elev + (end_elev - start_elev) * frac
+    clearance = elevations[idx] - line_elev
+    if clearance > max_obstruction:
+      max_obstruction = clearance
+  return max_obstruction
+
+
+def relay_score(points: List[Tuple[float, float, float]], elevations: List[float], idx: int) -> float:
+  return max(
+    los_max_obstruction(points, elevations, 0, idx),
+    los_max_obstruction(points, elevations, idx, len(points) - 1),
+  )
+
+
+def find_los_suggestion(points: List[Tuple[float, float, float]], elevations: List[float]) -> Optional[Dict[str, Any]]:
+  if len(points) < 3:
+    return None
+  best_idx = None
+  best_score = None
+  best_clear = False
+  for idx in range(1, len(points) - 1):
+    obst_a = los_max_obstruction(points, elevations, 0, idx)
+    obst_b = los_max_obstruction(points, elevations, idx, len(points) - 1)
+    score = max(obst_a, obst_b)
+    clear = score <= 0.0
+    if clear and not best_clear:
+      best_idx = idx
+      best_score = score
+      best_clear = True
+    elif clear and best_clear:
+      if elevations[idx] > elevations[best_idx]:
+        best_idx = idx
+        best_score = score
+    elif not best_clear:
+      if best_score is None or score < best_score:
+        best_idx = idx
+        best_score = score
+  if best_idx is None:
+    return None
+  return {
+    "lat": round(points[best_idx][0], 6),
+    "lon": round(points[best_idx][1], 6),
+    "elevation_m": round(float(elevations[best_idx]), 2),
+    "clear": best_clear,
+    "max_obstruction_m": round(float(best_score), 2) if best_score is not None else None,
+  }
+
+
+def find_los_peaks(
+  points: List[Tuple[float, float, float]],
+  elevations: List[float],
+  distance_m: float,
+  peaks_max: int,
+) -> List[Dict[str, Any]]:
+  if len(points) < 3:
+    return []
+
+  peak_indices = []
+  for idx in range(1, len(elevations) - 1):
+    elev = elevations[idx]
+    if elev >= elevations[idx - 1] and elev >= elevations[idx + 1]:
+      peak_indices.append(idx)
+
+  if not peak_indices:
+    try:
+      peak_indices = [max(range(1, len(elevations) - 1), key=lambda i: elevations[i])]
+    except ValueError:
+      return []
+
+  peak_indices = sorted(peak_indices, key=lambda i: elevations[i], reverse=True)[:peaks_max]
+  peak_indices = sorted(peak_indices, key=lambda i: points[i][2])
+
+  peaks = []
+  for i, idx in enumerate(peak_indices, start=1):
+    t = points[idx][2]
+    peaks.append({
+      "index": i,
+      "lat": round(points[idx][0], 6),
+      "lon": round(points[idx][1], 6),
+      "elevation_m": round(float(elevations[idx]), 2),
+      "distance_m": round(distance_m * t, 2),
+    })
+  return peaks
@@ -0,0 +1,110 @@
+import math
+
+import numpy as np
+import pytest
+
+from dem import HGT_VOID, DemTileStore, HgtTile, hgt_name
+
+# .hgt parsing, bilinear interpolation and void handling on small synthetic
+# 3" tiles (1201 x 1201 big-endian int16, row 0 at the north edge).
+SAMPLES = 1201
+LAST = SAMPLES - 1
+
+
+def _write_tile(directory, name: str, grid: np.ndarray) -> str:
+  path = str(directory / name)
+  grid.astype(">i2").tofile(path)
+  return path
+
+
+def _ramp() -> np.ndarray:
+  # Elevation = 2 * row + col, so bilinear interpolation is exact.
+  rows, cols = np.mgrid[0:SAMPLES, 0:SAMPLES]
+  return 2 * rows + cols
+
+
+def _latlon(row: float, col: float, lat0: int = 42, lon0: int = -72):
+  return lat0 + 1 - row / LAST, lon0 + col / LAST
+
+
+def test_hgt_name():
+  assert hgt_name(42.5, -71.5) == "N42W072.hgt"
+  assert hgt_name(-0.5, 0.5) == "S01E000.hgt"
+  assert hgt_name(51.0, 179.99) == "N51E179.hgt"
+
+
+def test_posts_and_orientation(tmp_path):
+  tile = HgtTile(_write_tile(tmp_path, "N42W072.hgt", _ramp()))
+  try:
+    assert tile.samples == SAMPLES
+    # North-west corner is row 0, col 0; south-east is the last post. (The
+    # exact north edge belongs to the next tile up, so stay just inside.)
+    assert tile.elevation(*_latlon(1e-6, 0)) == pytest.approx(0, abs=1e-5)
+    assert tile.elevation(*_latlon(LAST - 1e-6, LAST - 1e-6)) == pytest.approx(3 * LAST, abs=1e-4)
+    assert tile.elevation(*_latlon(10, 20)) == pytest.approx(40)
+  finally:
+    tile.close()
+
+
+def test_bilinear_between_posts(tmp_path):
+  tile = HgtTile(_write_tile(tmp_path, "N42W072.hgt", _ramp()))
+  try:
+    for row, col in ((10.5, 20.25), (0.1, 0.9), (599.75, 1199.5)):
+      assert tile.elevation(*_latlon(row, col)) == pytest.approx(2 * row + col, abs=1e-6)
+    lats, lons = zip(*[_latlon(r, c) for r, c in ((10.5, 20.25), (0.1, 0.9), (599.75, 1199.5))])
+    assert tile.sample(np.array(lats), np.array(lons)) == pytest.approx([41.25, 1.1, 2399.0], abs=1e-6)
+  finally:
+    tile.close()
+
+
+def test_voids_drop_out_of_the_weighting(tmp_path):
+  grid = np.full((SAMPLES, SAMPLES), 100, dtype=np.int64)
+  grid[10, 10] = HGT_VOID
+  grid[10, 11] = 300
+  grid[500:502, 500:502] = HGT_VOID
+  tile = HgtTile(_write_tile(tmp_path, "N42W072.hgt", grid))
+  try:
+    # Halfway between a void and a 300 post: only the 300 post counts.
+    assert tile.elevation(*_latlon(10, 10.5)) == pytest.approx(300)
+    # Surrounded by voids: no elevation.
+    assert tile.elevation(*_latlon(500.5, 500.5)) is None
+    values = tile.sample(*map(np.array, zip(_latlon(10, 10.5), _latlon(500.5, 500.5), _latlon(200, 200))))
+    assert values[0] == pytest.approx(300)
+    assert math.isnan(values[1])
+    assert values[2] == pytest.approx(100)
+  finally:
+    tile.close()
+
+
+def test_store_lookup_and_sample_agree(tmp_path):
+  _write_tile(tmp_path, "N42W072.hgt", _ramp())
+  _write_tile(tmp_path, "N42W071.hgt", _ramp() + 5000)
+  store = DemTileStore(str(tmp_path), max_open=1)
+  try:
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(41.5, 43.0, 500)
+    lons = rng.uniform(-72.0, -70.0, 500)
+    looked_up = store.lookup(list(zip(lats.tolist(), lons.tolist())))
+    sampled = store.sample(lats, lons)
+    for expected, value in zip(looked_up, sampled.tolist()):
+      if expected is None:
+        assert math.isnan(value)
+      else:
+        assert value == pytest.approx(expected, abs=1e-9)
+    # Points south of 42 have no tile.
+    assert all((value is None) == (lat < 42.0) for value, lat in zip(looked_up, lats))
+    # max_open=1: tiles were closed and reopened as the lookups alternated.
+    assert store.stats()["open_tiles"] == 1
+    assert store.opened > 2
+  finally:
+    store.close()
+
+
+def test_bad_tile_size_is_skipped(tmp_path):
+  (tmp_path / "N42W072.hgt").write_bytes(b"\x00" * 1000)
+  store = DemTileStore(str(tmp_path))
+  try:
+    assert store.lookup([(42.5, -71.5)]) == [None]
+    assert math.isnan(store.sample(np.array([42.5]), np.array([-71.5]))[0])
+  finally:
+    store.close()
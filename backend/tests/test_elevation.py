@@ -0,0 +1,214 @@
+import asyncio
+import gc
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from elevation import ElevationClient, ElevationError
+
+# ElevationClient against a local stand-in for an OpenTopoData-style API.
+# The server answers elevation = lat * 100 + lon unless a scripted response
+# is queued for the next request.
+
+
+def _elevation(lat: float, lon: float) -> float:
+  return round(lat * 100 + lon, 3)
+
+
+class StandIn:
+
+  def __init__(self) -> None:
+    self.requests = []
+    self.script = []
+    self.delay = 0.0
+    self.lock = threading.Lock()
+
+  def next_response(self, locations):
+    with self.lock:
+      self.requests.append(locations)
+      scripted = self.script.pop(0) if self.script else None
+    if scripted is not None:
+      return scripted
+    results = [{"elevation": _elevation(lat, lon)} for lat, lon in locations]
+    return 200, {}, {"status": "OK", "results": results}
+
+
+@pytest.fixture
+def stand_in():
+  server_state = StandIn()
+
+  class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+      query = parse_qs(urlparse(self.path).query)
+      locations = [tuple(float(v) for v in pair.split(",")) for pair in query["locations"][0].split("|")]
+      status, headers, body = server_state.next_response(locations)
+      if server_state.delay:
+        time.sleep(server_state.delay)
+      payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+      try:
+        self.send_response(status)
+        for name, value in headers.items():
+          self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+      except (BrokenPipeError, ConnectionResetError):
+        pass
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+  thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+  thread.start()
+  server_state.url = f"http://127.0.0.1:{server.server_address[1]}/v1/test"
+  yield server_state
+  server.shutdown()
+  server.server_close()
+
+
+def _run(client: ElevationClient, coro):
+  async def runner():
+    try:
+      return await coro
+    finally:
+      await client.close()
+  return asyncio.run(runner())
+
+
+LOCATIONS = [(42.0 + i * 0.01, -71.0 - i * 0.01) for i in range(7)]
+
+
+def test_chunks_locations_and_keeps_order(stand_in):
+  client = ElevationClient(stand_in.url, chunk_size=3, batch_window=0.0)
+  elevations = _run(client, client.fetch(LOCATIONS))
+  assert elevations == [_elevation(lat, lon) for lat, lon in LOCATIONS]
+  assert sorted(len(chunk) for chunk in stand_in.requests) == [1, 3, 3]
+  assert client.requests == 3 and client.locations == 7
+
+
+def test_concurrent_callers_share_one_batch(stand_in):
+  client = ElevationClient(stand_in.url, chunk_size=100, batch_window=0.05)
+
+  async def callers():
+    return await asyncio.gather(client.fetch(LOCATIONS[:4]), client.fetch(LOCATIONS[2:]))
+
+  first, second = _run(client, callers())
+  assert first == [_elevation(lat, lon) for lat, lon in LOCATIONS[:4]]
+  assert second == [_elevation(lat, lon) for lat, lon in LOCATIONS[2:]]
+  # One request for the 7 distinct locations; the overlap is coalesced.
+  assert len(stand_in.requests) == 1 and len(stand_in.requests[0]) == 7
+  assert client.coalesced == 2
+
+
+def test_chunks_run_concurrently(stand_in):
+  stand_in.delay = 0.2
+  client = ElevationClient(stand_in.url, chunk_size=1, concurrency=8, batch_window=0.0)
+  started = time.perf_counter()
+  elevations = _run(client, client.fetch(LOCATIONS))
+  assert elevations == [_elevation(lat, lon) for lat, lon in LOCATIONS]
+  # Seven 200 ms requests side by side, not back to back.
+  assert len(stand_in.requests) == 7 and time.perf_counter() - started < 0.8
+
+
+def test_retries_5xx_and_429_then_succeeds(stand_in):
+  stand_in.script = [(503, {}, {"error": "busy"}), (429, {"Retry-After": "0"}, {"error": "slow down"})]
+  client = ElevationClient(stand_in.url, retries=2, backoff=0.01, batch_window=0.0)
+  elevations = _run(client, client.fetch(LOCATIONS[:2]))
+  assert elevations == [_elevation(lat, lon) for lat, lon in LOCATIONS[:2]]
+  assert len(stand_in.requests) == 3
+  assert client.retried == 2 and client.failures == 0
+
+
+def test_gives_up_after_retries(stand_in):
+  stand_in.script = [(502, {}, {})] * 3
+  client = ElevationClient(stand_in.url, retries=2, backoff=0.01, batch_window=0.0)
+  with pytest.raises(ElevationError, match="http_502"):
+    _run(client, client.fetch(LOCATIONS[:1]))
+  assert len(stand_in.requests) == 3 and client.failures == 1
+
+
+def test_client_errors_are_not_retried(stand_in):
+  stand_in.script = [(400, {}, {"error": "bad locations"})]
+  client = ElevationClient(stand_in.url, retries=2, backoff=0.01, batch_window=0.0)
+  with pytest.raises(ElevationError, match="http_400"):
+    _run(client, client.fetch(LOCATIONS[:1]))
+  assert len(stand_in.requests) == 1
+
+
+def test_timeout_is_retried_then_reported(stand_in):
+  stand_in.delay = 0.5
+  client = ElevationClient(stand_in.url, retries=1, timeout=0.1, backoff=0.01, batch_window=0.0)
+  started = time.perf_counter()
+  with pytest.raises(ElevationError, match="Timeout"):
+    _run(client, client.fetch(LOCATIONS[:1]))
+  assert time.perf_counter() - started < 1.0
+  assert len(stand_in.requests) == 2 and client.retried == 1
+
+
+@pytest.mark.parametrize("body, error", [
+  ({"status": "INVALID_REQUEST", "results": []}, "INVALID_REQUEST"),
+  ({"status": "OK", "results": [{"elevation": 1.0}]}, "unexpected_result_length"),
+  ({"status": "OK", "results": [{"elevation": None}, {"elevation": 2.0}]}, "missing_elevation"),
+  (b"not json", "invalid_json"),
+])
+def test_malformed_payloads(stand_in, body, error):
+  stand_in.script = [(200, {}, body)]
+  client = ElevationClient(stand_in.url, retries=0, batch_window=0.0)
+  with pytest.raises(ElevationError, match=error):
+    _run(client, client.fetch(LOCATIONS[:2]))
+
+
+def test_failed_chunks_leave_no_unretrieved_futures(stand_in):
+  # Every chunk fails, including a location only a caller that already gave
+  # up was waiting on: each failure must be consumed, none logged.
+  stand_in.script = [(400, {}, {"error": "bad"})] * 3
+  stand_in.delay = 0.1
+  client = ElevationClient(stand_in.url, chunk_size=3, retries=0, batch_window=0.0)
+  unhandled = []
+
+  async def callers():
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+    impatient = asyncio.wait_for(client.fetch([(10.0, 10.0)]), 0.01)
+    results = await asyncio.gather(
+      impatient, client.fetch(LOCATIONS[:6]), client.fetch(LOCATIONS[1:]), return_exceptions=True
+    )
+    await asyncio.sleep(0.2)
+    # Keep only the types: tracebacks would hold the futures past the check.
+    kinds = [type(result) for result in results]
+    del results
+    gc.collect()
+    return kinds
+
+  kinds = _run(client, callers())
+  assert kinds == [asyncio.TimeoutError, ElevationError, ElevationError]
+  assert len(stand_in.requests) == 3 and client.failures == 3
+  assert not client.stats()["in_flight"]
+  assert unhandled == []
+
+
+def test_close_cancels_running_chunks(stand_in):
+  stand_in.delay = 0.5
+  client = ElevationClient(stand_in.url, chunk_size=2, batch_window=0.0)
+
+  async def main():
+    pending = asyncio.ensure_future(client.fetch(LOCATIONS[:4]))
+    await asyncio.sleep(0.05)
+    # Chunk tasks are held by the client, not left to the loop's weak refs.
+    tasks = set(client._tasks)
+    assert len(tasks) == 2
+    started = time.perf_counter()
+    await client.close()
+    assert time.perf_counter() - started < 0.3
+    assert all(task.cancelled() for task in tasks) and not client._tasks
+    with pytest.raises(ElevationError, match="client_closed"):
+      await pending
+    assert not client.stats()["in_flight"]
+
+  asyncio.run(main())
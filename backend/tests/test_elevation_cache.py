@@ -0,0 +1,65 @@
+import sqlite3
+
+from elevation import ElevationCache
+
+# ElevationCache: grid-quantized keys, LRU cap, TTL, and the write-behind
+# SQLite file round trip.
+
+
+def test_nearby_points_share_a_grid_cell():
+  cache = ElevationCache(grid_arcsec=3, max_entries=10, ttl=0)
+  step = 3 / 3600.0
+  key = cache.key(42.3601, -71.0589)
+  lat, lon = cache.location(key)
+  assert abs(lat - 42.3601) <= step / 2 and abs(lon + 71.0589) <= step / 2
+  assert cache.key(lat, lon) == key
+  assert cache.key(lat + step * 0.4, lon - step * 0.4) == key
+  assert cache.key(lat + step * 0.6, lon) != key
+  # Keys stay distinct and stable at the edges of the grid.
+  assert cache.location(cache.key(-90.0, -180.0)) == (-90.0, -180.0)
+  assert cache.location(cache.key(90.0, 180.0)) == (90.0, 180.0)
+
+
+def test_lru_cap_and_ttl():
+  cache = ElevationCache(grid_arcsec=1, max_entries=3, ttl=100)
+  for i in range(3):
+    cache.put(i, float(i), now=0.0)
+  assert cache.get(0, now=1.0) == 0.0
+  cache.put(3, 3.0, now=2.0)
+  assert cache.get(1, now=2.0) is None and cache.evicted == 1
+  assert cache.get(0, now=50.0) == 0.0
+  assert cache.get(2, now=101.0) is None and cache.expired == 1
+  assert (cache.hits, cache.misses) == (2, 2)
+  assert len(cache) == 2
+
+
+def test_flush_and_load_round_trip(tmp_path):
+  path = str(tmp_path / "cache" / "elevations.sqlite")
+  cache = ElevationCache(grid_arcsec=1, max_entries=4, ttl=0, path=path)
+  for i in range(6):
+    cache.put(i, 100.0 + i, now=1000.0 + i)
+  cache.flush()
+  assert cache.stats()["pending"] == 0 and cache.persisted == 6
+  cache.flush()
+  assert cache.persisted == 6
+  # The file is trimmed to the newest max_entries rows.
+  with sqlite3.connect(path) as conn:
+    assert sorted(row[0] for row in conn.execute("SELECT cell FROM elevations")) == [2, 3, 4, 5]
+
+  reloaded = ElevationCache(grid_arcsec=1, max_entries=3, ttl=0, path=path)
+  reloaded.load()
+  assert reloaded.loaded == 3 and len(reloaded) == 3
+  # Newest entries load last, so the oldest loaded one is evicted first.
+  reloaded.put(9, 0.0, now=2000.0)
+  assert reloaded.evicted == 1
+  assert [reloaded.get(cell, now=2000.0) for cell in (2, 3, 4, 5)] == [None, None, 104.0, 105.0]
+
+
+def test_load_skips_entries_past_ttl(tmp_path):
+  path = str(tmp_path / "elevations.sqlite")
+  cache = ElevationCache(grid_arcsec=1, max_entries=10, ttl=0, path=path)
+  cache.put(1, 10.0, now=0.0)
+  cache.flush()
+  expiring = ElevationCache(grid_arcsec=1, max_entries=10, ttl=3600, path=path)
+  expiring.load()
+  assert expiring.loaded == 0 and len(expiring) == 0
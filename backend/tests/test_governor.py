@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+
+import app as app_module
+import governor
+import history
+import state
+from buckets import EdgeBucketAggregator
+from peers import PeerIndex
+from rollups import DailyRollupStore
+from segments import HistorySegmentStore
+from spatial import EdgeGridIndex
+
+# Shedding order and trail downsampling under a fake per-item footprint, and
+# that shed history stays out of RAM across a restart.
+NOW = 1760860000.0
+SEGMENT_BYTES, HEAT_BYTES, POINT_BYTES = 1000, 100, 50
+
+
+def _fake_estimates():
+  segments = len(state.route_history_segments)
+  points = sum(len(trail) for trail in state.trails.values())
+  return {
+    "route_history_segments": {"items": segments, "bytes": segments * SEGMENT_BYTES},
+    "route_history_edges": {"items": len(state.route_history_edges), "bytes": 0},
+    "heat_events": {"items": len(state.heat_events), "bytes": len(state.heat_events) * HEAT_BYTES},
+    "trails": {"items": points, "bytes": points * POINT_BYTES},
+    "message_origins": {"items": 0, "bytes": 0},
+  }
+
+
+@pytest.fixture
+def live(tmp_path, monkeypatch):
+  monkeypatch.setattr(state, "route_history_segments", HistorySegmentStore())
+  monkeypatch.setattr(state, "route_history_edges", {})
+  monkeypatch.setattr(state, "history_edge_index", EdgeGridIndex())
+  monkeypatch.setattr(state, "peer_index", PeerIndex())
+  monkeypatch.setattr(state, "history_buckets", EdgeBucketAggregator(300, 6 * 3600, 7 * 86400))
+  monkeypatch.setattr(state, "history_rollups", DailyRollupStore(str(tmp_path / "rollups"), 30, None))
+  monkeypatch.setattr(state, "heat_events", [])
+  monkeypatch.setattr(state, "trails", {})
+  monkeypatch.setattr(state, "state_dirty", False)
+  monkeypatch.setattr(history, "ROUTE_HISTORY_ENABLED", True)
+  monkeypatch.setattr(history, "HISTORY_ROLLUP_ENABLED", True)
+  monkeypatch.setattr(governor, "_estimate_structures", _fake_estimates)
+  monkeypatch.setattr(governor, "governor_actions", type(governor.governor_actions)(maxlen=20))
+  monkeypatch.setattr(governor, "governor_stats", dict(governor.governor_stats))
+
+
+def _entry(i):
+  lat = 42.0 + (i % 40) * 0.01
+  return {
+    "ts": NOW + i, "a": [lat, -71.0], "b": [lat + 0.005, -71.01], "a_id": f"rpt-{i % 7}", "b_id": "rpt-x",
+    "message_hash": f"h{i}", "payload_type": 2, "origin_id": None, "receiver_id": "rpt-x", "route_mode": "path",
+    "topic": "meshcore/x",
+  }
+
+
+def _fill(segments=0, heat=0, trails=None):
+  for i in range(segments):
+    history._apply_history_item(history._history_item_from_entry(_entry(i), 0.0))
+  state.heat_events.extend({"ts": NOW + i} for i in range(heat))
+  for device_id, points in (trails or {}).items():
+    state.trails[device_id] = [[42.0, -71.0, NOW + i] for i in range(points)]
+
+
+def _govern(budget):
+  governor.governor_stats["budget_bytes"] = budget
+  return governor._govern_memory()
+
+
+def test_history_is_shed_before_anything_else(live):
+  _fill(segments=300, heat=100, trails={"rpt-a": 10})
+  # 311 kB against 250 kB: the 86 kB over 90% comes out of history alone.
+  updates, removed = _govern(250_000)
+  assert len(state.route_history_segments) == 214
+  assert state.route_history_segments.oldest_ts() == NOW + 86
+  assert len(state.heat_events) == 100 and len(state.trails["rpt-a"]) == 10
+  assert [(a["structure"], a["action"], a["count"]) for a in governor.governor_actions] == [
+    ("route_history_segments", "evict_oldest", 86),
+  ]
+  assert updates or removed
+  # Shed segments still count in the rollups.
+  assert state.history_rollups.folded == 86
+  assert governor.governor_stats["over_budget"] and governor.governor_stats["estimated_bytes"] <= 225_000
+
+
+def test_falls_through_to_heat_once_history_is_at_its_floor(live):
+  _fill(segments=150, heat=500, trails={"rpt-a": 9, "rpt-b": 9})
+  _govern(150_000)
+  assert len(state.route_history_segments) == governor.MIN_HISTORY_SEGMENTS
+  # 50 kB from history, the remaining 15.9 kB from the oldest heat events.
+  assert len(state.heat_events) == 341 and state.heat_events[0]["ts"] == NOW + 159
+  assert [len(trail) for trail in state.trails.values()] == [9, 9]
+  assert [a["structure"] for a in governor.governor_actions] == ["route_history_segments", "heat_events"]
+
+
+def test_trails_downsample_keeping_the_newest_point(live):
+  _fill(trails={"odd": 5, "even": 6, "short": 2})
+  freed = governor._shed_trails(10_000, _fake_estimates(), [], [])
+  assert [point[2] - NOW for point in state.trails["odd"]] == [0, 2, 4]
+  assert [point[2] - NOW for point in state.trails["even"]] == [1, 3, 5]
+  assert len(state.trails["short"]) == 2
+  assert freed == 5 * POINT_BYTES and state.state_dirty
+  assert governor.governor_actions[-1]["action"] == "downsample"
+
+
+def test_trails_stop_downsampling_once_enough_is_freed(live):
+  _fill(trails={"first": 11, "second": 11})
+  governor._shed_trails(5 * POINT_BYTES, _fake_estimates(), [], [])
+  assert [len(trail) for trail in state.trails.values()] == [6, 11]
+
+
+def test_under_budget_sheds_nothing(live):
+  _fill(segments=120, heat=10)
+  assert _govern(1_000_000) == ([], [])
+  assert not governor.governor_stats["over_budget"] and not governor.governor_actions
+
+
+def test_zero_budget_turns_the_governor_off(monkeypatch):
+  monkeypatch.setattr(app_module, "MEMORY_BUDGET_MB", 0)
+  # The loop would otherwise sleep for at least five seconds.
+  assert asyncio.run(asyncio.wait_for(app_module.memory_governor(), 1.0)) is None
+
+
+def test_shed_history_is_not_reloaded(live, tmp_path, monkeypatch):
+  history_dir = tmp_path / "route_history"
+  history_dir.mkdir()
+  monkeypatch.setattr(history, "ROUTE_HISTORY_DIR", str(history_dir))
+  monkeypatch.setattr(history, "CHECKPOINT_ENABLED", False)
+  monkeypatch.setattr(history, "ROUTE_HISTORY_HOURS", 24.0)
+  monkeypatch.setattr(history.time, "time", lambda: NOW + 3600)
+  monkeypatch.setattr(state, "history_load", {})
+  for i in range(300):
+    with open(history_dir / history._history_file_name(NOW + i), "a") as handle:
+      handle.write(json.dumps(_entry(i)) + "\n")
+
+  _fill(segments=300)
+  _govern(250_000)
+  assert len(state.route_history_segments) == 225
+  state.history_rollups.flush()
+
+  # Restart: fresh live state, rollups reopened from their meta file.
+  monkeypatch.setattr(state, "route_history_segments", HistorySegmentStore())
+  monkeypatch.setattr(state, "route_history_edges", {})
+  monkeypatch.setattr(state, "history_rollups", DailyRollupStore(str(tmp_path / "rollups"), 30, None))
+  asyncio.run(history._load_route_history_background(NOW + 3600, None))
+  assert len(state.route_history_segments) == 225
+  assert state.route_history_segments.oldest_ts() == NOW + 75
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+import history
+import state
+from spatial import EdgeGridIndex
+
+# EdgeGridIndex bbox queries against a brute-force overlap test, and
+# /history/edges bbox, payload_type and cursor paging over live edges.
+
+
+def _bounds(a, b):
+  return min(a[1], b[1]), min(a[0], b[0]), max(a[1], b[1]), max(a[0], b[0])
+
+
+def _overlaps(edge, box):
+  west, south, east, north = box
+  e_west, e_south, e_east, e_north = edge
+  if west > east:
+    return e_north >= south and e_south <= north and (e_east >= west or e_west <= east)
+  return e_east >= west and e_west <= east and e_north >= south and e_south <= north
+
+
+def test_grid_query_matches_brute_force():
+  rng = random.Random(37)
+  index = EdgeGridIndex(cell_degrees=0.25, max_cells=64)
+  edges = {}
+  for i in range(3000):
+    lat, lon = rng.uniform(-60, 60), rng.uniform(-180, 180)
+    # Mostly short links, a few long enough to land in the wide set.
+    span = 8.0 if i % 100 == 0 else 0.3
+    a = [lat, lon]
+    b = [lat + rng.uniform(-span, span), max(-180.0, min(180.0, lon + rng.uniform(-span, span)))]
+    edges[f"e{i:04d}"] = _bounds(a, b)
+    index.add(f"e{i:04d}", a, b)
+  for key in list(edges)[::3]:
+    index.remove(key)
+    del edges[key]
+  assert index.stats()["wide_edges"] > 0
+
+  boxes = [(-72.0, 41.0, -70.0, 43.0), (-180.0, -90.0, 180.0, 90.0), (170.0, -30.0, -170.0, 30.0)]
+  for _ in range(40):
+    west, south = rng.uniform(-180, 175), rng.uniform(-60, 55)
+    boxes.append((west, south, min(180.0, west + rng.uniform(0.1, 5)), south + rng.uniform(0.1, 5)))
+  for box in boxes:
+    assert index.query(box) == {key for key, edge in edges.items() if _overlaps(edge, box)}
+  assert index.query(None) == set(edges)
+
+
+@pytest.fixture
+def live_edges(monkeypatch):
+  saved = dict(state.route_history_edges)
+  state.route_history_edges.clear()
+  monkeypatch.setattr(state, "history_edge_index", EdgeGridIndex())
+  rng = random.Random(38)
+  for i in range(250):
+    lat, lon = 42.0 + rng.uniform(0, 2), -72.0 + rng.uniform(0, 2)
+    first = (int(lat * 1e6), int(lon * 1e6))
+    second = (first[0] + 5000, first[1] + 5000)
+    for _ in range(1 + i % 3):
+      history._touch_history_edge(f"edge-{i:03d}", first, second, 1000.0 + i, payload_type=i % 2)
+  yield
+  state.route_history_edges.clear()
+  state.route_history_edges.update(saved)
+
+
+def _pages(client, query):
+  ids, cursor = [], None
+  while True:
+    url = f"/history/edges?{query}" + (f"&cursor={cursor}" if cursor else "")
+    body = client.get(url).json()
+    ids.extend(edge["id"] for edge in body["edges"])
+    cursor = body["next_cursor"]
+    if not cursor:
+      return ids, body["edge_count"]
+
+
+def test_history_edges_pages_by_cursor(live_edges):
+  client = TestClient(app_module.app)
+  ids, total = _pages(client, "limit=40")
+  assert total == 250 and ids == sorted(state.route_history_edges)
+
+  box = (-71.5, 42.5, -70.5, 43.5)
+  ids, total = _pages(client, "limit=7&bbox=" + ",".join(str(v) for v in box))
+  expected = sorted(
+    key for key, edge in state.route_history_edges.items()
+    if _overlaps(_bounds(edge["a"], edge["b"]), box)
+  )
+  assert ids == expected and total == len(expected) and 0 < total < 250
+
+  ids, _ = _pages(client, "limit=50&min_count=3")
+  assert ids == sorted(key for key, edge in state.route_history_edges.items() if edge["count"] >= 3)
+  ids, _ = _pages(client, "limit=50&payload_type=1&min_count=2")
+  assert ids == sorted(key for key, edge in state.route_history_edges.items() if edge["types"].get(1, 0) >= 2)
+
+
+def test_history_edges_rejects_bad_queries(live_edges):
+  client = TestClient(app_module.app)
+  assert client.get("/history/edges?bbox=1,2,3").status_code == 400
+  assert client.get("/history/edges?bbox=-72,43,-71,42").status_code == 400
+  assert client.get("/history/edges?window=24h&payload_type=1").status_code == 400
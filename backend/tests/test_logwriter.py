@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+
+from logwriter import BufferedLogWriter
+
+
+def _read(path: str):
+  with open(path, "rb") as handle:
+    return [json.loads(line) for line in handle]
+
+
+def test_flush_groups_records_by_file(tmp_path):
+  writer = BufferedLogWriter(lambda record: str(tmp_path / f"{record['hour']}.jsonl"), 3, 0)
+  assert not writer.append([{"hour": 1, "n": 0}])
+  assert writer.append([{"hour": 2, "n": 1}, {"hour": 1, "n": 2}])
+  assert writer.pending() == 3
+  written = writer.flush()
+  assert writer.pending() == 0
+  assert written == os.path.getsize(tmp_path / "1.jsonl") + os.path.getsize(tmp_path / "2.jsonl")
+  assert _read(tmp_path / "1.jsonl") == [{"hour": 1, "n": 0}, {"hour": 1, "n": 2}]
+  assert _read(tmp_path / "2.jsonl") == [{"hour": 2, "n": 1}]
+  # Files not written in a flush are done with (hourly rollover) and closed.
+  writer.append([{"hour": 3, "n": 3}])
+  writer.flush()
+  assert writer.stats()["open_files"] == ["3.jsonl"]
+  writer.close()
+  assert writer.stats()["open_files"] == []
+
+
+def test_reopen_follows_replaced_file(tmp_path):
+  path = str(tmp_path / "history.jsonl")
+  writer = BufferedLogWriter(lambda record: path, 100, 0)
+  writer.append([{"n": 0}])
+  writer.flush()
+  # Compaction rewrites the file; the writer must not keep the old inode.
+  os.replace(str(tmp_path / "history.jsonl"), str(tmp_path / "old.jsonl"))
+  with open(path, "w") as handle:
+    handle.write(json.dumps({"n": "compacted"}) + "\n")
+  writer.reopen()
+  writer.append([{"n": 1}])
+  writer.close()
+  assert _read(path) == [{"n": "compacted"}, {"n": 1}]
+
+
+def test_fsync_on_close_and_interval(tmp_path):
+  writer = BufferedLogWriter(lambda record: str(tmp_path / "a.jsonl"), 10, 3600)
+  writer.append([{"n": 0}])
+  writer.flush()
+  assert writer.fsyncs == 0
+  writer.append([{"n": 1}])
+  writer.close()
+  assert writer.fsyncs == 1
+
+
+def test_encoded_frames_are_self_contained(tmp_path):
+  path = str(tmp_path / "a.jsonl.gz")
+  writer = BufferedLogWriter(lambda record: path, 10, 0, encode=gzip.compress)
+  writer.append([{"n": 0}, {"n": 1}])
+  writer.flush()
+  writer.append([{"n": 2}])
+  writer.close()
+  # Concatenated gzip members decode as one stream.
+  with gzip.open(path, "rb") as handle:
+    assert [json.loads(line) for line in handle] == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+
+def test_write_error_is_counted_and_handles_dropped(tmp_path):
+  blocker = tmp_path / "file"
+  blocker.write_text("")
+  writer = BufferedLogWriter(lambda record: str(blocker / "a.jsonl"), 10, 0)
+  writer.append([{"n": 0}])
+  assert writer.flush() == 0
+  assert writer.errors == 1
+  assert writer.stats()["open_files"] == []
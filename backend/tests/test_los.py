@@ -0,0 +1,128 @@
+import asyncio
+import math
+import random
+
+import pytest
+
+import los
+import los_reference
+import state
+from elevation import ElevationCache
+
+# Old (pure Python) vs new (NumPy) relay search and peaks on random, ridge,
+# hill, flat, quantized and mirror-image profiles. Verdicts (clear/blocked,
+# max obstruction) must match exactly. A suggestion may land on a different
+# sample only when the old code scores both the same within SCORE_TOLERANCE_M
+# (a tie), and reported scores may differ by at most one rounding step.
+PROFILES = 3000
+SCORE_TOLERANCE_M = 1e-6
+ROUNDING_TOLERANCE_M = 0.01
+LAT0 = 40.0
+LAT_STEP = 1e-4
+
+
+def _profile(rng: random.Random, kind: str, n: int):
+  if kind == "random":
+    elev = [rng.uniform(0, 400) for _ in range(n)]
+  elif kind == "ridge":
+    peak = rng.randrange(1, n - 1)
+    elev = [100 + 300 * (1 - abs(i - peak) / n) + rng.uniform(-5, 5) for i in range(n)]
+  elif kind == "hill":
+    elev = [50 + 200 * math.sin(math.pi * i / (n - 1)) + rng.uniform(-2, 2) for i in range(n)]
+  elif kind == "flat":
+    level = rng.choice([0.0, 12.5, 300.0])
+    elev = [level] * n
+    for _ in range(rng.randrange(0, 3)):
+      elev[rng.randrange(1, n - 1)] += rng.choice([0.1, 5.0, 40.0])
+  elif kind == "quantized":
+    elev = [float(rng.randrange(0, 6) * 10) for _ in range(n)]
+  elif kind == "decimal":
+    elev = [round(rng.uniform(0, 400), 1) for _ in range(n)]
+  elif kind == "linear":
+    # Mostly collinear: candidates sit exactly on the sight line.
+    a, b = rng.uniform(0, 300), rng.uniform(0, 300)
+    elev = [a + (b - a) * i / (n - 1) + rng.choice([0.0, 0.0, 0.0, rng.uniform(-1, 1)]) for i in range(n)]
+  else:
+    half = [rng.uniform(0, 300) for _ in range((n + 1) // 2)]
+    elev = half + half[::-1][n % 2:]
+  points = [(LAT0 + i * LAT_STEP, -71.0, i / (n - 1)) for i in range(n)]
+  return points, elev
+
+
+def _index(suggestion) -> int:
+  return round((suggestion["lat"] - LAT0) / LAT_STEP)
+
+
+KINDS = ["random", "ridge", "hill", "flat", "quantized", "decimal", "linear", "mirror"]
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_relay_search_matches_reference(kind):
+  rng = random.Random(kind)
+  for _ in range(PROFILES // len(KINDS)):
+    points, elev = _profile(rng, kind, rng.randrange(3, 160))
+    t, arr = los._los_arrays(points, elev)
+    last = len(points) - 1
+    assert los._los_max_obstruction(t, arr, 0, last) == los_reference.los_max_obstruction(points, elev, 0, last)
+
+    old = los_reference.find_los_suggestion(points, elev)
+    new = los._find_los_suggestion(points, t, arr)
+    assert new["clear"] == old["clear"], (elev, old, new)
+    assert abs(new["max_obstruction_m"] - old["max_obstruction_m"]) <= ROUNDING_TOLERANCE_M
+    old_idx, new_idx = _index(old), _index(new)
+    if new_idx != old_idx:
+      if old["clear"]:
+        assert elev[new_idx] == elev[old_idx]
+      else:
+        old_score = los_reference.relay_score(points, elev, old_idx)
+        assert abs(los_reference.relay_score(points, elev, new_idx) - old_score) <= SCORE_TOLERANCE_M
+
+    assert los._find_los_peaks(points, arr, 1000.0) == los_reference.find_los_peaks(points, elev, 1000.0, los.LOS_PEAKS_MAX)
+
+
+def test_clear_verdict_survives_float_noise():
+  # Collinear terrain: the slope pass sees these as ties, the verdict has to
+  # come from the same comparison as the endpoint check.
+  n = 50
+  points = [(LAT0 + i * LAT_STEP, -71.0, i / (n - 1)) for i in range(n)]
+  for start, end in ((0.1, 0.7), (100.0, 33.3), (12.345, 12.345)):
+    elev = [start + (end - start) * p[2] for p in points]
+    elev[n // 2] += 3.0
+    t, arr = los._los_arrays(points, elev)
+    old = los_reference.find_los_suggestion(points, elev)
+    new = los._find_los_suggestion(points, t, arr)
+    assert (new["clear"], new["max_obstruction_m"]) == (old["clear"], old["max_obstruction_m"])
+
+
+class _HalfDem:
+  # Covers only the southern half of the test path.
+  def lookup(self, coords):
+    return [100.0 if lat < LAT0 + 0.0025 else None for lat, _ in coords]
+
+
+class _FullDem:
+  def lookup(self, coords):
+    return [100.0] * len(coords)
+
+
+class _Api:
+  async def fetch(self, locations):
+    return [50.0] * len(locations)
+
+
+@pytest.mark.parametrize("dem, expected", [
+  (_HalfDem(), "mixed"),
+  (_FullDem(), f"dem:{los.DEM_DIR}"),
+  (None, los.LOS_ELEVATION_URL),
+])
+def test_provider_reports_what_filled_the_samples(monkeypatch, dem, expected):
+  monkeypatch.setattr(state, "dem_store", dem)
+  monkeypatch.setattr(los, "DEM_API_FALLBACK", True)
+  monkeypatch.setattr(los, "elevation_client", _Api())
+  monkeypatch.setattr(los, "elevation_cache", ElevationCache(1.0, 1000, 3600.0))
+  n = 50
+  points = [(LAT0 + i * LAT_STEP, -71.0, i / (n - 1)) for i in range(n)]
+  elevations, error, from_dem = asyncio.run(los._fetch_elevations(points))
+  assert error is None
+  result = los._los_evaluate(points, elevations, 5000.0, "terrain", detail=False, from_dem=from_dem)
+  assert result["provider"] == expected
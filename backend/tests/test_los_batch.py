@@ -0,0 +1,100 @@
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from state import DeviceState, devices
+
+# POST /los/batch: request validation, per-pair errors, one elevation lookup
+# for the whole batch, and verdicts identical to GET /los.
+
+
+def _terrain(lat, lon):
+  # A 300 m hill centred between the test endpoints.
+  return 20.0 + 300.0 * math.exp(-(((lat - 42.05) / 0.02) ** 2 + ((lon + 71.05) / 0.02) ** 2))
+
+
+@pytest.fixture
+def client(monkeypatch):
+  calls = []
+
+  async def fake_fetch(points):
+    calls.append(len(points))
+    return [_terrain(lat, lon) for lat, lon, _ in points], None, [False] * len(points)
+
+  monkeypatch.setattr(app_module, "_fetch_elevations", fake_fetch)
+  devices["rpt-1"] = DeviceState(device_id="rpt-1", lat=42.0, lon=-71.0, ts=0.0)
+  devices["rpt-0"] = DeviceState(device_id="rpt-0", lat=0.0, lon=0.0, ts=0.0)
+  test_client = TestClient(app_module.app)
+  test_client.calls = calls
+  yield test_client
+  devices.pop("rpt-1", None)
+  devices.pop("rpt-0", None)
+
+
+PAIRS = [
+  [[42.0, -71.0], [42.1, -71.1]],
+  {"id": "around", "a": {"lat": 42.0, "lon": -71.2}, "b": {"lat": 42.1, "lon": -71.2}},
+  {"id": "dev", "a": "rpt-1", "b": [42.1, -71.1]},
+]
+# The same pairs as plain coordinates, for GET /los.
+ENDPOINTS = [((42.0, -71.0), (42.1, -71.1)), ((42.0, -71.2), (42.1, -71.2)), ((42.0, -71.0), (42.1, -71.1))]
+
+
+def test_batch_verdicts_match_single_los(client):
+  body = client.post("/los/batch", json={"pairs": PAIRS, "model": "radio"}).json()
+  assert body["ok"] and body["pairs"] == 3 and body["model"] == "radio"
+  assert [result["id"] for result in body["results"]] == [0, "around", "dev"]
+  # Every sample of every pair went out in one lookup.
+  assert client.calls == [body["samples"]]
+  for result, (start, end) in zip(body["results"], ENDPOINTS):
+    single = client.get(
+      "/los", params={"lat1": start[0], "lon1": start[1], "lat2": end[0], "lon2": end[1], "model": "radio"}
+    ).json()
+    for key in ("blocked", "max_obstruction_m", "suggested", "distance_m", "samples"):
+      assert result[key] == single[key]
+    assert result["fresnel"]["fresnel_clear"] == single["fresnel"]["fresnel_clear"]
+    # Batch verdicts skip the per-sample detail unless asked for.
+    assert "profile" not in result and "clearance_pct" not in result["fresnel"]
+  # Over the hill vs. along flat ground beside it.
+  assert body["results"][0]["max_obstruction_m"] > 100.0 > body["results"][1]["max_obstruction_m"]
+
+  detailed = client.post("/los/batch", json={"pairs": PAIRS[:1], "profile": True}).json()
+  assert "profile" in detailed["results"][0] and "peaks" in detailed["results"][0]
+
+
+def test_bad_pairs_fail_alone(client):
+  pairs = [
+    ["rpt-missing", [42.1, -71.1]],
+    ["rpt-0", [42.1, -71.1]],
+    [["north", 0.0], [42.1, -71.1]],
+    [[42.0], [42.1, -71.1]],
+    [[42.0, -71.0], [42.0, -71.0]],
+    "not-a-pair",
+    PAIRS[0],
+  ]
+  body = client.post("/los/batch", json={"pairs": pairs}).json()
+  errors = [result.get("error") for result in body["results"]]
+  assert errors == ["unknown_device", "unknown_device", "invalid_coords", "invalid_coords", "zero_distance", "invalid_coords", None]
+  assert body["results"][-1]["ok"] and body["results"][-1]["blocked"]
+  assert len(client.calls) == 1
+
+
+def test_request_validation(client, monkeypatch):
+  assert client.post("/los/batch", content=b"{", headers={"content-type": "application/json"}).status_code == 400
+  assert client.post("/los/batch", json=[PAIRS[0]]).status_code == 400
+  assert client.post("/los/batch", json={"pairs": "x"}).status_code == 400
+  assert client.post("/los/batch", json={"pairs": PAIRS, "model": "magic"}).status_code == 400
+  monkeypatch.setattr(app_module, "LOS_BATCH_MAX_PAIRS", 2)
+  assert client.post("/los/batch", json={"pairs": PAIRS}).json() == {"detail": "too_many_pairs"}
+  assert client.post("/los/batch", json={"pairs": []}).json()["results"] == []
+  assert client.calls == []
+
+
+def test_elevation_failure_fails_the_batch(client, monkeypatch):
+  async def failing_fetch(points):
+    return None, "elevation_fetch_failed: http_503", [False] * len(points)
+
+  monkeypatch.setattr(app_module, "_fetch_elevations", failing_fetch)
+  assert client.post("/los/batch", json={"pairs": PAIRS}).json() == {"ok": False, "error": "elevation_fetch_failed: http_503"}
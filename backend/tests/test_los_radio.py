@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+
+from los import EARTH_RADIUS_M, SPEED_OF_LIGHT_M_S, _earth_bulge, _los_max_obstruction, _los_radio_model
+
+# Effective-earth bulge and first Fresnel zone clearance against the closed
+# forms, and how the raised terrain changes the obstruction verdict.
+K = 4.0 / 3.0
+
+
+def _flat_path(distance_m, antenna_m, samples=401):
+  t = np.linspace(0.0, 1.0, samples)
+  elev = np.zeros(samples)
+  elev[0] = elev[-1] = antenna_m
+  return t, elev
+
+
+def test_bulge_matches_closed_form():
+  t = np.linspace(0.0, 1.0, 101)
+  bulge = _earth_bulge(t, 40000.0, K)
+  assert bulge[0] == 0.0 and bulge[-1] == 0.0
+  assert np.allclose(bulge, bulge[::-1])
+  # Midpoint: d^2 / (8 k R).
+  assert math.isclose(bulge[50], 40000.0 ** 2 / (8 * K * EARTH_RADIUS_M))
+  assert math.isclose(bulge[50], 23.54, abs_tol=0.01)
+  # A flatter effective earth (larger k) bulges less.
+  assert _earth_bulge(t, 40000.0, 2 * K)[50] == bulge[50] / 2
+
+
+def test_fresnel_clearance_on_a_flat_path():
+  distance = 40000.0
+  t, elev = _flat_path(distance, 30.0)
+  effective, model = _los_radio_model(t, elev, distance, K, 915.0, 0.6)
+  wavelength = SPEED_OF_LIGHT_M_S / 915e6
+  mid_radius = math.sqrt(wavelength * distance / 4)
+  mid_gap = 30.0 - distance ** 2 / (8 * K * EARTH_RADIUS_M)
+  assert model["clearance_pct"][0] is None and model["clearance_pct"][-1] is None
+  assert math.isclose(model["clearance_pct"][200], mid_gap / mid_radius * 100, abs_tol=0.05)
+  worst = model["worst"]
+  # The bulge peaks mid-path, where the zone is also widest.
+  assert worst["index"] == 200
+  assert math.isclose(worst["fresnel_radius_m"], mid_radius, abs_tol=0.01)
+  assert math.isclose(worst["intrusion_m"], 0.6 * mid_radius - mid_gap, abs_tol=0.01)
+  assert not model["fresnel_clear"]
+  assert model["max_bulge_m"] == round(distance ** 2 / (8 * K * EARTH_RADIUS_M), 2)
+  # The line still clears the bulge; only the Fresnel zone is short.
+  assert _los_max_obstruction(t, effective, 0, len(t) - 1) == 0.0
+
+  _, tall = _los_radio_model(t, _flat_path(distance, 70.0)[1], distance, K, 915.0, 0.6)
+  assert tall["fresnel_clear"] and tall["worst"]["intrusion_m"] == 0.0
+
+
+def test_bulge_can_block_a_path_straight_lines_clear():
+  distance = 60000.0
+  t, elev = _flat_path(distance, 20.0)
+  assert _los_max_obstruction(t, elev, 0, len(t) - 1) == 0.0
+  effective, _ = _los_radio_model(t, elev, distance, K, 868.0, 0.6)
+  blocked_by = _los_max_obstruction(t, effective, 0, len(t) - 1)
+  assert math.isclose(blocked_by, distance ** 2 / (8 * K * EARTH_RADIUS_M) - 20.0, abs_tol=0.01)
+
+
+def test_two_sample_path_has_no_zone():
+  effective, model = _los_radio_model(np.array([0.0, 1.0]), np.array([5.0, 7.0]), 1000.0, K, 915.0, 0.6)
+  assert effective.tolist() == [5.0, 7.0]
+  assert model["clearance_pct"] == [None, None]
+  assert model["fresnel_clear"] and model["worst"] is None
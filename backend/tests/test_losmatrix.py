@@ -0,0 +1,81 @@
+import pytest
+
+from losmatrix import LosMatrix
+
+# Pair bookkeeping: what a move invalidates, verdicts computed against an old
+# position being dropped, the in-flight count, and checkpoint restore.
+POSITIONS = {"a": (42.00, -71.00), "b": (42.01, -71.00), "c": (42.02, -71.00), "far": (43.0, -71.0)}
+VERDICT = {"distance_m": 1112.0, "blocked": False, "max_obstruction_m": 0.0}
+
+
+def _matrix(positions=POSITIONS):
+  matrix = LosMatrix(5.0, 100.0, "straight")
+  matrix.sync(dict(positions))
+  return matrix
+
+
+def _finish_all(matrix):
+  for key, _, _, versions in matrix.take(100):
+    assert matrix.finish(key, versions, VERDICT, 1.0)
+
+
+def test_only_pairs_in_range_are_queued():
+  matrix = _matrix()
+  assert matrix.pending == {("a", "b"), ("a", "c"), ("b", "c")}
+  _finish_all(matrix)
+  assert len(matrix) == 3 and not matrix.pending and matrix.stats()["pending"] == 0
+
+
+def test_a_move_requeues_only_that_row():
+  matrix = _matrix()
+  _finish_all(matrix)
+  # Under move_meters is not a move.
+  assert matrix.sync({**POSITIONS, "c": (42.0201, -71.0)}) == 0
+  assert matrix.sync({**POSITIONS, "c": (42.05, -71.0)}) == 1
+  assert set(matrix.pairs) == {("a", "b")}
+  # c moved out of a's range, so only b-c comes back.
+  assert matrix.pending == {("b", "c")}
+  assert matrix.rows("a") == [{"a": "a", "b": "b", **VERDICT, "ts": 1.0}]
+
+
+def test_a_verdict_for_a_moved_repeater_is_dropped():
+  matrix = _matrix()
+  jobs = {key: versions for key, _, _, versions in matrix.take(100)}
+  matrix.sync({**POSITIONS, "b": (42.011, -71.0)})
+  assert not matrix.finish(("a", "b"), jobs[("a", "b")], VERDICT, 1.0)
+  assert matrix.finish(("a", "c"), jobs[("a", "c")], VERDICT, 1.0)
+  assert set(matrix.pairs) == {("a", "c")}
+  assert matrix.pending == {("a", "b"), ("b", "c")}
+
+
+def test_in_flight_counts_every_outstanding_take():
+  matrix = _matrix()
+  first = matrix.take(1)
+  second = matrix.take(2)
+  assert matrix.in_flight == 3 and matrix.stats()["pending"] == 3
+  matrix.retry(key for key, _, _, _ in first)
+  assert matrix.in_flight == 2 and matrix.stats()["pending"] == 3
+  for key, _, _, versions in second:
+    matrix.finish(key, versions, VERDICT, 1.0)
+  assert matrix.in_flight == 0 and matrix.stats()["pending"] == 1
+
+
+def test_restore_rebuilds_links_and_queues_missing_pairs():
+  matrix = _matrix()
+  _finish_all(matrix)
+  body = matrix.export()
+  body["pairs"] = [pair for pair in body["pairs"] if pair[:2] != ["b", "c"]]
+  restored = LosMatrix(5.0, 100.0, "straight")
+  assert restored.restore(body)
+  assert set(restored.pairs) == {("a", "b"), ("a", "c")} and restored.pending == {("b", "c")}
+  # Restored positions are current: nothing is re-queued on the first sync.
+  assert restored.sync(dict(POSITIONS)) == 0
+
+
+@pytest.mark.parametrize("max_km, model", [(5.0, "radio"), (10.0, "straight")])
+def test_restore_rejects_another_model_or_range(max_km, model):
+  matrix = _matrix()
+  _finish_all(matrix)
+  other = LosMatrix(max_km, 100.0, model)
+  assert not other.restore(matrix.export())
+  assert not other.repeaters and not other.pairs and not other.pending
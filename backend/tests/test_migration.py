@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+import history
+
+# The one-time split of route_history.jsonl into span files: nothing becomes
+# visible until the whole source is converted, and an interrupted run never
+# duplicates segments on the next start.
+NOW = 1760860000.0
+ENTRIES = [{"ts": NOW + i * 900, "a": [42.1, -71.1], "b": [42.2, -71.2], "message_hash": f"h{i}"} for i in range(12)]
+
+
+@pytest.fixture
+def legacy(tmp_path, monkeypatch):
+  history_dir = tmp_path / "route_history"
+  history_dir.mkdir()
+  legacy_file = tmp_path / "route_history.jsonl"
+  legacy_file.write_text("".join(json.dumps(entry) + "\n" for entry in ENTRIES) + "not json\n\n")
+  monkeypatch.setattr(history, "ROUTE_HISTORY_DIR", str(history_dir))
+  monkeypatch.setattr(history, "ROUTE_HISTORY_FILE", str(legacy_file))
+  monkeypatch.setattr(history, "ROUTE_HISTORY_FILE_SECONDS", 3600)
+  monkeypatch.setattr(history, "MIGRATE_FRAME_LINES", 2)
+  # A span written before the migration keeps its segment.
+  existing = {"ts": NOW - 1, "a": [42.1, -71.1], "b": [42.2, -71.2], "message_hash": "live"}
+  with open(history_dir / history._history_file_name(existing["ts"]), "w") as handle:
+    handle.write(json.dumps(existing) + "\n")
+  return legacy_file
+
+
+def _stored_hashes():
+  return [entry["message_hash"] for entry in history._iter_history_file_segments(0.0, float("inf"))]
+
+
+def _leftovers(legacy_file):
+  names = os.listdir(history.ROUTE_HISTORY_DIR)
+  return [name for name in names if name.endswith(".tmp")], os.path.exists(f"{legacy_file}.migrated")
+
+
+def test_migration_splits_into_spans(legacy):
+  before = os.listdir(history.ROUTE_HISTORY_DIR)
+  assert history._migrate_route_history_file() == 12
+  assert not legacy.exists() and _leftovers(legacy) == ([], False)
+  assert _stored_hashes() == ["live"] + [entry["message_hash"] for entry in ENTRIES]
+  assert len(os.listdir(history.ROUTE_HISTORY_DIR)) == len(before) + 3
+
+
+def test_failure_partway_leaves_nothing_behind(legacy, monkeypatch):
+  frames = []
+  encode = history.compress_frame
+
+  def failing_frame(codec, data):
+    frames.append(data)
+    if len(frames) == 3:
+      raise OSError("disk full")
+    return encode(codec, data)
+
+  monkeypatch.setattr(history, "compress_frame", failing_frame)
+  assert history._migrate_route_history_file() == 0
+  assert legacy.exists() and _leftovers(legacy) == ([], False)
+  # Frames written before the failure never reached a span file.
+  assert _stored_hashes() == ["live"]
+
+  monkeypatch.setattr(history, "compress_frame", encode)
+  assert history._migrate_route_history_file() == 12
+  assert _stored_hashes() == ["live"] + [entry["message_hash"] for entry in ENTRIES]
+
+
+def test_restart_after_the_commit_point_finishes_the_move(legacy, monkeypatch):
+  finish = history._finish_route_history_migration
+
+  def crash(done_path):
+    raise OSError("power cut")
+
+  monkeypatch.setattr(history, "_finish_route_history_migration", crash)
+  assert history._migrate_route_history_file() == 0
+  assert not legacy.exists()
+  tmp_files, migrated = _leftovers(legacy)
+  # Four spans, the first one merged with the existing file.
+  assert len(tmp_files) == 4 and migrated
+  assert _stored_hashes() == ["live"]
+
+  monkeypatch.setattr(history, "_finish_route_history_migration", finish)
+  assert history._migrate_route_history_file() == 0
+  assert _leftovers(legacy) == ([], False)
+  assert _stored_hashes() == ["live"] + [entry["message_hash"] for entry in ENTRIES]
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+import decoder
+from state import DeviceState, devices, node_hash_candidates, node_hash_collisions, node_hash_to_device
+
+# Incremental node-hash index (_index_node_hash/_unindex_node_hash) against a
+# from-scratch _rebuild_node_hash_map() after random evict/insert churn.
+DEVICES = 10000
+CHURN = 5000
+
+
+def _snapshot():
+  return (
+    {node_hash: list(ids) for node_hash, ids in node_hash_candidates.items()},
+    set(node_hash_collisions),
+    dict(node_hash_to_device),
+  )
+
+
+@pytest.fixture
+def empty_devices():
+  saved = dict(devices)
+  devices.clear()
+  decoder._rebuild_node_hash_map()
+  yield
+  devices.clear()
+  devices.update(saved)
+  decoder._rebuild_node_hash_map()
+
+
+def _device_id(rng: random.Random) -> str:
+  return "".join(rng.choice("0123456789ABCDEF") for _ in range(64))
+
+
+def _insert(device_id: str) -> None:
+  devices[device_id] = DeviceState(device_id=device_id, lat=42.0, lon=-71.0, ts=0.0)
+  decoder._index_node_hash(device_id)
+
+
+def _evict(device_id: str) -> None:
+  devices.pop(device_id, None)
+  decoder._unindex_node_hash(device_id)
+
+
+def test_incremental_index_matches_rebuild_after_churn(empty_devices):
+  rng = random.Random(28)
+  for _ in range(DEVICES):
+    _insert(_device_id(rng))
+  for step in range(CHURN):
+    action = rng.random()
+    if action < 0.45 and devices:
+      _evict(rng.choice(list(devices)) if step % 50 == 0 else next(iter(devices)))
+    elif action < 0.55 and devices:
+      # Re-seen device: indexing twice must not duplicate it.
+      decoder._index_node_hash(rng.choice(list(devices)) if step % 50 == 0 else next(reversed(devices)))
+    else:
+      _insert(_device_id(rng))
+  # Ids that can't carry a hash are ignored both ways.
+  _insert("z")
+  _evict("z")
+  _evict("not-a-device")
+
+  incremental = _snapshot()
+  decoder._rebuild_node_hash_map()
+  assert incremental == _snapshot()
+  # 10k ids over 256 buckets: every bucket collides (unique buckets are
+  # covered by the sparse test below).
+  assert incremental[1] and not incremental[2]
+
+
+def test_single_bucket_transitions(empty_devices):
+  _insert("AB01")
+  assert node_hash_to_device == {"AB": "AB01"} and not node_hash_collisions
+  _insert("ab02")
+  assert node_hash_collisions == {"AB"} and "AB" not in node_hash_to_device
+  _evict("AB01")
+  assert node_hash_to_device == {"AB": "ab02"} and not node_hash_collisions
+  _evict("ab02")
+  assert not node_hash_candidates and not node_hash_to_device
+  incremental = _snapshot()
+  decoder._rebuild_node_hash_map()
+  assert incremental == _snapshot()
+
+
+def test_sparse_churn_matches_rebuild(empty_devices):
+  # Few devices, so buckets move between empty, unique and colliding.
+  rng = random.Random(2028)
+  pool = [f"{rng.randrange(8):02X}{i:04d}" for i in range(40)]
+  for _ in range(2000):
+    device_id = rng.choice(pool)
+    if device_id in devices:
+      _evict(device_id)
+    else:
+      _insert(device_id)
+  incremental = _snapshot()
+  decoder._rebuild_node_hash_map()
+  assert incremental == _snapshot()
+  assert incremental[2]
@@ -0,0 +1,51 @@
+from origins import INTERN_COMPACT_AT, MessageOriginTracker
+
+# MessageOriginTracker: LRU order on touch, TTL expiry from the cold end, the
+# hard entry cap, first-receiver bookkeeping and intern-table compaction.
+
+
+def test_observe_keeps_first_receiver_and_latest_origin():
+  tracker = MessageOriginTracker(ttl_seconds=60, max_entries=10)
+  assert tracker.observe("h1", 1.0, receiver_id="rx-a") == (None, "rx-a")
+  assert tracker.observe("h1", 2.0, origin_id="node-1", receiver_id="rx-b") == ("node-1", "rx-a")
+  assert tracker.observe("h1", 3.0, receiver_id="rx-a") == ("node-1", "rx-a")
+  assert tracker.receivers("h1") == ["rx-a", "rx-b"]
+  assert tracker.receivers("missing") == []
+  assert len(tracker) == 1 and tracker.inserted_total == 1
+
+
+def test_cap_evicts_least_recently_touched():
+  tracker = MessageOriginTracker(ttl_seconds=60, max_entries=3)
+  for i, key in enumerate(["a", "b", "c"]):
+    tracker.observe(key, float(i), receiver_id="rx")
+  # Touching "a" makes "b" the coldest entry.
+  tracker.observe("a", 3.0)
+  tracker.observe("d", 4.0, receiver_id="rx")
+  assert len(tracker) == 3 and tracker.evicted_total == 1
+  assert tracker.receivers("b") == []
+  assert tracker.receivers("a") == ["rx"]
+
+
+def test_expire_stops_at_first_live_entry():
+  tracker = MessageOriginTracker(ttl_seconds=10, max_entries=0)
+  for i in range(5):
+    tracker.observe(f"h{i}", float(i))
+  # h0 is touched late, so it survives even though it was inserted first.
+  tracker.observe("h0", 20.0)
+  assert tracker.expire(now=13.5) == 3
+  assert len(tracker) == 2 and tracker.expired_total == 3
+  assert tracker.expire(now=13.5) == 0
+  assert tracker.expire(now=100.0) == 2 and len(tracker) == 0
+
+
+def test_expire_compacts_the_intern_table():
+  tracker = MessageOriginTracker(ttl_seconds=10, max_entries=0)
+  for i in range(INTERN_COMPACT_AT):
+    tracker.observe(f"old{i}", 0.0, receiver_id=f"rx{i}")
+  tracker.observe("keep", 50.0, origin_id="node-9", receiver_id="rx-live")
+  tracker.observe("keep", 50.0, receiver_id="rx7")
+  assert tracker.expire(now=50.0) == INTERN_COMPACT_AT
+  assert tracker.compactions == 1
+  assert tracker.stats()["interned_ids"] == 3
+  assert tracker.observe("keep", 51.0) == ("node-9", "rx-live")
+  assert tracker.receivers("keep") == ["rx-live", "rx7"]
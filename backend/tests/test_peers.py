@@ -0,0 +1,79 @@
+import random
+from collections import deque
+
+from peers import PeerIndex
+
+# PeerIndex counters against a full scan of a segment window that grows at
+# the tail and expires oldest-first, as route history does.
+NODES = [f"N{i:02d}" for i in range(15)]
+
+
+def _count(table, peer_id, ts):
+  count, last = table.get(peer_id, (0, 0.0))
+  table[peer_id] = (count + 1, max(last, ts))
+
+
+def _scan(window, device_id):
+  inbound, outbound = {}, {}
+  for a_id, b_id, ts in window:
+    if not a_id or not b_id or a_id == b_id:
+      continue
+    if a_id == device_id:
+      _count(outbound, b_id, ts)
+    if b_id == device_id:
+      _count(inbound, a_id, ts)
+  return inbound, outbound
+
+
+def _rows(rows):
+  return {peer_id: (count, last) for peer_id, count, last in rows}
+
+
+def test_counters_match_a_scan_under_expiry():
+  rng = random.Random(32)
+  index = PeerIndex()
+  window = deque()
+  clock = 0.0
+  for step in range(6000):
+    if rng.random() < 0.6 or not window:
+      clock += 1.0
+      a_id, b_id = rng.choice(NODES + [None]), rng.choice(NODES)
+      window.append((a_id, b_id, clock))
+      index.add(a_id, b_id, clock)
+    else:
+      a_id, b_id, _ = window.popleft()
+      index.remove(a_id, b_id)
+    if step % 250 == 0:
+      for device_id in NODES:
+        inbound, outbound = index.peers(device_id)
+        expected_in, expected_out = _scan(window, device_id)
+        assert _rows(inbound) == expected_in
+        assert _rows(outbound) == expected_out
+        assert [row[1] for row in inbound] == sorted((row[1] for row in inbound), reverse=True)
+
+  while window:
+    a_id, b_id, _ = window.popleft()
+    index.remove(a_id, b_id)
+  assert index.stats()["devices"] == 0 and index.stats()["links"] == 0
+
+
+def test_cached_lists_are_dropped_when_counters_change():
+  index = PeerIndex()
+  index.add("A", "B", 1.0)
+  index.add("A", "C", 2.0)
+  index.add("A", "C", 3.0)
+  assert index.peers("A") == ([], [("C", 2, 3.0), ("B", 1, 1.0)])
+  assert index.peers("A") == ([], [("C", 2, 3.0), ("B", 1, 1.0)])
+  assert (index.cache_hits, index.cache_misses) == (1, 1)
+  # A change on B's side leaves A's cached lists alone.
+  index.add("C", "B", 4.0)
+  index.peers("A")
+  assert index.cache_hits == 2
+  index.remove("A", "B")
+  assert index.peers("A") == ([], [("C", 2, 3.0)])
+  assert index.cache_misses == 2
+  # Self-links and missing ids are ignored, and unknown devices are never cached.
+  index.add("A", "A", 5.0)
+  index.add(None, "A", 5.0)
+  assert index.peers("Z") == ([], [])
+  assert index.stats()["cached_devices"] == 1
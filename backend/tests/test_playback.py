@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import history
+from playback import PlaybackSession
+
+# PlaybackSession against an in-memory source: ordered delivery, seek, pause,
+# speed changes, and the source generator always being closed.
+START, END = 1000.0, 2000.0
+
+
+class Source:
+  def __init__(self, gate=None):
+    self.calls = []
+    self.closed = 0
+    self.gate = gate
+    self.reading = threading.Event()
+
+  def __call__(self, start, end):
+    self.calls.append(start)
+    return self._entries(start, end)
+
+  def _entries(self, start, end):
+    try:
+      for ts in range(int(START), int(END)):
+        if self.gate is not None and ts == start + 1:
+          self.reading.set()
+          self.gate.wait(5)
+        if start <= ts <= end:
+          yield {"ts": float(ts), "a": [42.0, -71.0], "b": [42.1, -71.1], "a_id": "a", "b_id": "b"}
+    finally:
+      self.closed += 1
+
+
+async def _start(source, speed, max_speed=1000.0):
+  session = PlaybackSession(source, START, END, speed, max_speed)
+  messages = []
+
+  async def send(payload):
+    messages.append(payload)
+
+  return session, messages, asyncio.ensure_future(session.run(send))
+
+
+async def _until(predicate, timeout=5.0):
+  deadline = time.monotonic() + timeout
+  while not predicate():
+    assert time.monotonic() < deadline
+    await asyncio.sleep(0.01)
+
+
+def _segment_ts(messages):
+  return [segment[0] for message in messages if message["type"] == "playback_segments" for segment in message["segments"]]
+
+
+def test_plays_everything_in_order_then_ends():
+  source = Source()
+
+  async def main():
+    session, messages, task = await _start(source, 1000.0)
+    await _until(lambda: messages and messages[-1]["type"] == "playback_end")
+    assert session.paused
+    session.close()
+    await task
+    return messages
+
+  messages = asyncio.run(main())
+  assert messages[0]["type"] == "playback_state" and messages[0]["clock"] == pytest.approx(START, abs=1.0)
+  assert _segment_ts(messages) == [float(ts) for ts in range(int(START), int(END))]
+  assert messages[-1]["sent"] == 1000
+  assert source.closed == 1
+
+
+def test_seek_restarts_the_source_and_closes_the_old_generator():
+  source = Source()
+
+  async def main():
+    session, messages, task = await _start(source, 0.1)
+    await _until(lambda: _segment_ts(messages))
+    # The first chunk left the original generator suspended mid-range.
+    assert source.closed == 0
+    before = len(messages)
+    session.seek(1500.0)
+    session.set_speed(1000.0)
+    await _until(lambda: messages[-1]["type"] == "playback_end")
+    session.close()
+    await task
+    return messages[before:]
+
+  after = asyncio.run(main())
+  assert source.calls == [START, 1500.0]
+  assert after[0]["type"] == "playback_state" and after[0]["clock"] == pytest.approx(1500.0, abs=1.0)
+  assert _segment_ts(after) == [float(ts) for ts in range(1500, int(END))]
+  assert source.closed == 2
+
+
+def test_pause_freezes_the_clock_and_resume_continues_from_it():
+  source = Source()
+
+  async def main():
+    session, messages, task = await _start(source, 10.0)
+    await _until(lambda: _segment_ts(messages))
+    session.pause()
+    frozen = session.clock()
+    sent = len(_segment_ts(messages))
+    await asyncio.sleep(0.3)
+    assert session.clock() == frozen and len(_segment_ts(messages)) == sent
+    session.resume()
+    assert session.clock() == pytest.approx(frozen, abs=0.1)
+    await _until(lambda: len(_segment_ts(messages)) > sent)
+    session.close()
+    await task
+
+  asyncio.run(main())
+
+
+def test_speed_is_clamped_and_keeps_the_clock_continuous():
+  source = Source()
+
+  async def main():
+    session, _, task = await _start(source, 5000.0, max_speed=50.0)
+    assert session.speed == 50.0
+    await asyncio.sleep(0.1)
+    before = session.clock()
+    session.set_speed(0)
+    assert session.speed == 0.1
+    assert session.clock() == pytest.approx(before, abs=0.5)
+    session.set_speed(20.0)
+    await asyncio.sleep(0.2)
+    assert session.clock() - before == pytest.approx(4.0, abs=2.0)
+    assert session.state()["speed"] == 20.0
+    session.close()
+    await task
+
+  asyncio.run(main())
+
+
+def test_disconnect_mid_read_closes_the_generator_after_the_read():
+  gate = threading.Event()
+  source = Source(gate)
+
+  async def main():
+    session, _, task = await _start(source, 1000.0)
+    await asyncio.to_thread(source.reading.wait, 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+      await task
+    # The worker thread still owns the generator, so it is not closed yet.
+    assert source.closed == 0
+    gate.set()
+    await asyncio.wait([session._reading])
+    assert source.closed == 1
+
+  asyncio.run(main())
+
+
+def test_history_source_includes_segments_still_queued_in_the_writer(tmp_path, monkeypatch):
+  monkeypatch.setattr(history, "ROUTE_HISTORY_DIR", str(tmp_path))
+  entry = {"ts": START + 5, "a": [42.0, -71.0], "b": [42.1, -71.1], "a_id": "a", "b_id": "b"}
+  history.route_history_writer.append([entry])
+  try:
+    assert list(history._iter_history_segments(START, END)) == [entry]
+  finally:
+    history.route_history_writer.reopen()
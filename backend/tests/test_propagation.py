@@ -0,0 +1,195 @@
+import asyncio
+import math
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import pytest
+
+import app as app_module
+import propagation
+from propagation import (
+  OVERLAP_RGB,
+  RASTER_HEADER,
+  RASTER_MAGIC,
+  SINGLE_RGB,
+  parse_render_request,
+  raster_grid,
+  raster_meta,
+  raster_png,
+  render_key,
+  render_raster,
+)
+
+# Server propagation rasters: request normalization, the free-space budget
+# against a per-cell reference, terrain shadowing over a synthetic DEM tile,
+# and the binary / PNG encodings.
+ORIGIN_A = {"lat": 42.5, "lon": -71.5}
+ORIGIN_B = {"lat": 42.52, "lon": -71.47}
+
+
+def _request(origins, budget=120, **config):
+  return {
+    "origins": origins,
+    "renderRange": 5000,
+    "maxPathLossDb": budget,
+    "freqMHz": 915,
+    "config": {"gridStep": 250, "sampleStep": 90, "pathLossExp": 2.2, **config},
+  }
+
+
+def _params(origins, budget=120, **config):
+  params, error = parse_render_request(_request(origins, budget, **config), 16, 100000.0)
+  assert error is None
+  return params
+
+
+def _decode(blob):
+  header = RASTER_HEADER.unpack_from(blob, 0)
+  cells = header[3] * header[4]
+  coverage = np.frombuffer(blob, dtype=np.uint8, count=cells, offset=RASTER_HEADER.size)
+  alpha = np.frombuffer(blob, dtype=np.uint8, count=cells, offset=RASTER_HEADER.size + cells)
+  return header, coverage, alpha
+
+
+def test_requests_normalize_to_one_key():
+  first = _params([ORIGIN_A, ORIGIN_B])
+  second = _params([[ORIGIN_B["lat"], ORIGIN_B["lon"]], ORIGIN_A])
+  assert first == second and render_key(first) == render_key(second)
+  assert first["origins"] == [[42.5, -71.5], [42.52, -71.47]]
+  assert render_key(_params([ORIGIN_A])) != render_key(first)
+  clamped = _params([ORIGIN_A], gridStep=1, pathLossExp=99)
+  assert clamped["grid_step"] == 30.0 and clamped["path_loss_exp"] == 6.0
+
+
+@pytest.mark.parametrize("body, error", [
+  ([], "invalid_body"),
+  ({"origins": []}, "no_origins"),
+  ({"origins": [{"lat": "x", "lon": 1}]}, "invalid_origin"),
+  ({"origins": [[1, 2, 3]]}, "invalid_origin"),
+  ({"origins": [ORIGIN_A] * 3, "renderRange": 1000, "maxPathLossDb": 100}, "too_many_origins"),
+  ({"origins": [ORIGIN_A], "renderRange": 0, "maxPathLossDb": 100}, "invalid_budget"),
+  ({"origins": [ORIGIN_A], "renderRange": 1000}, "invalid_budget"),
+  ({"origins": [ORIGIN_A], "renderRange": 200000, "maxPathLossDb": 100}, "range_too_large"),
+])
+def test_request_errors(body, error):
+  assert parse_render_request(body, 2, 100000.0) == (None, error)
+
+
+def test_free_space_coverage_matches_reference():
+  params = _params([ORIGIN_A, ORIGIN_B])
+  header, coverage, alpha = _decode(render_raster(params))
+  grid = raster_grid(params)
+  assert header[:5] == (RASTER_MAGIC, 1, 2, grid["cols"], grid["rows"])
+
+  lat = np.repeat(grid["lat_max"] - np.arange(grid["rows"]) * grid["lat_step"], grid["cols"])
+  lon = np.tile(grid["lon_min"] + np.arange(grid["cols"]) * grid["lon_step"], grid["rows"])
+  expected = np.zeros(lat.shape, dtype=np.uint8)
+  fspl_1m = 32.44 + 20 * math.log10(915) - 60
+  for o_lat, o_lon in params["origins"]:
+    dx = (lon - o_lon) * propagation.LAT_SCALE * math.cos(math.radians(o_lat))
+    dy = (lat - o_lat) * propagation.LAT_SCALE
+    d = np.hypot(dx, dy)
+    with np.errstate(divide="ignore"):
+      margin = 120 - (fspl_1m + 22 * np.log10(d))
+    expected += (d > 1.0) & (d <= 5000) & (margin > 0)
+  assert np.array_equal(coverage, expected)
+  assert 0 < np.count_nonzero(coverage == 2) < np.count_nonzero(coverage)
+  assert np.array_equal(alpha, np.where(expected > 0, 255, 0))
+
+
+def test_fade_by_margin_scales_alpha():
+  _, coverage, alpha = _decode(render_raster(_params([ORIGIN_A], fadeByMargin=True)))
+  assert alpha.max() == 255 and 0 < alpha[coverage > 0].min() < 255
+  assert not alpha[coverage == 0].any()
+
+
+def test_terrain_wall_shadows_cells_behind_it(tmp_path, monkeypatch):
+  # Flat ground with a 500 m north-south wall 2 km east of the origin.
+  tile = np.zeros((1201, 1201), dtype=np.int16)
+  wall_col = int(round((-71.5 + 2000 / (propagation.LAT_SCALE * math.cos(math.radians(42.5))) + 72) * 1200))
+  tile[:, wall_col - 2:wall_col + 3] = 500
+  tile.astype(">i2").tofile(str(tmp_path / "N42W072.hgt"))
+  monkeypatch.setattr(propagation, "_dem", None)
+  propagation.init_worker(str(tmp_path), 4)
+
+  params = _params([ORIGIN_A], budget=130, useTerrain=True, txAgl=10)
+  _, coverage, _ = _decode(render_raster(params))
+  grid = raster_grid(params)
+  lon = grid["lon_min"] + np.arange(grid["cols"]) * grid["lon_step"]
+  middle = coverage.reshape(grid["rows"], grid["cols"])[grid["rows"] // 2]
+  wall_lon = -72 + wall_col / 1200
+  west = middle[(lon < ORIGIN_A["lon"]) & (lon > 2 * ORIGIN_A["lon"] - wall_lon + 0.005)]
+  east = middle[(lon > wall_lon + 0.005) & (lon < 2 * wall_lon - ORIGIN_A["lon"])]
+  assert len(west) > 5 and west.all()
+  assert len(east) > 5 and not east.any()
+
+
+def test_meta_and_png_encoding():
+  blob = render_raster(_params([ORIGIN_A, ORIGIN_B]))
+  header, coverage, alpha = _decode(blob)
+  meta = raster_meta(blob)
+  assert (meta["width"], meta["height"]) == (header[3], header[4])
+  assert meta["requiredOverlap"] == 2 and meta["coveredCells"] == np.count_nonzero(coverage)
+
+  png = raster_png(blob)
+  assert png.startswith(b"\x89PNG\r\n\x1a\n")
+  chunks, offset = {}, 8
+  while offset < len(png):
+    (length,) = struct.unpack_from(">I", png, offset)
+    kind = png[offset + 4:offset + 8]
+    data = png[offset + 8:offset + 8 + length]
+    assert struct.unpack_from(">I", png, offset + 8 + length)[0] == zlib.crc32(kind + data)
+    chunks[kind] = data
+    offset += 12 + length
+  assert struct.unpack(">IIBBBBB", chunks[b"IHDR"]) == (meta["width"], meta["height"], 8, 6, 0, 0, 0)
+  rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(meta["height"], -1)
+  assert not rows[:, 0].any()
+  rgba = rows[:, 1:].reshape(-1, 4)
+  assert np.array_equal(rgba[:, 3], alpha)
+  assert (rgba[coverage == 2, :3] == OVERLAP_RGB).all()
+  assert (rgba[coverage == 1, :3] == SINGLE_RGB).all()
+  assert not rgba[coverage == 0].any()
+
+
+def test_shared_render_outlives_a_cancelled_request(monkeypatch):
+  gate = threading.Event()
+  pool = ThreadPoolExecutor(max_workers=1)
+
+  def slow_render(params):
+    gate.wait(5)
+    return render_raster(params)
+
+  monkeypatch.setattr(app_module, "PROPAGATION_ENABLED", True)
+  monkeypatch.setattr(app_module, "_propagation_pool", lambda: pool)
+  monkeypatch.setattr(app_module, "render_raster", slow_render)
+  renders = app_module.propagation_renders
+  body = _request([ORIGIN_A])
+  key = render_key(_params([ORIGIN_A]))
+
+  async def main():
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://map") as client:
+      first = asyncio.ensure_future(client.post("/propagation/render", json=body))
+      while key not in app_module._propagation_inflight:
+        await asyncio.sleep(0.01)
+      second = asyncio.ensure_future(client.post("/propagation/render", json=body))
+      await asyncio.sleep(0.05)
+      # The first client goes away mid-render; the second still gets it.
+      first.cancel()
+      gate.set()
+      response = await second
+      assert first.cancelled()
+      return response.json()
+
+  try:
+    result = asyncio.run(main())
+  finally:
+    pool.shutdown()
+  assert result["ok"] and result["key"] == key and not result["cached"]
+  assert app_module.propagation_renders == renders + 1
+  assert app_module.propagation_cache.get(("bin", key)) is not None
+  assert key not in app_module._propagation_inflight
@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+import history
+import state
+from buckets import EdgeBucketAggregator
+from peers import PeerIndex
+from rollups import META_FILE, DailyRollupStore
+from segments import HistorySegmentStore
+from spatial import EdgeGridIndex
+
+# Daily rollups: every live fold counts whatever its ts order, flushes merge
+# into the day files, queries sum days, and the startup catch-up folds only
+# what expired after covered_until.
+DAY = 1760832000.0  # 2025-10-19T00:00Z
+A, B = [42.1, -71.1], [42.2, -71.2]
+C, D = [42.5, 179.5], [42.6, 179.8]
+
+
+def _store(tmp_path, retention_days=0):
+  return DailyRollupStore(str(tmp_path / "rollups"), retention_days, None)
+
+
+def test_folds_count_out_of_order_and_only_advance_the_mark(tmp_path):
+  rollups = _store(tmp_path)
+  rollups.fold(DAY + 100, "ab", A, B, 2)
+  rollups.fold(DAY + 50, "ab", A, B, 4)
+  rollups.fold(DAY + 100, "ab", A, B, None)
+  assert rollups.covered_until == DAY + 100 and rollups.folded == 3
+  matched, edges = rollups.query(DAY, DAY + 86399)
+  assert matched == 1
+  assert edges[0]["count"] == 3 and edges[0]["first_seen"] == DAY + 50 and edges[0]["last_seen"] == DAY + 100
+  assert edges[0]["payload_types"] == {"2": 1, "4": 1, "unknown": 1}
+
+
+def test_flush_merges_into_day_files(tmp_path):
+  rollups = _store(tmp_path)
+  rollups.fold(DAY + 10, "ab", A, B, 2)
+  rollups.fold(DAY + 86400 + 10, "ab", A, B, 2)
+  assert rollups.flush() == 2
+  assert sorted(os.listdir(rollups.directory)) == ["20251019.json", "20251020.json", META_FILE]
+  with open(os.path.join(rollups.directory, META_FILE)) as handle:
+    assert json.load(handle) == {"covered_until": DAY + 86400 + 10}
+  for payload_type in range(7):
+    rollups.fold(DAY + 20 + payload_type, "ab", A, B, payload_type)
+  rollups.flush()
+  assert rollups.flush() == 0
+
+  reopened = _store(tmp_path)
+  assert reopened.covered_until == DAY + 86400 + 10
+  day = reopened.series("ab", DAY, DAY + 86399)
+  # Eight segments that day; only the top five payload types are kept.
+  assert day[0]["count"] == 8 and len(day[0]["payload_types"]) == 5 and day[0]["payload_types"]["2"] == 2
+  assert [row["day"] for row in reopened.series("ab", DAY, DAY + 2 * 86400)] == ["2025-10-19", "2025-10-20"]
+
+
+def test_query_sums_days_and_filters(tmp_path):
+  rollups = _store(tmp_path)
+  for day in range(3):
+    for _ in range(day + 1):
+      rollups.fold(DAY + day * 86400 + 60, "ab", A, B, 2)
+  rollups.flush()
+  rollups.fold(DAY + 2 * 86400 + 120, "ab", A, B, 2)
+  rollups.fold(DAY + 3600, "cd", C, D, 5)
+  matched, edges = rollups.query(DAY, DAY + 3 * 86400)
+  # Unflushed folds are merged with the day files.
+  assert matched == 2 and [(e["id"], e["count"], e["active_days"]) for e in edges] == [("ab", 7, 3), ("cd", 1, 1)]
+  assert rollups.query(DAY + 86400, DAY + 3 * 86400)[1][0]["count"] == 6
+  assert rollups.query(DAY, DAY + 3 * 86400, min_count=2)[0] == 1
+  assert len(rollups.query(DAY, DAY + 3 * 86400, limit=1)[1]) == 1
+  # A bbox that wraps the antimeridian still finds the edge inside it.
+  assert [e["id"] for e in rollups.query(DAY, DAY + 3 * 86400, bounds=(179.0, 42.0, -179.0, 43.0))[1]] == ["cd"]
+  assert [e["id"] for e in rollups.query(DAY, DAY + 3 * 86400, bounds=(-72.0, 42.0, -71.0, 43.0))[1]] == ["ab"]
+
+
+def test_flush_expires_days_past_retention(tmp_path):
+  rollups = _store(tmp_path, retention_days=30)
+  rollups.fold(DAY - 400 * 86400, "ab", A, B, 2)
+  rollups.fold(DAY + 10 * 365 * 86400, "ab", A, B, 2)
+  rollups.flush()
+  assert sorted(name for name in os.listdir(rollups.directory) if name != META_FILE) == ["20351017.json"]
+
+
+@pytest.fixture
+def live(tmp_path, monkeypatch):
+  history_dir = tmp_path / "route_history"
+  history_dir.mkdir()
+  monkeypatch.setattr(history, "ROUTE_HISTORY_DIR", str(history_dir))
+  monkeypatch.setattr(history, "ROUTE_HISTORY_ENABLED", True)
+  monkeypatch.setattr(history, "HISTORY_ROLLUP_ENABLED", True)
+  monkeypatch.setattr(state, "route_history_segments", HistorySegmentStore())
+  monkeypatch.setattr(state, "route_history_edges", {})
+  monkeypatch.setattr(state, "history_edge_index", EdgeGridIndex())
+  monkeypatch.setattr(state, "peer_index", PeerIndex())
+  monkeypatch.setattr(state, "history_buckets", EdgeBucketAggregator(300, 6 * 3600, 7 * 86400))
+  monkeypatch.setattr(state, "history_rollups", _store(tmp_path))
+  return history_dir
+
+
+def _entry(ts, a=A, b=B):
+  return {"ts": ts, "a": a, "b": b, "a_id": "rpt-a", "b_id": "rpt-b", "message_hash": f"h{ts}", "payload_type": 2}
+
+
+def test_pruning_folds_segments_that_expire_out_of_order(live):
+  for ts in (DAY + 30, DAY + 10, DAY + 20):
+    history._apply_history_item(history._history_item_from_entry(_entry(ts), 0.0))
+  history._prune_route_history(force_limit=True, max_segments=1)
+  history._prune_route_history(force_limit=True, max_segments=0)
+  rollups = state.history_rollups
+  assert len(state.route_history_segments) == 0
+  assert rollups.folded == 3 and rollups.covered_until == DAY + 30
+  assert rollups.query(DAY, DAY + 86399)[1][0]["count"] == 3
+
+
+def test_catch_up_folds_only_what_expired_after_covered_until(live):
+  entries = [_entry(DAY + offset) for offset in (100, 200, 300, 400)] + [_entry(DAY + 250, C, D)]
+  for entry in entries:
+    with open(live / history._history_file_name(entry["ts"]), "a") as handle:
+      handle.write(json.dumps(entry) + "\n")
+  rollups = state.history_rollups
+  rollups.fold(DAY + 200, "earlier", A, B, 2)
+  rollups.flush()
+
+  # 300 and the out-of-order 250 expired offline; 400 is still in the window.
+  assert history._catch_up_history_rollups(DAY + 350) == 2
+  assert rollups.covered_until == DAY + 300
+  ab = history._edge_key_from_e6((42100000, -71100000), (42200000, -71200000))
+  cd = history._edge_key_from_e6((42500000, 179500000), (42600000, 179800000))
+  counts = {edge["id"]: edge["count"] for edge in rollups.query(DAY, DAY + 86399)[1]}
+  assert counts == {"earlier": 1, ab: 1, cd: 1}
+  # A second start has nothing left to fold.
+  assert history._catch_up_history_rollups(DAY + 350) == 0
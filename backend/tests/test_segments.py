@@ -0,0 +1,160 @@
+import random
+from array import array
+from collections import Counter, deque
+
+import pytest
+
+from segments import HistorySegmentStore, StringPool, _edge_key_from_e6
+
+# HistorySegmentStore against a deque-of-dicts model under random
+# append/appendleft/popleft, including ring wraparound and growth.
+FIELDS = ("a_id", "b_id", "message_hash", "payload_type", "origin_id", "receiver_id", "route_mode", "topic")
+
+
+def _segment(rng: random.Random, ts: float):
+  nodes = [(42_000_000 + i * 1_000, -71_000_000 - i * 2_000) for i in range(12)]
+  a, b = rng.sample(nodes, 2)
+  ids = [f"{i:02X}" * 4 for i in range(6)] + [None]
+  fields = (
+    rng.choice(ids),
+    rng.choice(ids),
+    rng.choice([None, f"{rng.randrange(50):08x}"]),
+    rng.choice([None, 0, 4, 5]),
+    rng.choice(ids),
+    rng.choice(ids),
+    rng.choice(["path", "direct", None]),
+    rng.choice(["meshcore/a/packets", "meshcore/b/packets"]),
+  )
+  return ts, a, b, fields
+
+
+def _model_entry(ts, a, b, fields):
+  return {"ts": ts, "a": [a[0] / 1e6, a[1] / 1e6], "b": [b[0] / 1e6, b[1] / 1e6], **dict(zip(FIELDS, fields))}
+
+
+def test_store_matches_deque_model():
+  rng = random.Random(31)
+  store = HistorySegmentStore(capacity=16)
+  model = deque()
+  edges = Counter()
+  clock = 1000.0
+  for step in range(20000):
+    roll = rng.random()
+    if roll < 0.55 or not model:
+      clock += 1.0
+      ts, a, b, fields = _segment(rng, clock)
+      key = store.append(ts, a, b, *fields)
+      model.append((ts, a, b, fields))
+    elif roll < 0.65:
+      ts, a, b, fields = _segment(rng, model[0][0] - 1.0)
+      key = store.appendleft(ts, a, b, *fields)
+      model.appendleft((ts, a, b, fields))
+    else:
+      ts, a, b, fields = model.popleft()
+      key, emptied = store.popleft()
+      expected = _edge_key_from_e6(a, b)
+      assert key == expected
+      edges[(a, b)] -= 1
+      assert emptied == (edges[(a, b)] == 0)
+      if emptied:
+        del edges[(a, b)]
+      continue
+    assert key == _edge_key_from_e6(a, b)
+    edges[(a, b)] += 1
+
+    if step % 997 == 0:
+      assert len(store) == len(model)
+      assert list(store) == [_model_entry(*segment) for segment in model]
+      assert store.edge_count() == len(edges)
+
+  assert list(store) == [_model_entry(*segment) for segment in model]
+  assert [store.edge_key_at(i) for i in range(len(store))] == [_edge_key_from_e6(a, b) for _, a, b, _ in model]
+  assert list(store.endpoints()) == [(ts, fields[0], fields[1]) for ts, _, _, fields in model]
+  assert store.oldest_ts() == model[0][0]
+
+  exported = store.export_columns()
+  assert array("d", exported["ts"]).tolist() == [segment[0] for segment in model]
+  coords = array("i", exported["coords_e6"]).tolist()
+  assert coords == [value for _, a, b, _ in model for value in (*a, *b)]
+  for i, name in enumerate(FIELDS):
+    values = [fields[i] for _, _, _, fields in model]
+    if name == "payload_type":
+      values = [value if isinstance(value, int) and value >= 0 else None for value in values]
+    assert exported["columns"][name] == values
+
+  while model:
+    model.popleft()
+    store.popleft()
+  assert len(store) == 0 and store.edge_count() == 0
+  # Every pooled string was released with its last segment.
+  assert len(store._ids) == 0 and len(store._hashes) == 0 and len(store._labels) == 0
+  with pytest.raises(IndexError):
+    store.popleft()
+
+
+def test_columns_shrink_as_the_store_drains():
+  rng = random.Random(131)
+  store = HistorySegmentStore(capacity=16)
+  model = deque()
+  for i in range(3000):
+    ts, a, b, fields = _segment(rng, 1000.0 + i)
+    store.append(ts, a, b, *fields)
+    model.append((ts, a, b, fields))
+    # Keep the head moving so the ring wraps before it shrinks.
+    if i % 3 == 0:
+      model.popleft()
+      store.popleft()
+  full = store.nbytes()
+  assert store._cap == 2048
+
+  while len(model) > 300:
+    model.popleft()
+    store.popleft()
+  # Halved below a quarter full, so the next append never has to grow again.
+  assert store._cap == 1024 and store.nbytes() < full
+  assert list(store) == [_model_entry(*segment) for segment in model]
+  ts, a, b, fields = _segment(rng, 500.0)
+  store.appendleft(ts, a, b, *fields)
+  model.appendleft((ts, a, b, fields))
+  assert list(store) == [_model_entry(*segment) for segment in model]
+
+  while model:
+    model.popleft()
+    store.popleft()
+  assert store._cap == 16
+  ts, a, b, fields = _segment(rng, 1.0)
+  store.append(ts, a, b, *fields)
+  assert len(store) == 1 and store.oldest_ts() == 1.0
+
+
+def test_string_pool_reuses_released_slots():
+  pool = StringPool()
+  a = pool.acquire("alpha")
+  assert pool.acquire("alpha") == a
+  b = pool.acquire(7)
+  assert pool.value(b) == "7"
+  pool.release(a)
+  assert pool.value(a) == "alpha"
+  pool.release(a)
+  assert len(pool) == 1
+  assert pool.acquire("gamma") == a
+  assert pool.acquire(None) == -1 and pool.value(-1) is None
+
+
+def test_snapshot_export_ignores_later_mutation():
+  # The checkpoint writer exports a snapshot in a thread while the loop keeps
+  # appending and expiring; freed pool slots get reused with other strings.
+  rng = random.Random(7)
+  store = HistorySegmentStore(capacity=16)
+  for i in range(300):
+    ts, a, b, fields = _segment(rng, 1000.0 + i)
+    store.append(ts, a, b, *fields)
+  for _ in range(120):
+    store.popleft()
+  expected = store.export_columns()
+  snapshot = store.snapshot()
+  for i in range(400):
+    store.popleft()
+    ts, a, b, fields = _segment(rng, 2000.0 + i)
+    store.append(ts, a, b, f"new-{i}", *fields[1:])
+  assert store.export_columns(snapshot) == expected
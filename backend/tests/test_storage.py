@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pytest
+
+import app as app_module
+import history
+import storage
+
+# SQLite's first-start import of the file-backed state and route history.
+NOW = 1760860000.0
+
+
+def _segment(ts, a, b, a_id):
+  return {
+    "ts": ts, "a": list(a), "b": list(b), "a_id": a_id, "b_id": "rpt-b", "message_hash": f"h{ts:.0f}",
+    "payload_type": 2, "origin_id": a_id, "receiver_id": "rpt-b", "route_mode": "path", "topic": "meshcore/x",
+  }
+
+
+SEGMENTS = [
+  _segment(NOW, (42.1, -71.1), (42.2, -71.2), "rpt-a"),
+  _segment(NOW + 10, (42.2, -71.2), (42.3, -71.3), "rpt-c"),
+  _segment(NOW + 7200, (42.1, -71.1), (42.2, -71.2), "rpt-a"),
+]
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+  history_dir = tmp_path / "route_history"
+  history_dir.mkdir()
+  monkeypatch.setattr(history, "ROUTE_HISTORY_DIR", str(history_dir))
+  for entry in SEGMENTS:
+    with open(history_dir / history._history_file_name(entry["ts"]), "a") as handle:
+      handle.write(json.dumps(entry) + "\n")
+  state_file = tmp_path / "state.json"
+  state_file.write_text(json.dumps({
+    "devices": {
+      "rpt-a": {"device_id": "rpt-a", "lat": 42.1, "lon": -71.1, "ts": NOW, "name": "Alpha", "role": "repeater"},
+      "rpt-c": {"device_id": "rpt-c", "lat": 42.3, "lon": -71.3, "ts": NOW + 5},
+      "broken": {"device_id": "broken", "lat": None, "lon": -71.0, "ts": NOW},
+    },
+    "trails": {"rpt-a": [[42.1, -71.1, NOW], [42.11, -71.1, NOW + 60]], "rpt-c": [[42.3, -71.3]]},
+  }))
+  monkeypatch.setattr(app_module, "STATE_FILE", str(state_file))
+  monkeypatch.setattr(app_module, "CHECKPOINT_ENABLED", False)
+  monkeypatch.setattr(storage, "SQLITE_ENABLED", True)
+  monkeypatch.setattr(storage, "SQLITE_FILE", str(tmp_path / "meshmap.db"))
+  yield tmp_path / "meshmap.db"
+  storage._sqlite_close()
+
+
+def _count(path, table):
+  with sqlite3.connect(str(path)) as conn:
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_first_start_imports_files_once(files):
+  assert storage._sqlite_init(app_module._sqlite_file_import)
+  assert sorted(row["device_id"] for row in storage._query_devices()) == ["rpt-a", "rpt-c"]
+  assert storage._query_trail("rpt-a", 0) == [[42.1, -71.1, NOW], [42.11, -71.1, NOW + 60]]
+  stored = storage._query_history_segments(0)
+  assert stored == SEGMENTS
+  items, source = history._read_route_history_items(0)
+  assert source == "sqlite" and len(items) == 3
+
+  # Later starts find the marker and import nothing again.
+  storage._sqlite_close()
+  assert storage._sqlite_init(app_module._sqlite_file_import)
+  assert _count(files, "history_segments") == 3 and _count(files, "trails") == 2
+
+
+def test_failed_import_commits_nothing_and_retries(files):
+  def failing_import():
+    devices, trails, segments = app_module._sqlite_file_import()
+
+    def rows():
+      yield next(iter(segments))
+      raise OSError("disk went away")
+    return devices, trails, rows()
+
+  assert not storage._sqlite_init(failing_import)
+  # The run stays on the files.
+  assert not storage._sqlite_ready()
+  assert _count(files, "devices") == 0 and _count(files, "history_segments") == 0 and _count(files, "meta") == 0
+
+  assert storage._sqlite_init(app_module._sqlite_file_import)
+  assert _count(files, "devices") == 2 and _count(files, "history_segments") == 3
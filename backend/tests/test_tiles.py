@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import app as app_module
+from tiles import build_edge_tile, build_node_tile, pack_edge_row, render_tile
+
+# Tiles built from packed rows match the in-process builders, and renders
+# shared between requests survive any one client going away.
+EDGES = [
+  ([42.10, -71.10], [42.20, -71.20], 7, 1760860000.0),
+  ([42.10, -71.10], [42.20, -71.2001], 3, None),
+  ([42.50, -71.90], [42.60, -71.95], 1, 1760860100.5),
+]
+
+
+def test_packed_edge_rows_render_like_the_builder():
+  packed = array("d")
+  for row in EDGES:
+    pack_edge_row(packed, *row)
+  for z in (4, 12, 18):
+    assert json.loads(render_tile("edges", z, packed, 2)) == build_edge_tile(z, EDGES, 2)
+  nodes = [("rpt-a", 42.1, -71.1, "Alpha", "repeater", 1760860000.0), ("rpt-b", 42.1001, -71.1, None, None, None)]
+  assert json.loads(render_tile("nodes", 10, nodes, 10)) == build_node_tile(10, nodes, 10)
+
+
+def _run_shared(render, cancel):
+  # Two requests share one render; the ones in `cancel` go away before it ends.
+  release = threading.Event()
+  inflight, cache = {}, {}
+
+  def work():
+    release.wait(5)
+    return render()
+
+  async def main():
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=1)
+    starts = []
+
+    def start():
+      starts.append(1)
+      return loop.run_in_executor(pool, work)
+
+    def request():
+      future = app_module._shared_render(inflight, "key", start, lambda result: cache.update(key=result))
+      return asyncio.ensure_future(asyncio.shield(future))
+
+    waiters = [request(), request()]
+    shared = inflight["key"]
+    await asyncio.sleep(0)
+    for index in cancel:
+      waiters[index].cancel()
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait([shared])
+    pool.shutdown()
+    return results, len(starts)
+
+  results, starts = asyncio.run(main())
+  return results, starts, inflight, cache
+
+
+def test_a_cancelled_client_leaves_the_shared_render_running():
+  (first, second), starts, inflight, cache = _run_shared(lambda: b"tile", cancel=[0])
+  assert starts == 1
+  assert isinstance(first, asyncio.CancelledError) and second == b"tile"
+  assert cache == {"key": b"tile"} and inflight == {}
+
+
+def test_a_render_nobody_waits_for_is_still_cached():
+  results, _, inflight, cache = _run_shared(lambda: b"tile", cancel=[0, 1])
+  assert all(isinstance(result, asyncio.CancelledError) for result in results)
+  assert cache == {"key": b"tile"} and inflight == {}
+
+
+def test_a_failed_render_reaches_every_waiter_and_is_not_cached():
+  def render():
+    raise ValueError("bad tile")
+
+  results, _, inflight, cache = _run_shared(render, cancel=[])
+  assert all(isinstance(result, ValueError) for result in results)
+  assert cache == {} and inflight == {}
@@ -0,0 +1,172 @@
+import json
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from spatial import Bounds
+
+# Compact GeoJSON tiles in the standard web-mercator z/x/y scheme. Geometry is
+# snapped to a pixel grid for the tile's zoom, so edges that collapse onto the
+# same pixels merge and coordinates only carry the precision the zoom can show.
+TILE_PIXELS = 256
+EDGE_SNAP_PIXELS = 2
+NODE_SNAP_PIXELS = 6
+MAX_ZOOM = 22
+
+EdgeRow = Tuple[List[float], List[float], int, Optional[float]]
+# Edge rows cross to the render processes packed as six floats each
+# (a_lat, a_lon, b_lat, b_lon, count, last_ts or nan): one buffer to pickle.
+EDGE_ROW_WIDTH = 6
+NodeRow = Tuple[str, float, float, Optional[str], Optional[str], Optional[float]]
+
+
+def tile_valid(z: int, x: int, y: int) -> bool:
+  if z < 0 or z > MAX_ZOOM:
+    return False
+  size = 1 << z
+  return 0 <= x < size and 0 <= y < size
+
+
+def tile_bounds(z: int, x: int, y: int) -> Bounds:
+  size = float(1 << z)
+
+  def lat(row: float) -> float:
+    return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * row / size))))
+
+  return x / size * 360.0 - 180.0, lat(y + 1), (x + 1) / size * 360.0 - 180.0, lat(y)
+
+
+def _mercator_y(lat: float) -> float:
+  lat = max(-85.05112878, min(85.05112878, lat))
+  rad = math.radians(lat)
+  return (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0
+
+
+def _pixel(lat: float, lon: float, z: int, snap: int) -> Tuple[int, int]:
+  scale = (1 << z) * TILE_PIXELS / snap
+  return int((lon + 180.0) / 360.0 * scale), int(_mercator_y(lat) * scale)
+
+
+def _decimals(z: int) -> int:
+  # Enough digits to resolve one pixel at this zoom.
+  degrees_per_pixel = 360.0 / ((1 << z) * TILE_PIXELS)
+  return max(2, min(6, int(math.ceil(-math.log10(degrees_per_pixel)))))
+
+
+def build_edge_tile(z: int, rows: Iterable[EdgeRow], max_features: int) -> Dict[str, Any]:
+  merged: Dict[Tuple[Tuple[int, int], Tuple[int, int]], List[Any]] = {}
+  for a, b, count, last_ts in rows:
+    pa = _pixel(a[0], a[1], z, EDGE_SNAP_PIXELS)
+    pb = _pixel(b[0], b[1], z, EDGE_SNAP_PIXELS)
+    if pa == pb:
+      continue  # shorter than the snap grid at this zoom
+    key = (pa, pb) if pa <= pb else (pb, pa)
+    item = merged.get(key)
+    if item is None:
+      merged[key] = [a, b, count, last_ts or 0.0, 1, count]
+      continue
+    item[2] += count
+    item[3] = max(item[3], last_ts or 0.0)
+    item[4] += 1
+    if count > item[5]:
+      # Draw the merged edge along its heaviest member.
+      item[0], item[1], item[5] = a, b, count
+  items = sorted(merged.values(), key=lambda item: item[2], reverse=True)
+  dropped = max(0, len(items) - max_features)
+  digits = _decimals(z)
+  features = []
+  for a, b, count, last_ts, merged_count, _ in items[:max_features]:
+    features.append({
+      "type": "Feature",
+      "geometry": {
+        "type": "LineString",
+        "coordinates": [
+          [round(a[1], digits), round(a[0], digits)],
+          [round(b[1], digits), round(b[0], digits)],
+        ],
+      },
+      "properties": {"count": count, "last_ts": round(last_ts, 1) if last_ts else None, "edges": merged_count},
+    })
+  return {"type": "FeatureCollection", "features": features, "dropped": dropped}
+
+
+def build_node_tile(z: int, rows: Iterable[NodeRow], max_features: int) -> Dict[str, Any]:
+  clusters: Dict[Tuple[int, int], List[Any]] = {}
+  for device_id, lat, lon, name, role, ts in rows:
+    cell = _pixel(lat, lon, z, NODE_SNAP_PIXELS)
+    cluster = clusters.get(cell)
+    if cluster is None:
+      clusters[cell] = [device_id, lat, lon, name, role, ts or 0.0, 1]
+      continue
+    cluster[6] += 1
+    if (ts or 0.0) > cluster[5]:
+      # The most recently seen node represents the cluster.
+      cluster[0:6] = [device_id, lat, lon, name, role, ts or 0.0]
+  items = sorted(clusters.values(), key=lambda cluster: cluster[6], reverse=True)
+  digits = _decimals(z)
+  features = []
+  for device_id, lat, lon, name, role, ts, count in items[:max_features]:
+    features.append({
+      "type": "Feature",
+      "geometry": {"type": "Point", "coordinates": [round(lon, digits), round(lat, digits)]},
+      "properties": {"id": device_id, "name": name, "role": role, "last_seen": round(ts, 1) if ts else None, "count": count},
+    })
+  return {"type": "FeatureCollection", "features": features, "dropped": max(0, len(items) - max_features)}
+
+
+def pack_edge_row(packed: array, a: List[float], b: List[float], count: int, last_ts: Optional[float]) -> None:
+  packed.extend((a[0], a[1], b[0], b[1], count, last_ts if last_ts is not None else math.nan))
+
+
+def _unpack_edge_rows(packed: array) -> Iterable[EdgeRow]:
+  for i in range(0, len(packed), EDGE_ROW_WIDTH):
+    last_ts = packed[i + 5]
+    yield [packed[i], packed[i + 1]], [packed[i + 2], packed[i + 3]], int(packed[i + 4]), None if math.isnan(last_ts) else last_ts
+
+
+def render_tile(layer: str, z: int, rows: Any, max_features: int) -> bytes:
+  if layer == "edges":
+    body = build_edge_tile(z, _unpack_edge_rows(rows), max_features)
+  else:
+    body = build_node_tile(z, rows, max_features)
+  return json.dumps(body, separators=(",", ":")).encode("utf-8")
+
+
+class TileCache:
+  # LRU of encoded tiles keyed by (layer, z, x, y, version).
+
+  def __init__(self, max_entries: int) -> None:
+    self.max_entries = max(1, int(max_entries))
+    self._entries: "OrderedDict[Tuple[Any, ...], bytes]" = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: Tuple[Any, ...]) -> Optional[bytes]:
+    with self._lock:
+      body = self._entries.get(key)
+      if body is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return body
+
+  def put(self, key: Tuple[Any, ...], body: bytes) -> None:
+    with self._lock:
+      self._entries[key] = body
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def discard(self, key: Tuple[Any, ...]) -> None:
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      entries = len(self._entries)
+      size = sum(len(body) for body in self._entries.values())
+    return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,106 @@
+import math
+from typing import Any, Dict
+
+import numpy as np
+
+import propagation
+from propagation import LAT_SCALE, RASTER_HEADER, RASTER_MAGIC, RASTER_VERSION
+
+# Viewshed from one observer over the local DEM, R2-style radial sweep: one
+# ray from the observer to every cell on the perimeter of a square grid of
+# (2n + 1)^2 cells, sampled once per cell along the ray's major axis, so
+# every cell is crossed by at least one ray. A sample is visible when its
+# target elevation angle is at least the steepest terrain angle seen before
+# it on the same ray (running maximum); a cell takes the verdict of the ray
+# that passes closest to its centre. All rays are swept at once as an (rays x n) array.
+#
+# Results use the propagation raster format (coverage 1 = visible,
+# required_overlap 1), so raster_meta/raster_png serve them unchanged.
+EARTH_RADIUS_M = 6371000.0
+
+
+def viewshed_grid(params: Dict[str, Any]) -> Dict[str, float]:
+  n = max(1, int(math.ceil(params["radius_m"] / params["grid_step"])))
+  lat_step = params["grid_step"] / LAT_SCALE
+  lon_step = params["grid_step"] / (LAT_SCALE * max(0.01, math.cos(math.radians(params["lat"]))))
+  return {
+    "n": n,
+    "rows": 2 * n + 1,
+    "cols": 2 * n + 1,
+    "lat_step": lat_step,
+    "lon_step": lon_step,
+    # Bounds are cell edges; the observer sits in the centre cell.
+    "lat_min": params["lat"] - (n + 0.5) * lat_step,
+    "lat_max": params["lat"] + (n + 0.5) * lat_step,
+    "lon_min": params["lon"] - (n + 0.5) * lon_step,
+    "lon_max": params["lon"] + (n + 0.5) * lon_step,
+  }
+
+
+def _perimeter(n: int) -> np.ndarray:
+  # (dy, dx) of every perimeter cell, walked once around the square.
+  side = np.arange(-n, n)
+  return np.concatenate([
+    np.stack([np.full(2 * n, n), side], axis=1),
+    np.stack([-side, np.full(2 * n, n)], axis=1),
+    np.stack([np.full(2 * n, -n), -side], axis=1),
+    np.stack([side, np.full(2 * n, -n)], axis=1),
+  ])
+
+
+def render_viewshed(params: Dict[str, Any]) -> bytes:
+  grid = viewshed_grid(params)
+  n = grid["n"]
+  size = grid["rows"]
+  lat0, lon0 = params["lat"], params["lon"]
+  step = params["grid_step"]
+
+  ground = float(propagation._elevations(np.array([lat0]), np.array([lon0]))[0])
+  observer = (0.0 if math.isnan(ground) else ground) + params["height"]
+
+  ends = _perimeter(n)
+  k = np.arange(1, n + 1)[None, :] / n
+  dy = ends[:, :1] * k
+  dx = ends[:, 1:] * k
+  distance = np.sqrt(dx * dx + dy * dy) * step
+  elev = propagation._elevations(
+    (lat0 + dy * grid["lat_step"]).ravel(), (lon0 + dx * grid["lon_step"]).ravel()
+  ).reshape(distance.shape)
+  # Cells without DEM coverage neither block nor count as visible.
+  known = ~np.isnan(elev)
+  elev = np.where(known, elev, -np.inf)
+  drop = distance * distance / (2 * EARTH_RADIUS_M * params["k_factor"]) + observer
+  terrain = (elev - drop) / distance
+  target = (elev + params["target_height"] - drop) / distance
+  # Steepest terrain angle strictly before each sample.
+  horizon = np.maximum.accumulate(terrain, axis=1)
+  horizon = np.concatenate([np.full((len(ends), 1), -np.inf), horizon[:, :-1]], axis=1)
+  visible = known & (target >= horizon)
+
+  # Each cell takes the verdict of the ray sample closest to its centre.
+  inside = distance <= params["radius_m"]
+  rows = np.rint(dy)
+  cols = np.rint(dx)
+  offset = (np.abs(dy - rows) + np.abs(dx - cols))[inside]
+  cells = ((n - rows) * size + (n + cols)).astype(np.int64)[inside]
+  order = np.lexsort((offset, cells))
+  cells = cells[order]
+  first = np.concatenate([[True], cells[1:] != cells[:-1]])
+  coverage = np.zeros(size * size, dtype=np.uint8)
+  coverage[cells[first]] = visible[inside][order][first]
+  coverage[n * size + n] = 1
+  alpha = np.where(coverage > 0, 255, 0).astype(np.uint8)
+  header = RASTER_HEADER.pack(
+    RASTER_MAGIC,
+    RASTER_VERSION,
+    1,
+    size,
+    size,
+    grid["lat_min"],
+    grid["lat_max"],
+    grid["lon_min"],
+    grid["lon_max"],
+    grid["lat_step"],
+    grid["lon_step"],
+  )
+  return header + coverage.tobytes() + alpha.tobytes()